@@ -0,0 +1,96 @@
+"""
+Write contention: threads writing small transactions on their own connections.
+
+Run with `python benchmarks/contention.py` after building the package.
+"""
+
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+import sqlean
+
+TIMEOUT = 30.0
+
+
+def set_timeout(conn):
+    conn.set_busy_timeout(TIMEOUT)
+
+
+def set_handler(conn):
+    # the same fixed sleep in Python, called under the GIL for every retry
+    deadline = []
+
+    def handler(n):
+        if n == 0:
+            deadline[:] = [time.monotonic() + TIMEOUT]
+        if time.monotonic() >= deadline[0]:
+            return 0
+        time.sleep(0.001)
+        return 1
+
+    conn.set_busy_handler(handler)
+
+
+def set_backoff(conn):
+    conn.set_busy_backoff(TIMEOUT, initial_delay=0.0001, max_delay=0.01)
+
+
+def run(path, setup, threads, count):
+    conns = []
+    for _ in range(threads):
+        conn = sqlean.connect(path, isolation_level=None, check_same_thread=False)
+        setup(conn)
+        conns.append(conn)
+
+    def write(conn):
+        for i in range(count):
+            conn.execute("begin immediate")
+            conn.execute("insert into bench(value) values (?)", (i,))
+            conn.execute("commit")
+
+    workers = [threading.Thread(target=write, args=(conn,)) for conn in conns]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+
+    stats = None
+    if setup is set_backoff:
+        stats = [conn.busy_stats() for conn in conns]
+    for conn in conns:
+        conn.close()
+    return threads * count / elapsed, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-t", "--threads", type=int, default=8, help="writing threads")
+    parser.add_argument("-n", "--count", type=int, default=2_000, help="transactions per thread")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        conn = sqlean.connect(path)
+        conn.execute("pragma journal_mode = wal")
+        conn.execute("pragma synchronous = off")
+        conn.execute("create table bench(id integer primary key, value)")
+        conn.close()
+
+        for name, setup in (("busy_timeout", set_timeout), ("busy_handler", set_handler),
+                            ("busy_backoff", set_backoff)):
+            rate, stats = run(path, setup, args.threads, args.count)
+            print(f"{name:<14} {rate:>12,.0f} tx/s")
+            if stats:
+                waits = sum(s["events"] for s in stats)
+                wait_time = sum(s["wait_time"] for s in stats)
+                max_wait = max(s["max_wait"] for s in stats)
+                print(f"{'':<14} {waits:,} waits, {wait_time:.2f}s waited, longest {max_wait * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+CSV import: import_csv() against csv.reader with executemany() and a vsv table.
+
+Run with `python benchmarks/import_csv.py` after building the package.
+"""
+
+import argparse
+import csv
+import os
+import tempfile
+import time
+
+import sqlean
+
+TYPES = ("integer", "text", "real")
+
+
+def write_csv(path, count):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(("id", "name", "score"))
+        for i in range(count):
+            writer.writerow((i, f"name {i}", i / 4))
+
+
+def load_executemany(conn, path):
+    conn.execute("create table t(id integer, name text, score real)")
+    with open(path, newline="") as f:
+        reader = csv.reader(f)
+        next(reader)
+        conn.executemany("insert into t values (?, ?, ?)", reader)
+    conn.commit()
+
+
+def load_vsv(conn, path):
+    conn.execute("create table t(id integer, name text, score real)")
+    filename = path.replace("'", "''")
+    conn.execute(f"create virtual table temp.source using vsv(filename='{filename}', header)")
+    conn.execute("insert into t select * from temp.source")
+    conn.commit()
+
+
+def load_import_csv(conn, path):
+    conn.import_csv(path, "t", types=TYPES)
+
+
+def run(load, csv_path, database):
+    if os.path.exists(database):
+        os.remove(database)
+    conn = sqlean.connect(database, extensions=("vsv",))
+    conn.execute("pragma synchronous = off")
+
+    start = time.perf_counter()
+    load(conn, csv_path)
+    elapsed = time.perf_counter() - start
+
+    conn.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-n", "--count", type=int, default=500_000, help="rows in the file")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="runs, the best one is shown")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "bench.csv")
+        database = os.path.join(tmp, "bench.db")
+        write_csv(csv_path, args.count)
+        for name, load in (
+            ("executemany", load_executemany),
+            ("vsv", load_vsv),
+            ("import_csv", load_import_csv),
+        ):
+            elapsed = min(run(load, csv_path, database) for _ in range(args.repeat))
+            print(f"{name:<12} {elapsed:>8.3f} s {args.count / elapsed:>12,.0f} rows/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""
+Transaction throughput: many small transactions of one insert each.
+
+Run with `python benchmarks/transactions.py` after building the package.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import sqlean
+
+
+def run(database, isolation_level, count):
+    conn = sqlean.connect(database, isolation_level=isolation_level)
+    conn.execute("pragma synchronous = off")
+    conn.execute("create table if not exists bench(id integer primary key, value)")
+    conn.commit()
+    insert = "insert into bench(value) values (?)"
+
+    start = time.perf_counter()
+    for i in range(count):
+        conn.execute(insert, (i,))
+        conn.commit()
+    elapsed = time.perf_counter() - start
+
+    conn.close()
+    return count / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-n", "--count", type=int, default=100_000, help="transactions per run")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="runs, the best one is shown")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        for database in (":memory:", path):
+            for level in ("DEFERRED", "IMMEDIATE", "EXCLUSIVE"):
+                rate = max(run(database, level, args.count) for _ in range(args.repeat))
+                name = "memory" if database == ":memory:" else "file"
+                print(f"{name:<8} {level:<10} {rate:>12,.0f} tx/s")
+
+
+if __name__ == "__main__":
+    main()
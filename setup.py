@@ -42,6 +42,15 @@ sources = [
         "util.c",
         "row.c",
         "blob.c",
+        "serialize.c",
+        "column_buffer.c",
+        "prefetch.c",
+        "backup.c",
+        "session.c",
+        "prepared.c",
+        "transaction.c",
+        "resultcache.c",
+        "changes.c",
     ]
 ]
 
@@ -94,7 +103,9 @@ class Builder(build_ext):
             "ENABLE_GEOPOLY",
             "ENABLE_JSON1",
             "ENABLE_MATH_FUNCTIONS",
+            "ENABLE_PREUPDATE_HOOK",
             "ENABLE_RTREE",
+            "ENABLE_SESSION",
             "ENABLE_STAT4",
             "ENABLE_STMTVTAB",
             "LIKE_DOESNT_MATCH_BLOBS",
@@ -136,8 +147,10 @@ class Builder(build_ext):
         ext.sources.append(os.path.join(self.amalgamation_root, "sqlean-time.c"))
         ext.sources.append(os.path.join(self.amalgamation_root, "sqlean-unicode.c"))
         ext.sources.append(os.path.join(self.amalgamation_root, "sqlean-uuid.c"))
-        ext.sources.append(os.path.join(self.amalgamation_root, "sqlean-vsv.c"))
         ext.sources.append(os.path.join("src", "sqlean.c"))
+        ext.sources.append(os.path.join("src", "regexp_cache.c"))
+        ext.sources.append(os.path.join("src", "vsv_index.c"))
+        ext.sources.append(os.path.join("src", "vsv_reader.c"))
 
     def __setattr__(self, k, v):
         # Make sure we don't link against the SQLite
@@ -0,0 +1,137 @@
+"""
+Background WAL checkpoints.
+
+By default, SQLite checkpoints a WAL-mode database on the connection that
+commits the transaction which makes the log large enough, so that writer
+waits for the checkpoint. A Checkpointer turns off these automatic
+checkpoints and runs them from its own connection in a background thread.
+"""
+
+import threading
+
+from sqlean import dbapi2
+
+
+class Checkpointer:
+    """
+    Checkpoints the database of a connection in a background thread.
+
+    The checkpoint runs when a commit leaves at least `frames` frames
+    in the log, or every `interval` seconds if anything was committed
+    since the last one (None disables the timer). `mode` is one of the
+    modes of Connection.wal_checkpoint().
+
+    Create, start and stop the checkpointer from the thread that uses
+    the connection. The database must be a file in WAL mode.
+
+    If a checkpoint fails, the background thread ends, and the writer
+    checkpoints after its commits as `wal_autocheckpoint` asked before
+    the start. stop() then raises the error.
+    """
+
+    def __init__(self, connection, frames=1000, interval=None, mode="passive"):
+        if frames < 1:
+            raise ValueError("frames must be greater than zero")
+        if interval is not None and interval <= 0:
+            raise ValueError("interval must be greater than zero")
+        mode = mode.lower()
+        if mode not in ("passive", "full", "restart", "truncate"):
+            raise ValueError(f"unknown checkpoint mode: {mode}")
+
+        journal_mode = connection.execute("pragma journal_mode").fetchone()[0]
+        if journal_mode.lower() != "wal":
+            raise ValueError("database is not in WAL mode")
+        path = _database_path(connection)
+        if not path:
+            raise ValueError("database is not a file")
+
+        self.connection = connection
+        self.path = path
+        self.frames = frames
+        self.interval = interval
+        self.mode = mode
+        self.checkpoints = 0
+        self.error = None
+        self._pending = 0
+        self._autocheckpoint = None
+        self._stopping = False
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Moves the checkpoints of the connection to the background thread."""
+        if self._thread:
+            raise RuntimeError("checkpointer is already started")
+        self._autocheckpoint = self.connection.execute("pragma wal_autocheckpoint").fetchone()[0]
+        self._stopping = False
+        self.error = None
+        self._thread = threading.Thread(target=self._run, name="sqlean-checkpointer", daemon=True)
+        self._thread.start()
+        self.connection.set_wal_hook(self._on_commit)
+
+    def stop(self):
+        """
+        Runs the last checkpoint and gives the checkpoints back to the
+        connection. Raises the error that ended the background thread, if any.
+        """
+        if not self._thread:
+            return
+        self.connection.set_wal_hook(None)
+        self.connection.execute(f"pragma wal_autocheckpoint = {self._autocheckpoint}")
+        self._stopping = True
+        self._wakeup.set()
+        self._thread.join()
+        self._thread = None
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            self.stop()
+        except dbapi2.Error:
+            # the error of the block wins; this one stays in self.error
+            if exc_type is None:
+                raise
+        return False
+
+    def _on_commit(self, name, frames):
+        """Wakes the background thread up if the log is large enough. Runs on the writer."""
+        if name != "main":
+            return
+        if self.error is not None:
+            # the thread is gone, so checkpoint here as SQLite would have
+            if self._autocheckpoint and frames >= self._autocheckpoint:
+                self.connection.wal_checkpoint()
+            return
+        self._pending = frames
+        if frames >= self.frames:
+            self._wakeup.set()
+
+    def _run(self):
+        connection = None
+        try:
+            connection = dbapi2.connect(self.path)
+            while not self._stopping:
+                self._wakeup.wait(self.interval)
+                self._wakeup.clear()
+                if self._pending or self._stopping:
+                    self._pending = 0
+                    connection.wal_checkpoint(self.mode)
+                    self.checkpoints += 1
+        except dbapi2.Error as exc:
+            self.error = exc
+        finally:
+            if connection is not None:
+                connection.close()
+
+
+def _database_path(connection):
+    """Returns the file of the main database, or an empty string."""
+    for _, name, path in connection.execute("pragma database_list"):
+        if name == "main":
+            return path
+    return ""
@@ -0,0 +1,233 @@
+"""
+Large objects stored as a sequence of fixed-size blobs.
+
+A single SQLite blob is limited to about 2 GiB and can't grow after it is
+inserted. A ChunkedBlob splits an object over rows of a table, so it can
+be appended to in a stream and read at any 64-bit offset. Reads go through
+one Blob handle that is moved between the rows with Blob.reopen().
+"""
+
+import io
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+
+def create_table(connection, table):
+    """Creates a table for chunked objects if it does not exist."""
+    connection.execute(
+        f"create table if not exists {_quote(table)} ("
+        "key text not null, seq integer not null, data blob not null, "
+        "primary key (key, seq))"
+    )
+
+
+class ChunkedBlob(io.RawIOBase):
+    """
+    File-like access to the object stored under `key` in `table`.
+
+    `mode` is "r" to read, "w" to replace the object or "a" to append to it.
+    The object is written in rows of `chunk_size` bytes; the last row may be
+    shorter. Existing objects are read and appended to with the chunk size
+    they were written with, except that an object of a single row is
+    rewritten with the new chunk size when it is appended to. Writing creates the table if needed and runs in
+    the current transaction of the connection, so the caller commits it as
+    usual.
+    """
+
+    def __init__(self, connection, table, key, mode="r", chunk_size=DEFAULT_CHUNK_SIZE):
+        super().__init__()
+        if mode not in ("r", "w", "a"):
+            raise ValueError(f"invalid mode: {mode}")
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be greater than zero")
+        self.connection = connection
+        self.table = table
+        self.key = key
+        self.mode = mode
+        self.chunk_size = chunk_size
+        self._sql_table = _quote(table)
+        self._pos = 0
+        self._blob = None
+        self._blob_seq = -1
+        self._pending = bytearray()
+
+        if mode == "r":
+            self._rowids = [
+                row[0]
+                for row in connection.execute(
+                    f"select rowid from {self._sql_table} where key = ? order by seq", (key,)
+                )
+            ]
+            self._size = self._stored_size()
+            return
+
+        create_table(connection, table)
+        if mode == "w":
+            connection.execute(f"delete from {self._sql_table} where key = ?", (key,))
+            self._seq = 0
+            self._size = 0
+            return
+
+        # Appending continues from the last row. A short last row is read
+        # back into the pending buffer and rewritten when it fills up.
+        row = connection.execute(
+            f"select seq, data from {self._sql_table} where key = ? order by seq desc limit 1",
+            (key,),
+        ).fetchone()
+        self._seq = 0
+        self._size = 0
+        if row is None:
+            return
+        seq, data = row
+        if seq == 0:
+            # a single row doesn't tell the chunk size it was written with,
+            # so it is rewritten with this one
+            self.write(data)
+            return
+        (self.chunk_size,) = connection.execute(
+            f"select length(data) from {self._sql_table} where key = ? and seq = 0",
+            (key,),
+        ).fetchone()
+        self._size = seq * self.chunk_size + len(data)
+        if len(data) < self.chunk_size:
+            self._seq = seq
+            self._pending += data
+        else:
+            self._seq = seq + 1
+        self._pos = self._size
+
+    def readable(self):
+        return self.mode == "r"
+
+    def writable(self):
+        return self.mode != "r"
+
+    def seekable(self):
+        return self.mode == "r"
+
+    def tell(self):
+        self._checkClosed()
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        self._checkClosed()
+        if not self.seekable():
+            raise io.UnsupportedOperation("seek")
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = self._size + offset
+        else:
+            raise ValueError(f"invalid whence: {whence}")
+        if pos < 0:
+            raise ValueError(f"negative seek position {pos}")
+        self._pos = pos
+        return pos
+
+    def readinto(self, buffer):
+        self._checkClosed()
+        if not self.readable():
+            raise io.UnsupportedOperation("read")
+        view = memoryview(buffer).cast("B")
+        total = 0
+        while total < len(view) and self._pos < self._size:
+            seq, offset = divmod(self._pos, self.chunk_size)
+            blob = self._open_chunk(seq)
+            blob.seek(offset)
+            count = blob.readinto(view[total:])
+            if count == 0:
+                break
+            total += count
+            self._pos += count
+        return total
+
+    def readall(self):
+        self._checkClosed()
+        if not self.readable():
+            raise io.UnsupportedOperation("read")
+        buffer = bytearray(max(self._size - self._pos, 0))
+        count = self.readinto(buffer)
+        del buffer[count:]
+        return bytes(buffer)
+
+    def write(self, data):
+        self._checkClosed()
+        if not self.writable():
+            raise io.UnsupportedOperation("write")
+        view = memoryview(data).cast("B")
+        count = len(view)
+        if self._pending:
+            take = min(self.chunk_size - len(self._pending), len(view))
+            self._pending += view[:take]
+            view = view[take:]
+            if len(self._pending) == self.chunk_size:
+                self._put(self._pending)
+                self._pending.clear()
+        # full chunks of the input are inserted without copying them
+        while len(view) >= self.chunk_size:
+            self._put(view[: self.chunk_size])
+            view = view[self.chunk_size :]
+        self._pending += view
+        self._size += count
+        self._pos = self._size
+        return count
+
+    def flush(self):
+        """Stores the short last chunk. Later writes keep extending it."""
+        if self.closed:
+            return
+        if self._pending and self.writable():
+            self.connection.execute(
+                f"insert or replace into {self._sql_table} (key, seq, data) values (?, ?, ?)",
+                (self.key, self._seq, self._pending),
+            )
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            self.flush()
+        finally:
+            if self._blob is not None:
+                self._blob.close()
+                self._blob = None
+            super().close()
+
+    def __len__(self):
+        return self._size
+
+    def _put(self, data):
+        self.connection.execute(
+            f"insert or replace into {self._sql_table} (key, seq, data) values (?, ?, ?)",
+            (self.key, self._seq, data),
+        )
+        self._seq += 1
+
+    def _stored_size(self):
+        """Returns the size of the stored object and sets its chunk size."""
+        if not self._rowids:
+            return 0
+        sql = f"select length(data) from {self._sql_table} where rowid = ?"
+        (last,) = self.connection.execute(sql, (self._rowids[-1],)).fetchone()
+        if len(self._rowids) > 1:
+            (self.chunk_size,) = self.connection.execute(sql, (self._rowids[0],)).fetchone()
+        else:
+            self.chunk_size = max(last, 1)
+        return (len(self._rowids) - 1) * self.chunk_size + last
+
+    def _open_chunk(self, seq):
+        """Returns a blob handle positioned on the given chunk."""
+        if self._blob is None:
+            self._blob = self.connection.open_blob(
+                self.table, "data", self._rowids[seq], readonly=True
+            )
+        elif seq != self._blob_seq:
+            self._blob.reopen(self._rowids[seq])
+        self._blob_seq = seq
+        return self._blob
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
@@ -1,5 +1,9 @@
 """
 Extension management.
+
+These functions set environment variables, so they affect every connection
+opened afterwards. Use the `extensions` argument of `connect()` to select
+extensions for a single connection.
 """
 
 import os
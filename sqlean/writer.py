@@ -0,0 +1,156 @@
+"""
+Group commits for many writing threads.
+
+SQLite allows one writer at a time. When threads write small transactions
+on their own connections, every transaction pays for its own commit and
+waits for the write lock. A WriteQueue runs the writes of all threads on a
+single connection in a background thread and commits them in batches.
+"""
+
+import collections
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from sqlean import dbapi2
+
+WriteResult = collections.namedtuple("WriteResult", "rowcount lastrowid")
+
+_STOP = object()
+
+
+class WriteQueue:
+    """
+    Runs writes submitted from any thread on one connection to `database`.
+
+    The writer thread takes the writes that are waiting, up to `max_batch`,
+    and runs them in one transaction. With `max_delay` it also waits that
+    many seconds after the first write for more to arrive. Each write runs
+    in a savepoint, so a failing write fails only its own future. Other
+    arguments are passed to connect().
+
+    Writes must not begin or end transactions themselves.
+    """
+
+    def __init__(self, database, max_batch=1000, max_delay=0.0, **kwargs):
+        if max_batch < 1:
+            raise ValueError("max_batch must be greater than zero")
+        if max_delay < 0:
+            raise ValueError("max_delay must not be negative")
+        kwargs["isolation_level"] = None
+        kwargs["check_same_thread"] = False
+        self.connection = dbapi2.connect(database, **kwargs)
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.batches = 0
+        self.writes = 0
+        self._savepoint = self.connection.prepare("savepoint write_queue")
+        self._release = self.connection.prepare("release write_queue")
+        self._rollback = self.connection.prepare("rollback to write_queue")
+        self._queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="sqlean-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, sql, parameters=()):
+        """Queues a write and returns a Future of its WriteResult."""
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("write queue is closed")
+            self._queue.put((future, sql, parameters))
+        return future
+
+    def execute(self, sql, parameters=()):
+        """Queues a write and waits until it is committed."""
+        return self.submit(sql, parameters).result()
+
+    def close(self):
+        """Commits the writes that were already submitted and closes the connection."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(_STOP)
+        self._thread.join()
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            stopping = self._collect(batch)
+            try:
+                self._write(batch)
+            except Exception as exc:
+                _fail(batch, exc)
+
+    def _collect(self, batch):
+        """Adds waiting writes to the batch. Returns True if the queue was closed."""
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            try:
+                item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                return False
+            if item is _STOP:
+                return True
+            batch.append(item)
+        return False
+
+    def _write(self, batch):
+        """Runs a batch of writes in one transaction and resolves their futures."""
+        connection = self.connection
+        done = []
+        connection.execute("begin immediate")
+        for future, sql, parameters in batch:
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                self._savepoint.execute()
+                cursor = connection.execute(sql, parameters)
+                self._release.execute()
+            except Exception as exc:
+                future.set_exception(exc)
+                if connection.in_transaction:
+                    self._rollback.execute()
+                    self._release.execute()
+                else:
+                    # the error rolled back the whole transaction
+                    _fail(done, exc)
+                    done = []
+                    connection.execute("begin immediate")
+            else:
+                done.append((future, WriteResult(cursor.rowcount, cursor.lastrowid)))
+
+        try:
+            connection.execute("commit")
+        except dbapi2.Error:
+            if connection.in_transaction:
+                connection.execute("rollback")
+            raise
+
+        self.batches += 1
+        self.writes += len(done)
+        for future, result in done:
+            future.set_result(result)
+
+
+def _fail(items, exc):
+    """Fails the futures of the items that are not resolved yet."""
+    for item in items:
+        future = item[0]
+        if not future.done():
+            future.set_exception(exc)
@@ -0,0 +1,301 @@
+#include "backup.h"
+#include "module.h"
+#include "util.h"
+
+/* Upper bound for the pages of an adaptive step */
+#define BACKUP_MAX_PAGES (1 << 20)
+
+/*
+ * Returns 1 if the database is in WAL mode. In WAL mode a backup step only
+ * holds a read transaction on the source, which does not block writers.
+ */
+int pysqlite_backup_is_wal(sqlite3* db, const char* name)
+{
+    sqlite3_stmt* statement = NULL;
+    char* sql;
+    int wal = 0;
+
+    sql = sqlite3_mprintf("PRAGMA \"%w\".journal_mode", name);
+    if (!sql) {
+        return 0;
+    }
+    if (sqlite3_prepare_v2(db, sql, -1, &statement, NULL) == SQLITE_OK
+        && sqlite3_step(statement) == SQLITE_ROW) {
+        const char* mode = (const char*)sqlite3_column_text(statement, 0);
+        wal = mode && sqlite3_stricmp(mode, "wal") == 0;
+    }
+    sqlite3_finalize(statement);
+    sqlite3_free(sql);
+    return wal;
+}
+
+/*
+ * Returns the number of pages for the next step, so that it takes about
+ * step_time seconds if the last step of the given pages took elapsed.
+ * The batch at most doubles or quarters from one step to the next.
+ */
+int pysqlite_backup_adapt_pages(int pages, double elapsed, double step_time)
+{
+    double ratio = elapsed > 0 ? step_time / elapsed : 2.0;
+    double next;
+
+    if (pages < 1) {
+        return pages;
+    }
+    if (ratio > 2.0) {
+        ratio = 2.0;
+    } else if (ratio < 0.25) {
+        ratio = 0.25;
+    }
+    next = pages * ratio;
+    if (next < 1) {
+        return 1;
+    }
+    if (next > BACKUP_MAX_PAGES) {
+        return BACKUP_MAX_PAGES;
+    }
+    return (int)next;
+}
+
+/*
+ * Returns the step time after a restart of a WAL-mode backup: twice the
+ * current one, at most max_step_time.
+ */
+double pysqlite_backup_grow_step_time(double step_time, double max_step_time)
+{
+    return step_time * 2 < max_step_time ? step_time * 2 : max_step_time;
+}
+
+PyObject* pysqlite_backup_new(pysqlite_Connection* source, pysqlite_Connection* target,
+                              const char* name, int pages, double step_time)
+{
+    pysqlite_Backup* self;
+    sqlite3_backup* backup;
+    int wal = 0;
+
+    Py_BEGIN_ALLOW_THREADS
+    if (step_time > 0) {
+        wal = pysqlite_backup_is_wal(source->db, name);
+    }
+    backup = sqlite3_backup_init(target->db, "main", source->db, name);
+    Py_END_ALLOW_THREADS
+
+    if (!backup) {
+        _pysqlite_seterror(target->db);
+        return NULL;
+    }
+
+    self = PyObject_New(pysqlite_Backup, &pysqlite_BackupType);
+    if (!self) {
+        sqlite3_backup_finish(backup);
+        return NULL;
+    }
+    Py_INCREF(source);
+    self->source = source;
+    Py_INCREF(target);
+    self->target = target;
+    self->backup = backup;
+    self->pages = step_time > 0 ? BACKUP_INITIAL_PAGES : pages;
+    self->step_time = step_time;
+    self->max_step_time = step_time * BACKUP_MAX_STEP_GROWTH;
+    self->wal = wal;
+    self->remaining = -1;
+    self->pagecount = -1;
+    self->restarts = 0;
+    self->done = 0;
+    self->in_weakreflist = NULL;
+    return (PyObject*)self;
+}
+
+/*
+ * Releases the backup handle. Returns the result of sqlite3_backup_finish().
+ */
+static int _pysqlite_backup_finish(pysqlite_Backup* self)
+{
+    sqlite3_backup* backup = self->backup;
+    int rc = SQLITE_OK;
+
+    self->backup = NULL;
+    if (backup) {
+        Py_BEGIN_ALLOW_THREADS
+        rc = sqlite3_backup_finish(backup);
+        Py_END_ALLOW_THREADS
+    }
+    return rc;
+}
+
+static void pysqlite_backup_dealloc(pysqlite_Backup* self)
+{
+    _pysqlite_backup_finish(self);
+    if (self->in_weakreflist != NULL) {
+        PyObject_ClearWeakRefs((PyObject*)self);
+    }
+    Py_XDECREF(self->source);
+    Py_XDECREF(self->target);
+    Py_TYPE(self)->tp_free((PyObject*)self);
+}
+
+/*
+ * Checks that the backup can make progress.
+ *
+ * 0 => error; 1 => ok
+ */
+static int pysqlite_check_backup(pysqlite_Backup* self)
+{
+    if (!pysqlite_check_thread(self->source)) {
+        return 0;
+    }
+    if (!self->backup) {
+        PyErr_SetString(pysqlite_ProgrammingError, "Cannot operate on a finished backup.");
+        return 0;
+    }
+    return pysqlite_check_connection(self->source) && pysqlite_check_connection(self->target);
+}
+
+static void _pysqlite_backup_set_error(int rc)
+{
+    /* The backup APIs do not set the error status on the connection object,
+       but rather on the backup handle. */
+    if (rc == SQLITE_NOMEM) {
+        (void)PyErr_NoMemory();
+    } else {
+        PyErr_SetString(pysqlite_OperationalError, sqlite3_errstr(rc));
+    }
+}
+
+static PyObject* pysqlite_backup_step(pysqlite_Backup* self, PyObject* args, PyObject* kwargs)
+{
+    static char *kwlist[] = {"pages", NULL};
+    int pages = 0;
+    int previous = self->remaining;
+    double started, elapsed;
+    int rc;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "|i:step", kwlist, &pages)) {
+        return NULL;
+    }
+    if (self->done) {
+        Py_RETURN_TRUE;
+    }
+    if (!pysqlite_check_backup(self)) {
+        return NULL;
+    }
+    if (pages == 0) {
+        pages = self->pages;
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+    started = pysqlite_monotonic();
+    rc = sqlite3_backup_step(self->backup, pages);
+    elapsed = pysqlite_monotonic() - started;
+    Py_END_ALLOW_THREADS
+
+    if (rc == SQLITE_BUSY || rc == SQLITE_LOCKED) {
+        /* the source or the target is busy, try again later */
+        Py_RETURN_FALSE;
+    }
+
+    self->remaining = sqlite3_backup_remaining(self->backup);
+    self->pagecount = sqlite3_backup_pagecount(self->backup);
+
+    if (rc == SQLITE_DONE) {
+        self->done = 1;
+        rc = _pysqlite_backup_finish(self);
+        if (rc != SQLITE_OK) {
+            _pysqlite_backup_set_error(rc);
+            return NULL;
+        }
+        Py_RETURN_TRUE;
+    }
+    if (rc != SQLITE_OK) {
+        _pysqlite_backup_finish(self);
+        _pysqlite_backup_set_error(rc);
+        return NULL;
+    }
+
+    if (previous >= 0 && self->remaining > previous - pages
+        && self->remaining + pages >= self->pagecount) {
+        /* another connection wrote to the source, the backup started over */
+        self->restarts++;
+        if (self->wal && self->step_time > 0) {
+            /* writers are not blocked in WAL mode, so copy more at once
+               to finish before the next write */
+            self->step_time = pysqlite_backup_grow_step_time(self->step_time, self->max_step_time);
+        }
+    }
+    if (self->step_time > 0 && pages == self->pages) {
+        self->pages = pysqlite_backup_adapt_pages(self->pages, elapsed, self->step_time);
+    }
+    Py_RETURN_FALSE;
+}
+
+static PyObject* pysqlite_backup_finish(pysqlite_Backup* self, PyObject* args)
+{
+    int rc;
+
+    if (!pysqlite_check_thread(self->source)) {
+        return NULL;
+    }
+    rc = _pysqlite_backup_finish(self);
+    if (rc != SQLITE_OK) {
+        _pysqlite_backup_set_error(rc);
+        return NULL;
+    }
+    Py_RETURN_NONE;
+}
+
+static PyObject* pysqlite_backup_enter(pysqlite_Backup* self, PyObject* args)
+{
+    Py_INCREF(self);
+    return (PyObject*)self;
+}
+
+static PyObject* pysqlite_backup_exit(pysqlite_Backup* self, PyObject* args)
+{
+    PyObject* res = pysqlite_backup_finish(self, NULL);
+    if (!res) {
+        return NULL;
+    }
+    Py_DECREF(res);
+    Py_RETURN_FALSE;
+}
+
+static PyMethodDef backup_methods[] = {
+    {"step", (PyCFunction)(void(*)(void))pysqlite_backup_step, METH_VARARGS|METH_KEYWORDS,
+        PyDoc_STR("Copies the next batch of pages. Returns True when the backup is complete.")},
+    {"finish", (PyCFunction)pysqlite_backup_finish, METH_NOARGS,
+        PyDoc_STR("Releases the backup, complete or not.")},
+    {"__enter__", (PyCFunction)pysqlite_backup_enter, METH_NOARGS,
+        PyDoc_STR("backup context manager enter")},
+    {"__exit__", (PyCFunction)pysqlite_backup_exit, METH_VARARGS,
+        PyDoc_STR("backup context manager exit")},
+    {NULL, NULL}
+};
+
+static struct PyMemberDef backup_members[] =
+{
+    {"remaining", T_INT, offsetof(pysqlite_Backup, remaining), READONLY},
+    {"pagecount", T_INT, offsetof(pysqlite_Backup, pagecount), READONLY},
+    {"pages", T_INT, offsetof(pysqlite_Backup, pages), READONLY},
+    {"restarts", T_INT, offsetof(pysqlite_Backup, restarts), READONLY},
+    {"step_time", T_DOUBLE, offsetof(pysqlite_Backup, step_time), READONLY},
+    {"done", T_BOOL, offsetof(pysqlite_Backup, done), READONLY},
+    {NULL}
+};
+
+PyTypeObject pysqlite_BackupType = {
+        PyVarObject_HEAD_INIT(NULL, 0)
+        MODULE_NAME ".Backup",
+        .tp_basicsize = sizeof(pysqlite_Backup),
+        .tp_dealloc = (destructor)pysqlite_backup_dealloc,
+        .tp_flags = Py_TPFLAGS_DEFAULT,
+        .tp_doc = PyDoc_STR("Online backup driven one step at a time."),
+        .tp_weaklistoffset = offsetof(pysqlite_Backup, in_weakreflist),
+        .tp_methods = backup_methods,
+        .tp_members = backup_members,
+};
+
+extern int pysqlite_backup_setup_types(void)
+{
+    return PyType_Ready(&pysqlite_BackupType);
+}
@@ -0,0 +1,51 @@
+#ifndef PYSQLITE_BACKUP_H
+#define PYSQLITE_BACKUP_H
+#include "Python.h"
+#include "sqlite3.h"
+#include "connection.h"
+
+/* Pages copied by the first step of an adaptive backup */
+#define BACKUP_INITIAL_PAGES 64
+
+/* How many times the configured step time restarts may double it to */
+#define BACKUP_MAX_STEP_GROWTH 16
+
+/* An online backup driven by the caller, one step at a time */
+typedef struct
+{
+    PyObject_HEAD
+    pysqlite_Connection* source;
+    pysqlite_Connection* target;
+    sqlite3_backup* backup;
+
+    /* pages per step, -1 for all of them */
+    int pages;
+
+    /* if positive, pages is adapted so that a step takes this long;
+       restarts raise it up to BACKUP_MAX_STEP_GROWTH times max_step_time */
+    double step_time;
+    double max_step_time;
+
+    /* the source is in WAL mode, so steps do not block its writers */
+    int wal;
+
+    int remaining;
+    int pagecount;
+    int restarts;
+    char done;
+
+    PyObject* in_weakreflist; /* List of weak references */
+} pysqlite_Backup;
+
+extern PyTypeObject pysqlite_BackupType;
+
+PyObject* pysqlite_backup_new(pysqlite_Connection* source, pysqlite_Connection* target,
+                              const char* name, int pages, double step_time);
+
+int pysqlite_backup_is_wal(sqlite3* db, const char* name);
+int pysqlite_backup_adapt_pages(int pages, double elapsed, double step_time);
+double pysqlite_backup_grow_step_time(double step_time, double max_step_time);
+
+int pysqlite_backup_setup_types(void);
+
+#endif
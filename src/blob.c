@@ -1,6 +1,31 @@
 #include "blob.h"
 #include "util.h"
 
+#ifdef MS_WINDOWS
+#include <io.h>
+#define blob_fd_write(fd, buf, len) _write(fd, buf, (unsigned int)(len))
+#else
+#include <unistd.h>
+#define blob_fd_write(fd, buf, len) write(fd, buf, len)
+#endif
+
+/* Size of the buffer Blob.sendfile() copies through. */
+#define BLOB_SENDFILE_CHUNK (256 * 1024)
+
+/* Default chunk size of Blob.iter_chunks(). */
+#define BLOB_ITER_CHUNK (64 * 1024)
+
+typedef struct
+{
+    PyObject_HEAD
+    pysqlite_Blob* blob;
+    PyObject* buffer;  /* bytearray reused for every chunk */
+    PyObject* chunk;   /* memoryview of the last chunk, released before the next read */
+    int size;
+} pysqlite_BlobChunks;
+
+static PyTypeObject pysqlite_BlobChunksType;
+
 
 int pysqlite_blob_init(pysqlite_Blob *self, pysqlite_Connection* connection,
                        sqlite3_blob *blob)
@@ -107,24 +132,20 @@ static Py_ssize_t pysqlite_blob_length(pysqlite_Blob *self)
     return self->length;
 };
 
-static PyObject* inner_read(pysqlite_Blob *self, int read_length, int offset)
+/*
+ * Reads length bytes at offset into buf. Sets an exception on failure.
+ *
+ * 0 => ok; -1 => error
+ */
+static int read_inner(pysqlite_Blob *self, void *buf, int length, int offset)
 {
-    PyObject *buffer;
-    char *raw_buffer;
     int rc;
 
-    buffer = PyBytes_FromStringAndSize(NULL, read_length);
-    if (!buffer) {
-        return NULL;
-    }
-    raw_buffer = PyBytes_AS_STRING(buffer);
-
     Py_BEGIN_ALLOW_THREADS
-    rc = sqlite3_blob_read(self->blob, raw_buffer, read_length, self->offset);
+    rc = sqlite3_blob_read(self->blob, buf, length, offset);
     Py_END_ALLOW_THREADS
 
     if (rc != SQLITE_OK){
-        Py_DECREF(buffer);
         /* For some reason after modifying blob the
            error is not set on the connection db. */
         if (rc == SQLITE_ABORT) {
@@ -133,6 +154,22 @@ static PyObject* inner_read(pysqlite_Blob *self, int read_length, int offset)
         } else {
             _pysqlite_seterror(self->connection->db);
         }
+        return -1;
+    }
+    return 0;
+}
+
+static PyObject* inner_read(pysqlite_Blob *self, int read_length, int offset)
+{
+    PyObject *buffer;
+
+    buffer = PyBytes_FromStringAndSize(NULL, read_length);
+    if (!buffer) {
+        return NULL;
+    }
+
+    if (read_inner(self, PyBytes_AS_STRING(buffer), read_length, offset) < 0) {
+        Py_DECREF(buffer);
         return NULL;
     }
     return buffer;
@@ -141,10 +178,10 @@ static PyObject* inner_read(pysqlite_Blob *self, int read_length, int offset)
 
 PyObject* pysqlite_blob_read(pysqlite_Blob *self, PyObject *args)
 {
-    int read_length = -1;
+    Py_ssize_t read_length = -1;
     PyObject *buffer;
 
-    if (!PyArg_ParseTuple(args, "|i", &read_length)) {
+    if (!PyArg_ParseTuple(args, "|n", &read_length)) {
         return NULL;
     }
 
@@ -152,26 +189,274 @@ PyObject* pysqlite_blob_read(pysqlite_Blob *self, PyObject *args)
         return NULL;
     }
 
-    if (read_length < 0) {
-        /* same as file read. */
-        read_length = self->length;
-    }
-
-    /* making sure we don't read more then blob size */
-    if (read_length > self->length - self->offset) {
+    /* making sure we don't read more then blob size,
+       negative length reads the rest, same as file read. */
+    if (read_length < 0 || read_length > self->length - self->offset) {
         read_length = self->length - self->offset;
     }
 
-    buffer = inner_read(self, read_length, self->offset);
+    buffer = inner_read(self, (int)read_length, self->offset);
 
     if (buffer != NULL) {
         /* update offset on sucess. */
-        self->offset += read_length;
+        self->offset += (int)read_length;
     }
 
     return buffer;
 };
 
+PyObject* pysqlite_blob_readinto(pysqlite_Blob *self, PyObject *data)
+{
+    Py_buffer data_buffer;
+    int read_length;
+
+    if (!PyArg_Parse(data, "w*:readinto", &data_buffer)) {
+        return NULL;
+    }
+
+    if (!pysqlite_check_blob(self)) {
+        PyBuffer_Release(&data_buffer);
+        return NULL;
+    }
+
+    /* making sure we don't read more then blob size */
+    read_length = self->length - self->offset;
+    if (data_buffer.len < read_length) {
+        read_length = (int)data_buffer.len;
+    }
+
+    if (read_inner(self, data_buffer.buf, read_length, self->offset) < 0) {
+        PyBuffer_Release(&data_buffer);
+        return NULL;
+    }
+
+    self->offset += read_length;
+    PyBuffer_Release(&data_buffer);
+    return PyLong_FromLong(read_length);
+}
+
+
+PyObject* pysqlite_blob_sendfile(pysqlite_Blob *self, PyObject *args, PyObject *kwargs)
+{
+    static char *kwlist[] = {"fd", "count", NULL};
+    PyObject *file;
+    Py_ssize_t count = -1;
+    Py_ssize_t total, sent = 0;
+    char *buf;
+    int fd, chunk;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "O|n:sendfile", kwlist,
+                                     &file, &count)) {
+        return NULL;
+    }
+
+    if (!pysqlite_check_blob(self)) {
+        return NULL;
+    }
+
+    fd = PyObject_AsFileDescriptor(file);
+    if (fd < 0) {
+        return NULL;
+    }
+
+    total = self->length - self->offset;
+    if (count >= 0 && count < total) {
+        total = count;
+    }
+    if (total == 0) {
+        return PyLong_FromLong(0);
+    }
+
+    chunk = total < BLOB_SENDFILE_CHUNK ? (int)total : BLOB_SENDFILE_CHUNK;
+    buf = (char *)PyMem_Malloc(chunk);
+    if (buf == NULL) {
+        return PyErr_NoMemory();
+    }
+
+    while (sent < total) {
+        int length = total - sent < chunk ? (int)(total - sent) : chunk;
+        Py_ssize_t written = 0;
+        int rc, err = 0;
+
+        /* Read a chunk and write all of it to the file
+           without taking the GIL in between. */
+        Py_BEGIN_ALLOW_THREADS
+        rc = sqlite3_blob_read(self->blob, buf, length, self->offset);
+        if (rc == SQLITE_OK) {
+            while (written < length) {
+                Py_ssize_t n = blob_fd_write(fd, buf + written, length - written);
+                if (n < 0) {
+                    err = errno;
+                    break;
+                }
+                written += n;
+            }
+        }
+        Py_END_ALLOW_THREADS
+
+        /* the offset covers what actually reached the file */
+        self->offset += (int)written;
+        sent += written;
+
+        if (rc != SQLITE_OK) {
+            if (rc == SQLITE_ABORT) {
+                PyErr_SetString(pysqlite_OperationalError,
+                                "Cannot operate on modified blob");
+            } else {
+                _pysqlite_seterror(self->connection->db);
+            }
+            goto error;
+        }
+        if (err == EINTR) {
+            if (PyErr_CheckSignals() < 0) {
+                goto error;
+            }
+        } else if (err) {
+            errno = err;
+            PyErr_SetFromErrno(PyExc_OSError);
+            goto error;
+        }
+    }
+
+    PyMem_Free(buf);
+    return PyLong_FromSsize_t(sent);
+
+error:
+    PyMem_Free(buf);
+    return NULL;
+}
+
+
+PyObject* pysqlite_blob_iter_chunks(pysqlite_Blob *self, PyObject *args, PyObject *kwargs)
+{
+    static char *kwlist[] = {"size", NULL};
+    int size = BLOB_ITER_CHUNK;
+    pysqlite_BlobChunks *chunks;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "|i:iter_chunks", kwlist,
+                                     &size)) {
+        return NULL;
+    }
+
+    if (!pysqlite_check_blob(self)) {
+        return NULL;
+    }
+
+    if (size <= 0) {
+        PyErr_SetString(PyExc_ValueError, "size must be greater than zero");
+        return NULL;
+    }
+
+    /* no need for a buffer larger than the rest of the blob */
+    if (size > self->length - self->offset) {
+        size = self->length - self->offset;
+    }
+
+    chunks = PyObject_New(pysqlite_BlobChunks, &pysqlite_BlobChunksType);
+    if (!chunks) {
+        return NULL;
+    }
+    Py_INCREF(self);
+    chunks->blob = self;
+    chunks->size = size;
+    chunks->chunk = NULL;
+    chunks->buffer = PyByteArray_FromStringAndSize(NULL, size);
+    if (!chunks->buffer) {
+        Py_DECREF(chunks);
+        return NULL;
+    }
+    return (PyObject *)chunks;
+}
+
+
+static void pysqlite_blob_chunks_dealloc(pysqlite_BlobChunks *self)
+{
+    /* the chunk must go first, it holds an export of the buffer */
+    Py_XDECREF(self->chunk);
+    Py_XDECREF(self->buffer);
+    Py_XDECREF(self->blob);
+    PyObject_Free(self);
+}
+
+
+/*
+ * Releases the last chunk so that it can't be read once the buffer is
+ * overwritten. If the buffer is still exported, through a view made from
+ * the chunk or an object like a numpy array, it is left to them and a new
+ * one is used.
+ *
+ * -1 => error; 0 => ok
+ */
+static int _pysqlite_blob_chunks_release(pysqlite_BlobChunks *self)
+{
+    PyObject* result;
+
+    if (!self->chunk) {
+        return 0;
+    }
+    result = PyObject_CallMethod(self->chunk, "release", NULL);
+    Py_CLEAR(self->chunk);
+    if (result) {
+        Py_DECREF(result);
+    } else if (PyErr_ExceptionMatches(PyExc_BufferError)) {
+        PyErr_Clear();
+    } else {
+        return -1;
+    }
+
+    if (((PyByteArrayObject *)self->buffer)->ob_exports > 0) {
+        Py_SETREF(self->buffer, PyByteArray_FromStringAndSize(NULL, self->size));
+        if (!self->buffer) {
+            return -1;
+        }
+    }
+    return 0;
+}
+
+
+static PyObject* pysqlite_blob_chunks_next(pysqlite_BlobChunks *self)
+{
+    pysqlite_Blob *blob = self->blob;
+    PyObject* view;
+    int length;
+
+    if (_pysqlite_blob_chunks_release(self) < 0) {
+        return NULL;
+    }
+    if (!pysqlite_check_blob(blob)) {
+        return NULL;
+    }
+
+    length = blob->length - blob->offset;
+    if (length <= 0) {
+        return NULL;
+    }
+    if (length > self->size) {
+        length = self->size;
+    }
+
+    if (read_inner(blob, PyByteArray_AS_STRING(self->buffer), length, blob->offset) < 0) {
+        return NULL;
+    }
+    blob->offset += length;
+
+    /* a view of its own for every chunk, so that it can be released */
+    view = PyMemoryView_FromObject(self->buffer);
+    if (!view) {
+        return NULL;
+    }
+    if (length < self->size) {
+        Py_SETREF(view, PySequence_GetSlice(view, 0, length));
+        if (!view) {
+            return NULL;
+        }
+    }
+    Py_INCREF(view);
+    self->chunk = view;
+    return view;
+}
+
+
 static int write_inner(pysqlite_Blob *self, const void *buf, Py_ssize_t len, int offset)
 {
     int rc;
@@ -237,9 +522,10 @@ PyObject* pysqlite_blob_write(pysqlite_Blob *self, PyObject *data)
 
 PyObject* pysqlite_blob_seek(pysqlite_Blob *self, PyObject *args)
 {
-    int offset, from_what = 0;
+    Py_ssize_t offset;
+    int from_what = 0;
 
-    if (!PyArg_ParseTuple(args, "i|i", &offset, &from_what)) {
+    if (!PyArg_ParseTuple(args, "n|i", &offset, &from_what)) {
         return NULL;
     }
 
@@ -248,19 +534,20 @@ PyObject* pysqlite_blob_seek(pysqlite_Blob *self, PyObject *args)
         return NULL;
     }
 
+    /* no valid relative offset is larger than the blob,
+       and smaller ones can't overflow the sums below */
+    if (offset > self->length || offset < -(Py_ssize_t)self->length) {
+        PyErr_SetString(PyExc_ValueError, "offset out of blob range");
+        return NULL;
+    }
+
     switch (from_what) {
         case 0:  // relative to blob begin
             break;
         case 1:  // relative to current position
-            if (offset > INT_MAX - self->offset) {
-                goto overflow;
-            }
             offset = self->offset + offset;
             break;
         case 2:  // relative to blob end
-            if (offset > INT_MAX - self->length) {
-                goto overflow;
-            }
             offset = self->length + offset;
             break;
         default:
@@ -274,12 +561,41 @@ PyObject* pysqlite_blob_seek(pysqlite_Blob *self, PyObject *args)
         return NULL;
     }
 
-    self->offset = offset;
+    self->offset = (int)offset;
     Py_RETURN_NONE;
+}
 
-overflow:
-    PyErr_SetString(PyExc_OverflowError, "seek offset result in overflow");
-    return NULL;
+
+PyObject* pysqlite_blob_reopen(pysqlite_Blob *self, PyObject *arg)
+{
+    sqlite_int64 rowid;
+    int rc, length = 0;
+
+    rowid = PyLong_AsLongLong(arg);
+    if (rowid == -1 && PyErr_Occurred()) {
+        return NULL;
+    }
+
+    if (!pysqlite_check_blob(self)) {
+        return NULL;
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+    rc = sqlite3_blob_reopen(self->blob, rowid);
+    if (rc == SQLITE_OK) {
+        length = sqlite3_blob_bytes(self->blob);
+    }
+    Py_END_ALLOW_THREADS
+
+    /* the handle is aborted on failure, so further reads fail too */
+    self->offset = 0;
+    self->length = length;
+
+    if (rc != SQLITE_OK) {
+        _pysqlite_seterror(self->connection->db);
+        return NULL;
+    }
+    Py_RETURN_NONE;
 }
 
 
@@ -605,6 +921,12 @@ static int pysqlite_blob_ass_subscript(pysqlite_Blob *self, PyObject *item, PyOb
 static PyMethodDef blob_methods[] = {
     {"read", (PyCFunction)pysqlite_blob_read, METH_VARARGS,
         PyDoc_STR("read data from blob")},
+    {"readinto", (PyCFunction)pysqlite_blob_readinto, METH_O,
+        PyDoc_STR("read data from blob into a writable buffer")},
+    {"iter_chunks", (PyCFunction)(void(*)(void))pysqlite_blob_iter_chunks, METH_VARARGS|METH_KEYWORDS,
+        PyDoc_STR("iterate over the rest of the blob in memoryviews of one buffer, each released when the next is read")},
+    {"sendfile", (PyCFunction)(void(*)(void))pysqlite_blob_sendfile, METH_VARARGS|METH_KEYWORDS,
+        PyDoc_STR("write the rest of the blob to a file descriptor")},
     {"write", (PyCFunction)pysqlite_blob_write, METH_O,
         PyDoc_STR("write data to blob")},
     {"close", (PyCFunction)pysqlite_blob_close, METH_NOARGS,
@@ -613,6 +935,8 @@ static PyMethodDef blob_methods[] = {
         PyDoc_STR("change blob current offset")},
     {"tell", (PyCFunction)pysqlite_blob_tell, METH_NOARGS,
         PyDoc_STR("return blob current offset")},
+    {"reopen", (PyCFunction)pysqlite_blob_reopen, METH_O,
+        PyDoc_STR("move blob to another row of the same table")},
     {"__enter__", (PyCFunction)pysqlite_blob_enter, METH_NOARGS,
         PyDoc_STR("blob context manager enter")},
     {"__exit__", (PyCFunction)pysqlite_blob_exit, METH_VARARGS,
@@ -647,8 +971,21 @@ PyTypeObject pysqlite_BlobType = {
         .tp_methods = blob_methods,
 };
 
+static PyTypeObject pysqlite_BlobChunksType = {
+        PyVarObject_HEAD_INIT(NULL, 0)
+        MODULE_NAME ".BlobChunks",
+        .tp_basicsize = sizeof(pysqlite_BlobChunks),
+        .tp_dealloc = (destructor)pysqlite_blob_chunks_dealloc,
+        .tp_flags = Py_TPFLAGS_DEFAULT,
+        .tp_iter = PyObject_SelfIter,
+        .tp_iternext = (iternextfunc)pysqlite_blob_chunks_next,
+};
+
 extern int pysqlite_blob_setup_types(void)
 {
     pysqlite_BlobType.tp_new = PyType_GenericNew;
+    if (PyType_Ready(&pysqlite_BlobChunksType) < 0) {
+        return -1;
+    }
     return PyType_Ready(&pysqlite_BlobType);
 }
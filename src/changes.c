@@ -0,0 +1,427 @@
+#include "changes.h"
+
+/*
+ * Events are kept as plain structs in memory from sqlite3_malloc(), so the
+ * update hook doesn't need the GIL. Python objects are only built when a
+ * batch is delivered, with one string object per table.
+ */
+
+void pysqlite_changes_init(pysqlite_ChangeFeed* feed, Py_ssize_t max_events)
+{
+    memset(feed, 0, sizeof(pysqlite_ChangeFeed));
+    feed->max_events = max_events;
+    feed->last_table = -1;
+}
+
+/* Closes the savepoints from index first on */
+static void _pysqlite_changes_close_savepoints(pysqlite_ChangeFeed* feed, int first)
+{
+    while (feed->savepoint_count > first) {
+        sqlite3_free(feed->savepoints[--feed->savepoint_count]);
+    }
+}
+
+void pysqlite_changes_free(pysqlite_ChangeFeed* feed)
+{
+    int i;
+
+    for (i = 0; i < feed->table_count; i++) {
+        sqlite3_free(feed->tables[i]);
+    }
+    _pysqlite_changes_close_savepoints(feed, 0);
+    sqlite3_free(feed->savepoints);
+    sqlite3_free(feed->savepoint_events);
+    sqlite3_free(feed->tables);
+    sqlite3_free(feed->overflowed);
+    sqlite3_free(feed->events);
+    pysqlite_changes_init(feed, feed->max_events);
+}
+
+static int _pysqlite_table_matches(const char* name, const char* db, const char* table)
+{
+    size_t db_length;
+
+    if (!db) {
+        return strcmp(name, table) == 0;
+    }
+    db_length = strlen(db);
+    return strncmp(name, db, db_length) == 0 && name[db_length] == '.' &&
+           strcmp(name + db_length + 1, table) == 0;
+}
+
+/*
+ * Returns the index of a table, adding it if needed, or -1 if out of
+ * memory. db is NULL for the main database or a name that is already
+ * qualified.
+ */
+static int _pysqlite_changes_table(pysqlite_ChangeFeed* feed, const char* db, const char* table)
+{
+    char** tables;
+    char* overflowed;
+    char* name;
+    int capacity;
+    int i;
+
+    if (feed->last_table >= 0 && _pysqlite_table_matches(feed->tables[feed->last_table], db, table)) {
+        return feed->last_table;
+    }
+    for (i = 0; i < feed->table_count; i++) {
+        if (_pysqlite_table_matches(feed->tables[i], db, table)) {
+            feed->last_table = i;
+            return i;
+        }
+    }
+
+    if (feed->table_count == feed->table_capacity) {
+        capacity = feed->table_capacity ? feed->table_capacity * 2 : 8;
+        tables = sqlite3_realloc64(feed->tables, capacity * sizeof(char*));
+        if (!tables) {
+            return -1;
+        }
+        feed->tables = tables;
+        overflowed = sqlite3_realloc64(feed->overflowed, capacity);
+        if (!overflowed) {
+            return -1;
+        }
+        feed->overflowed = overflowed;
+        feed->table_capacity = capacity;
+    }
+    name = db ? sqlite3_mprintf("%s.%s", db, table) : sqlite3_mprintf("%s", table);
+    if (!name) {
+        return -1;
+    }
+    feed->tables[feed->table_count] = name;
+    feed->overflowed[feed->table_count] = 0;
+    feed->last_table = feed->table_count;
+    return feed->table_count++;
+}
+
+static void _pysqlite_changes_append(pysqlite_ChangeFeed* feed, int op, int table, sqlite3_int64 rowid)
+{
+    pysqlite_ChangeEvent* events;
+    Py_ssize_t capacity;
+
+    if (feed->count >= feed->max_events) {
+        feed->overflowed[table] = 1;
+        return;
+    }
+    if (feed->count == feed->capacity) {
+        capacity = feed->capacity ? feed->capacity * 2 : 64;
+        if (capacity > feed->max_events) {
+            capacity = feed->max_events;
+        }
+        events = sqlite3_realloc64(feed->events, capacity * sizeof(pysqlite_ChangeEvent));
+        if (!events) {
+            feed->overflowed[table] = 1;
+            return;
+        }
+        feed->events = events;
+        feed->capacity = capacity;
+    }
+    feed->events[feed->count].op = op;
+    feed->events[feed->count].table = table;
+    feed->events[feed->count].rowid = rowid;
+    feed->count++;
+}
+
+void pysqlite_changes_add(pysqlite_ChangeFeed* feed, int op, const char* db, const char* table, sqlite3_int64 rowid)
+{
+    int index;
+
+    index = _pysqlite_changes_table(feed, strcmp(db, "main") == 0 ? NULL : db, table);
+    if (index < 0) {
+        feed->lost = 1;
+        return;
+    }
+    _pysqlite_changes_append(feed, op, index, rowid);
+}
+
+void pysqlite_changes_commit(pysqlite_ChangeFeed* feed)
+{
+    int i;
+
+    _pysqlite_changes_close_savepoints(feed, 0);
+    feed->committed = feed->count;
+    if (feed->committed > 0 || feed->lost) {
+        feed->ready = 1;
+        return;
+    }
+    for (i = 0; i < feed->table_count; i++) {
+        if (feed->overflowed[i]) {
+            feed->ready = 1;
+            return;
+        }
+    }
+}
+
+void pysqlite_changes_rollback(pysqlite_ChangeFeed* feed)
+{
+    /* tables that overflowed in the transaction are still reported */
+    _pysqlite_changes_close_savepoints(feed, 0);
+    feed->count = feed->committed;
+}
+
+/* Skips whitespace and comments */
+static const char* _pysqlite_sql_skip(const char* z)
+{
+    for (;;) {
+        while (Py_ISSPACE(*z)) {
+            z++;
+        }
+        if (z[0] == '-' && z[1] == '-') {
+            while (*z && *z != '\n') {
+                z++;
+            }
+        } else if (z[0] == '/' && z[1] == '*') {
+            const char* end = strstr(z + 2, "*/");
+            z = end ? end + 2 : z + strlen(z);
+        } else {
+            return z;
+        }
+    }
+}
+
+/* Consumes a keyword, ignoring case; 1 => found */
+static int _pysqlite_sql_keyword(const char** z, const char* keyword)
+{
+    size_t n = strlen(keyword);
+
+    if (sqlite3_strnicmp(*z, keyword, (int)n) != 0 || Py_ISALNUM((*z)[n]) || (*z)[n] == '_') {
+        return 0;
+    }
+    *z = _pysqlite_sql_skip(*z + n);
+    return 1;
+}
+
+/*
+ * Reads a savepoint name, removing the quotes around it. Returns NULL if
+ * there is none or out of memory.
+ */
+static char* _pysqlite_sql_name(const char* z)
+{
+    const char* start = z;
+    char* name;
+    char quote;
+    size_t n = 0;
+
+    quote = *z == '[' ? ']' : (*z == '"' || *z == '\'' || *z == '`') ? *z : 0;
+    if (!quote) {
+        while (Py_ISALNUM(*z) || *z == '_' || *z == '$' || (unsigned char)*z >= 0x80) {
+            z++;
+        }
+        return z > start ? sqlite3_mprintf("%.*s", (int)(z - start), start) : NULL;
+    }
+
+    name = sqlite3_malloc64(strlen(z) + 1);
+    if (!name) {
+        return NULL;
+    }
+    for (z++; *z; z++) {
+        if (*z == quote) {
+            if (quote == ']' || z[1] != quote) {
+                break;
+            }
+            z++;
+        }
+        name[n++] = *z;
+    }
+    name[n] = '\0';
+    return name;
+}
+
+/* Returns the innermost savepoint with the name, or -1 */
+static int _pysqlite_changes_find_savepoint(pysqlite_ChangeFeed* feed, const char* name)
+{
+    int i;
+
+    for (i = feed->savepoint_count - 1; i >= 0; i--) {
+        if (sqlite3_stricmp(feed->savepoints[i], name) == 0) {
+            return i;
+        }
+    }
+    return -1;
+}
+
+static void _pysqlite_changes_open_savepoint(pysqlite_ChangeFeed* feed, char* name)
+{
+    char** savepoints;
+    Py_ssize_t* events;
+    int capacity;
+
+    if (feed->savepoint_count == feed->savepoint_capacity) {
+        capacity = feed->savepoint_capacity ? feed->savepoint_capacity * 2 : 8;
+        savepoints = sqlite3_realloc64(feed->savepoints, capacity * sizeof(char*));
+        if (savepoints) {
+            feed->savepoints = savepoints;
+            events = sqlite3_realloc64(feed->savepoint_events, capacity * sizeof(Py_ssize_t));
+            if (events) {
+                feed->savepoint_events = events;
+                feed->savepoint_capacity = capacity;
+            }
+        }
+        if (feed->savepoint_count == feed->savepoint_capacity) {
+            /* without this savepoint, ROLLBACK TO could find an outer one
+             * of the same name; forgetting all of them keeps the events */
+            sqlite3_free(name);
+            _pysqlite_changes_close_savepoints(feed, 0);
+            return;
+        }
+    }
+    feed->savepoints[feed->savepoint_count] = name;
+    feed->savepoint_events[feed->savepoint_count] = feed->count;
+    feed->savepoint_count++;
+}
+
+void pysqlite_changes_statement(pysqlite_ChangeFeed* feed, const char* sql)
+{
+    const char* z = _pysqlite_sql_skip(sql);
+    int savepoint = 0;
+    int rollback = 0;
+    char* name;
+    int i;
+
+    if (_pysqlite_sql_keyword(&z, "SAVEPOINT")) {
+        savepoint = 1;
+    } else if (_pysqlite_sql_keyword(&z, "RELEASE")) {
+        _pysqlite_sql_keyword(&z, "SAVEPOINT");
+    } else if (_pysqlite_sql_keyword(&z, "ROLLBACK")) {
+        _pysqlite_sql_keyword(&z, "TRANSACTION");
+        if (!_pysqlite_sql_keyword(&z, "TO")) {
+            /* the rollback hook drops the whole transaction */
+            return;
+        }
+        _pysqlite_sql_keyword(&z, "SAVEPOINT");
+        rollback = 1;
+    } else {
+        return;
+    }
+
+    name = _pysqlite_sql_name(z);
+    if (!name) {
+        _pysqlite_changes_close_savepoints(feed, 0);
+        return;
+    }
+    if (savepoint) {
+        _pysqlite_changes_open_savepoint(feed, name);
+        return;
+    }
+
+    /* a savepoint opened before the feed started is not known; the ones
+     * opened since then are closed by SQLite as well */
+    i = _pysqlite_changes_find_savepoint(feed, name);
+    sqlite3_free(name);
+    if (i < 0) {
+        _pysqlite_changes_close_savepoints(feed, 0);
+    } else if (rollback) {
+        /* tables that overflowed after the savepoint are still reported */
+        feed->count = feed->savepoint_events[i];
+        _pysqlite_changes_close_savepoints(feed, i + 1);
+    } else {
+        _pysqlite_changes_close_savepoints(feed, i);
+    }
+}
+
+void pysqlite_changes_take(pysqlite_ChangeFeed* feed, pysqlite_ChangeFeed* batch)
+{
+    pysqlite_ChangeEvent* event;
+    Py_ssize_t count = feed->count;
+    int index;
+
+    *batch = *feed;
+    batch->count = batch->committed;
+    pysqlite_changes_init(feed, batch->max_events);
+
+    /* so do the savepoints of the current transaction */
+    feed->savepoints = batch->savepoints;
+    feed->savepoint_events = batch->savepoint_events;
+    feed->savepoint_count = batch->savepoint_count;
+    feed->savepoint_capacity = batch->savepoint_capacity;
+    for (index = 0; index < feed->savepoint_count; index++) {
+        feed->savepoint_events[index] -= batch->committed;
+    }
+    batch->savepoints = NULL;
+    batch->savepoint_events = NULL;
+    batch->savepoint_count = batch->savepoint_capacity = 0;
+
+    /* the events of the current transaction stay in the feed */
+    for (event = batch->events + batch->committed; event < batch->events + count; event++) {
+        index = _pysqlite_changes_table(feed, NULL, batch->tables[event->table]);
+        if (index < 0) {
+            feed->lost = 1;
+            continue;
+        }
+        _pysqlite_changes_append(feed, event->op, index, event->rowid);
+    }
+}
+
+PyObject* pysqlite_changes_list(pysqlite_ChangeFeed* batch)
+{
+    PyObject* list;
+    PyObject** names;
+    PyObject* item;
+    pysqlite_ChangeEvent* event;
+    Py_ssize_t i;
+    int ok = 0;
+
+    list = PyList_New(batch->count);
+    if (!list) {
+        return NULL;
+    }
+    names = PyMem_Calloc(batch->table_count ? batch->table_count : 1, sizeof(PyObject*));
+    if (!names) {
+        Py_DECREF(list);
+        return PyErr_NoMemory();
+    }
+
+    for (i = 0; i < batch->count; i++) {
+        event = batch->events + i;
+        if (!names[event->table]) {
+            names[event->table] = PyUnicode_FromString(batch->tables[event->table]);
+            if (!names[event->table]) {
+                goto finally;
+            }
+        }
+        item = PyTuple_New(3);
+        if (!item) {
+            goto finally;
+        }
+        PyList_SET_ITEM(list, i, item);
+        PyTuple_SET_ITEM(item, 0, PyLong_FromLong(event->op));
+        Py_INCREF(names[event->table]);
+        PyTuple_SET_ITEM(item, 1, names[event->table]);
+        PyTuple_SET_ITEM(item, 2, PyLong_FromLongLong(event->rowid));
+        if (!PyTuple_GET_ITEM(item, 0) || !PyTuple_GET_ITEM(item, 2)) {
+            goto finally;
+        }
+    }
+    for (i = 0; i < batch->table_count; i++) {
+        if (!batch->overflowed[i]) {
+            continue;
+        }
+        item = Py_BuildValue("(OsO)", Py_None, batch->tables[i], Py_None);
+        if (!item || PyList_Append(list, item) != 0) {
+            Py_XDECREF(item);
+            goto finally;
+        }
+        Py_DECREF(item);
+    }
+    if (batch->lost) {
+        item = Py_BuildValue("(OOO)", Py_None, Py_None, Py_None);
+        if (!item || PyList_Append(list, item) != 0) {
+            Py_XDECREF(item);
+            goto finally;
+        }
+        Py_DECREF(item);
+    }
+    ok = 1;
+
+finally:
+    for (i = 0; i < batch->table_count; i++) {
+        Py_XDECREF(names[i]);
+    }
+    PyMem_Free(names);
+    if (!ok) {
+        Py_CLEAR(list);
+    }
+    return list;
+}
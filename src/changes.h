@@ -0,0 +1,78 @@
+#ifndef PYSQLITE_CHANGES_H
+#define PYSQLITE_CHANGES_H
+#include "Python.h"
+#include "sqlite3.h"
+
+/*
+ * Rows changed by the transactions of a connection, recorded by its update
+ * hook and delivered to Python once per commit. See Connection.changes().
+ *
+ * The functions that record changes run without the GIL, from the hooks,
+ * and expect the database mutex to be held.
+ */
+typedef struct
+{
+    int op;                 /* SQLITE_INSERT, SQLITE_UPDATE or SQLITE_DELETE */
+    int table;              /* index in tables */
+    sqlite3_int64 rowid;
+} pysqlite_ChangeEvent;
+
+typedef struct
+{
+    pysqlite_ChangeEvent* events;
+    Py_ssize_t count;
+    Py_ssize_t capacity;
+
+    /* events beyond this many are not kept; their tables are marked as
+     * overflowed instead */
+    Py_ssize_t max_events;
+
+    /* the first committed events belong to committed transactions, the rest
+     * to the current one */
+    Py_ssize_t committed;
+
+    /* table names, qualified with the schema for databases other than main,
+     * with their overflow flags */
+    char** tables;
+    char* overflowed;
+    int table_count;
+    int table_capacity;
+    int last_table;
+
+    /* savepoints open in the current transaction, innermost last, with the
+     * number of events recorded when each was opened */
+    char** savepoints;
+    Py_ssize_t* savepoint_events;
+    int savepoint_count;
+    int savepoint_capacity;
+
+    /* 1 when a commit waits to be delivered; 1 in lost if changes could
+     * not be recorded for lack of memory */
+    int ready;
+    int lost;
+} pysqlite_ChangeFeed;
+
+void pysqlite_changes_init(pysqlite_ChangeFeed* feed, Py_ssize_t max_events);
+void pysqlite_changes_free(pysqlite_ChangeFeed* feed);
+
+void pysqlite_changes_add(pysqlite_ChangeFeed* feed, int op, const char* db, const char* table, sqlite3_int64 rowid);
+void pysqlite_changes_commit(pysqlite_ChangeFeed* feed);
+void pysqlite_changes_rollback(pysqlite_ChangeFeed* feed);
+
+/*
+ * Follows a statement that has run: SAVEPOINT opens a savepoint, RELEASE
+ * closes it and ROLLBACK TO drops the events recorded since it was opened.
+ * Other statements are ignored.
+ */
+void pysqlite_changes_statement(pysqlite_ChangeFeed* feed, const char* sql);
+
+/*
+ * Moves the committed changes into batch, which must be freed, and keeps
+ * the changes of the current transaction.
+ */
+void pysqlite_changes_take(pysqlite_ChangeFeed* feed, pysqlite_ChangeFeed* batch);
+
+/* Returns a new list of (op, table, rowid) tuples for a batch */
+PyObject* pysqlite_changes_list(pysqlite_ChangeFeed* batch);
+
+#endif
@@ -0,0 +1,137 @@
+#include "column_buffer.h"
+#include "module.h"
+
+/*
+ * Large values are copied into blocks from a small pool instead of new
+ * bytes objects. Blocks this large are mapped fresh by malloc, so reusing
+ * them saves the page faults of touching new memory on every row.
+ */
+#define COLUMN_BUFFER_BLOCK (64 * 1024)
+#define COLUMN_BUFFER_POOL_SIZE 4
+#define COLUMN_BUFFER_POOL_BYTES (32 * 1024 * 1024)
+
+typedef struct
+{
+    char* data;
+    Py_ssize_t capacity;
+} PoolBlock;
+
+/* protected by the GIL */
+static PoolBlock pool[COLUMN_BUFFER_POOL_SIZE];
+static int pool_count = 0;
+static Py_ssize_t pool_bytes = 0;
+
+/* Takes the smallest pooled block that fits, or allocates a new one. */
+static char* _column_buffer_acquire(Py_ssize_t size, Py_ssize_t* capacity)
+{
+    int i, best = -1;
+    char* data;
+
+    for (i = 0; i < pool_count; i++) {
+        if (pool[i].capacity >= size &&
+                (best < 0 || pool[i].capacity < pool[best].capacity)) {
+            best = i;
+        }
+    }
+
+    if (best >= 0) {
+        data = pool[best].data;
+        *capacity = pool[best].capacity;
+        pool_bytes -= pool[best].capacity;
+        pool[best] = pool[--pool_count];
+        return data;
+    }
+
+    *capacity = (size + COLUMN_BUFFER_BLOCK - 1) / COLUMN_BUFFER_BLOCK * COLUMN_BUFFER_BLOCK;
+    if (*capacity == 0) {
+        *capacity = COLUMN_BUFFER_BLOCK;
+    }
+    return PyMem_RawMalloc(*capacity);
+}
+
+/* Returns a block to the pool, or frees it if the pool is full. */
+static void _column_buffer_release(char* data, Py_ssize_t capacity)
+{
+    if (pool_count < COLUMN_BUFFER_POOL_SIZE &&
+            pool_bytes + capacity <= COLUMN_BUFFER_POOL_BYTES) {
+        pool[pool_count].data = data;
+        pool[pool_count].capacity = capacity;
+        pool_count++;
+        pool_bytes += capacity;
+    } else {
+        PyMem_RawFree(data);
+    }
+}
+
+/*
+ * Copies a column value and returns a read-only memoryview over the copy.
+ */
+PyObject* pysqlite_column_buffer_new(const void* data, Py_ssize_t size)
+{
+    pysqlite_ColumnBuffer* self;
+    PyObject* view;
+
+    self = PyObject_New(pysqlite_ColumnBuffer, &pysqlite_ColumnBufferType);
+    if (!self) {
+        return NULL;
+    }
+    self->size = size;
+    self->data = _column_buffer_acquire(size, &self->capacity);
+    if (!self->data) {
+        /* dealloc must not release the missing block */
+        self->capacity = 0;
+        Py_DECREF(self);
+        return PyErr_NoMemory();
+    }
+    if (size > 0) {
+        memcpy(self->data, data, size);
+    }
+
+    view = PyMemoryView_FromObject((PyObject*)self);
+    Py_DECREF(self);
+    return view;
+}
+
+static void pysqlite_column_buffer_dealloc(pysqlite_ColumnBuffer* self)
+{
+    if (self->data) {
+        _column_buffer_release(self->data, self->capacity);
+    }
+    Py_TYPE(self)->tp_free((PyObject*)self);
+}
+
+static int pysqlite_column_buffer_getbuffer(pysqlite_ColumnBuffer* self, Py_buffer* view, int flags)
+{
+    /* the data is never resized, so exports need no bookkeeping */
+    return PyBuffer_FillInfo(view, (PyObject*)self, self->data, self->size, 1, flags);
+}
+
+static Py_ssize_t pysqlite_column_buffer_length(pysqlite_ColumnBuffer* self)
+{
+    return self->size;
+}
+
+static PyBufferProcs column_buffer_as_buffer = {
+    (getbufferproc)pysqlite_column_buffer_getbuffer,
+    NULL,
+};
+
+static PySequenceMethods column_buffer_sequence_methods = {
+    .sq_length = (lenfunc)pysqlite_column_buffer_length,
+};
+
+PyTypeObject pysqlite_ColumnBufferType = {
+        PyVarObject_HEAD_INIT(NULL, 0)
+        MODULE_NAME ".ColumnBuffer",
+        .tp_basicsize = sizeof(pysqlite_ColumnBuffer),
+        .tp_dealloc = (destructor)pysqlite_column_buffer_dealloc,
+        .tp_as_sequence = &column_buffer_sequence_methods,
+        .tp_as_buffer = &column_buffer_as_buffer,
+        .tp_flags = Py_TPFLAGS_DEFAULT,
+        .tp_doc = PyDoc_STR("Copy of a large column value. Supports the buffer protocol."),
+};
+
+extern int pysqlite_column_buffer_setup_types(void)
+{
+    return PyType_Ready(&pysqlite_ColumnBufferType);
+}
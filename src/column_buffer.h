@@ -0,0 +1,20 @@
+#ifndef PYSQLITE_COLUMN_BUFFER_H
+#define PYSQLITE_COLUMN_BUFFER_H
+#include "Python.h"
+
+/* A read-only copy of a large TEXT or BLOB value, see Cursor.buffer_threshold */
+typedef struct
+{
+    PyObject_HEAD
+    char* data;
+    Py_ssize_t size;
+    Py_ssize_t capacity;
+} pysqlite_ColumnBuffer;
+
+extern PyTypeObject pysqlite_ColumnBufferType;
+
+PyObject* pysqlite_column_buffer_new(const void* data, Py_ssize_t size);
+
+int pysqlite_column_buffer_setup_types(void);
+
+#endif
@@ -28,8 +28,16 @@
 #include "statement.h"
 #include "cursor.h"
 #include "blob.h"
+#include "serialize.h"
+#include "backup.h"
+#include "session.h"
+#include "prepared.h"
+#include "transaction.h"
 #include "prepare_protocol.h"
 #include "util.h"
+#include "extensions.h"
+#include "regexp_cache.h"
+#include "vsv_reader.h"
 
 #define ACTION_FINALIZE 1
 #define ACTION_RESET 2
@@ -44,6 +52,12 @@
 #define HAVE_BACKUP_API
 #endif
 
+#if SQLITE_VERSION_NUMBER >= 3036000
+#ifndef SQLITE_OMIT_DESERIALIZE
+#define HAVE_SERIALIZE
+#endif
+#endif
+
 #if SQLITE_VERSION_NUMBER >= 3014002
 #define HAVE_TRACE_V2
 #endif
@@ -71,7 +85,10 @@ static const char * const begin_statements[] = {
 };
 
 static int pysqlite_connection_set_isolation_level(pysqlite_Connection* self, PyObject* isolation_level, void *Py_UNUSED(ignored));
-static void _pysqlite_drop_unused_cursor_references(pysqlite_Connection* self);
+static void _pysqlite_finalize_transaction_statements(pysqlite_Connection* self);
+static void _pysqlite_detach_all(pysqlite_Link* head);
+static int _pysqlite_extensions_mask(PyObject* extensions, int* mask);
+static int _pysqlite_apply_settings(pysqlite_Connection* self, const char* profile, PyObject* pragmas);
 
 
 static void _sqlite3_result_error(sqlite3_context* ctx, const char* errmsg, int len)
@@ -91,7 +108,7 @@ int pysqlite_connection_init(pysqlite_Connection* self, PyObject* args, PyObject
     static char *kwlist[] = {
         "database", "timeout", "detect_types", "isolation_level",
         "check_same_thread", "factory", "cached_statements", "uri", "flags",
-        "vfs", NULL
+        "vfs", "extensions", "profile", "pragmas", NULL
     };
 
     const char* database;
@@ -105,27 +122,41 @@ int pysqlite_connection_init(pysqlite_Connection* self, PyObject* args, PyObject
     char *vfs = NULL;
     int uri = 0;
     double timeout = 5.0;
+    PyObject* extensions = Py_None;
+    int extensions_mask;
+    const char* profile = NULL;
+    PyObject* pragmas = Py_None;
     int rc;
 
-    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "O&|diOiOipiz", kwlist,
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "O&|diOiOipizOzO", kwlist,
                                      PyUnicode_FSConverter, &database_obj, &timeout, &detect_types,
                                      &isolation_level, &check_same_thread,
                                      &factory, &cached_statements, &uri,
-                                     &flags, &vfs))
+                                     &flags, &vfs, &extensions, &profile, &pragmas))
     {
         return -1;
     }
 
+    if (_pysqlite_extensions_mask(extensions, &extensions_mask) < 0) {
+        Py_DECREF(database_obj);
+        return -1;
+    }
+
     database = PyBytes_AsString(database_obj);
 
     self->initialized = 1;
 
     self->begin_statement = NULL;
+    _pysqlite_finalize_transaction_statements(self);
+    pysqlite_result_cache_free(self->result_cache);
+    self->result_cache = NULL;
 
     Py_CLEAR(self->statement_cache);
-    Py_CLEAR(self->statements);
-    Py_CLEAR(self->cursors);
+    _pysqlite_detach_all(&self->statements);
+    _pysqlite_detach_all(&self->cursors);
     Py_CLEAR(self->blobs);
+    Py_CLEAR(self->sessions);
+    Py_CLEAR(self->deserialized);
 
     Py_INCREF(Py_None);
     Py_XSETREF(self->row_factory, Py_None);
@@ -133,15 +164,25 @@ int pysqlite_connection_init(pysqlite_Connection* self, PyObject* args, PyObject
     Py_INCREF(&PyUnicode_Type);
     Py_XSETREF(self->text_factory, (PyObject*)&PyUnicode_Type);
 
+    Py_XSETREF(self->settings, PyDict_New());
+    if (!self->settings) {
+        Py_DECREF(database_obj);
+        return -1;
+    }
+
 #ifndef SQLITE_OPEN_URI
     if (uri) {
         PyErr_SetString(pysqlite_NotSupportedError, "URIs not supported");
         return -1;
     }
 #endif
+    /* Sqlean extensions are initialized by an auto-extension
+     * within sqlite3_open_v2 on the same thread */
     Py_BEGIN_ALLOW_THREADS
+    sqlean_select_extensions(extensions_mask);
     rc = sqlite3_open_v2(database, &self->db,
                          flags | (uri ? SQLITE_OPEN_URI : 0), vfs);
+    sqlean_select_extensions(SQLEAN_EXT_FROM_ENV);
     Py_END_ALLOW_THREADS
 
     Py_DECREF(database_obj);
@@ -171,14 +212,19 @@ int pysqlite_connection_init(pysqlite_Connection* self, PyObject* args, PyObject
         return -1;
     }
 
-    self->created_statements = 0;
-    self->created_cursors = 0;
+    pysqlite_link_init_head(&self->statements);
+    pysqlite_link_init_head(&self->cursors);
 
-    /* Create lists of weak references to statements/cursors/blobs */
-    self->statements = PyList_New(0);
-    self->cursors = PyList_New(0);
+    /* Create lists of weak references to blobs/sessions */
     self->blobs = PyList_New(0);
-    if (!self->statements || !self->cursors || !self->blobs) {
+    self->sessions = PyList_New(0);
+    if (!self->blobs || !self->sessions) {
+        return -1;
+    }
+
+    /* Buffers of read-only deserialized databases, by schema name */
+    self->deserialized = PyDict_New();
+    if (!self->deserialized) {
         return -1;
     }
 
@@ -193,6 +239,12 @@ int pysqlite_connection_init(pysqlite_Connection* self, PyObject* args, PyObject
     self->detect_types = detect_types;
     self->timeout = timeout;
     (void)sqlite3_busy_timeout(self->db, (int)(timeout*1000));
+
+    /* after the busy timeout, which a busy_timeout pragma overrides, and
+     * which changing the journal mode may need */
+    if (_pysqlite_apply_settings(self, profile, pragmas) < 0) {
+        return -1;
+    }
     self->thread_ident = PyThread_get_thread_ident();
     if (!check_same_thread && sqlite3_libversion_number() < 3003001) {
         PyErr_SetString(pysqlite_NotSupportedError, "shared connections not available");
@@ -202,8 +254,25 @@ int pysqlite_connection_init(pysqlite_Connection* self, PyObject* args, PyObject
 
     self->function_pinboard_trace_callback = NULL;
     self->function_pinboard_progress_handler = NULL;
+    self->progress_handler_n = 0;
+    self->progress_handler_every = 1;
+    self->progress_handler_calls = 0;
+    self->query_timeout = 0.0;
+    self->max_rows = -1;
+    self->check_deadlines = 0;
+    self->deadline = 0.0;
+    self->deadline_expired = 0;
     self->function_pinboard_authorizer_cb = NULL;
     self->function_pinboard_busy_handler_cb = NULL;
+    memset(&self->busy_backoff, 0, sizeof(self->busy_backoff));
+    self->function_pinboard_wal_hook = NULL;
+    self->function_pinboard_update_hook = NULL;
+    self->function_pinboard_commit_hook = NULL;
+    self->function_pinboard_rollback_hook = NULL;
+    self->python_functions = 0;
+    self->changes_callback = NULL;
+    self->changes_delivering = 0;
+    pysqlite_changes_init(&self->changes, 0);
 
     Py_XSETREF(self->collations, PyDict_New());
     if (!self->collations) {
@@ -224,42 +293,565 @@ int pysqlite_connection_init(pysqlite_Connection* self, PyObject* args, PyObject
     return 0;
 }
 
-/* action in (ACTION_RESET, ACTION_FINALIZE) */
-void pysqlite_do_all_statements(pysqlite_Connection* self, int action, int reset_cursors)
+/*
+ * The settings of the profiles of connect(), in the order they are applied.
+ * SQLite maps at most the size of the database file into memory, up to
+ * SQLITE_MAX_MMAP_SIZE.
+ */
+static const struct {
+    const char* profile;
+    const char* name;
+    const char* text;   /* the value, or NULL for number */
+    long long number;
+} profile_settings[] = {
+    /* many concurrent readers */
+    {"read_heavy", "journal_mode", "wal", 0},
+    {"read_heavy", "synchronous", "normal", 0},
+    {"read_heavy", "cache_size", NULL, -65536},
+    {"read_heavy", "mmap_size", NULL, 1099511627776LL},
+    {"read_heavy", "temp_store", "memory", 0},
+    /* short read and write transactions */
+    {"oltp", "journal_mode", "wal", 0},
+    {"oltp", "synchronous", "normal", 0},
+    {"oltp", "cache_size", NULL, -16384},
+    {"oltp", "mmap_size", NULL, 268435456},
+    {"oltp", "temp_store", "memory", 0},
+    /* large writes of data that can be loaded again after a crash */
+    {"bulk_load", "journal_mode", "wal", 0},
+    {"bulk_load", "synchronous", "off", 0},
+    {"bulk_load", "cache_size", NULL, -262144},
+    {"bulk_load", "temp_store", "memory", 0},
+    {"bulk_load", "wal_autocheckpoint", NULL, 10000},
+    {NULL}
+};
+
+/* Checks that a pragma name is an identifier, optionally qualified with a schema */
+static int _pysqlite_pragma_name_ok(const char* name)
+{
+    const char* c;
+    int dots = 0;
+
+    if (!*name || *name == '.') {
+        return 0;
+    }
+    for (c = name; *c; c++) {
+        if (*c == '.') {
+            if (++dots > 1 || !c[1]) {
+                return 0;
+            }
+        } else if (!(Py_ISALNUM(*c) || *c == '_')) {
+            return 0;
+        }
+    }
+    return 1;
+}
+
+/* Checks that SQLite knows a pragma; -1 => error; 0 => unknown; 1 => known */
+static int _pysqlite_pragma_known(pysqlite_Connection* self, const char* name)
+{
+    sqlite3_stmt* statement = NULL;
+    const char* dot;
+    int rc;
+
+    dot = strchr(name, '.');
+    if (dot) {
+        name = dot + 1;
+    }
+    rc = sqlite3_prepare_v2(self->db, "SELECT 1 FROM pragma_pragma_list WHERE name = ?", -1, &statement, NULL);
+    if (rc == SQLITE_OK) {
+        rc = sqlite3_bind_text(statement, 1, name, -1, SQLITE_STATIC);
+    }
+    if (rc == SQLITE_OK) {
+        rc = sqlite3_step(statement);
+    }
+    if (rc != SQLITE_ROW && rc != SQLITE_DONE) {
+        _pysqlite_seterror(self->db);
+        sqlite3_finalize(statement);
+        return -1;
+    }
+    sqlite3_finalize(statement);
+    return rc == SQLITE_ROW;
+}
+
+/* Formats the value of a pragma as SQL, in memory from sqlite3_malloc() */
+static char* _pysqlite_pragma_value(PyObject* value)
+{
+    const char* text;
+    long long number;
+    char* sql;
+
+    if (PyLong_Check(value)) {
+        number = PyLong_AsLongLong(value);
+        if (number == -1 && PyErr_Occurred()) {
+            return NULL;
+        }
+        sql = sqlite3_mprintf("%lld", number);
+    } else if (PyFloat_Check(value)) {
+        sql = sqlite3_mprintf("%!.15g", PyFloat_AS_DOUBLE(value));
+    } else if (PyUnicode_Check(value)) {
+        text = PyUnicode_AsUTF8(value);
+        if (!text) {
+            return NULL;
+        }
+        sql = sqlite3_mprintf("%Q", text);
+    } else {
+        PyErr_Format(PyExc_TypeError, "pragma values must be int, float or str, not %.200s",
+                     Py_TYPE(value)->tp_name);
+        return NULL;
+    }
+    if (!sql) {
+        PyErr_NoMemory();
+    }
+    return sql;
+}
+
+/*
+ * Runs a pragma and returns its first value, or NULL without an exception
+ * set if it returns no rows.
+ */
+static PyObject* _pysqlite_run_pragma(pysqlite_Connection* self, const char* sql)
+{
+    sqlite3_stmt* statement = NULL;
+    PyObject* value = NULL;
+    int rc;
+
+    if (!sql) {
+        return PyErr_NoMemory();
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+    rc = sqlite3_prepare_v2(self->db, sql, -1, &statement, NULL);
+    if (rc == SQLITE_OK) {
+        rc = sqlite3_step(statement);
+    }
+    Py_END_ALLOW_THREADS
+
+    if (rc == SQLITE_ROW) {
+        switch (sqlite3_column_type(statement, 0)) {
+            case SQLITE_INTEGER:
+                value = PyLong_FromLongLong(sqlite3_column_int64(statement, 0));
+                break;
+            case SQLITE_FLOAT:
+                value = PyFloat_FromDouble(sqlite3_column_double(statement, 0));
+                break;
+            case SQLITE_NULL:
+                Py_INCREF(Py_None);
+                value = Py_None;
+                break;
+            default:
+                value = PyUnicode_FromString((const char*)sqlite3_column_text(statement, 0));
+        }
+    } else if (rc != SQLITE_DONE) {
+        _pysqlite_seterror(self->db);
+    }
+    sqlite3_finalize(statement);
+    return value;
+}
+
+/*
+ * Pragmas whose value is checked once it is set, with the names their
+ * values may be given by. Others can legitimately read back a different
+ * value, like mmap_size, which SQLite caps at SQLITE_MAX_MMAP_SIZE and
+ * does not report for in-memory databases.
+ */
+typedef struct {
+    const char* name;
+    int value;
+} _pysqlite_ValueName;
+
+static const _pysqlite_ValueName synchronous_values[] = {
+    {"off", 0}, {"no", 0}, {"false", 0}, {"normal", 1}, {"on", 1}, {"yes", 1},
+    {"true", 1}, {"full", 2}, {"extra", 3}, {NULL}
+};
+static const _pysqlite_ValueName temp_store_values[] = {
+    {"default", 0}, {"file", 1}, {"memory", 2}, {NULL}
+};
+static const _pysqlite_ValueName boolean_values[] = {
+    {"off", 0}, {"no", 0}, {"false", 0}, {"on", 1}, {"yes", 1}, {"true", 1}, {NULL}
+};
+
+static const struct {
+    const char* name;
+    int text;                               /* compared as text, case-insensitively */
+    const _pysqlite_ValueName* values;      /* names SQLite accepts for values */
+} checked_pragmas[] = {
+    {"journal_mode", 1, NULL},
+    {"locking_mode", 1, NULL},
+    {"synchronous", 0, synchronous_values},
+    {"temp_store", 0, temp_store_values},
+    {"foreign_keys", 0, boolean_values},
+    {"cache_size", 0, NULL},
+    {"busy_timeout", 0, NULL},
+    {"wal_autocheckpoint", 0, NULL},
+    {NULL}
+};
+
+/*
+ * Checks the value read back for a pragma against the requested one.
+ * journal_mode is not checked for databases without a file, which can
+ * only use "memory" or "off".
+ *
+ * -1 => error; 0 => ok
+ */
+static int _pysqlite_check_setting(pysqlite_Connection* self, const char* name,
+                                   PyObject* requested, PyObject* actual)
+{
+    const char* dot = strchr(name, '.');
+    const char* pragma = dot ? dot + 1 : name;
+    const char* filename;
+    const char* text = NULL;
+    char schema[64];
+    long long number;
+    char* end;
+    int i, j;
+
+    for (i = 0; checked_pragmas[i].name; i++) {
+        if (strcmp(checked_pragmas[i].name, pragma) == 0) {
+            break;
+        }
+    }
+    if (!checked_pragmas[i].name) {
+        return 0;
+    }
+
+    if (PyUnicode_Check(requested)) {
+        text = PyUnicode_AsUTF8(requested);
+        if (!text) {
+            return -1;
+        }
+    }
+
+    if (checked_pragmas[i].text) {
+        if (strcmp(pragma, "journal_mode") == 0) {
+            PyOS_snprintf(schema, sizeof(schema), "%.*s", dot ? (int)(dot - name) : 4,
+                          dot ? name : "main");
+            filename = sqlite3_db_filename(self->db, schema);
+            if (!filename || !*filename) {
+                return 0;
+            }
+        }
+        if (text && PyUnicode_Check(actual) &&
+            sqlite3_stricmp(text, PyUnicode_AsUTF8(actual)) == 0) {
+            return 0;
+        }
+    } else if (PyLong_Check(actual)) {
+        if (text) {
+            number = -1;
+            for (j = 0; checked_pragmas[i].values && checked_pragmas[i].values[j].name; j++) {
+                if (sqlite3_stricmp(checked_pragmas[i].values[j].name, text) == 0) {
+                    number = checked_pragmas[i].values[j].value;
+                    break;
+                }
+            }
+            if (!checked_pragmas[i].values || !checked_pragmas[i].values[j].name) {
+                number = strtoll(text, &end, 10);
+                if (end == text || *end) {
+                    /* SQLite silently uses a default for unknown names */
+                    goto mismatch;
+                }
+            }
+        } else if (PyLong_Check(requested)) {
+            number = PyLong_AsLongLong(requested);
+            if (number == -1 && PyErr_Occurred()) {
+                return -1;
+            }
+        } else {
+            return 0;
+        }
+        if (number == PyLong_AsLongLong(actual)) {
+            return 0;
+        }
+    }
+
+mismatch:
+    PyErr_Format(pysqlite_OperationalError, "pragma %s is %R after setting it to %R",
+                 name, actual, requested);
+    return -1;
+}
+
+/*
+ * Applies the settings of a profile and the pragmas given to connect(),
+ * which override the profile, and reads every setting back into
+ * Connection.settings, with None for those that return nothing, like
+ * mmap_size for in-memory databases. Unknown pragmas, and checked
+ * pragmas that don't take the requested value, are an error.
+ *
+ * -1 => error; 0 => ok
+ */
+static int _pysqlite_apply_settings(pysqlite_Connection* self, const char* profile, PyObject* pragmas)
 {
+    PyObject* requested;
+    PyObject* settings = NULL;
+    PyObject* items = NULL;
+    PyObject* name;
+    PyObject* value;
+    PyObject* actual;
+    Py_ssize_t pos;
+    const char* name_str;
+    char* value_sql;
+    char* sql;
     int i;
-    PyObject* weakref;
-    PyObject* statement;
-    pysqlite_Cursor* cursor;
+    int rc;
+    int found = 0;
+    int ok = 0;
+
+    requested = PyDict_New();
+    if (!requested) {
+        return -1;
+    }
 
-    for (i = 0; i < PyList_Size(self->statements); i++) {
-        weakref = PyList_GetItem(self->statements, i);
-        if (PyWeakref_GetRef(weakref, &statement) == 1) {
-            if (action == ACTION_RESET) {
-                (void)pysqlite_statement_reset((pysqlite_Statement*)statement);
+    if (profile) {
+        for (i = 0; profile_settings[i].profile; i++) {
+            if (strcmp(profile_settings[i].profile, profile) != 0) {
+                continue;
+            }
+            found = 1;
+            if (profile_settings[i].text) {
+                value = PyUnicode_FromString(profile_settings[i].text);
             } else {
-                (void)pysqlite_statement_finalize((pysqlite_Statement*)statement);
+                value = PyLong_FromLongLong(profile_settings[i].number);
             }
-            Py_DECREF(statement);
+            if (!value || PyDict_SetItemString(requested, profile_settings[i].name, value) != 0) {
+                Py_XDECREF(value);
+                goto finally;
+            }
+            Py_DECREF(value);
+        }
+        if (!found) {
+            PyErr_Format(PyExc_ValueError,
+                         "unknown profile '%s', expected 'read_heavy', 'oltp' or 'bulk_load'", profile);
+            goto finally;
         }
     }
 
-    if (reset_cursors) {
-        for (i = 0; i < PyList_Size(self->cursors); i++) {
-            weakref = PyList_GetItem(self->cursors, i);
-            if (PyWeakref_GetRef(weakref, (PyObject**)&cursor) == 1) {
-                cursor->reset = 1;
-                Py_DECREF(cursor);
+    if (pragmas != Py_None) {
+        items = PyMapping_Items(pragmas);
+        if (!items) {
+            goto finally;
+        }
+        for (pos = 0; pos < PyList_GET_SIZE(items); pos++) {
+            if (!PyArg_ParseTuple(PyList_GET_ITEM(items, pos), "UO;pragma names must be str", &name, &value)) {
+                goto finally;
+            }
+            name = PyObject_CallMethod(name, "lower", NULL);
+            if (!name || PyDict_SetItem(requested, name, value) != 0) {
+                Py_XDECREF(name);
+                goto finally;
+            }
+            Py_DECREF(name);
+        }
+    }
+
+    settings = PyDict_New();
+    if (!settings) {
+        goto finally;
+    }
+
+    pos = 0;
+    while (PyDict_Next(requested, &pos, &name, &value)) {
+        name_str = PyUnicode_AsUTF8(name);
+        if (!name_str) {
+            goto finally;
+        }
+        if (!_pysqlite_pragma_name_ok(name_str)) {
+            PyErr_Format(PyExc_ValueError, "invalid pragma name '%s'", name_str);
+            goto finally;
+        }
+        rc = _pysqlite_pragma_known(self, name_str);
+        if (rc <= 0) {
+            if (rc == 0) {
+                PyErr_Format(pysqlite_OperationalError, "unknown pragma '%s'", name_str);
+            }
+            goto finally;
+        }
+        value_sql = _pysqlite_pragma_value(value);
+        if (!value_sql) {
+            goto finally;
+        }
+
+        sql = sqlite3_mprintf("PRAGMA %s = %s", name_str, value_sql);
+        sqlite3_free(value_sql);
+        actual = _pysqlite_run_pragma(self, sql);
+        sqlite3_free(sql);
+        Py_XDECREF(actual);
+        if (PyErr_Occurred()) {
+            goto finally;
+        }
+
+        sql = sqlite3_mprintf("PRAGMA %s", name_str);
+        actual = _pysqlite_run_pragma(self, sql);
+        sqlite3_free(sql);
+        if (!actual) {
+            if (PyErr_Occurred()) {
+                goto finally;
             }
+            Py_INCREF(Py_None);
+            actual = Py_None;
+        }
+        if (_pysqlite_check_setting(self, name_str, value, actual) < 0) {
+            Py_DECREF(actual);
+            goto finally;
+        }
+        if (PyDict_SetItem(settings, name, actual) != 0) {
+            Py_DECREF(actual);
+            goto finally;
+        }
+        Py_DECREF(actual);
+    }
+
+    Py_INCREF(settings);
+    Py_XSETREF(self->settings, settings);
+    ok = 1;
+
+finally:
+    Py_DECREF(requested);
+    Py_XDECREF(settings);
+    Py_XDECREF(items);
+    return ok ? 0 : -1;
+}
+
+/*
+ * Converts the extensions argument of the connection to a bitmask:
+ * None selects extensions according to the environment variables,
+ * an int is used as a bitmask, any other iterable must contain
+ * extension names.
+ *
+ * -1 => error; 0 => ok
+ */
+static int _pysqlite_extensions_mask(PyObject* extensions, int* mask)
+{
+    PyObject* iterator;
+    PyObject* item;
+    const char* name;
+    int flag;
+    long value;
+
+    if (extensions == Py_None) {
+        *mask = SQLEAN_EXT_FROM_ENV;
+        return 0;
+    }
+
+    if (PyLong_Check(extensions)) {
+        value = PyLong_AsLong(extensions);
+        if (value == -1 && PyErr_Occurred()) {
+            return -1;
+        }
+        if (value < 0 || value > SQLEAN_EXT_ALL) {
+            PyErr_SetString(PyExc_ValueError, "invalid extensions bitmask");
+            return -1;
+        }
+        *mask = (int)value;
+        return 0;
+    }
+
+    if (PyUnicode_Check(extensions)) {
+        PyErr_SetString(PyExc_TypeError,
+                        "extensions must be an int or an iterable of names, not str");
+        return -1;
+    }
+
+    iterator = PyObject_GetIter(extensions);
+    if (!iterator) {
+        return -1;
+    }
+
+    *mask = 0;
+    while ((item = PyIter_Next(iterator))) {
+        if (!PyUnicode_Check(item)) {
+            PyErr_Format(PyExc_TypeError,
+                         "extension name must be a string, not %.100s",
+                         Py_TYPE(item)->tp_name);
+            Py_DECREF(item);
+            break;
+        }
+        name = PyUnicode_AsUTF8(item);
+        if (!name) {
+            Py_DECREF(item);
+            break;
+        }
+        flag = sqlean_extension_flag(name);
+        if (!flag) {
+            PyErr_Format(PyExc_ValueError, "unknown extension: %s", name);
+            Py_DECREF(item);
+            break;
+        }
+        *mask |= flag;
+        Py_DECREF(item);
+    }
+    Py_DECREF(iterator);
+
+    return PyErr_Occurred() ? -1 : 0;
+}
+
+/*
+ * Unlinks the objects that are still in a list of the connection, when the
+ * connection goes away before them.
+ */
+static void _pysqlite_detach_all(pysqlite_Link* head)
+{
+    if (!head->next) {
+        return;
+    }
+    while (head->next != head) {
+        pysqlite_link_remove(head->next);
+    }
+    head->prev = NULL;
+    head->next = NULL;
+}
+
+/* action in (ACTION_RESET, ACTION_FINALIZE) */
+void pysqlite_do_all_statements(pysqlite_Connection* self, int action, int reset_cursors)
+{
+    pysqlite_Link* head = &self->statements;
+    pysqlite_Link* link;
+    pysqlite_Link* next;
+    pysqlite_Statement* statement;
+
+    if (!head->next) {
+        return;
+    }
+
+    /* Resetting a statement releases the GIL, so other threads may drop
+     * statements meanwhile. The current and the next statement are kept
+     * alive while the links between them are used. */
+    link = head->next;
+    if (link != head) {
+        Py_INCREF(PYSQLITE_LINK_OWNER(link, pysqlite_Statement, link));
+    }
+    while (link != head) {
+        statement = PYSQLITE_LINK_OWNER(link, pysqlite_Statement, link);
+        if (action == ACTION_RESET) {
+            (void)pysqlite_statement_reset(statement);
+        } else {
+            (void)pysqlite_statement_finalize(statement);
+        }
+        next = link->next;
+        if (next != head) {
+            Py_INCREF(PYSQLITE_LINK_OWNER(next, pysqlite_Statement, link));
+        }
+        Py_DECREF(statement);
+        link = next;
+    }
+
+    if (reset_cursors) {
+        for (link = self->cursors.next; link != &self->cursors; link = link->next) {
+            PYSQLITE_LINK_OWNER(link, pysqlite_Cursor, link)->reset = 1;
         }
     }
 }
 
 void pysqlite_connection_dealloc(pysqlite_Connection* self)
 {
+    if (self->query_cursor) {
+        ((pysqlite_Cursor*)self->query_cursor)->connection = NULL;
+        Py_CLEAR(self->query_cursor);
+    }
     Py_XDECREF(self->statement_cache);
 
     /* Clean up if user has not called .close() explicitly. */
+    _pysqlite_finalize_transaction_statements(self);
+    pysqlite_result_cache_free(self->result_cache);
+    self->result_cache = NULL;
     if (self->db) {
         sqlite3_close_v2(self->db);
     }
@@ -269,40 +861,29 @@ void pysqlite_connection_dealloc(pysqlite_Connection* self)
     Py_XDECREF(self->function_pinboard_progress_handler);
     Py_XDECREF(self->function_pinboard_authorizer_cb);
     Py_XDECREF(self->function_pinboard_busy_handler_cb);
+    Py_XDECREF(self->function_pinboard_wal_hook);
+    Py_XDECREF(self->function_pinboard_update_hook);
+    Py_XDECREF(self->function_pinboard_commit_hook);
+    Py_XDECREF(self->function_pinboard_rollback_hook);
+    Py_XDECREF(self->changes_callback);
+    pysqlite_changes_free(&self->changes);
     Py_XDECREF(self->row_factory);
     Py_XDECREF(self->text_factory);
     Py_XDECREF(self->collations);
-    Py_XDECREF(self->statements);
-    Py_XDECREF(self->cursors);
+    Py_XDECREF(self->settings);
+    _pysqlite_detach_all(&self->statements);
+    _pysqlite_detach_all(&self->cursors);
     Py_XDECREF(self->blobs);
+    Py_XDECREF(self->sessions);
+    Py_XDECREF(self->deserialized);
 
     Py_TYPE(self)->tp_free((PyObject*)self);
 }
 
-/*
- * Registers a cursor with the connection.
- *
- * 0 => error; 1 => ok
- */
-int pysqlite_connection_register_cursor(pysqlite_Connection* connection, PyObject* cursor)
+/* Registers a cursor with the connection, so that rollbacks can reset it */
+void pysqlite_connection_register_cursor(pysqlite_Connection* connection, PyObject* cursor)
 {
-    PyObject* weakref;
-
-    weakref = PyWeakref_NewRef((PyObject*)cursor, NULL);
-    if (!weakref) {
-        goto error;
-    }
-
-    if (PyList_Append(connection->cursors, weakref) != 0) {
-        Py_CLEAR(weakref);
-        goto error;
-    }
-
-    Py_DECREF(weakref);
-
-    return 1;
-error:
-    return 0;
+    pysqlite_link_insert(&connection->cursors, &((pysqlite_Cursor*)cursor)->link);
 }
 
 PyObject* pysqlite_connection_cursor(pysqlite_Connection* self, PyObject* args, PyObject* kwargs)
@@ -335,8 +916,6 @@ PyObject* pysqlite_connection_cursor(pysqlite_Connection* self, PyObject* args,
         return NULL;
     }
 
-    _pysqlite_drop_unused_cursor_references(self);
-
     if (cursor && self->row_factory != Py_None) {
         Py_INCREF(self->row_factory);
         Py_XSETREF(((pysqlite_Cursor *)cursor)->row_factory, self->row_factory);
@@ -423,6 +1002,24 @@ static void pysqlite_close_all_blobs(pysqlite_Connection *self)
     }
 }
 
+#ifdef HAVE_SESSION
+static void pysqlite_close_all_sessions(pysqlite_Connection *self)
+{
+    int i;
+    PyObject *weakref;
+    PyObject *session;
+
+    /* sessions must be deleted before the database is closed */
+    for (i = 0; i < PyList_GET_SIZE(self->sessions); i++) {
+        weakref = PyList_GET_ITEM(self->sessions, i);
+        if (PyWeakref_GetRef(weakref, &session) == 1) {
+            Py_XDECREF(pysqlite_session_close((pysqlite_Session*)session, NULL));
+            Py_DECREF(session);
+        }
+    }
+}
+#endif
+
 PyObject* pysqlite_connection_close(pysqlite_Connection* self, PyObject* args)
 {
     int rc;
@@ -434,6 +1031,12 @@ PyObject* pysqlite_connection_close(pysqlite_Connection* self, PyObject* args)
     pysqlite_do_all_statements(self, ACTION_FINALIZE, 1);
 
     pysqlite_close_all_blobs(self);
+#ifdef HAVE_SESSION
+    pysqlite_close_all_sessions(self);
+#endif
+    _pysqlite_finalize_transaction_statements(self);
+    pysqlite_result_cache_free(self->result_cache);
+    self->result_cache = NULL;
 
     if (self->db) {
         rc = sqlite3_close_v2(self->db);
@@ -443,6 +1046,7 @@ PyObject* pysqlite_connection_close(pysqlite_Connection* self, PyObject* args)
             return NULL;
         } else {
             self->db = NULL;
+            Py_CLEAR(self->deserialized);
         }
     }
 
@@ -469,87 +1073,124 @@ int pysqlite_check_connection(pysqlite_Connection* con)
     }
 }
 
-PyObject* _pysqlite_connection_begin(pysqlite_Connection* self)
+static void _pysqlite_finalize_statement_array(sqlite3_stmt** statements, int count)
 {
-    int rc;
-    sqlite3_stmt* statement;
-
-    Py_BEGIN_ALLOW_THREADS
-    rc = sqlite3_prepare_v2(self->db, self->begin_statement, -1, &statement, NULL);
-    Py_END_ALLOW_THREADS
+    int i;
 
-    if (rc != SQLITE_OK) {
-        _pysqlite_seterror(self->db);
-        goto error;
+    for (i = 0; i < count; i++) {
+        if (statements[i]) {
+            Py_BEGIN_ALLOW_THREADS
+            sqlite3_finalize(statements[i]);
+            Py_END_ALLOW_THREADS
+            statements[i] = NULL;
+        }
+    }
+}
+
+static void _pysqlite_finalize_transaction_statements(pysqlite_Connection* self)
+{
+    _pysqlite_finalize_statement_array(self->transaction_statements, PYSQLITE_TRANSACTION_STATEMENTS);
+    _pysqlite_finalize_statement_array(&self->savepoint_statements[0][0],
+                                       PYSQLITE_SAVEPOINT_LEVELS * PYSQLITE_SAVEPOINT_STATEMENTS);
+    self->savepoint_level = 0;
+}
+
+/*
+ * Returns 1 if stepping a statement of the connection may call Python: a
+ * Python function, collation or callback is registered. A thread stepping
+ * without the GIL while holding the database mutex, like the one of
+ * Cursor.prefetch(), would deadlock with the thread holding the GIL.
+ */
+int pysqlite_connection_calls_python(pysqlite_Connection* self)
+{
+    return self->python_functions ||
+           (self->collations && PyDict_GET_SIZE(self->collations) > 0) ||
+           self->function_pinboard_trace_callback ||
+           self->function_pinboard_progress_handler ||
+           self->function_pinboard_authorizer_cb ||
+           self->function_pinboard_busy_handler_cb ||
+           self->function_pinboard_wal_hook ||
+           self->function_pinboard_update_hook ||
+           self->function_pinboard_commit_hook ||
+           self->function_pinboard_rollback_hook;
+}
+
+/*
+ * Runs a statement that controls transactions. If statement is not NULL,
+ * it keeps the prepared statement: it is prepared the first time and reset
+ * after every run, so a transaction doesn't pay for parsing it. Otherwise
+ * the statement is prepared and finalized here.
+ *
+ * 0 => error; 1 => ok
+ */
+int pysqlite_connection_run_statement(pysqlite_Connection* self, sqlite3_stmt** statement, const char* sql)
+{
+    sqlite3_stmt* st = statement ? *statement : NULL;
+    int rc;
+
+    if (!st) {
+        Py_BEGIN_ALLOW_THREADS
+        rc = sqlite3_prepare_v2(self->db, sql, -1, &st, NULL);
+        Py_END_ALLOW_THREADS
+        if (rc != SQLITE_OK) {
+            _pysqlite_seterror(self->db);
+            return 0;
+        }
+        if (statement) {
+            *statement = st;
+        }
     }
 
-    rc = pysqlite_step(statement, self);
+    rc = pysqlite_step(st, self);
     if (rc != SQLITE_DONE) {
         _pysqlite_seterror(self->db);
     }
 
     Py_BEGIN_ALLOW_THREADS
-    rc = sqlite3_finalize(statement);
+    if (statement) {
+        sqlite3_reset(st);
+    } else {
+        sqlite3_finalize(st);
+    }
     Py_END_ALLOW_THREADS
 
-    if (rc != SQLITE_OK && !PyErr_Occurred()) {
-        _pysqlite_seterror(self->db);
+    pysqlite_connection_deliver_changes(self);
+    return rc == SQLITE_DONE;
+}
+
+PyObject* _pysqlite_connection_begin(pysqlite_Connection* self)
+{
+    int i;
+
+    for (i = 0; begin_statements[i] != self->begin_statement; i++) {
+        assert(begin_statements[i] != NULL);
     }
 
-error:
-    if (PyErr_Occurred()) {
+    if (!pysqlite_connection_run_statement(self, &self->transaction_statements[PYSQLITE_TRANSACTION_BEGIN + i],
+                                           self->begin_statement)) {
         return NULL;
-    } else {
-        Py_RETURN_NONE;
     }
+    Py_RETURN_NONE;
 }
 
 PyObject* pysqlite_connection_commit(pysqlite_Connection* self, PyObject* args)
 {
-    int rc;
-    sqlite3_stmt* statement;
-
     if (!pysqlite_check_thread(self) || !pysqlite_check_connection(self)) {
         return NULL;
     }
 
     if (!sqlite3_get_autocommit(self->db)) {
-
-        Py_BEGIN_ALLOW_THREADS
-        rc = sqlite3_prepare_v2(self->db, "COMMIT", -1, &statement, NULL);
-        Py_END_ALLOW_THREADS
-        if (rc != SQLITE_OK) {
-            _pysqlite_seterror(self->db);
-            goto error;
-        }
-
-        rc = pysqlite_step(statement, self);
-        if (rc != SQLITE_DONE) {
-            _pysqlite_seterror(self->db);
-        }
-
-        Py_BEGIN_ALLOW_THREADS
-        rc = sqlite3_finalize(statement);
-        Py_END_ALLOW_THREADS
-        if (rc != SQLITE_OK && !PyErr_Occurred()) {
-            _pysqlite_seterror(self->db);
+        if (!pysqlite_connection_run_statement(self, &self->transaction_statements[PYSQLITE_TRANSACTION_COMMIT],
+                                               "COMMIT")) {
+            return NULL;
         }
-
     }
 
-error:
-    if (PyErr_Occurred()) {
-        return NULL;
-    } else {
-        Py_RETURN_NONE;
-    }
+    Py_RETURN_NONE;
 }
 
 PyObject* pysqlite_connection_rollback(pysqlite_Connection* self, PyObject* args)
 {
-    int rc;
-    sqlite3_stmt* statement;
-
     if (!pysqlite_check_thread(self) || !pysqlite_check_connection(self)) {
         return NULL;
     }
@@ -557,34 +1198,13 @@ PyObject* pysqlite_connection_rollback(pysqlite_Connection* self, PyObject* args
     if (!sqlite3_get_autocommit(self->db)) {
         pysqlite_do_all_statements(self, ACTION_RESET, 1);
 
-        Py_BEGIN_ALLOW_THREADS
-        rc = sqlite3_prepare_v2(self->db, "ROLLBACK", -1, &statement, NULL);
-        Py_END_ALLOW_THREADS
-        if (rc != SQLITE_OK) {
-            _pysqlite_seterror(self->db);
-            goto error;
-        }
-
-        rc = pysqlite_step(statement, self);
-        if (rc != SQLITE_DONE) {
-            _pysqlite_seterror(self->db);
-        }
-
-        Py_BEGIN_ALLOW_THREADS
-        rc = sqlite3_finalize(statement);
-        Py_END_ALLOW_THREADS
-        if (rc != SQLITE_OK && !PyErr_Occurred()) {
-            _pysqlite_seterror(self->db);
+        if (!pysqlite_connection_run_statement(self, &self->transaction_statements[PYSQLITE_TRANSACTION_ROLLBACK],
+                                               "ROLLBACK")) {
+            return NULL;
         }
-
     }
 
-error:
-    if (PyErr_Occurred()) {
-        return NULL;
-    } else {
-        Py_RETURN_NONE;
-    }
+    Py_RETURN_NONE;
 }
 
 static int
@@ -936,72 +1556,6 @@ error:
 
 #endif
 
-static void _pysqlite_drop_unused_statement_references(pysqlite_Connection* self)
-{
-    PyObject* new_list;
-    PyObject* weakref;
-    PyObject* ref;
-    int i;
-
-    /* we only need to do this once in a while */
-    if (self->created_statements++ < 200) {
-        return;
-    }
-
-    self->created_statements = 0;
-
-    new_list = PyList_New(0);
-    if (!new_list) {
-        return;
-    }
-
-    for (i = 0; i < PyList_Size(self->statements); i++) {
-        weakref = PyList_GetItem(self->statements, i);
-        if (PyWeakref_GetRef(weakref, &ref) == 1) {
-            Py_DECREF(ref);
-            if (PyList_Append(new_list, weakref) != 0) {
-                Py_DECREF(new_list);
-                return;
-            }
-        }
-    }
-
-    Py_SETREF(self->statements, new_list);
-}
-
-static void _pysqlite_drop_unused_cursor_references(pysqlite_Connection* self)
-{
-    PyObject* new_list;
-    PyObject* weakref;
-    PyObject* ref;
-    int i;
-
-    /* we only need to do this once in a while */
-    if (self->created_cursors++ < 200) {
-        return;
-    }
-
-    self->created_cursors = 0;
-
-    new_list = PyList_New(0);
-    if (!new_list) {
-        return;
-    }
-
-    for (i = 0; i < PyList_Size(self->cursors); i++) {
-        weakref = PyList_GetItem(self->cursors, i);
-        if (PyWeakref_GetRef(weakref, &ref) == 1) {
-            Py_DECREF(ref);
-            if (PyList_Append(new_list, weakref) != 0) {
-                Py_DECREF(new_list);
-                return;
-            }
-        }
-    }
-
-    Py_SETREF(self->cursors, new_list);
-}
-
 static void _destructor(void* args)
 {
     Py_DECREF((PyObject *)args);
@@ -1059,6 +1613,7 @@ PyObject* pysqlite_connection_create_function(pysqlite_Connection* self, PyObjec
         PyErr_SetString(pysqlite_OperationalError, "Error creating function");
         return NULL;
     }
+    self->python_functions = 1;
     Py_RETURN_NONE;
 }
 
@@ -1096,6 +1651,7 @@ PyObject* pysqlite_connection_create_aggregate(pysqlite_Connection* self, PyObje
         PyErr_SetString(pysqlite_OperationalError, "Error creating aggregate");
         return NULL;
     }
+    self->python_functions = 1;
     Py_RETURN_NONE;
 }
 
@@ -1137,20 +1693,31 @@ PyObject* pysqlite_connection_create_window_function(pysqlite_Connection* self,
         PyErr_SetString(pysqlite_OperationalError, "Error creating window function");
         return NULL;
     }
+    self->python_functions = 1;
     Py_RETURN_NONE;
 }
 #endif
 
 
+/*
+ * Calls the authorizer set with set_authorizer(), if any. While changes()
+ * is on, DELETE is also answered with SQLITE_IGNORE, which only turns off
+ * the truncate optimization, so the update hook sees every deleted row.
+ */
 static int _authorizer_callback(void* user_arg, int action, const char* arg1, const char* arg2 , const char* dbname, const char* access_attempt_source)
 {
+    pysqlite_Connection* self = (pysqlite_Connection*)user_arg;
     PyObject *ret;
     int rc;
     PyGILState_STATE gilstate;
 
+    if (!self->function_pinboard_authorizer_cb) {
+        return action == SQLITE_DELETE ? SQLITE_IGNORE : SQLITE_OK;
+    }
+
     gilstate = PyGILState_Ensure();
 
-    ret = PyObject_CallFunction((PyObject*)user_arg, "issss", action, arg1, arg2, dbname, access_attempt_source);
+    ret = PyObject_CallFunction(self->function_pinboard_authorizer_cb, "issss", action, arg1, arg2, dbname, access_attempt_source);
 
     if (ret == NULL) {
         if (_pysqlite_enable_callback_tracebacks)
@@ -1178,17 +1745,49 @@ static int _authorizer_callback(void* user_arg, int action, const char* arg1, co
     }
 
     PyGILState_Release(gilstate);
+    if (rc == SQLITE_OK && action == SQLITE_DELETE && self->changes_callback) {
+        rc = SQLITE_IGNORE;
+    }
     return rc;
 }
 
+/* Installs the native authorizer if it has something to do */
+static int _pysqlite_install_authorizer(pysqlite_Connection* self)
+{
+    int on = self->function_pinboard_authorizer_cb || self->changes_callback;
+
+    return sqlite3_set_authorizer(self->db, on ? _authorizer_callback : NULL, self);
+}
+
+/*
+ * Checks the deadline of the query being stepped without taking the GIL,
+ * then calls the handler set with set_progress_handler(), if any.
+ */
 static int _progress_handler(void* user_arg)
 {
+    pysqlite_Connection* self = (pysqlite_Connection*)user_arg;
     int rc;
     PyObject *ret;
     PyGILState_STATE gilstate;
 
+    if (self->deadline > 0.0 && pysqlite_monotonic() >= self->deadline) {
+        self->deadline_expired = 1;
+        return 1;
+    }
+    if (self->progress_handler_n <= 0) {
+        return 0;
+    }
+    if (++self->progress_handler_calls < self->progress_handler_every) {
+        return 0;
+    }
+    self->progress_handler_calls = 0;
+
     gilstate = PyGILState_Ensure();
-    ret = PyObject_CallObject((PyObject*)user_arg, NULL);
+    if (!self->function_pinboard_progress_handler) {
+        PyGILState_Release(gilstate);
+        return 0;
+    }
+    ret = PyObject_CallObject(self->function_pinboard_progress_handler, NULL);
 
     if (!ret) {
         if (_pysqlite_enable_callback_tracebacks) {
@@ -1238,6 +1837,55 @@ static int _busy_handler(void* user_arg, int n)
     return rc;
 }
 
+/*
+ * Busy handler of set_busy_backoff(). It sleeps between tries for a delay
+ * that doubles up to max_delay, with a random part cut off so that waiting
+ * connections don't retry in lockstep. It runs without the GIL; SQLite holds
+ * the mutex of the connection while it runs.
+ */
+static int _busy_backoff_handler(void* user_arg, int n)
+{
+    pysqlite_BusyBackoff* backoff = (pysqlite_BusyBackoff*)user_arg;
+    double now = pysqlite_monotonic();
+    double waited;
+    double delay;
+    unsigned int random;
+
+    if (n == 0) {
+        backoff->wait_start = now;
+        backoff->events++;
+    }
+    waited = now - backoff->wait_start;
+    if (waited > backoff->max_wait) {
+        backoff->max_wait = waited;
+    }
+    if (waited >= backoff->timeout) {
+        backoff->timeouts++;
+        return 0;
+    }
+
+    delay = backoff->initial_delay * ldexp(1.0, n < 30 ? n : 30);
+    if (delay > backoff->max_delay) {
+        delay = backoff->max_delay;
+    }
+    if (backoff->jitter > 0.0) {
+        sqlite3_randomness(sizeof(random), &random);
+        delay *= 1.0 - backoff->jitter * ((double)random / 4294967296.0);
+    }
+    if (delay > backoff->timeout - waited) {
+        delay = backoff->timeout - waited;
+    }
+
+    pysqlite_sleep(delay);
+    now = pysqlite_monotonic();
+    backoff->retries++;
+    backoff->wait_time += now - backoff->wait_start - waited;
+    if (now - backoff->wait_start > backoff->max_wait) {
+        backoff->max_wait = now - backoff->wait_start;
+    }
+    return 1;
+}
+
 #ifdef HAVE_TRACE_V2
 static int _trace_callback(unsigned int type, void *ctx, void *stmt, void *sql)
 {
@@ -1328,14 +1976,13 @@ static PyObject* pysqlite_connection_set_authorizer(pysqlite_Connection* self, P
 
     int rc;
     if (authorizer_cb == Py_None) {
-        rc = sqlite3_set_authorizer(self->db, NULL, NULL);
         Py_XSETREF(self->function_pinboard_authorizer_cb, NULL);
     }
     else {
         Py_INCREF(authorizer_cb);
         Py_XSETREF(self->function_pinboard_authorizer_cb, authorizer_cb);
-        rc = sqlite3_set_authorizer(self->db, _authorizer_callback, (void*)authorizer_cb);
     }
+    rc = _pysqlite_install_authorizer(self);
 
     if (rc != SQLITE_OK) {
         PyErr_SetString(pysqlite_OperationalError, "Error setting authorizer callback");
@@ -1345,6 +1992,41 @@ static PyObject* pysqlite_connection_set_authorizer(pysqlite_Connection* self, P
     Py_RETURN_NONE;
 }
 
+/*
+ * Installs the native progress handler if it has something to do. While
+ * query deadlines are checked, it runs at least every
+ * PYSQLITE_DEADLINE_INSTRUCTIONS instructions and calls the handler of
+ * set_progress_handler() every n instructions, rounded to that interval.
+ */
+static void _pysqlite_install_progress_handler(pysqlite_Connection* self)
+{
+    int n = self->progress_handler_n;
+
+    self->progress_handler_every = 1;
+    self->progress_handler_calls = 0;
+    if (self->check_deadlines) {
+        if (n <= 0 || n > PYSQLITE_DEADLINE_INSTRUCTIONS) {
+            if (n > 0) {
+                self->progress_handler_every = n / PYSQLITE_DEADLINE_INSTRUCTIONS;
+            }
+            n = PYSQLITE_DEADLINE_INSTRUCTIONS;
+        }
+    } else if (n <= 0) {
+        sqlite3_progress_handler(self->db, 0, 0, (void*)0);
+        return;
+    }
+    sqlite3_progress_handler(self->db, n, _progress_handler, self);
+}
+
+/* Makes the progress handler check query deadlines from now on */
+void pysqlite_connection_check_deadlines(pysqlite_Connection* self)
+{
+    if (!self->check_deadlines) {
+        self->check_deadlines = 1;
+        _pysqlite_install_progress_handler(self);
+    }
+}
+
 static PyObject* pysqlite_connection_set_progress_handler(pysqlite_Connection* self, PyObject* args, PyObject* kwargs)
 {
     PyObject* progress_handler;
@@ -1363,13 +2045,14 @@ static PyObject* pysqlite_connection_set_progress_handler(pysqlite_Connection* s
 
     if (progress_handler == Py_None) {
         /* None clears the progress handler previously set */
-        sqlite3_progress_handler(self->db, 0, 0, (void*)0);
         Py_XSETREF(self->function_pinboard_progress_handler, NULL);
+        self->progress_handler_n = 0;
     } else {
-        sqlite3_progress_handler(self->db, n, _progress_handler, progress_handler);
         Py_INCREF(progress_handler);
         Py_XSETREF(self->function_pinboard_progress_handler, progress_handler);
+        self->progress_handler_n = n;
     }
+    _pysqlite_install_progress_handler(self);
 
     Py_RETURN_NONE;
 }
@@ -1424,18 +2107,103 @@ static PyObject* pysqlite_connection_set_busy_timeout(pysqlite_Connection* self,
     }
 
     int rc;
-    rc = sqlite3_busy_timeout(self->db, (int)busy_timeout * 1000);
+    rc = sqlite3_busy_timeout(self->db, (int)(busy_timeout * 1000));
     if (rc != SQLITE_OK) {
         PyErr_SetString(pysqlite_OperationalError, "Error setting busy timeout");
         return NULL;
     }
     else {
-        Py_XDECREF(self->function_pinboard_busy_handler_cb);
+        Py_CLEAR(self->function_pinboard_busy_handler_cb);
+    }
+
+    Py_RETURN_NONE;
+}
+
+static PyObject* pysqlite_connection_set_busy_backoff(pysqlite_Connection* self, PyObject* args, PyObject* kwargs)
+{
+    pysqlite_BusyBackoff* backoff = &self->busy_backoff;
+    double timeout;
+    double initial_delay = 0.001;
+    double max_delay = 0.1;
+    double jitter = 0.5;
+    int rc;
+
+    static char *kwlist[] = { "timeout", "initial_delay", "max_delay", "jitter", NULL };
+
+    if (!pysqlite_check_thread(self) || !pysqlite_check_connection(self)) {
+        return NULL;
+    }
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "d|ddd:set_busy_backoff", kwlist,
+                                     &timeout, &initial_delay, &max_delay, &jitter)) {
+        return NULL;
+    }
+    if (!(timeout >= 0.0)) {
+        PyErr_SetString(PyExc_ValueError, "timeout must not be negative");
+        return NULL;
+    }
+    if (!(initial_delay > 0.0) || !(max_delay >= initial_delay)) {
+        PyErr_SetString(PyExc_ValueError,
+                        "initial_delay must be greater than zero and not greater than max_delay");
+        return NULL;
+    }
+    if (!(jitter >= 0.0 && jitter <= 1.0)) {
+        PyErr_SetString(PyExc_ValueError, "jitter must be between 0 and 1");
+        return NULL;
+    }
+
+    backoff->timeout = timeout;
+    backoff->initial_delay = initial_delay;
+    backoff->max_delay = max_delay;
+    backoff->jitter = jitter;
+    rc = sqlite3_busy_handler(self->db, _busy_backoff_handler, backoff);
+    if (rc != SQLITE_OK) {
+        PyErr_SetString(pysqlite_OperationalError, "Error setting busy handler");
+        return NULL;
     }
+    Py_CLEAR(self->function_pinboard_busy_handler_cb);
 
     Py_RETURN_NONE;
 }
 
+/*
+ * Returns the counters of the busy handler of set_busy_backoff(), and
+ * optionally resets them.
+ */
+static PyObject* pysqlite_connection_busy_stats(pysqlite_Connection* self, PyObject* args, PyObject* kwargs)
+{
+    pysqlite_BusyBackoff* backoff = &self->busy_backoff;
+    int reset = 0;
+    PyObject* stats;
+
+    static char *kwlist[] = { "reset", NULL };
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "|p:busy_stats", kwlist, &reset)) {
+        return NULL;
+    }
+    if (!pysqlite_check_connection(self)) {
+        return NULL;
+    }
+
+    /* the handler updates the counters while holding the mutex */
+    sqlite3_mutex_enter(sqlite3_db_mutex(self->db));
+    stats = Py_BuildValue("{s:L,s:L,s:L,s:d,s:d}",
+                          "events", backoff->events,
+                          "retries", backoff->retries,
+                          "timeouts", backoff->timeouts,
+                          "wait_time", backoff->wait_time,
+                          "max_wait", backoff->max_wait);
+    if (stats && reset) {
+        backoff->events = 0;
+        backoff->retries = 0;
+        backoff->timeouts = 0;
+        backoff->wait_time = 0.0;
+        backoff->max_wait = 0.0;
+    }
+    sqlite3_mutex_leave(sqlite3_db_mutex(self->db));
+    return stats;
+}
+
 static PyObject* pysqlite_connection_set_trace_callback(pysqlite_Connection* self, PyObject* args, PyObject* kwargs)
 {
     PyObject* trace_callback;
@@ -1472,55 +2240,413 @@ static PyObject* pysqlite_connection_set_trace_callback(pysqlite_Connection* sel
     Py_RETURN_NONE;
 }
 
-#ifdef HAVE_LOAD_EXTENSION
-static PyObject* pysqlite_enable_load_extension(pysqlite_Connection* self, PyObject* args)
+static int _wal_hook(void* user_arg, sqlite3* db, const char* name, int pages)
 {
-    int rc;
-    int onoff;
+    PyObject *ret;
+    PyGILState_STATE gilstate;
 
-    if (!pysqlite_check_thread(self) || !pysqlite_check_connection(self)) {
-        return NULL;
-    }
+    gilstate = PyGILState_Ensure();
+    ret = PyObject_CallFunction((PyObject*)user_arg, "si", name, pages);
 
-    if (!PyArg_ParseTuple(args, "i", &onoff)) {
-        return NULL;
+    if (ret) {
+        Py_DECREF(ret);
+    } else {
+        if (_pysqlite_enable_callback_tracebacks) {
+            PyErr_Print();
+        } else {
+            PyErr_Clear();
+        }
     }
 
-    rc = sqlite3_enable_load_extension(self->db, onoff);
+    PyGILState_Release(gilstate);
 
-    if (rc != SQLITE_OK) {
-        PyErr_SetString(pysqlite_OperationalError, "Error enabling load extension");
-        return NULL;
-    } else {
-        Py_RETURN_NONE;
-    }
+    /* errors in the hook do not fail the commit */
+    return SQLITE_OK;
 }
 
-static PyObject* pysqlite_load_extension(pysqlite_Connection* self, PyObject* args)
+static PyObject* pysqlite_connection_set_wal_hook(pysqlite_Connection* self, PyObject* args, PyObject* kwargs)
 {
-    int rc;
-    char* extension_name;
-    char* errmsg;
+    PyObject* wal_hook;
+
+    static char *kwlist[] = { "wal_hook", NULL };
 
     if (!pysqlite_check_thread(self) || !pysqlite_check_connection(self)) {
         return NULL;
     }
 
-    if (!PyArg_ParseTuple(args, "s", &extension_name)) {
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "O:set_wal_hook",
+                                      kwlist, &wal_hook)) {
         return NULL;
     }
 
-    rc = sqlite3_load_extension(self->db, extension_name, 0, &errmsg);
-    if (rc != 0) {
-        PyErr_SetString(pysqlite_OperationalError, errmsg);
-        return NULL;
+    if (wal_hook == Py_None) {
+        /* None clears the hook previously set, and the automatic checkpoints */
+        sqlite3_wal_hook(self->db, NULL, NULL);
+        Py_XSETREF(self->function_pinboard_wal_hook, NULL);
     } else {
-        Py_RETURN_NONE;
+        /* replaces the automatic checkpoints, see sqlite3_wal_autocheckpoint() */
+        sqlite3_wal_hook(self->db, _wal_hook, wal_hook);
+        Py_INCREF(wal_hook);
+        Py_XSETREF(self->function_pinboard_wal_hook, wal_hook);
     }
+
+    Py_RETURN_NONE;
 }
-#endif
 
-int pysqlite_check_thread(pysqlite_Connection* self)
+/*
+ * The update, commit and rollback hooks of SQLite record the changes for
+ * changes() without the GIL, and call the hooks set from Python if any.
+ */
+static void _update_hook(void* user_arg, int op, const char* db, const char* table, sqlite3_int64 rowid)
+{
+    pysqlite_Connection* self = (pysqlite_Connection*)user_arg;
+    PyObject* ret;
+    PyGILState_STATE gilstate;
+
+    if (self->changes_callback) {
+        pysqlite_changes_add(&self->changes, op, db, table, rowid);
+    }
+    if (!self->function_pinboard_update_hook) {
+        return;
+    }
+
+    gilstate = PyGILState_Ensure();
+    ret = PyObject_CallFunction(self->function_pinboard_update_hook, "issL", op, db, table, (long long)rowid);
+    if (ret) {
+        Py_DECREF(ret);
+    } else {
+        if (_pysqlite_enable_callback_tracebacks) {
+            PyErr_Print();
+        } else {
+            PyErr_Clear();
+        }
+    }
+    PyGILState_Release(gilstate);
+}
+
+static int _commit_hook(void* user_arg)
+{
+    pysqlite_Connection* self = (pysqlite_Connection*)user_arg;
+    PyObject* ret;
+    PyGILState_STATE gilstate;
+    int rollback = 0;
+
+    if (self->function_pinboard_commit_hook) {
+        gilstate = PyGILState_Ensure();
+        ret = PyObject_CallObject(self->function_pinboard_commit_hook, NULL);
+        if (ret) {
+            rollback = PyObject_IsTrue(ret);
+            Py_DECREF(ret);
+        } else {
+            rollback = -1;
+        }
+        if (rollback < 0) {
+            /* an error in the hook turns the commit into a rollback */
+            if (_pysqlite_enable_callback_tracebacks) {
+                PyErr_Print();
+            } else {
+                PyErr_Clear();
+            }
+            rollback = 1;
+        }
+        PyGILState_Release(gilstate);
+    }
+
+    if (!rollback && self->changes_callback) {
+        pysqlite_changes_commit(&self->changes);
+    }
+    return rollback;
+}
+
+static void _rollback_hook(void* user_arg)
+{
+    pysqlite_Connection* self = (pysqlite_Connection*)user_arg;
+    PyObject* ret;
+    PyGILState_STATE gilstate;
+
+    if (self->changes_callback) {
+        pysqlite_changes_rollback(&self->changes);
+    }
+    if (!self->function_pinboard_rollback_hook) {
+        return;
+    }
+
+    gilstate = PyGILState_Ensure();
+    ret = PyObject_CallObject(self->function_pinboard_rollback_hook, NULL);
+    if (ret) {
+        Py_DECREF(ret);
+    } else {
+        if (_pysqlite_enable_callback_tracebacks) {
+            PyErr_Print();
+        } else {
+            PyErr_Clear();
+        }
+    }
+    PyGILState_Release(gilstate);
+}
+
+/* Installs the native hooks that have something to do, and removes the others */
+static void _pysqlite_install_change_hooks(pysqlite_Connection* self)
+{
+    int feed = self->changes_callback != NULL;
+
+    sqlite3_update_hook(self->db, feed || self->function_pinboard_update_hook ? _update_hook : NULL, self);
+    sqlite3_commit_hook(self->db, feed || self->function_pinboard_commit_hook ? _commit_hook : NULL, self);
+    sqlite3_rollback_hook(self->db, feed || self->function_pinboard_rollback_hook ? _rollback_hook : NULL, self);
+}
+
+/* Sets one of the update, commit and rollback hooks from Python */
+static PyObject* _pysqlite_connection_set_hook(pysqlite_Connection* self, PyObject* args, PyObject* kwargs,
+                                               const char* format, char** kwlist, PyObject** pinboard)
+{
+    PyObject* hook;
+
+    if (!pysqlite_check_thread(self) || !pysqlite_check_connection(self)) {
+        return NULL;
+    }
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, format, kwlist, &hook)) {
+        return NULL;
+    }
+
+    if (hook == Py_None) {
+        /* None clears the hook previously set */
+        Py_CLEAR(*pinboard);
+    } else {
+        Py_INCREF(hook);
+        Py_XSETREF(*pinboard, hook);
+    }
+    _pysqlite_install_change_hooks(self);
+
+    Py_RETURN_NONE;
+}
+
+static PyObject* pysqlite_connection_set_update_hook(pysqlite_Connection* self, PyObject* args, PyObject* kwargs)
+{
+    static char *kwlist[] = { "update_hook", NULL };
+
+    return _pysqlite_connection_set_hook(self, args, kwargs, "O:set_update_hook", kwlist,
+                                         &self->function_pinboard_update_hook);
+}
+
+static PyObject* pysqlite_connection_set_commit_hook(pysqlite_Connection* self, PyObject* args, PyObject* kwargs)
+{
+    static char *kwlist[] = { "commit_hook", NULL };
+
+    return _pysqlite_connection_set_hook(self, args, kwargs, "O:set_commit_hook", kwlist,
+                                         &self->function_pinboard_commit_hook);
+}
+
+static PyObject* pysqlite_connection_set_rollback_hook(pysqlite_Connection* self, PyObject* args, PyObject* kwargs)
+{
+    static char *kwlist[] = { "rollback_hook", NULL };
+
+    return _pysqlite_connection_set_hook(self, args, kwargs, "O:set_rollback_hook", kwlist,
+                                         &self->function_pinboard_rollback_hook);
+}
+
+static PyObject* pysqlite_connection_changes(pysqlite_Connection* self, PyObject* args, PyObject* kwargs)
+{
+    PyObject* callback;
+    Py_ssize_t max_events = 100000;
+
+    static char *kwlist[] = { "callback", "max_events", NULL };
+
+    if (!pysqlite_check_thread(self) || !pysqlite_check_connection(self)) {
+        return NULL;
+    }
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "O|n:changes", kwlist, &callback, &max_events)) {
+        return NULL;
+    }
+
+    if (max_events < 0) {
+        PyErr_SetString(PyExc_ValueError, "max_events must not be negative");
+        return NULL;
+    }
+
+    if (callback == Py_None) {
+        /* None stops the feed and drops the changes not delivered yet */
+        Py_CLEAR(self->changes_callback);
+        _pysqlite_install_change_hooks(self);
+        _pysqlite_install_authorizer(self);
+        Py_BEGIN_ALLOW_THREADS
+        sqlite3_mutex_enter(sqlite3_db_mutex(self->db));
+        pysqlite_changes_free(&self->changes);
+        sqlite3_mutex_leave(sqlite3_db_mutex(self->db));
+        Py_END_ALLOW_THREADS
+    } else {
+        Py_INCREF(callback);
+        Py_XSETREF(self->changes_callback, callback);
+        self->changes.max_events = max_events;
+        _pysqlite_install_change_hooks(self);
+        _pysqlite_install_authorizer(self);
+    }
+
+    Py_RETURN_NONE;
+}
+
+/*
+ * Follows the savepoints of the transaction for changes(), after a
+ * statement has run. Called without the GIL.
+ */
+void pysqlite_connection_statement_done(pysqlite_Connection* self, const char* sql)
+{
+    if (!self->changes_callback || !sql) {
+        return;
+    }
+    sqlite3_mutex_enter(sqlite3_db_mutex(self->db));
+    pysqlite_changes_statement(&self->changes, sql);
+    sqlite3_mutex_leave(sqlite3_db_mutex(self->db));
+}
+
+/*
+ * Calls the callback of changes() with the changes of the transactions
+ * committed since the last call, if any. Called with the GIL once a
+ * statement is done and the cursor has taken rowcount and lastrowid.
+ * Errors in the callback are not propagated. Commits made by the callback
+ * are delivered after it returns, at the end of the next statement.
+ */
+void pysqlite_connection_deliver_changes(pysqlite_Connection* self)
+{
+    pysqlite_ChangeFeed batch;
+    PyObject* callback;
+    PyObject* changes;
+    PyObject* ret = NULL;
+    PyObject *exc_type, *exc_value, *exc_tb;
+
+    if (!self->changes.ready || !self->changes_callback || !self->db || self->changes_delivering) {
+        return;
+    }
+
+    /* the hooks of another thread may be recording changes; they take the
+     * GIL while holding the database mutex, so wait for it without the GIL */
+    Py_BEGIN_ALLOW_THREADS
+    sqlite3_mutex_enter(sqlite3_db_mutex(self->db));
+    pysqlite_changes_take(&self->changes, &batch);
+    sqlite3_mutex_leave(sqlite3_db_mutex(self->db));
+    Py_END_ALLOW_THREADS
+
+    PyErr_Fetch(&exc_type, &exc_value, &exc_tb);
+    callback = self->changes_callback;
+    changes = pysqlite_changes_list(&batch);
+    pysqlite_changes_free(&batch);
+    if (changes && callback) {
+        Py_INCREF(callback);
+        self->changes_delivering = 1;
+        ret = PyObject_CallFunctionObjArgs(callback, changes, NULL);
+        self->changes_delivering = 0;
+        Py_DECREF(callback);
+    }
+    Py_XDECREF(changes);
+
+    if (ret) {
+        Py_DECREF(ret);
+    } else if (PyErr_Occurred()) {
+        if (_pysqlite_enable_callback_tracebacks) {
+            PyErr_Print();
+        } else {
+            PyErr_Clear();
+        }
+    }
+    PyErr_Restore(exc_type, exc_value, exc_tb);
+}
+
+static PyObject* pysqlite_connection_wal_checkpoint(pysqlite_Connection* self, PyObject* args, PyObject* kwargs)
+{
+    const char* mode = "passive";
+    const char* name = NULL;
+    int emode;
+    int log = -1, checkpointed = -1;
+    int rc;
+
+    static char *kwlist[] = { "mode", "name", NULL };
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "|s$z:wal_checkpoint",
+                                      kwlist, &mode, &name)) {
+        return NULL;
+    }
+
+    if (!pysqlite_check_thread(self) || !pysqlite_check_connection(self)) {
+        return NULL;
+    }
+
+    if (sqlite3_stricmp(mode, "passive") == 0) {
+        emode = SQLITE_CHECKPOINT_PASSIVE;
+    } else if (sqlite3_stricmp(mode, "full") == 0) {
+        emode = SQLITE_CHECKPOINT_FULL;
+    } else if (sqlite3_stricmp(mode, "restart") == 0) {
+        emode = SQLITE_CHECKPOINT_RESTART;
+    } else if (sqlite3_stricmp(mode, "truncate") == 0) {
+        emode = SQLITE_CHECKPOINT_TRUNCATE;
+    } else {
+        PyErr_Format(PyExc_ValueError, "unknown checkpoint mode: %s", mode);
+        return NULL;
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+    rc = sqlite3_wal_checkpoint_v2(self->db, name, emode, &log, &checkpointed);
+    Py_END_ALLOW_THREADS
+
+    /* SQLITE_BUSY means the checkpoint could not finish, but the frame
+       counts tell how far it got */
+    if (rc != SQLITE_OK && rc != SQLITE_BUSY) {
+        _pysqlite_seterror(self->db);
+        return NULL;
+    }
+
+    return Py_BuildValue("(ii)", log, checkpointed);
+}
+
+#ifdef HAVE_LOAD_EXTENSION
+static PyObject* pysqlite_enable_load_extension(pysqlite_Connection* self, PyObject* args)
+{
+    int rc;
+    int onoff;
+
+    if (!pysqlite_check_thread(self) || !pysqlite_check_connection(self)) {
+        return NULL;
+    }
+
+    if (!PyArg_ParseTuple(args, "i", &onoff)) {
+        return NULL;
+    }
+
+    rc = sqlite3_enable_load_extension(self->db, onoff);
+
+    if (rc != SQLITE_OK) {
+        PyErr_SetString(pysqlite_OperationalError, "Error enabling load extension");
+        return NULL;
+    } else {
+        Py_RETURN_NONE;
+    }
+}
+
+static PyObject* pysqlite_load_extension(pysqlite_Connection* self, PyObject* args)
+{
+    int rc;
+    char* extension_name;
+    char* errmsg;
+
+    if (!pysqlite_check_thread(self) || !pysqlite_check_connection(self)) {
+        return NULL;
+    }
+
+    if (!PyArg_ParseTuple(args, "s", &extension_name)) {
+        return NULL;
+    }
+
+    rc = sqlite3_load_extension(self->db, extension_name, 0, &errmsg);
+    if (rc != 0) {
+        PyErr_SetString(pysqlite_OperationalError, errmsg);
+        return NULL;
+    } else {
+        Py_RETURN_NONE;
+    }
+}
+#endif
+
+int pysqlite_check_thread(pysqlite_Connection* self)
 {
     if (self->check_same_thread) {
         if (PyThread_get_thread_ident() != self->thread_ident) {
@@ -1550,6 +2676,14 @@ static PyObject* pysqlite_connection_get_total_changes(pysqlite_Connection* self
     }
 }
 
+static PyObject* pysqlite_connection_get_settings(pysqlite_Connection* self, void* unused)
+{
+    if (!pysqlite_check_connection(self)) {
+        return NULL;
+    }
+    return PyDictProxy_New(self->settings);
+}
+
 static PyObject* pysqlite_connection_get_in_transaction(pysqlite_Connection* self, void* unused)
 {
     if (!pysqlite_check_connection(self)) {
@@ -1561,6 +2695,46 @@ static PyObject* pysqlite_connection_get_in_transaction(pysqlite_Connection* sel
     Py_RETURN_FALSE;
 }
 
+static PyObject* pysqlite_connection_get_query_timeout(pysqlite_Connection* self, void* unused)
+{
+    if (self->query_timeout > 0.0) {
+        return PyFloat_FromDouble(self->query_timeout);
+    }
+    Py_RETURN_NONE;
+}
+
+static int pysqlite_connection_set_query_timeout(pysqlite_Connection* self, PyObject* value, void* unused)
+{
+    if (!value) {
+        PyErr_SetString(PyExc_AttributeError, "cannot delete attribute");
+        return -1;
+    }
+    if (!pysqlite_parse_query_timeout(value, &self->query_timeout)) {
+        return -1;
+    }
+    return 0;
+}
+
+static PyObject* pysqlite_connection_get_max_rows(pysqlite_Connection* self, void* unused)
+{
+    if (self->max_rows >= 0) {
+        return PyLong_FromSsize_t(self->max_rows);
+    }
+    Py_RETURN_NONE;
+}
+
+static int pysqlite_connection_set_max_rows(pysqlite_Connection* self, PyObject* value, void* unused)
+{
+    if (!value) {
+        PyErr_SetString(PyExc_AttributeError, "cannot delete attribute");
+        return -1;
+    }
+    if (!pysqlite_parse_max_rows(value, &self->max_rows)) {
+        return -1;
+    }
+    return 0;
+}
+
 static int
 pysqlite_connection_set_isolation_level(pysqlite_Connection* self, PyObject* isolation_level, void *Py_UNUSED(ignored))
 {
@@ -1611,7 +2785,6 @@ PyObject* pysqlite_connection_call(pysqlite_Connection* self, PyObject* args, Py
 {
     PyObject* sql;
     pysqlite_Statement* statement;
-    PyObject* weakref;
     int rc;
 
     if (!pysqlite_check_thread(self) || !pysqlite_check_connection(self)) {
@@ -1621,8 +2794,6 @@ PyObject* pysqlite_connection_call(pysqlite_Connection* self, PyObject* args, Py
     if (!PyArg_ParseTuple(args, "U", &sql))
         return NULL;
 
-    _pysqlite_drop_unused_statement_references(self);
-
     statement = PyObject_New(pysqlite_Statement, &pysqlite_StatementType);
     if (!statement) {
         return NULL;
@@ -1632,6 +2803,9 @@ PyObject* pysqlite_connection_call(pysqlite_Connection* self, PyObject* args, Py
     statement->st = NULL;
     statement->sql = NULL;
     statement->in_use = 0;
+    statement->prefetch = NULL;
+    statement->link.prev = NULL;
+    statement->link.next = NULL;
     statement->in_weakreflist = NULL;
 
     rc = pysqlite_statement_create(statement, self, sql);
@@ -1648,14 +2822,7 @@ PyObject* pysqlite_connection_call(pysqlite_Connection* self, PyObject* args, Py
         goto error;
     }
 
-    weakref = PyWeakref_NewRef((PyObject*)statement, NULL);
-    if (weakref == NULL)
-        goto error;
-    if (PyList_Append(self->statements, weakref) != 0) {
-        Py_DECREF(weakref);
-        goto error;
-    }
-    Py_DECREF(weakref);
+    pysqlite_link_insert(&self->statements, &statement->link);
 
     return (PyObject*)statement;
 
@@ -1664,11 +2831,56 @@ error:
     return NULL;
 }
 
-PyObject* pysqlite_connection_execute(pysqlite_Connection* self, PyObject* args)
+/*
+ * Sets a run-time limit of the connection, see sqlite3_limit(). Returns the
+ * previous value.
+ */
+static PyObject* pysqlite_connection_setlimit(pysqlite_Connection* self, PyObject* args)
 {
-    PyObject* cursor = 0;
-    PyObject* result = 0;
-    PyObject* method = 0;
+    int category;
+    int limit;
+    int old_limit;
+
+    if (!PyArg_ParseTuple(args, "ii:setlimit", &category, &limit)) {
+        return NULL;
+    }
+    if (!pysqlite_check_thread(self) || !pysqlite_check_connection(self)) {
+        return NULL;
+    }
+
+    old_limit = sqlite3_limit(self->db, category, limit);
+    if (old_limit < 0) {
+        PyErr_SetString(pysqlite_ProgrammingError, "'category' is out of bounds");
+        return NULL;
+    }
+    return PyLong_FromLong(old_limit);
+}
+
+static PyObject* pysqlite_connection_getlimit(pysqlite_Connection* self, PyObject* args)
+{
+    int category;
+    int limit;
+
+    if (!PyArg_ParseTuple(args, "i:getlimit", &category)) {
+        return NULL;
+    }
+    if (!pysqlite_check_thread(self) || !pysqlite_check_connection(self)) {
+        return NULL;
+    }
+
+    limit = sqlite3_limit(self->db, category, -1);
+    if (limit < 0) {
+        PyErr_SetString(pysqlite_ProgrammingError, "'category' is out of bounds");
+        return NULL;
+    }
+    return PyLong_FromLong(limit);
+}
+
+PyObject* pysqlite_connection_execute(pysqlite_Connection* self, PyObject* args, PyObject* kwargs)
+{
+    PyObject* cursor = 0;
+    PyObject* result = 0;
+    PyObject* method = 0;
 
     cursor = _PyObject_CallMethodId((PyObject*)self, &PyId_cursor, NULL);
     if (!cursor) {
@@ -1681,7 +2893,7 @@ PyObject* pysqlite_connection_execute(pysqlite_Connection* self, PyObject* args)
         goto error;
     }
 
-    result = PyObject_CallObject(method, args);
+    result = PyObject_Call(method, args, kwargs);
     if (!result) {
         Py_CLEAR(cursor);
     }
@@ -1693,7 +2905,7 @@ error:
     return cursor;
 }
 
-PyObject* pysqlite_connection_executemany(pysqlite_Connection* self, PyObject* args)
+PyObject* pysqlite_connection_executemany(pysqlite_Connection* self, PyObject* args, PyObject* kwargs)
 {
     PyObject* cursor = 0;
     PyObject* result = 0;
@@ -1710,7 +2922,7 @@ PyObject* pysqlite_connection_executemany(pysqlite_Connection* self, PyObject* a
         goto error;
     }
 
-    result = PyObject_CallObject(method, args);
+    result = PyObject_Call(method, args, kwargs);
     if (!result) {
         Py_CLEAR(cursor);
     }
@@ -1722,7 +2934,8 @@ error:
     return cursor;
 }
 
-PyObject* pysqlite_connection_executescript(pysqlite_Connection* self, PyObject* args)
+static PyObject* _pysqlite_connection_cursor_call(pysqlite_Connection* self, const char* name,
+                                                  PyObject* args, PyObject* kwargs)
 {
     PyObject* cursor = 0;
     PyObject* result = 0;
@@ -1733,213 +2946,1482 @@ PyObject* pysqlite_connection_executescript(pysqlite_Connection* self, PyObject*
         goto error;
     }
 
-    method = PyObject_GetAttrString(cursor, "executescript");
+    method = PyObject_GetAttrString(cursor, name);
     if (!method) {
         Py_CLEAR(cursor);
         goto error;
     }
 
-    result = PyObject_CallObject(method, args);
-    if (!result) {
-        Py_CLEAR(cursor);
+    result = PyObject_Call(method, args, kwargs);
+    if (!result) {
+        Py_CLEAR(cursor);
+    }
+
+error:
+    Py_XDECREF(result);
+    Py_XDECREF(method);
+
+    return cursor;
+}
+
+PyObject* pysqlite_connection_executescript(pysqlite_Connection* self, PyObject* args, PyObject* kwargs)
+{
+    return _pysqlite_connection_cursor_call(self, "executescript", args, kwargs);
+}
+
+PyObject* pysqlite_connection_executebatch(pysqlite_Connection* self, PyObject* args, PyObject* kwargs)
+{
+    return _pysqlite_connection_cursor_call(self, "executebatch", args, kwargs);
+}
+
+/*
+ * Runs a query and returns its result without creating a cursor for it.
+ * The connection keeps one cursor for these queries. A nested query, for
+ * example from a user function, gets a new one, and so does a query whose
+ * rows go through a row factory: the factory is called with the cursor and
+ * may keep it, but the shared cursor doesn't own its connection.
+ */
+static PyObject* _pysqlite_connection_query(pysqlite_Connection* self, PyObject* args, int mode)
+{
+    PyObject* sql;
+    PyObject* parameters = NULL;
+    PyObject* row_factory;
+    pysqlite_Cursor* cursor;
+    PyObject* result;
+
+    if (!PyArg_ParseTuple(args, "U|O", &sql, &parameters)) {
+        return NULL;
+    }
+    if (!pysqlite_check_thread(self) || !pysqlite_check_connection(self)) {
+        return NULL;
+    }
+
+    if (!self->query_cursor) {
+        self->query_cursor = PyObject_CallFunctionObjArgs((PyObject*)&pysqlite_CursorType, self, NULL);
+        if (!self->query_cursor) {
+            return NULL;
+        }
+        /* Like the statement cache, the cursor would keep the connection
+         * alive. Its reference is dropped in pysqlite_connection_dealloc(). */
+        Py_DECREF(self);
+    }
+
+    /* fetchval() takes the first value of the plain row */
+    row_factory = mode == PYSQLITE_FETCH_VALUE ? Py_None : self->row_factory;
+
+    if (self->query_cursor_busy || row_factory != Py_None) {
+        cursor = (pysqlite_Cursor*)PyObject_CallFunctionObjArgs((PyObject*)&pysqlite_CursorType, self, NULL);
+        if (!cursor) {
+            return NULL;
+        }
+    } else {
+        cursor = (pysqlite_Cursor*)self->query_cursor;
+        Py_INCREF(cursor);
+        self->query_cursor_busy = 1;
+    }
+
+    Py_INCREF(row_factory);
+    Py_XSETREF(cursor->row_factory, row_factory);
+
+    result = pysqlite_cursor_query(cursor, sql, parameters, mode);
+
+    if ((PyObject*)cursor == self->query_cursor) {
+        Py_INCREF(Py_None);
+        Py_XSETREF(cursor->row_factory, Py_None);
+        self->query_cursor_busy = 0;
+    }
+    Py_DECREF(cursor);
+    return result;
+}
+
+static PyObject* pysqlite_connection_fetchone(pysqlite_Connection* self, PyObject* args)
+{
+    return _pysqlite_connection_query(self, args, PYSQLITE_FETCH_ONE);
+}
+
+static PyObject* pysqlite_connection_fetchall(pysqlite_Connection* self, PyObject* args)
+{
+    return _pysqlite_connection_query(self, args, PYSQLITE_FETCH_ALL);
+}
+
+static PyObject* pysqlite_connection_fetchval(pysqlite_Connection* self, PyObject* args)
+{
+    return _pysqlite_connection_query(self, args, PYSQLITE_FETCH_VALUE);
+}
+
+/*
+ * Prepares a statement that can be run many times without the lookup in
+ * the statement cache.
+ */
+static PyObject* pysqlite_connection_prepare(pysqlite_Connection* self, PyObject* args)
+{
+    PyObject* statement;
+    PyObject* prepared;
+
+    statement = pysqlite_connection_call(self, args, NULL);
+    if (!statement) {
+        return NULL;
+    }
+    if (!((pysqlite_Statement*)statement)->st) {
+        PyErr_SetString(pysqlite_ProgrammingError, "There is no SQL statement to prepare.");
+        Py_DECREF(statement);
+        return NULL;
+    }
+
+    prepared = pysqlite_prepared_new(self, (pysqlite_Statement*)statement);
+    Py_DECREF(statement);
+    return prepared;
+}
+
+static PyObject* pysqlite_connection_transaction(pysqlite_Connection* self, PyObject* args, PyObject* kwargs)
+{
+    static char *kwlist[] = {"mode", NULL};
+    const char* mode = "immediate";
+    int begin;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "|s:transaction", kwlist, &mode)) {
+        return NULL;
+    }
+    if (!pysqlite_check_thread(self) || !pysqlite_check_connection(self)) {
+        return NULL;
+    }
+
+    if (sqlite3_stricmp(mode, "deferred") == 0) {
+        begin = PYSQLITE_TRANSACTION_BEGIN_DEFERRED;
+    } else if (sqlite3_stricmp(mode, "immediate") == 0) {
+        begin = PYSQLITE_TRANSACTION_BEGIN_IMMEDIATE;
+    } else if (sqlite3_stricmp(mode, "exclusive") == 0) {
+        begin = PYSQLITE_TRANSACTION_BEGIN_EXCLUSIVE;
+    } else {
+        PyErr_Format(PyExc_ValueError, "unknown transaction mode: %s", mode);
+        return NULL;
+    }
+    return pysqlite_transaction_new(self, begin);
+}
+
+static PyObject* pysqlite_connection_savepoint(pysqlite_Connection* self, PyObject* args)
+{
+    if (!pysqlite_check_thread(self) || !pysqlite_check_connection(self)) {
+        return NULL;
+    }
+    return pysqlite_transaction_new(self, -1);
+}
+
+/* ------------------------- COLLATION CODE ------------------------ */
+
+static int
+pysqlite_collation_callback(
+        void* context,
+        int text1_length, const void* text1_data,
+        int text2_length, const void* text2_data)
+{
+    PyObject* callback = (PyObject*)context;
+    PyObject* string1 = 0;
+    PyObject* string2 = 0;
+    PyGILState_STATE gilstate;
+    PyObject* retval = NULL;
+    long longval;
+    int result = 0;
+    gilstate = PyGILState_Ensure();
+
+    if (PyErr_Occurred()) {
+        goto finally;
+    }
+
+    string1 = PyUnicode_FromStringAndSize((const char*)text1_data, text1_length);
+    string2 = PyUnicode_FromStringAndSize((const char*)text2_data, text2_length);
+
+    if (!string1 || !string2) {
+        goto finally; /* failed to allocate strings */
+    }
+
+    retval = PyObject_CallFunctionObjArgs(callback, string1, string2, NULL);
+
+    if (!retval) {
+        /* execution failed */
+        goto finally;
+    }
+
+    longval = PyLong_AsLongAndOverflow(retval, &result);
+    if (longval == -1 && PyErr_Occurred()) {
+        PyErr_Clear();
+        result = 0;
+    }
+    else if (!result) {
+        if (longval > 0)
+            result = 1;
+        else if (longval < 0)
+            result = -1;
+    }
+
+finally:
+    Py_XDECREF(string1);
+    Py_XDECREF(string2);
+    Py_XDECREF(retval);
+    PyGILState_Release(gilstate);
+    return result;
+}
+
+static PyObject *
+pysqlite_connection_regexp_cache_stats(pysqlite_Connection* self, PyObject* args)
+{
+    struct regexp_cache_stats stats;
+
+    if (!pysqlite_check_thread(self) || !pysqlite_check_connection(self)) {
+        return NULL;
+    }
+
+    if (!regexp_cache_get_stats(self->db, &stats)) {
+        PyErr_SetString(pysqlite_OperationalError,
+                        "regexp extension is not enabled for this connection");
+        return NULL;
+    }
+
+    return Py_BuildValue("{s:L,s:L,s:L,s:L}",
+                         "capacity", stats.capacity,
+                         "size", stats.size,
+                         "hits", stats.hits,
+                         "misses", stats.misses);
+}
+
+/*
+ * Turns the result cache on with a size limit, changes the limit, or turns
+ * the cache off for 0.
+ */
+static PyObject* pysqlite_connection_enable_result_cache(pysqlite_Connection* self, PyObject* args)
+{
+    Py_ssize_t max_bytes;
+
+    if (!PyArg_ParseTuple(args, "n:enable_result_cache", &max_bytes)) {
+        return NULL;
+    }
+    if (!pysqlite_check_thread(self) || !pysqlite_check_connection(self)) {
+        return NULL;
+    }
+    if (max_bytes < 0) {
+        PyErr_SetString(PyExc_ValueError, "max_bytes must not be negative");
+        return NULL;
+    }
+
+    if (max_bytes == 0) {
+        pysqlite_result_cache_free(self->result_cache);
+        self->result_cache = NULL;
+    } else if (self->result_cache) {
+        pysqlite_result_cache_resize(self->result_cache, max_bytes);
+    } else {
+        self->result_cache = pysqlite_result_cache_new(max_bytes);
+        if (!self->result_cache) {
+            return NULL;
+        }
+    }
+    Py_RETURN_NONE;
+}
+
+static PyObject* pysqlite_connection_result_cache_stats(pysqlite_Connection* self, PyObject* args)
+{
+    pysqlite_ResultCache* cache = self->result_cache;
+
+    if (!pysqlite_check_thread(self) || !pysqlite_check_connection(self)) {
+        return NULL;
+    }
+    if (!cache) {
+        PyErr_SetString(pysqlite_OperationalError, "result cache is not enabled for this connection");
+        return NULL;
+    }
+
+    return Py_BuildValue("{s:n,s:n,s:n,s:L,s:L,s:L}",
+                         "capacity", cache->max_bytes,
+                         "size", cache->bytes,
+                         "entries", PyDict_GET_SIZE(cache->entries),
+                         "hits", cache->hits,
+                         "misses", cache->misses,
+                         "invalidations", cache->invalidations);
+}
+
+static PyObject *
+pysqlite_connection_interrupt(pysqlite_Connection* self, PyObject* args)
+{
+    PyObject* retval = NULL;
+
+    if (!pysqlite_check_connection(self)) {
+        goto finally;
+    }
+
+    sqlite3_interrupt(self->db);
+
+    Py_INCREF(Py_None);
+    retval = Py_None;
+
+finally:
+    return retval;
+}
+
+#ifdef HAVE_BACKUP_API
+static PyObject *
+pysqlite_connection_backup(pysqlite_Connection *self, PyObject *args, PyObject *kwds)
+{
+    PyObject *target = NULL;
+    int pages = -1;
+    PyObject *progress = Py_None;
+    const char *name = "main";
+    int rc;
+    int callback_error = 0;
+    double sleep_s = 0.25;
+    int sleep_ms = 0;
+    double step_time = 0;
+    double max_step_time;
+    int wal = 0;
+    int remaining = -1;
+    double started, elapsed;
+    sqlite3 *bck_conn;
+    sqlite3_backup *bck_handle;
+    static char *keywords[] = {"target", "pages", "progress", "name", "sleep", "step_time", NULL};
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "O!|$iOsdd:backup", keywords,
+                                     &pysqlite_ConnectionType, &target,
+                                     &pages, &progress, &name, &sleep_s, &step_time)) {
+        return NULL;
+    }
+
+    if (!pysqlite_check_connection((pysqlite_Connection *)target)) {
+        return NULL;
+    }
+
+    if ((pysqlite_Connection *)target == self) {
+        PyErr_SetString(PyExc_ValueError, "target cannot be the same connection instance");
+        return NULL;
+    }
+    if (sleep_s < 0) {
+        PyErr_SetString(PyExc_ValueError, "sleep must be greater-than or equal to zero");
+        return NULL;
+    }
+    sleep_ms = (int)(sleep_s * 1000.0);
+    if (step_time < 0) {
+        PyErr_SetString(PyExc_ValueError, "step_time must be greater-than or equal to zero");
+        return NULL;
+    }
+    max_step_time = step_time * BACKUP_MAX_STEP_GROWTH;
+
+#if SQLITE_VERSION_NUMBER < 3008008
+    /* Since 3.8.8 this is already done, per commit
+       https://www.sqlite.org/src/info/169b5505498c0a7e */
+    if (!sqlite3_get_autocommit(((pysqlite_Connection *)target)->db)) {
+        PyErr_SetString(pysqlite_OperationalError, "target is in transaction");
+        return NULL;
+    }
+#endif
+
+    if (progress != Py_None && !PyCallable_Check(progress)) {
+        PyErr_SetString(PyExc_TypeError, "progress argument must be a callable");
+        return NULL;
+    }
+
+    if (pages == 0) {
+        pages = -1;
+    }
+    if (step_time > 0 && pages < 0) {
+        /* adaptive: pages is sized from the duration of the last step */
+        pages = BACKUP_INITIAL_PAGES;
+    }
+
+    bck_conn = ((pysqlite_Connection *)target)->db;
+
+    Py_BEGIN_ALLOW_THREADS
+    if (step_time > 0) {
+        wal = pysqlite_backup_is_wal(self->db, name);
+    }
+    bck_handle = sqlite3_backup_init(bck_conn, "main", self->db, name);
+    Py_END_ALLOW_THREADS
+
+    if (bck_handle) {
+        do {
+            Py_BEGIN_ALLOW_THREADS
+            started = pysqlite_monotonic();
+            rc = sqlite3_backup_step(bck_handle, pages);
+            elapsed = pysqlite_monotonic() - started;
+            Py_END_ALLOW_THREADS
+
+            if (step_time > 0 && rc == SQLITE_OK) {
+                int previous = remaining;
+                remaining = sqlite3_backup_remaining(bck_handle);
+                if (wal && previous >= 0 && remaining > previous - pages
+                    && remaining + pages >= sqlite3_backup_pagecount(bck_handle)) {
+                    /* the backup started over after a write to the source;
+                       writers are not blocked in WAL mode, so copy more at once */
+                    step_time = pysqlite_backup_grow_step_time(step_time, max_step_time);
+                }
+                pages = pysqlite_backup_adapt_pages(pages, elapsed, step_time);
+            }
+
+            if (progress != Py_None) {
+                PyObject *res;
+
+                res = PyObject_CallFunction(progress, "iii", rc,
+                                            sqlite3_backup_remaining(bck_handle),
+                                            sqlite3_backup_pagecount(bck_handle));
+                if (res == NULL) {
+                    /* User's callback raised an error: interrupt the loop and
+                       propagate it. */
+                    callback_error = 1;
+                    rc = -1;
+                } else {
+                    Py_DECREF(res);
+                }
+            }
+
+            /* Sleep for a while if there are still further pages to copy and
+               the engine could not make any progress */
+            if (rc == SQLITE_BUSY || rc == SQLITE_LOCKED) {
+                Py_BEGIN_ALLOW_THREADS
+                sqlite3_sleep(sleep_ms);
+                Py_END_ALLOW_THREADS
+            }
+        } while (rc == SQLITE_OK || rc == SQLITE_BUSY || rc == SQLITE_LOCKED);
+
+        Py_BEGIN_ALLOW_THREADS
+        rc = sqlite3_backup_finish(bck_handle);
+        Py_END_ALLOW_THREADS
+    } else {
+        rc = _pysqlite_seterror(bck_conn);
+    }
+
+    if (!callback_error && rc != SQLITE_OK) {
+        /* We cannot use _pysqlite_seterror() here because the backup APIs do
+           not set the error status on the connection object, but rather on
+           the backup handle. */
+        if (rc == SQLITE_NOMEM) {
+            (void)PyErr_NoMemory();
+        } else {
+            PyErr_SetString(pysqlite_OperationalError, sqlite3_errstr(rc));
+        }
+    }
+
+    if (!callback_error && rc == SQLITE_OK) {
+        Py_RETURN_NONE;
+    } else {
+        return NULL;
+    }
+}
+
+static PyObject *
+pysqlite_connection_backup_async(pysqlite_Connection *self, PyObject *args, PyObject *kwds)
+{
+    PyObject *target = NULL;
+    int pages = -1;
+    const char *name = "main";
+    double step_time = 0.01;
+    static char *keywords[] = {"target", "pages", "name", "step_time", NULL};
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "O!|$isd:backup_async", keywords,
+                                     &pysqlite_ConnectionType, &target,
+                                     &pages, &name, &step_time)) {
+        return NULL;
+    }
+
+    if (!pysqlite_check_thread(self) || !pysqlite_check_connection(self)) {
+        return NULL;
+    }
+    if (!pysqlite_check_connection((pysqlite_Connection *)target)) {
+        return NULL;
+    }
+    if ((pysqlite_Connection *)target == self) {
+        PyErr_SetString(PyExc_ValueError, "target cannot be the same connection instance");
+        return NULL;
+    }
+    if (step_time < 0) {
+        PyErr_SetString(PyExc_ValueError, "step_time must be greater-than or equal to zero");
+        return NULL;
+    }
+    if (pages == 0) {
+        pages = -1;
+    }
+    if (pages > 0) {
+        /* a fixed batch size turns off the adaptive mode */
+        step_time = 0;
+    }
+
+    return pysqlite_backup_new(self, (pysqlite_Connection *)target, name, pages, step_time);
+}
+#endif
+
+#ifdef HAVE_SERIALIZE
+static PyObject *
+pysqlite_connection_serialize(pysqlite_Connection *self, PyObject *args, PyObject *kwds)
+{
+    const char *name = "main";
+    unsigned char *data;
+    sqlite3_int64 size;
+    static char *keywords[] = {"name", NULL};
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "|$s:serialize", keywords, &name)) {
+        return NULL;
+    }
+
+    if (!pysqlite_check_thread(self) || !pysqlite_check_connection(self)) {
+        return NULL;
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+    data = sqlite3_serialize(self->db, name, &size, 0);
+    Py_END_ALLOW_THREADS
+
+    if (size < 0) {
+        PyErr_Format(pysqlite_OperationalError, "unknown database %s", name);
+        return NULL;
+    }
+    if (!data && size > 0) {
+        return PyErr_NoMemory();
+    }
+    if (size > PY_SSIZE_T_MAX) {
+        sqlite3_free(data);
+        return PyErr_NoMemory();
+    }
+
+    /* the returned object owns the data, so it is not copied again */
+    return pysqlite_serialized_new(data, (Py_ssize_t)size);
+}
+
+static PyObject *
+pysqlite_connection_deserialize(pysqlite_Connection *self, PyObject *args, PyObject *kwds)
+{
+    PyObject *data;
+    const char *name = "main";
+    int readonly = 0;
+    PyObject *view = NULL;
+    PyObject *key = NULL;
+    Py_buffer *buffer;
+    unsigned char *copy;
+    unsigned int flags;
+    int rc;
+    static char *keywords[] = {"data", "name", "readonly", NULL};
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "O|$sp:deserialize", keywords,
+                                     &data, &name, &readonly)) {
+        return NULL;
+    }
+
+    if (!pysqlite_check_thread(self) || !pysqlite_check_connection(self)) {
+        return NULL;
+    }
+
+    view = PyMemoryView_FromObject(data);
+    if (!view) {
+        return NULL;
+    }
+    buffer = PyMemoryView_GET_BUFFER(view);
+    if (!PyBuffer_IsContiguous(buffer, 'C')) {
+        PyErr_SetString(PyExc_ValueError, "data must be a contiguous buffer");
+        goto error;
+    }
+    key = PyUnicode_FromString(name);
+    if (!key) {
+        goto error;
+    }
+    Py_SETREF(key, PyObject_CallMethod(key, "lower", NULL));
+    if (!key) {
+        goto error;
+    }
+
+    /* the database cannot be replaced while statements are reading from it */
+    pysqlite_do_all_statements(self, ACTION_RESET, 1);
+
+    if (readonly) {
+        /* SQLite reads the buffer in place, so it has to outlive the
+         * database. The view keeps it alive until the connection is closed
+         * or the database is replaced. */
+        copy = buffer->buf;
+        flags = SQLITE_DESERIALIZE_READONLY;
+    } else {
+        /* a writable database must be in memory that SQLite can resize */
+        copy = sqlite3_malloc64(buffer->len ? buffer->len : 1);
+        if (!copy) {
+            PyErr_NoMemory();
+            goto error;
+        }
+        memcpy(copy, buffer->buf, buffer->len);
+        flags = SQLITE_DESERIALIZE_FREEONCLOSE | SQLITE_DESERIALIZE_RESIZEABLE;
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+    rc = sqlite3_deserialize(self->db, name, copy, buffer->len, buffer->len, flags);
+    Py_END_ALLOW_THREADS
+
+    if (rc != SQLITE_OK) {
+        if (sqlite3_errcode(self->db) == rc) {
+            _pysqlite_seterror(self->db);
+        } else if (rc == SQLITE_NOMEM) {
+            PyErr_NoMemory();
+        } else {
+            PyErr_SetString(pysqlite_OperationalError, sqlite3_errstr(rc));
+        }
+        goto error;
+    }
+
+    /* the previous buffer of this database, if any, is no longer used */
+    if (readonly) {
+        rc = PyDict_SetItem(self->deserialized, key, view);
+    } else {
+        rc = PyDict_DelItem(self->deserialized, key);
+        if (rc < 0 && PyErr_ExceptionMatches(PyExc_KeyError)) {
+            PyErr_Clear();
+            rc = 0;
+        }
+    }
+    Py_DECREF(key);
+    Py_DECREF(view);
+    if (rc < 0) {
+        return NULL;
+    }
+    Py_RETURN_NONE;
+
+error:
+    Py_XDECREF(key);
+    Py_XDECREF(view);
+    return NULL;
+}
+#endif
+
+#ifdef HAVE_SESSION
+static PyObject *
+pysqlite_connection_session(pysqlite_Connection *self, PyObject *args, PyObject *kwds)
+{
+    PyObject *tables = Py_None;
+    const char *name = "main";
+    sqlite3_session *session;
+    PyObject *pysession = NULL;
+    PyObject *iterator = NULL;
+    PyObject *item;
+    PyObject *weakref;
+    int rc;
+    static char *keywords[] = {"tables", "name", NULL};
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "|O$s:session", keywords, &tables, &name)) {
+        return NULL;
+    }
+
+    if (!pysqlite_check_thread(self) || !pysqlite_check_connection(self)) {
+        return NULL;
+    }
+
+    rc = sqlite3session_create(self->db, name, &session);
+    if (rc != SQLITE_OK) {
+        _pysqlite_seterror(self->db);
+        return NULL;
+    }
+    pysession = pysqlite_session_new(self, session);
+    if (!pysession) {
+        return NULL;
+    }
+
+    if (tables == Py_None) {
+        rc = sqlite3session_attach(session, NULL);
+    } else {
+        iterator = PyObject_GetIter(tables);
+        if (!iterator) {
+            goto error;
+        }
+        while (rc == SQLITE_OK && (item = PyIter_Next(iterator))) {
+            const char *table = PyUnicode_Check(item) ? PyUnicode_AsUTF8(item) : NULL;
+            if (!table) {
+                if (!PyErr_Occurred()) {
+                    PyErr_SetString(PyExc_TypeError, "tables must be an iterable of table names");
+                }
+                Py_DECREF(item);
+                goto error;
+            }
+            rc = sqlite3session_attach(session, table);
+            Py_DECREF(item);
+        }
+        if (PyErr_Occurred()) {
+            goto error;
+        }
+    }
+    if (rc != SQLITE_OK) {
+        PyErr_SetString(pysqlite_OperationalError, sqlite3_errstr(rc));
+        goto error;
+    }
+
+    /* Add the session to the connection sessions list */
+    weakref = PyWeakref_NewRef(pysession, NULL);
+    if (!weakref) {
+        goto error;
+    }
+    if (PyList_Append(self->sessions, weakref) != 0) {
+        Py_DECREF(weakref);
+        goto error;
+    }
+    Py_DECREF(weakref);
+
+    Py_XDECREF(iterator);
+    return pysession;
+
+error:
+    Py_XDECREF(iterator);
+    Py_XDECREF(pysession);
+    return NULL;
+}
+
+/* What apply_changeset() does on a conflict, see sqlite3changeset_apply() */
+typedef struct {
+    PyObject *callback;     /* None or a callable that returns the action */
+    int action;             /* SQLITE_CHANGESET_* action if there is no callback */
+    int aborted;
+    PyObject *exc_type, *exc_value, *exc_tb;
+} ApplyContext;
+
+static int _pysqlite_changeset_conflict(void *ctx, int conflict, sqlite3_changeset_iter *iter)
+{
+    ApplyContext *context = ctx;
+    PyGILState_STATE threadstate;
+    PyObject *result;
+    const char *table;
+    int ncols, op, indirect;
+    int action;
+
+    if (context->callback == Py_None) {
+        action = context->action;
+        if (action == SQLITE_CHANGESET_REPLACE
+            && conflict != SQLITE_CHANGESET_DATA && conflict != SQLITE_CHANGESET_CONFLICT) {
+            /* only data conflicts can be resolved by replacing the row */
+            action = SQLITE_CHANGESET_OMIT;
+        }
+        context->aborted = action == SQLITE_CHANGESET_ABORT;
+        return action;
+    }
+
+    threadstate = PyGILState_Ensure();
+
+    if (sqlite3changeset_op(iter, &table, &ncols, &op, &indirect) != SQLITE_OK) {
+        table = "";
+    }
+    result = PyObject_CallFunction(context->callback, "is", conflict, table);
+    if (result) {
+        action = PyLong_AsLong(result);
+        Py_DECREF(result);
+        if (action == -1 && PyErr_Occurred()) {
+            action = SQLITE_CHANGESET_ABORT;
+        } else if (action != SQLITE_CHANGESET_OMIT && action != SQLITE_CHANGESET_REPLACE
+                   && action != SQLITE_CHANGESET_ABORT) {
+            PyErr_Format(PyExc_ValueError, "invalid conflict action: %d", action);
+            action = SQLITE_CHANGESET_ABORT;
+        }
+    } else {
+        action = SQLITE_CHANGESET_ABORT;
+    }
+    if (PyErr_Occurred()) {
+        /* keep the first error, it is raised when the changeset is rolled back */
+        if (!context->exc_type) {
+            PyErr_Fetch(&context->exc_type, &context->exc_value, &context->exc_tb);
+        } else {
+            PyErr_Clear();
+        }
+    } else {
+        context->aborted = action == SQLITE_CHANGESET_ABORT;
+    }
+
+    PyGILState_Release(threadstate);
+    return action;
+}
+
+static PyObject *
+pysqlite_connection_apply_changeset(pysqlite_Connection *self, PyObject *args, PyObject *kwds)
+{
+    Py_buffer data;
+    PyObject *conflict = NULL;
+    ApplyContext context = {Py_None, SQLITE_CHANGESET_ABORT, 0, NULL, NULL, NULL};
+    int rc;
+    static char *keywords[] = {"data", "conflict", NULL};
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "y*|$O:apply_changeset", keywords,
+                                     &data, &conflict)) {
+        return NULL;
+    }
+
+    if (!pysqlite_check_thread(self) || !pysqlite_check_connection(self)) {
+        goto error;
+    }
+    if (data.len > INT_MAX) {
+        PyErr_SetString(pysqlite_DataError, "changeset is too large");
+        goto error;
+    }
+
+    if (!conflict || conflict == Py_None) {
+        context.action = SQLITE_CHANGESET_ABORT;
+    } else if (PyCallable_Check(conflict)) {
+        context.callback = conflict;
+    } else if (PyUnicode_Check(conflict) && PyUnicode_CompareWithASCIIString(conflict, "abort") == 0) {
+        context.action = SQLITE_CHANGESET_ABORT;
+    } else if (PyUnicode_Check(conflict) && PyUnicode_CompareWithASCIIString(conflict, "omit") == 0) {
+        context.action = SQLITE_CHANGESET_OMIT;
+    } else if (PyUnicode_Check(conflict) && PyUnicode_CompareWithASCIIString(conflict, "replace") == 0) {
+        context.action = SQLITE_CHANGESET_REPLACE;
+    } else {
+        PyErr_SetString(PyExc_ValueError,
+                        "conflict must be 'abort', 'omit', 'replace' or a callable");
+        goto error;
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+    rc = sqlite3changeset_apply(self->db, (int)data.len, data.buf, NULL,
+                                _pysqlite_changeset_conflict, &context);
+    Py_END_ALLOW_THREADS
+
+    if (context.exc_type) {
+        PyErr_Restore(context.exc_type, context.exc_value, context.exc_tb);
+        goto error;
+    }
+    if (rc != SQLITE_OK) {
+        if (rc == SQLITE_ABORT && context.aborted) {
+            PyErr_SetString(pysqlite_IntegrityError, "conflict while applying changeset");
+        } else if (sqlite3_errcode(self->db) == rc) {
+            _pysqlite_seterror(self->db);
+        } else if (rc == SQLITE_NOMEM) {
+            PyErr_NoMemory();
+        } else if (rc == SQLITE_CORRUPT) {
+            PyErr_SetString(pysqlite_DatabaseError, sqlite3_errstr(rc));
+        } else {
+            PyErr_SetString(pysqlite_OperationalError, sqlite3_errstr(rc));
+        }
+        goto error;
+    }
+
+    PyBuffer_Release(&data);
+    Py_RETURN_NONE;
+
+error:
+    PyBuffer_Release(&data);
+    return NULL;
+}
+#endif
+
+/* Column types accepted by import_csv(). */
+enum {
+    IMPORT_TYPE_NONE = 0,
+    IMPORT_TYPE_INTEGER,
+    IMPORT_TYPE_REAL,
+    IMPORT_TYPE_NUMERIC,
+    IMPORT_TYPE_TEXT,
+    IMPORT_TYPE_BLOB
+};
+
+static const char * const import_type_names[] = {
+    "", "INTEGER", "REAL", "NUMERIC", "TEXT", "BLOB", NULL
+};
+
+/* Rows inserted by a single INSERT statement. */
+#define IMPORT_ROWS_PER_INSERT 64
+
+/* Returned while reading records for import_csv(). */
+#define IMPORT_PARSE_ERROR (-1)
+#define IMPORT_BLANK_LINE (-2)
+
+/* A field converted according to its column type. */
+typedef struct {
+    int type;                   /* SQLITE_NULL, SQLITE_INTEGER, ... */
+    sqlite3_int64 ival;
+    double rval;
+    sqlite3_int64 offset;       /* text or blob in ImportState.data */
+    int length;
+} ImportValue;
+
+typedef struct {
+    sqlite3_stmt* insert_many;  /* inserts rows_per_insert rows */
+    sqlite3_stmt* insert_one;   /* inserts the rest */
+    int rows_per_insert;
+    int ncols;
+    const int* types;
+    ImportValue* values;        /* rows_per_insert * ncols */
+    char* data;                 /* text of the pending rows */
+    sqlite3_int64 size;
+    sqlite3_int64 alloc;
+} ImportState;
+
+/*
+ * Converts the field the reader has just read according to the column
+ * type. Text is copied into the state, so that it can be bound later
+ * without another copy.
+ */
+static int _pysqlite_import_value(ImportState* state, ImportValue* value, VsvReader* reader, int type)
+{
+    if (!reader->notNull && type != IMPORT_TYPE_NONE && type != IMPORT_TYPE_TEXT) {
+        value->type = SQLITE_NULL;
+        return SQLITE_OK;
+    }
+
+    switch (type) {
+        case IMPORT_TYPE_INTEGER:
+            if (vsv_number_type(reader->dsep, reader->z) == 1) {
+                value->type = SQLITE_INTEGER;
+                value->ival = strtoll(reader->z, NULL, 10);
+                return SQLITE_OK;
+            }
+            break;
+        case IMPORT_TYPE_REAL:
+            if (vsv_number_type(reader->dsep, reader->z) != 0) {
+                value->type = SQLITE_FLOAT;
+                value->rval = strtod(reader->z, NULL);
+                return SQLITE_OK;
+            }
+            break;
+        case IMPORT_TYPE_NUMERIC:
+            switch (vsv_number_type(reader->dsep, reader->z)) {
+                case 1:
+                    value->type = SQLITE_INTEGER;
+                    value->ival = strtoll(reader->z, NULL, 10);
+                    return SQLITE_OK;
+                case 2:
+                    value->type = SQLITE_FLOAT;
+                    value->rval = strtod(reader->z, NULL);
+                    return SQLITE_OK;
+            }
+            break;
+    }
+
+    if (state->size + reader->n > state->alloc) {
+        sqlite3_int64 alloc = (state->size + reader->n) * 2 + 1024;
+        char* data = sqlite3_realloc64(state->data, alloc);
+        if (!data) {
+            return SQLITE_NOMEM;
+        }
+        state->data = data;
+        state->alloc = alloc;
+    }
+    memcpy(state->data + state->size, reader->z, reader->n);
+    value->type = type == IMPORT_TYPE_BLOB ? SQLITE_BLOB : SQLITE_TEXT;
+    value->offset = state->size;
+    value->length = reader->n;
+    state->size += reader->n;
+    return SQLITE_OK;
+}
+
+/*
+ * Reads the next record into row. Missing fields are NULL
+ * and extra fields are ignored.
+ *
+ * Returns SQLITE_ROW, SQLITE_DONE at the end of input, IMPORT_BLANK_LINE,
+ * IMPORT_PARSE_ERROR on malformed input, or an SQLite error code.
+ */
+static int _pysqlite_import_record(ImportState* state, VsvReader* reader, ImportValue* row)
+{
+    int i = 0;
+    int rc;
+
+    do {
+        if (vsv_reader_read_field(reader) == NULL) {
+            if (reader->rc != SQLITE_OK) {
+                return reader->rc;
+            }
+            break;
+        }
+        if (i < state->ncols) {
+            rc = _pysqlite_import_value(state, &row[i], reader, state->types[i]);
+            if (rc != SQLITE_OK) {
+                return rc;
+            }
+        }
+        i++;
+    } while (reader->cTerm == reader->fsep);
+
+    if (reader->zErr[0]) {
+        return IMPORT_PARSE_ERROR;
+    }
+    if (i == 0) {
+        return SQLITE_DONE;
+    }
+    /* a blank line is an empty value if there is only one column */
+    if (i == 1 && !reader->notNull && state->ncols > 1) {
+        return IMPORT_BLANK_LINE;
+    }
+    for (; i < state->ncols; i++) {
+        row[i].type = SQLITE_NULL;
+    }
+    return SQLITE_ROW;
+}
+
+/*
+ * Binds nrows pending rows starting from first_row to the statement
+ * and executes it.
+ */
+static int _pysqlite_import_insert(ImportState* state, sqlite3_stmt* statement, int first_row, int nrows)
+{
+    const ImportValue* value = &state->values[first_row * state->ncols];
+    int pos;
+    int rc = SQLITE_OK;
+
+    for (pos = 1; pos <= nrows * state->ncols && rc == SQLITE_OK; pos++, value++) {
+        switch (value->type) {
+            case SQLITE_INTEGER:
+                rc = sqlite3_bind_int64(statement, pos, value->ival);
+                break;
+            case SQLITE_FLOAT:
+                rc = sqlite3_bind_double(statement, pos, value->rval);
+                break;
+            case SQLITE_TEXT:
+                rc = sqlite3_bind_text(statement, pos, state->data + value->offset,
+                                       value->length, SQLITE_STATIC);
+                break;
+            case SQLITE_BLOB:
+                rc = sqlite3_bind_blob(statement, pos, state->data + value->offset,
+                                       value->length, SQLITE_STATIC);
+                break;
+            default:
+                rc = sqlite3_bind_null(statement, pos);
+        }
+    }
+    if (rc != SQLITE_OK) {
+        return rc;
+    }
+    rc = sqlite3_step(statement);
+    sqlite3_reset(statement);
+    return rc == SQLITE_DONE ? SQLITE_OK : rc;
+}
+
+/*
+ * Inserts up to max_rows records (all of them if max_rows is 0) from the
+ * reader, rows_per_insert rows per INSERT. Blank lines are skipped,
+ * except in a single column, where they are empty values.
+ * Runs without the GIL.
+ *
+ * Returns SQLITE_DONE at the end of input, SQLITE_OK when max_rows have
+ * been inserted, IMPORT_PARSE_ERROR on malformed input, or an SQLite
+ * error code.
+ */
+static int _pysqlite_import_rows(ImportState* state, VsvReader* reader,
+                                 sqlite3_int64 max_rows, sqlite3_int64* rows)
+{
+    sqlite3_int64 count = 0;
+    int done = 0;
+    int rc;
+
+    while (!done && (max_rows == 0 || count < max_rows)) {
+        int limit = state->rows_per_insert;
+        int nrows = 0;
+        int i;
+
+        if (max_rows != 0 && max_rows - count < limit) {
+            limit = (int)(max_rows - count);
+        }
+        state->size = 0;
+        while (nrows < limit) {
+            rc = _pysqlite_import_record(state, reader, &state->values[nrows * state->ncols]);
+            if (rc == SQLITE_DONE) {
+                done = 1;
+                break;
+            }
+            if (rc == SQLITE_ROW) {
+                nrows++;
+            } else if (rc != IMPORT_BLANK_LINE) {
+                return rc;
+            }
+        }
+
+        if (nrows == state->rows_per_insert) {
+            rc = _pysqlite_import_insert(state, state->insert_many, 0, nrows);
+        } else {
+            for (i = 0, rc = SQLITE_OK; i < nrows && rc == SQLITE_OK; i++) {
+                rc = _pysqlite_import_insert(state, state->insert_one, i, 1);
+            }
+        }
+        if (rc != SQLITE_OK) {
+            return rc;
+        }
+        count += nrows;
+        *rows += nrows;
+    }
+    return done ? SQLITE_DONE : SQLITE_OK;
+}
+
+/*
+ * Executes a statement that returns no rows, without the GIL.
+ */
+static int _pysqlite_exec(pysqlite_Connection* self, const char* sql)
+{
+    int rc;
+
+    Py_BEGIN_ALLOW_THREADS
+    rc = sqlite3_exec(self->db, sql, NULL, NULL, NULL);
+    if (rc == SQLITE_OK) {
+        pysqlite_connection_statement_done(self, sql);
     }
+    Py_END_ALLOW_THREADS
+    pysqlite_connection_deliver_changes(self);
 
-error:
-    Py_XDECREF(result);
-    Py_XDECREF(method);
-
-    return cursor;
+    return rc;
 }
 
-/* ------------------------- COLLATION CODE ------------------------ */
-
-static int
-pysqlite_collation_callback(
-        void* context,
-        int text1_length, const void* text1_data,
-        int text2_length, const void* text2_data)
+/*
+ * Converts a sequence of column type names into IMPORT_TYPE_* values.
+ * Returns the number of types, or -1 on error.
+ */
+static Py_ssize_t _pysqlite_import_types(PyObject* seq, int** types)
 {
-    PyObject* callback = (PyObject*)context;
-    PyObject* string1 = 0;
-    PyObject* string2 = 0;
-    PyGILState_STATE gilstate;
-    PyObject* retval = NULL;
-    long longval;
-    int result = 0;
-    gilstate = PyGILState_Ensure();
+    PyObject* fast;
+    Py_ssize_t i, n;
 
-    if (PyErr_Occurred()) {
-        goto finally;
+    fast = PySequence_Fast(seq, "types must be a sequence of type names");
+    if (!fast) {
+        return -1;
     }
+    n = PySequence_Fast_GET_SIZE(fast);
+    *types = PyMem_Calloc(n ? n : 1, sizeof(int));
+    if (!*types) {
+        Py_DECREF(fast);
+        PyErr_NoMemory();
+        return -1;
+    }
+    for (i = 0; i < n; i++) {
+        PyObject* item = PySequence_Fast_GET_ITEM(fast, i);
+        const char* name;
+        int type;
 
-    string1 = PyUnicode_FromStringAndSize((const char*)text1_data, text1_length);
-    string2 = PyUnicode_FromStringAndSize((const char*)text2_data, text2_length);
-
-    if (!string1 || !string2) {
-        goto finally; /* failed to allocate strings */
+        if (!PyUnicode_Check(item)) {
+            PyErr_SetString(PyExc_TypeError, "types must be a sequence of type names");
+            goto error;
+        }
+        name = PyUnicode_AsUTF8(item);
+        if (!name) {
+            goto error;
+        }
+        for (type = IMPORT_TYPE_INTEGER; import_type_names[type]; type++) {
+            if (sqlite3_stricmp(name, import_type_names[type]) == 0) {
+                break;
+            }
+        }
+        if (!import_type_names[type]) {
+            PyErr_Format(PyExc_ValueError, "unknown column type: %s", name);
+            goto error;
+        }
+        (*types)[i] = type;
     }
+    Py_DECREF(fast);
+    return n;
 
-    retval = PyObject_CallFunctionObjArgs(callback, string1, string2, NULL);
+error:
+    Py_DECREF(fast);
+    PyMem_Free(*types);
+    *types = NULL;
+    return -1;
+}
 
-    if (!retval) {
-        /* execution failed */
-        goto finally;
-    }
+/*
+ * Builds the CREATE TABLE statement for import_csv(), or the INSERT
+ * statement for nrows rows if nrows is not zero. names is a list of
+ * column names or NULL. The table name may be qualified with a schema.
+ * Returns NULL with an exception set on error.
+ */
+static char* _pysqlite_import_sql(const char* table, PyObject* names, int ncols, const int* types, int nrows)
+{
+    sqlite3_str* sql = sqlite3_str_new(NULL);
+    const char* dot = strchr(table, '.');
+    char* result;
+    int i;
 
-    longval = PyLong_AsLongAndOverflow(retval, &result);
-    if (longval == -1 && PyErr_Occurred()) {
-        PyErr_Clear();
-        result = 0;
+    sqlite3_str_appendall(sql, nrows ? "INSERT INTO " : "CREATE TABLE ");
+    if (dot) {
+        char* schema = sqlite3_mprintf("%.*s", (int)(dot - table), table);
+        if (!schema) {
+            sqlite3_free(sqlite3_str_finish(sql));
+            PyErr_NoMemory();
+            return NULL;
+        }
+        sqlite3_str_appendf(sql, "\"%w\".", schema);
+        sqlite3_free(schema);
+        table = dot + 1;
+    }
+    sqlite3_str_appendf(sql, "\"%w\"", table);
+    if (names || !nrows) {
+        sqlite3_str_appendchar(sql, 1, '(');
+        for (i = 0; i < ncols; i++) {
+            if (i) {
+                sqlite3_str_appendchar(sql, 1, ',');
+            }
+            if (names) {
+                const char* name = PyUnicode_AsUTF8(PyList_GET_ITEM(names, i));
+                if (!name) {
+                    sqlite3_free(sqlite3_str_finish(sql));
+                    return NULL;
+                }
+                sqlite3_str_appendf(sql, "\"%w\"", name);
+            } else {
+                sqlite3_str_appendf(sql, "c%d", i + 1);
+            }
+            if (!nrows && types[i] != IMPORT_TYPE_NONE) {
+                sqlite3_str_appendf(sql, " %s", import_type_names[types[i]]);
+            }
+        }
+        sqlite3_str_appendchar(sql, 1, ')');
     }
-    else if (!result) {
-        if (longval > 0)
-            result = 1;
-        else if (longval < 0)
-            result = -1;
+    if (nrows) {
+        sqlite3_str_appendall(sql, " VALUES");
+        for (i = 0; i < nrows * ncols; i++) {
+            sqlite3_str_appendall(sql, i % ncols ? ",?" : (i ? "),(?" : "(?"));
+        }
+        sqlite3_str_appendchar(sql, 1, ')');
     }
 
-finally:
-    Py_XDECREF(string1);
-    Py_XDECREF(string2);
-    Py_XDECREF(retval);
-    PyGILState_Release(gilstate);
+    result = sqlite3_str_finish(sql);
+    if (!result) {
+        PyErr_NoMemory();
+    }
     return result;
 }
 
-static PyObject *
-pysqlite_connection_interrupt(pysqlite_Connection* self, PyObject* args)
+/*
+ * Prepares the INSERT statements, creating the table if it does not exist.
+ */
+static int _pysqlite_import_prepare(pysqlite_Connection* self, ImportState* state,
+                                    const char* create_sql, const char* many_sql, const char* one_sql)
 {
-    PyObject* retval = NULL;
+    int rc;
 
-    if (!pysqlite_check_connection(self)) {
-        goto finally;
+    Py_BEGIN_ALLOW_THREADS
+    rc = sqlite3_prepare_v2(self->db, one_sql, -1, &state->insert_one, NULL);
+    if (rc != SQLITE_OK && sqlite3_strglob("no such table: *", sqlite3_errmsg(self->db)) == 0) {
+        rc = sqlite3_exec(self->db, create_sql, NULL, NULL, NULL);
+        if (rc == SQLITE_OK) {
+            rc = sqlite3_prepare_v2(self->db, one_sql, -1, &state->insert_one, NULL);
+        }
     }
+    if (rc == SQLITE_OK && state->rows_per_insert > 1) {
+        rc = sqlite3_prepare_v2(self->db, many_sql, -1, &state->insert_many, NULL);
+    }
+    Py_END_ALLOW_THREADS
 
-    sqlite3_interrupt(self->db);
-
-    Py_INCREF(Py_None);
-    retval = Py_None;
-
-finally:
-    return retval;
+    return rc;
 }
 
-#ifdef HAVE_BACKUP_API
 static PyObject *
-pysqlite_connection_backup(pysqlite_Connection *self, PyObject *args, PyObject *kwds)
+pysqlite_connection_import_csv(pysqlite_Connection *self, PyObject *args, PyObject *kwds)
 {
-    PyObject *target = NULL;
-    int pages = -1;
-    PyObject *progress = Py_None;
-    const char *name = "main";
+    PyObject* path = NULL;
+    const char* table;
+    int header = 1;
+    PyObject* columns = Py_None;
+    PyObject* types_obj = Py_None;
+    Py_ssize_t batch_rows = 10000;
+    const char* delimiter = ",";
+    PyObject* progress = Py_None;
+    static char *keywords[] = {"path", "table", "header", "columns", "types", "batch_rows",
+                               "delimiter", "progress", NULL};
+
+    VsvReader reader;
+    ImportState state = {0};
+    PyObject* names = NULL;
+    int* types = NULL;
+    int ncols = 0;
+    char* create_sql = NULL;
+    char* many_sql = NULL;
+    char* one_sql = NULL;
+    int own_transaction = 0;
+    int savepoint = 0;
+    sqlite3_int64 rows = 0;
+    PyObject* retval = NULL;
     int rc;
-    int callback_error = 0;
-    double sleep_s = 0.25;
-    int sleep_ms = 0;
-    sqlite3 *bck_conn;
-    sqlite3_backup *bck_handle;
-    static char *keywords[] = {"target", "pages", "progress", "name", "sleep", NULL};
 
-    if (!PyArg_ParseTupleAndKeywords(args, kwds, "O!|$iOsd:backup", keywords,
-                                     &pysqlite_ConnectionType, &target,
-                                     &pages, &progress, &name, &sleep_s)) {
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "O&s|$pOOnsO:import_csv", keywords,
+                                     PyUnicode_FSConverter, &path, &table, &header, &columns,
+                                     &types_obj, &batch_rows, &delimiter, &progress)) {
         return NULL;
     }
 
-    if (!pysqlite_check_connection((pysqlite_Connection *)target)) {
-        return NULL;
-    }
+    vsv_reader_init(&reader, ',', '\n', '.');
 
-    if ((pysqlite_Connection *)target == self) {
-        PyErr_SetString(PyExc_ValueError, "target cannot be the same connection instance");
-        return NULL;
+    if (!pysqlite_check_thread(self) || !pysqlite_check_connection(self)) {
+        goto finally;
     }
-    if (sleep_s < 0) {
-        PyErr_SetString(PyExc_ValueError, "sleep must be greater-than or equal to zero");
-        return NULL;
+    if (batch_rows < 0) {
+        PyErr_SetString(PyExc_ValueError, "batch_rows must be greater-than or equal to zero");
+        goto finally;
     }
-    sleep_ms = (int)(sleep_s * 1000.0);
-
-#if SQLITE_VERSION_NUMBER < 3008008
-    /* Since 3.8.8 this is already done, per commit
-       https://www.sqlite.org/src/info/169b5505498c0a7e */
-    if (!sqlite3_get_autocommit(((pysqlite_Connection *)target)->db)) {
-        PyErr_SetString(pysqlite_OperationalError, "target is in transaction");
-        return NULL;
+    if (strlen(delimiter) != 1 || delimiter[0] == '\n' || delimiter[0] == '"') {
+        PyErr_SetString(PyExc_ValueError, "delimiter must be a single character");
+        goto finally;
     }
-#endif
-
     if (progress != Py_None && !PyCallable_Check(progress)) {
         PyErr_SetString(PyExc_TypeError, "progress argument must be a callable");
-        return NULL;
+        goto finally;
     }
+    reader.fsep = (unsigned char)delimiter[0];
 
-    if (pages == 0) {
-        pages = -1;
+    if (columns != Py_None) {
+        names = PySequence_List(columns);
+        if (!names) {
+            goto finally;
+        }
+        for (ncols = 0; ncols < PyList_GET_SIZE(names); ncols++) {
+            if (!PyUnicode_Check(PyList_GET_ITEM(names, ncols))) {
+                PyErr_SetString(PyExc_TypeError, "columns must be a sequence of column names");
+                goto finally;
+            }
+        }
     }
 
-    bck_conn = ((pysqlite_Connection *)target)->db;
-
-    Py_BEGIN_ALLOW_THREADS
-    bck_handle = sqlite3_backup_init(bck_conn, "main", self->db, name);
-    Py_END_ALLOW_THREADS
+    if (vsv_reader_open(&reader, PyBytes_AS_STRING(path), NULL)) {
+        PyErr_SetString(pysqlite_OperationalError, reader.zErr);
+        goto finally;
+    }
 
-    if (bck_handle) {
+    /* The first record gives the column names, or at least their number. */
+    if (header && !names) {
+        names = PyList_New(0);
+        if (!names) {
+            goto finally;
+        }
         do {
-            Py_BEGIN_ALLOW_THREADS
-            rc = sqlite3_backup_step(bck_handle, pages);
-            Py_END_ALLOW_THREADS
-
-            if (progress != Py_None) {
-                PyObject *res;
-
-                res = PyObject_CallFunction(progress, "iii", rc,
-                                            sqlite3_backup_remaining(bck_handle),
-                                            sqlite3_backup_pagecount(bck_handle));
-                if (res == NULL) {
-                    /* User's callback raised an error: interrupt the loop and
-                       propagate it. */
-                    callback_error = 1;
-                    rc = -1;
-                } else {
-                    Py_DECREF(res);
-                }
+            PyObject* name;
+            if (!vsv_reader_read_field(&reader)) {
+                break;
             }
-
-            /* Sleep for a while if there are still further pages to copy and
-               the engine could not make any progress */
-            if (rc == SQLITE_BUSY || rc == SQLITE_LOCKED) {
-                Py_BEGIN_ALLOW_THREADS
-                sqlite3_sleep(sleep_ms);
-                Py_END_ALLOW_THREADS
+            name = PyUnicode_DecodeUTF8(reader.z, reader.n, "replace");
+            if (!name || PyList_Append(names, name) < 0) {
+                Py_XDECREF(name);
+                goto finally;
             }
-        } while (rc == SQLITE_OK || rc == SQLITE_BUSY || rc == SQLITE_LOCKED);
+            Py_DECREF(name);
+        } while (reader.cTerm == reader.fsep);
+        ncols = (int)PyList_GET_SIZE(names);
+    } else if (header) {
+        vsv_reader_skip_record(&reader);
+    } else if (!names) {
+        do {
+            if (!vsv_reader_read_field(&reader)) {
+                break;
+            }
+            ncols++;
+        } while (reader.cTerm == reader.fsep);
+        vsv_reader_seek(&reader, 0);
+    }
+    if (reader.rc != SQLITE_OK) {
+        PyErr_NoMemory();
+        goto finally;
+    }
+    if (ncols == 0) {
+        PyErr_SetString(pysqlite_OperationalError, "no columns to import");
+        goto finally;
+    }
 
-        Py_BEGIN_ALLOW_THREADS
-        rc = sqlite3_backup_finish(bck_handle);
-        Py_END_ALLOW_THREADS
+    if (types_obj != Py_None) {
+        Py_ssize_t ntypes = _pysqlite_import_types(types_obj, &types);
+        if (ntypes < 0) {
+            goto finally;
+        }
+        if (ntypes != ncols) {
+            PyErr_Format(PyExc_ValueError, "expected %d column types, got %zd", ncols, ntypes);
+            goto finally;
+        }
     } else {
-        rc = _pysqlite_seterror(bck_conn);
+        types = PyMem_Calloc(ncols, sizeof(int));
+        if (!types) {
+            PyErr_NoMemory();
+            goto finally;
+        }
     }
 
-    if (!callback_error && rc != SQLITE_OK) {
-        /* We cannot use _pysqlite_seterror() here because the backup APIs do
-           not set the error status on the connection object, but rather on
-           the backup handle. */
-        if (rc == SQLITE_NOMEM) {
-            (void)PyErr_NoMemory();
-        } else {
-            PyErr_SetString(pysqlite_OperationalError, sqlite3_errstr(rc));
-        }
+    state.ncols = ncols;
+    state.types = types;
+    state.rows_per_insert = sqlite3_limit(self->db, SQLITE_LIMIT_VARIABLE_NUMBER, -1) / ncols;
+    if (state.rows_per_insert > IMPORT_ROWS_PER_INSERT) {
+        state.rows_per_insert = IMPORT_ROWS_PER_INSERT;
+    }
+    if (state.rows_per_insert < 1) {
+        state.rows_per_insert = 1;
+    }
+    state.values = PyMem_Calloc((size_t)state.rows_per_insert * ncols, sizeof(ImportValue));
+    if (!state.values) {
+        PyErr_NoMemory();
+        goto finally;
     }
 
-    if (!callback_error && rc == SQLITE_OK) {
-        Py_RETURN_NONE;
+    create_sql = _pysqlite_import_sql(table, names, ncols, types, 0);
+    many_sql = _pysqlite_import_sql(table, names, ncols, types, state.rows_per_insert);
+    one_sql = _pysqlite_import_sql(table, names, ncols, types, 1);
+    if (!create_sql || !many_sql || !one_sql) {
+        goto finally;
+    }
+
+    /* The whole file is imported in one transaction, or in a savepoint of
+     * the current one, so that an error leaves the table as it was. */
+    if (sqlite3_get_autocommit(self->db)) {
+        if (_pysqlite_exec(self, "BEGIN") != SQLITE_OK) {
+            _pysqlite_seterror(self->db);
+            goto finally;
+        }
+        own_transaction = 1;
     } else {
-        return NULL;
+        if (_pysqlite_exec(self, "SAVEPOINT _sqlean_import") != SQLITE_OK) {
+            _pysqlite_seterror(self->db);
+            goto finally;
+        }
+        savepoint = 1;
+    }
+
+    if (_pysqlite_import_prepare(self, &state, create_sql, many_sql, one_sql) != SQLITE_OK) {
+        _pysqlite_seterror(self->db);
+        goto finally;
+    }
+
+    /* batch_rows only sets how often progress is called; the rows are
+     * committed together at the end */
+    do {
+        Py_BEGIN_ALLOW_THREADS
+        rc = _pysqlite_import_rows(&state, &reader, batch_rows, &rows);
+        Py_END_ALLOW_THREADS
+
+        if (rc == IMPORT_PARSE_ERROR) {
+            PyErr_SetString(pysqlite_DataError, reader.zErr);
+            goto finally;
+        }
+        if (rc != SQLITE_OK && rc != SQLITE_DONE) {
+            _pysqlite_seterror(self->db);
+            goto finally;
+        }
+
+        if (progress != Py_None) {
+            PyObject* res = PyObject_CallFunction(progress, "L", (long long)rows);
+            if (!res) {
+                goto finally;
+            }
+            Py_DECREF(res);
+        }
+    } while (rc == SQLITE_OK);
+
+    if (_pysqlite_exec(self, own_transaction ? "COMMIT" : "RELEASE _sqlean_import") != SQLITE_OK) {
+        _pysqlite_seterror(self->db);
+        goto finally;
     }
+    own_transaction = savepoint = 0;
+
+    retval = PyLong_FromLongLong(rows);
+
+finally:
+    Py_BEGIN_ALLOW_THREADS
+    sqlite3_finalize(state.insert_many);
+    sqlite3_finalize(state.insert_one);
+    Py_END_ALLOW_THREADS
+    if ((own_transaction || savepoint) && !sqlite3_get_autocommit(self->db)) {
+        /* roll back what was imported, keeping the error */
+        PyObject *exc_type, *exc_value, *exc_tb;
+        PyErr_Fetch(&exc_type, &exc_value, &exc_tb);
+        if (own_transaction) {
+            pysqlite_do_all_statements(self, ACTION_RESET, 1);
+            _pysqlite_exec(self, "ROLLBACK");
+        } else {
+            _pysqlite_exec(self, "ROLLBACK TO _sqlean_import");
+            _pysqlite_exec(self, "RELEASE _sqlean_import");
+        }
+        PyErr_Restore(exc_type, exc_value, exc_tb);
+    }
+    sqlite3_free(create_sql);
+    sqlite3_free(many_sql);
+    sqlite3_free(one_sql);
+    sqlite3_free(state.data);
+    PyMem_Free(state.values);
+    PyMem_Free(types);
+    Py_XDECREF(names);
+    vsv_reader_reset(&reader);
+    Py_XDECREF(path);
+    return retval;
 }
-#endif
 
 static PyObject *
 pysqlite_connection_create_collation(pysqlite_Connection* self, PyObject* args)
@@ -2088,6 +4570,9 @@ static PyGetSetDef connection_getset[] = {
     {"isolation_level",  (getter)pysqlite_connection_get_isolation_level, (setter)pysqlite_connection_set_isolation_level},
     {"total_changes",  (getter)pysqlite_connection_get_total_changes, (setter)0},
     {"in_transaction",  (getter)pysqlite_connection_get_in_transaction, (setter)0},
+    {"query_timeout",  (getter)pysqlite_connection_get_query_timeout, (setter)pysqlite_connection_set_query_timeout},
+    {"max_rows",  (getter)pysqlite_connection_get_max_rows, (setter)pysqlite_connection_set_max_rows},
+    {"settings",  (getter)pysqlite_connection_get_settings, (setter)0},
     {NULL}
 };
 
@@ -2102,6 +4587,10 @@ static PyMethodDef connection_methods[] = {
         PyDoc_STR("Commit the current transaction.")},
     {"rollback", (PyCFunction)pysqlite_connection_rollback, METH_NOARGS,
         PyDoc_STR("Roll back the current transaction.")},
+    {"transaction", (PyCFunction)(void(*)(void))pysqlite_connection_transaction, METH_VARARGS|METH_KEYWORDS,
+        PyDoc_STR("Returns a context manager that runs a block in a transaction. Non-standard.")},
+    {"savepoint", (PyCFunction)pysqlite_connection_savepoint, METH_NOARGS,
+        PyDoc_STR("Returns a context manager that runs a block in a savepoint. Non-standard.")},
     {"create_function", (PyCFunction)(void(*)(void))pysqlite_connection_create_function, METH_VARARGS|METH_KEYWORDS,
         PyDoc_STR("Creates a new function. Non-standard.")},
     {"create_aggregate", (PyCFunction)(void(*)(void))pysqlite_connection_create_aggregate, METH_VARARGS|METH_KEYWORDS,
@@ -2116,6 +4605,10 @@ static PyMethodDef connection_methods[] = {
         PyDoc_STR("Sets busy handler. Non-standard.")},
     {"set_busy_timeout", (PyCFunction)(void(*)(void))pysqlite_connection_set_busy_timeout, METH_VARARGS|METH_KEYWORDS,
         PyDoc_STR("Sets busy timeout. Non-standard.")},
+    {"set_busy_backoff", (PyCFunction)(void(*)(void))pysqlite_connection_set_busy_backoff, METH_VARARGS|METH_KEYWORDS,
+        PyDoc_STR("Sets a native busy handler that retries with exponential backoff. Non-standard.")},
+    {"busy_stats", (PyCFunction)(void(*)(void))pysqlite_connection_busy_stats, METH_VARARGS|METH_KEYWORDS,
+        PyDoc_STR("Returns the lock contention counters of the busy handler of set_busy_backoff(). Non-standard.")},
     #ifdef HAVE_LOAD_EXTENSION
     {"enable_load_extension", (PyCFunction)pysqlite_enable_load_extension, METH_VARARGS,
         PyDoc_STR("Enable dynamic loading of SQLite extension modules. Non-standard.")},
@@ -2126,25 +4619,73 @@ static PyMethodDef connection_methods[] = {
         PyDoc_STR("Sets progress handler callback. Non-standard.")},
     {"set_trace_callback", (PyCFunction)(void(*)(void))pysqlite_connection_set_trace_callback, METH_VARARGS|METH_KEYWORDS,
         PyDoc_STR("Sets a trace callback called for each SQL statement (passed as unicode). Non-standard.")},
-    {"execute", (PyCFunction)pysqlite_connection_execute, METH_VARARGS,
+    {"set_wal_hook", (PyCFunction)(void(*)(void))pysqlite_connection_set_wal_hook, METH_VARARGS|METH_KEYWORDS,
+        PyDoc_STR("Sets a hook called after each commit in WAL mode. Non-standard.")},
+    {"set_update_hook", (PyCFunction)(void(*)(void))pysqlite_connection_set_update_hook, METH_VARARGS|METH_KEYWORDS,
+        PyDoc_STR("Sets a function called with (op, database, table, rowid) for every changed row. Non-standard.")},
+    {"set_commit_hook", (PyCFunction)(void(*)(void))pysqlite_connection_set_commit_hook, METH_VARARGS|METH_KEYWORDS,
+        PyDoc_STR("Sets a function called before every commit; a true result turns it into a rollback. Non-standard.")},
+    {"set_rollback_hook", (PyCFunction)(void(*)(void))pysqlite_connection_set_rollback_hook, METH_VARARGS|METH_KEYWORDS,
+        PyDoc_STR("Sets a function called after every rollback. Non-standard.")},
+    {"changes", (PyCFunction)(void(*)(void))pysqlite_connection_changes, METH_VARARGS|METH_KEYWORDS,
+        PyDoc_STR("Calls a function with the (op, table, rowid) changes of each commit. Non-standard.")},
+    {"wal_checkpoint", (PyCFunction)(void(*)(void))pysqlite_connection_wal_checkpoint, METH_VARARGS|METH_KEYWORDS,
+        PyDoc_STR("Checkpoints the write-ahead log. Non-standard.")},
+    {"execute", (PyCFunction)(void(*)(void))pysqlite_connection_execute, METH_VARARGS|METH_KEYWORDS,
         PyDoc_STR("Executes a SQL statement. Non-standard.")},
-    {"executemany", (PyCFunction)pysqlite_connection_executemany, METH_VARARGS,
+    {"executemany", (PyCFunction)(void(*)(void))pysqlite_connection_executemany, METH_VARARGS|METH_KEYWORDS,
         PyDoc_STR("Repeatedly executes a SQL statement. Non-standard.")},
-    {"executescript", (PyCFunction)pysqlite_connection_executescript, METH_VARARGS,
+    {"executescript", (PyCFunction)(void(*)(void))pysqlite_connection_executescript, METH_VARARGS|METH_KEYWORDS,
         PyDoc_STR("Executes a multiple SQL statements at once. Non-standard.")},
+    {"executebatch", (PyCFunction)(void(*)(void))pysqlite_connection_executebatch, METH_VARARGS|METH_KEYWORDS,
+        PyDoc_STR("Executes a sequence of SQL statements with their parameters. Non-standard.")},
+    {"setlimit", (PyCFunction)pysqlite_connection_setlimit, METH_VARARGS,
+        PyDoc_STR("Sets a run-time limit of the connection and returns the previous one. Non-standard.")},
+    {"getlimit", (PyCFunction)pysqlite_connection_getlimit, METH_VARARGS,
+        PyDoc_STR("Returns a run-time limit of the connection. Non-standard.")},
+    {"fetchone", (PyCFunction)pysqlite_connection_fetchone, METH_VARARGS,
+        PyDoc_STR("Executes a query and returns its first row, or None. Non-standard.")},
+    {"fetchall", (PyCFunction)pysqlite_connection_fetchall, METH_VARARGS,
+        PyDoc_STR("Executes a query and returns a list of its rows. Non-standard.")},
+    {"fetchval", (PyCFunction)pysqlite_connection_fetchval, METH_VARARGS,
+        PyDoc_STR("Executes a query and returns the first value of its first row, or None. Non-standard.")},
+    {"prepare", (PyCFunction)pysqlite_connection_prepare, METH_VARARGS,
+        PyDoc_STR("Prepares a SQL statement to run many times. Non-standard.")},
     {"create_collation", (PyCFunction)pysqlite_connection_create_collation, METH_VARARGS,
         PyDoc_STR("Creates a collation function. Non-standard.")},
     {"interrupt", (PyCFunction)pysqlite_connection_interrupt, METH_NOARGS,
         PyDoc_STR("Abort any pending database operation. Non-standard.")},
+    {"enable_result_cache", (PyCFunction)pysqlite_connection_enable_result_cache, METH_VARARGS,
+        PyDoc_STR("Caches the results of read-only queries, up to max_bytes. Non-standard.")},
+    {"result_cache_stats", (PyCFunction)pysqlite_connection_result_cache_stats, METH_NOARGS,
+        PyDoc_STR("Returns the statistics of the result cache. Non-standard.")},
+    {"regexp_cache_stats", (PyCFunction)pysqlite_connection_regexp_cache_stats, METH_NOARGS,
+        PyDoc_STR("Returns statistics of the compiled regexp cache. Non-standard.")},
 #ifdef HAVE_ENCRYPTION
     {"set_key", (PyCFunction)(void(*)(void))pysqlite_connection_key, METH_VARARGS,
         PyDoc_STR("Set encryption key for database. Non-standard.")},
     {"reset_key", (PyCFunction)(void(*)(void))pysqlite_connection_rekey, METH_VARARGS,
         PyDoc_STR("Set encryption key for database. Non-standard.")},
 #endif
+    {"import_csv", (PyCFunction)(void(*)(void))pysqlite_connection_import_csv, METH_VARARGS | METH_KEYWORDS,
+        PyDoc_STR("Imports a CSV file into a table in one transaction. Non-standard.")},
+    #ifdef HAVE_SERIALIZE
+    {"serialize", (PyCFunction)(void(*)(void))pysqlite_connection_serialize, METH_VARARGS | METH_KEYWORDS,
+        PyDoc_STR("Serializes a database into a buffer. Non-standard.")},
+    {"deserialize", (PyCFunction)(void(*)(void))pysqlite_connection_deserialize, METH_VARARGS | METH_KEYWORDS,
+        PyDoc_STR("Loads a database from a buffer. Non-standard.")},
+    #endif
+    #ifdef HAVE_SESSION
+    {"session", (PyCFunction)(void(*)(void))pysqlite_connection_session, METH_VARARGS | METH_KEYWORDS,
+        PyDoc_STR("Starts recording changes to tables. Non-standard.")},
+    {"apply_changeset", (PyCFunction)(void(*)(void))pysqlite_connection_apply_changeset, METH_VARARGS | METH_KEYWORDS,
+        PyDoc_STR("Applies a changeset or a patchset to the database. Non-standard.")},
+    #endif
     #ifdef HAVE_BACKUP_API
     {"backup", (PyCFunction)(void(*)(void))pysqlite_connection_backup, METH_VARARGS | METH_KEYWORDS,
         PyDoc_STR("Makes a backup of the database. Non-standard.")},
+    {"backup_async", (PyCFunction)(void(*)(void))pysqlite_connection_backup_async, METH_VARARGS | METH_KEYWORDS,
+        PyDoc_STR("Starts a backup of the database that is driven one step at a time. Non-standard.")},
     #endif
     {"__enter__", (PyCFunction)pysqlite_connection_enter, METH_NOARGS,
         PyDoc_STR("For context manager. Non-standard.")},
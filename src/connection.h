@@ -32,6 +32,92 @@
 #include "module.h"
 
 #include "sqlite3.h"
+#include "resultcache.h"
+#include "changes.h"
+
+/*
+ * Entry of a list of the statements or cursors of a connection. The lists
+ * are circular, with the head in the connection, so an object can unlink
+ * itself without knowing its connection. Objects that are not in a list
+ * have NULL links.
+ */
+typedef struct pysqlite_Link
+{
+    struct pysqlite_Link* prev;
+    struct pysqlite_Link* next;
+} pysqlite_Link;
+
+/* the object that contains a list entry */
+#define PYSQLITE_LINK_OWNER(link, type, field) ((type*)((char*)(link) - offsetof(type, field)))
+
+static inline void pysqlite_link_init_head(pysqlite_Link* head)
+{
+    head->prev = head;
+    head->next = head;
+}
+
+static inline void pysqlite_link_insert(pysqlite_Link* head, pysqlite_Link* link)
+{
+    link->prev = head->prev;
+    link->next = head;
+    head->prev->next = link;
+    head->prev = link;
+}
+
+static inline void pysqlite_link_remove(pysqlite_Link* link)
+{
+    if (link->next) {
+        link->prev->next = link->next;
+        link->next->prev = link->prev;
+        link->prev = NULL;
+        link->next = NULL;
+    }
+}
+
+/* Transaction statements that a connection keeps prepared */
+enum {
+    PYSQLITE_TRANSACTION_BEGIN = 0,     /* one for each BEGIN statement of the isolation levels */
+    PYSQLITE_TRANSACTION_BEGIN_DEFERRED,
+    PYSQLITE_TRANSACTION_BEGIN_IMMEDIATE,
+    PYSQLITE_TRANSACTION_BEGIN_EXCLUSIVE,
+    PYSQLITE_TRANSACTION_COMMIT,
+    PYSQLITE_TRANSACTION_ROLLBACK,
+    PYSQLITE_TRANSACTION_STATEMENTS
+};
+
+/* SAVEPOINT, RELEASE and ROLLBACK TO are kept prepared for this many levels
+ * of Connection.savepoint(); deeper levels prepare them on every use */
+#define PYSQLITE_SAVEPOINT_LEVELS 8
+
+enum {
+    PYSQLITE_SAVEPOINT_BEGIN = 0,
+    PYSQLITE_SAVEPOINT_RELEASE,
+    PYSQLITE_SAVEPOINT_ROLLBACK,
+    PYSQLITE_SAVEPOINT_STATEMENTS
+};
+
+/* how often the progress handler checks the deadline of a query, in
+ * virtual machine instructions */
+#define PYSQLITE_DEADLINE_INSTRUCTIONS 1000
+
+/* Settings and counters of the native busy handler of set_busy_backoff(),
+ * times in seconds */
+typedef struct
+{
+    double timeout;
+    double initial_delay;
+    double max_delay;
+    double jitter;
+
+    /* when the current wait for a lock started */
+    double wait_start;
+
+    long long events;   /* waits for a lock */
+    long long retries;  /* sleeps between tries */
+    long long timeouts; /* waits given up */
+    double wait_time;   /* total time waited */
+    double max_wait;    /* longest wait */
+} pysqlite_BusyBackoff;
 
 typedef struct
 {
@@ -55,6 +141,15 @@ typedef struct
     /* NULL for autocommit, otherwise a string with the BEGIN statement */
     const char* begin_statement;
 
+    /* BEGIN, COMMIT and ROLLBACK, prepared on first use and finalized when
+     * the connection is closed */
+    sqlite3_stmt* transaction_statements[PYSQLITE_TRANSACTION_STATEMENTS];
+
+    /* savepoint statements by level, and the level of the innermost
+     * savepoint entered with Connection.savepoint() */
+    sqlite3_stmt* savepoint_statements[PYSQLITE_SAVEPOINT_LEVELS][PYSQLITE_SAVEPOINT_STATEMENTS];
+    int savepoint_level;
+
     /* 1 if a check should be performed for each API call if the connection is
      * used from the same thread it was created in */
     int check_same_thread;
@@ -66,15 +161,27 @@ typedef struct
 
     pysqlite_Cache* statement_cache;
 
-    /* Lists of weak references to statements, blobs and cursors used within this connection */
-    PyObject* statements;
-    PyObject* cursors;
+    /* Statements and cursors used within this connection. They unlink
+     * themselves when they are deallocated */
+    pysqlite_Link statements;
+    pysqlite_Link cursors;
+
+    /* see enable_result_cache(), NULL if it is off */
+    pysqlite_ResultCache* result_cache;
+
+    /* The cursor that Connection.fetchone() and friends reuse, created on
+     * first use. It doesn't own a reference to the connection */
+    PyObject* query_cursor;
+    int query_cursor_busy;
+
+    /* List of weak references to blobs used within this connection */
     PyObject* blobs;
 
-    /* Counters for how many statements/cursors were created in the connection. May be
-     * reset to 0 at certain intervals */
-    int created_statements;
-    int created_cursors;
+    /* List of weak references to sessions, which are deleted before the database is closed */
+    PyObject* sessions;
+
+    /* Buffers that read-only deserialized databases are read from */
+    PyObject* deserialized;
 
     PyObject* row_factory;
 
@@ -89,12 +196,50 @@ typedef struct
     /* remember references to functions/classes used in trace/progress/auth cb */
     PyObject* function_pinboard_trace_callback;
     PyObject* function_pinboard_progress_handler;
+
+    /* the number of instructions between calls of the progress handler set
+     * with set_progress_handler(), and how many calls of the native handler
+     * make one call of it when query deadlines are checked as well */
+    int progress_handler_n;
+    int progress_handler_every;
+    int progress_handler_calls;
+
+    /* Defaults for the timeout and max_rows of execute(): a timeout in
+     * seconds or 0.0, and a row limit or -1 */
+    double query_timeout;
+    Py_ssize_t max_rows;
+
+    /* 1 once the native progress handler checks query deadlines */
+    int check_deadlines;
+
+    /* the deadline of the query being stepped on pysqlite_monotonic()'s clock,
+     * 0.0 for none, and whether the progress handler interrupted it */
+    double deadline;
+    int deadline_expired;
     PyObject* function_pinboard_authorizer_cb;
     PyObject* function_pinboard_busy_handler_cb;
+    pysqlite_BusyBackoff busy_backoff;
+    PyObject* function_pinboard_wal_hook;
+    PyObject* function_pinboard_update_hook;
+    PyObject* function_pinboard_commit_hook;
+    PyObject* function_pinboard_rollback_hook;
+
+    /* the callback of changes() and the changes waiting for it; NULL while
+     * the feed is off */
+    PyObject* changes_callback;
+    pysqlite_ChangeFeed changes;
+    int changes_delivering;
+
+    /* pragma name => value of the settings applied by connect(), read back
+     * after they were set */
+    PyObject* settings;
 
     /* a dictionary of registered collation name => collation callable mappings */
     PyObject* collations;
 
+    /* 1 once a Python function, aggregate or window function was registered */
+    int python_functions;
+
     /* Exception objects */
     PyObject* Warning;
     PyObject* Error;
@@ -115,12 +260,17 @@ void pysqlite_connection_dealloc(pysqlite_Connection* self);
 PyObject* pysqlite_connection_cursor(pysqlite_Connection* self, PyObject* args, PyObject* kwargs);
 PyObject* pysqlite_connection_close(pysqlite_Connection* self, PyObject* args);
 PyObject* _pysqlite_connection_begin(pysqlite_Connection* self);
+int pysqlite_connection_calls_python(pysqlite_Connection* self);
+int pysqlite_connection_run_statement(pysqlite_Connection* self, sqlite3_stmt** statement, const char* sql);
 PyObject* pysqlite_connection_commit(pysqlite_Connection* self, PyObject* args);
 PyObject* pysqlite_connection_rollback(pysqlite_Connection* self, PyObject* args);
 PyObject* pysqlite_connection_new(PyTypeObject* type, PyObject* args, PyObject* kw);
 int pysqlite_connection_init(pysqlite_Connection* self, PyObject* args, PyObject* kwargs);
 
-int pysqlite_connection_register_cursor(pysqlite_Connection* connection, PyObject* cursor);
+void pysqlite_connection_check_deadlines(pysqlite_Connection* self);
+void pysqlite_connection_deliver_changes(pysqlite_Connection* self);
+void pysqlite_connection_statement_done(pysqlite_Connection* self, const char* sql);
+void pysqlite_connection_register_cursor(pysqlite_Connection* connection, PyObject* cursor);
 int pysqlite_check_thread(pysqlite_Connection* self);
 int pysqlite_check_connection(pysqlite_Connection* con);
 
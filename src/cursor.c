@@ -24,6 +24,7 @@
 #include "cursor.h"
 #include "module.h"
 #include "util.h"
+#include "column_buffer.h"
 
 PyObject* pysqlite_cursor_iternext(pysqlite_Cursor* self);
 
@@ -51,6 +52,7 @@ static int pysqlite_cursor_init(pysqlite_Cursor* self, PyObject* args, PyObject*
     Py_XSETREF(self->lastrowid, Py_None);
 
     self->arraysize = 1;
+    self->buffer_threshold = -1;
     self->closed = 0;
     self->reset = 0;
 
@@ -63,10 +65,12 @@ static int pysqlite_cursor_init(pysqlite_Cursor* self, PyObject* args, PyObject*
         return -1;
     }
 
-    if (!pysqlite_connection_register_cursor(connection, (PyObject*)self)) {
-        return -1;
-    }
+    /* __init__ may be called again with another connection */
+    pysqlite_link_remove(&self->link);
+    pysqlite_connection_register_cursor(connection, (PyObject*)self);
 
+    self->deadline = 0.0;
+    self->rows_left = -1;
     self->initialized = 1;
 
     return 0;
@@ -74,6 +78,8 @@ static int pysqlite_cursor_init(pysqlite_Cursor* self, PyObject* args, PyObject*
 
 static void pysqlite_cursor_dealloc(pysqlite_Cursor* self)
 {
+    pysqlite_link_remove(&self->link);
+
     /* Reset the statement if the user has not closed the cursor */
     if (self->statement) {
         pysqlite_statement_reset(self->statement);
@@ -86,6 +92,9 @@ static void pysqlite_cursor_dealloc(pysqlite_Cursor* self)
     Py_XDECREF(self->lastrowid);
     Py_XDECREF(self->row_factory);
     Py_XDECREF(self->next_row);
+    Py_XDECREF(self->cached_rows);
+    Py_XDECREF(self->capture_key);
+    Py_XDECREF(self->captured_rows);
 
     if (self->in_weakreflist != NULL) {
         PyObject_ClearWeakRefs((PyObject*)self);
@@ -228,6 +237,95 @@ _pysqlite_build_column_decltype(pysqlite_Cursor *self, const char *decltype)
     return PyUnicode_FromStringAndSize(decltype, strlen(decltype));
 }
 
+/*
+ * Returns the converter of column i, or Py_None.
+ */
+static PyObject *
+_pysqlite_get_column_converter(pysqlite_Cursor* self, int i)
+{
+    if (self->connection->detect_types
+            && self->row_cast_map != NULL
+            && i < PyList_GET_SIZE(self->row_cast_map))
+    {
+        return PyList_GET_ITEM(self->row_cast_map, i);
+    }
+    return Py_None;
+}
+
+/*
+ * Builds the Python value of column i. Values for converters are passed
+ * as blobs, with val_str NULL for NULL; other text and blob values are in
+ * val_str and nbytes.
+ */
+static PyObject *
+_pysqlite_build_value(pysqlite_Cursor* self, int i, PyObject* converter, int coltype,
+                      sqlite_int64 ival, double dval, const char* val_str, Py_ssize_t nbytes)
+{
+    PyObject* item;
+    PyObject* converted;
+    char buf[200];
+    const char* colname;
+    PyObject* error_msg;
+
+    if (converter != Py_None) {
+        if (!val_str) {
+            Py_RETURN_NONE;
+        }
+        item = PyBytes_FromStringAndSize(val_str, nbytes);
+        if (!item)
+            return NULL;
+        converted = PyObject_CallFunction(converter, "O", item);
+        Py_DECREF(item);
+        return converted;
+    }
+
+    if (coltype == SQLITE_NULL) {
+        Py_RETURN_NONE;
+    } else if (coltype == SQLITE_INTEGER) {
+        return PyLong_FromLongLong(ival);
+    } else if (coltype == SQLITE_FLOAT) {
+        return PyFloat_FromDouble(dval);
+    } else if (coltype == SQLITE_TEXT) {
+        if (self->connection->text_factory == (PyObject*)&PyUnicode_Type &&
+                self->buffer_threshold >= 0 && nbytes >= self->buffer_threshold) {
+            /* large values skip decoding, see buffer_threshold; other text
+             * factories get them as usual */
+            converted = pysqlite_column_buffer_new(val_str, nbytes);
+        } else if (self->connection->text_factory == (PyObject*)&PyUnicode_Type) {
+            converted = PyUnicode_FromStringAndSize(val_str, nbytes);
+            if (!converted && PyErr_ExceptionMatches(PyExc_UnicodeDecodeError)) {
+                PyErr_Clear();
+                colname = sqlite3_column_name(self->statement->st, i);
+                if (!colname) {
+                    colname = "<unknown column name>";
+                }
+                PyOS_snprintf(buf, sizeof(buf) - 1, "Could not decode to UTF-8 column '%s' with text '%.*s'",
+                             colname, (int)Py_MIN(nbytes, (Py_ssize_t)sizeof(buf)), val_str);
+                error_msg = PyUnicode_Decode(buf, strlen(buf), "ascii", "replace");
+                if (!error_msg) {
+                    PyErr_SetString(pysqlite_OperationalError, "Could not decode to UTF-8");
+                } else {
+                    PyErr_SetObject(pysqlite_OperationalError, error_msg);
+                    Py_DECREF(error_msg);
+                }
+            }
+        } else if (self->connection->text_factory == (PyObject*)&PyBytes_Type) {
+            converted = PyBytes_FromStringAndSize(val_str, nbytes);
+        } else if (self->connection->text_factory == (PyObject*)&PyByteArray_Type) {
+            converted = PyByteArray_FromStringAndSize(val_str, nbytes);
+        } else {
+            converted = PyObject_CallFunction(self->connection->text_factory, "y#", val_str, nbytes);
+        }
+        return converted;
+    } else {
+        /* coltype == SQLITE_BLOB */
+        if (self->buffer_threshold >= 0 && nbytes >= self->buffer_threshold) {
+            return pysqlite_column_buffer_new(val_str, nbytes);
+        }
+        return PyBytes_FromStringAndSize(val_str, nbytes);
+    }
+}
+
 /*
  * Returns a row from the currently active SQLite statement
  *
@@ -239,15 +337,12 @@ _pysqlite_fetch_one_row(pysqlite_Cursor* self)
 {
     int i, numcols;
     PyObject* row;
-    PyObject* item = NULL;
     int coltype;
     PyObject* converter;
     PyObject* converted;
     Py_ssize_t nbytes;
     const char* val_str;
-    char buf[200];
-    const char* colname;
-    PyObject* error_msg;
+    sqlite3_stmt* st = self->statement->st;
 
     if (self->reset) {
         PyErr_SetString(pysqlite_InterfaceError, errmsg_fetch_across_rollback);
@@ -255,7 +350,7 @@ _pysqlite_fetch_one_row(pysqlite_Cursor* self)
     }
 
     Py_BEGIN_ALLOW_THREADS
-    numcols = sqlite3_data_count(self->statement->st);
+    numcols = sqlite3_data_count(st);
     Py_END_ALLOW_THREADS
 
     row = PyTuple_New(numcols);
@@ -263,73 +358,31 @@ _pysqlite_fetch_one_row(pysqlite_Cursor* self)
         return NULL;
 
     for (i = 0; i < numcols; i++) {
-        if (self->connection->detect_types
-                && self->row_cast_map != NULL
-                && i < PyList_GET_SIZE(self->row_cast_map))
-        {
-            converter = PyList_GET_ITEM(self->row_cast_map, i);
-        }
-        else {
-            converter = Py_None;
-        }
+        converter = _pysqlite_get_column_converter(self, i);
 
         if (converter != Py_None) {
-            nbytes = sqlite3_column_bytes(self->statement->st, i);
-            val_str = (const char*)sqlite3_column_blob(self->statement->st, i);
-            if (!val_str) {
-                Py_INCREF(Py_None);
-                converted = Py_None;
-            } else {
-                item = PyBytes_FromStringAndSize(val_str, nbytes);
-                if (!item)
-                    goto error;
-                converted = PyObject_CallFunction(converter, "O", item);
-                Py_DECREF(item);
-            }
+            nbytes = sqlite3_column_bytes(st, i);
+            val_str = (const char*)sqlite3_column_blob(st, i);
+            converted = _pysqlite_build_value(self, i, converter, SQLITE_BLOB, 0, 0.0, val_str, nbytes);
         } else {
             Py_BEGIN_ALLOW_THREADS
-            coltype = sqlite3_column_type(self->statement->st, i);
+            coltype = sqlite3_column_type(st, i);
             Py_END_ALLOW_THREADS
-            if (coltype == SQLITE_NULL) {
-                Py_INCREF(Py_None);
-                converted = Py_None;
-            } else if (coltype == SQLITE_INTEGER) {
-                converted = PyLong_FromLongLong(sqlite3_column_int64(self->statement->st, i));
+            if (coltype == SQLITE_INTEGER) {
+                converted = PyLong_FromLongLong(sqlite3_column_int64(st, i));
             } else if (coltype == SQLITE_FLOAT) {
-                converted = PyFloat_FromDouble(sqlite3_column_double(self->statement->st, i));
+                converted = PyFloat_FromDouble(sqlite3_column_double(st, i));
             } else if (coltype == SQLITE_TEXT) {
-                val_str = (const char*)sqlite3_column_text(self->statement->st, i);
-                nbytes = sqlite3_column_bytes(self->statement->st, i);
-                if (self->connection->text_factory == (PyObject*)&PyUnicode_Type) {
-                    converted = PyUnicode_FromStringAndSize(val_str, nbytes);
-                    if (!converted && PyErr_ExceptionMatches(PyExc_UnicodeDecodeError)) {
-                        PyErr_Clear();
-                        colname = sqlite3_column_name(self->statement->st, i);
-                        if (!colname) {
-                            colname = "<unknown column name>";
-                        }
-                        PyOS_snprintf(buf, sizeof(buf) - 1, "Could not decode to UTF-8 column '%s' with text '%s'",
-                                     colname , val_str);
-                        error_msg = PyUnicode_Decode(buf, strlen(buf), "ascii", "replace");
-                        if (!error_msg) {
-                            PyErr_SetString(pysqlite_OperationalError, "Could not decode to UTF-8");
-                        } else {
-                            PyErr_SetObject(pysqlite_OperationalError, error_msg);
-                            Py_DECREF(error_msg);
-                        }
-                    }
-                } else if (self->connection->text_factory == (PyObject*)&PyBytes_Type) {
-                    converted = PyBytes_FromStringAndSize(val_str, nbytes);
-                } else if (self->connection->text_factory == (PyObject*)&PyByteArray_Type) {
-                    converted = PyByteArray_FromStringAndSize(val_str, nbytes);
-                } else {
-                    converted = PyObject_CallFunction(self->connection->text_factory, "y#", val_str, nbytes);
-                }
+                val_str = (const char*)sqlite3_column_text(st, i);
+                nbytes = sqlite3_column_bytes(st, i);
+                converted = _pysqlite_build_value(self, i, converter, coltype, 0, 0.0, val_str, nbytes);
+            } else if (coltype == SQLITE_BLOB) {
+                val_str = (const char*)sqlite3_column_blob(st, i);
+                nbytes = sqlite3_column_bytes(st, i);
+                converted = _pysqlite_build_value(self, i, converter, coltype, 0, 0.0, val_str, nbytes);
             } else {
-                /* coltype == SQLITE_BLOB */
-                nbytes = sqlite3_column_bytes(self->statement->st, i);
-                converted = PyBytes_FromStringAndSize(
-                    sqlite3_column_blob(self->statement->st, i), nbytes);
+                Py_INCREF(Py_None);
+                converted = Py_None;
             }
         }
 
@@ -349,6 +402,45 @@ error:
     return NULL;
 }
 
+/*
+ * Returns a row copied by the prefetch thread, see _pysqlite_fetch_one_row().
+ */
+static PyObject *
+_pysqlite_build_prefetched_row(pysqlite_Cursor* self, pysqlite_PrefetchRow* prefetched, int numcols)
+{
+    int i;
+    PyObject* row;
+    PyObject* converted;
+    pysqlite_PrefetchValue* value;
+    const char* val_str;
+
+    if (self->reset) {
+        PyErr_SetString(pysqlite_InterfaceError, errmsg_fetch_across_rollback);
+        return NULL;
+    }
+
+    row = PyTuple_New(numcols);
+    if (!row)
+        return NULL;
+
+    for (i = 0; i < numcols; i++) {
+        value = &prefetched->values[i];
+        val_str = NULL;
+        if (value->type == SQLITE_TEXT || value->type == SQLITE_BLOB) {
+            val_str = prefetched->data ? prefetched->data + value->offset : "";
+        }
+        converted = _pysqlite_build_value(self, i, _pysqlite_get_column_converter(self, i),
+                                          value->type, value->ival, value->dval,
+                                          val_str, value->nbytes);
+        if (!converted) {
+            Py_DECREF(row);
+            return NULL;
+        }
+        PyTuple_SET_ITEM(row, i, converted);
+    }
+    return row;
+}
+
 /*
  * Checks if a cursor object is usable.
  *
@@ -374,10 +466,176 @@ static int check_cursor(pysqlite_Cursor* cur)
     return pysqlite_check_thread(cur->connection) && pysqlite_check_connection(cur->connection);
 }
 
+/*
+ * Steps the statement of the cursor with the deadline of its query, which
+ * the progress handler of the connection checks. The deadline is set under
+ * the database mutex, so a prefetch thread stepping another query of the
+ * connection at the same time keeps its own.
+ */
+static int _pysqlite_cursor_step(pysqlite_Cursor* self)
+{
+    pysqlite_Connection* connection = self->connection;
+    sqlite3_mutex* db_mutex = sqlite3_db_mutex(connection->db);
+    double outer_deadline;
+    int rc;
+
+    Py_BEGIN_ALLOW_THREADS
+    sqlite3_mutex_enter(db_mutex);
+    outer_deadline = connection->deadline;
+    connection->deadline = self->deadline;
+    connection->deadline_expired = 0;
+    rc = sqlite3_step(self->statement->st);
+    connection->deadline = outer_deadline;
+    if (rc == SQLITE_DONE) {
+        pysqlite_connection_statement_done(connection, sqlite3_sql(self->statement->st));
+    }
+    sqlite3_mutex_leave(db_mutex);
+    Py_END_ALLOW_THREADS
+    return rc;
+}
+
+/* Sets the exception for a failed _pysqlite_cursor_step() */
+static void _pysqlite_cursor_seterror(pysqlite_Cursor* self)
+{
+    if (self->connection->deadline_expired) {
+        self->connection->deadline_expired = 0;
+        _pysqlite_seterror_timeout();
+    } else {
+        _pysqlite_seterror(self->connection->db);
+    }
+}
+
+/* Forgets the rows from the result cache and the capture of the last query */
+static void _pysqlite_cursor_clear_cached(pysqlite_Cursor* self)
+{
+    Py_CLEAR(self->cached_rows);
+    Py_CLEAR(self->capture_key);
+    Py_CLEAR(self->captured_rows);
+}
+
+/*
+ * Adds a row to the capture of a cacheable query. A capture that outgrows
+ * the result cache is dropped.
+ *
+ * 0 => error; 1 => ok
+ */
+static int _pysqlite_cursor_capture_row(pysqlite_Cursor* self, PyObject* row)
+{
+    pysqlite_ResultCache* cache = self->connection->result_cache;
+
+    if (!self->captured_rows) {
+        return 1;
+    }
+    if (PyTuple_Check(row)) {
+        self->captured_bytes += pysqlite_result_cache_row_size(row);
+    }
+    if (!cache || !PyTuple_Check(row) || self->captured_bytes > cache->max_bytes) {
+        Py_CLEAR(self->capture_key);
+        Py_CLEAR(self->captured_rows);
+        return 1;
+    }
+    return PyList_Append(self->captured_rows, row) == 0;
+}
+
+/*
+ * Stores the captured rows once the query is read to the end, if the
+ * database didn't change in the meantime.
+ *
+ * 0 => error; 1 => ok
+ */
+static int _pysqlite_cursor_capture_done(pysqlite_Cursor* self)
+{
+    pysqlite_ResultCache* cache = self->connection->result_cache;
+    PyObject* rows;
+    int ok = 1;
+
+    if (!self->captured_rows) {
+        return 1;
+    }
+    if (cache && cache->epoch == self->capture_epoch &&
+            pysqlite_result_cache_check(cache, self->connection->db) &&
+            cache->epoch == self->capture_epoch) {
+        rows = PyList_AsTuple(self->captured_rows);
+        ok = rows && pysqlite_result_cache_put(cache, self->capture_key, rows, self->description,
+                                               self->captured_bytes);
+        Py_XDECREF(rows);
+    }
+    Py_CLEAR(self->capture_key);
+    Py_CLEAR(self->captured_rows);
+    return ok;
+}
+
+/*
+ * Looks up a read-only query in the result cache. On a hit, the cursor
+ * returns the cached rows. On a miss, it starts capturing the rows.
+ *
+ * -1 => error; 0 => run the query; 1 => answered by the cache
+ */
+static int _pysqlite_cursor_use_result_cache(pysqlite_Cursor* self, PyObject* sql, PyObject* parameters)
+{
+    pysqlite_ResultCache* cache = self->connection->result_cache;
+    PyObject* key;
+    PyObject* entry;
+    PyObject* rows;
+    sqlite_int64 lastrowid;
+
+    key = pysqlite_result_cache_key(sql, parameters, self->connection->text_factory);
+    if (!key) {
+        return PyErr_Occurred() ? -1 : 0;
+    }
+    if (!pysqlite_result_cache_check(cache, self->connection->db)) {
+        Py_DECREF(key);
+        return 0;
+    }
+
+    entry = pysqlite_result_cache_get(cache, key);
+    if (entry) {
+        Py_DECREF(key);
+        rows = PyTuple_GET_ITEM(entry, 0);
+        Py_INCREF(PyTuple_GET_ITEM(entry, 1));
+        Py_SETREF(self->description, PyTuple_GET_ITEM(entry, 1));
+        self->rowcount = -1L;
+        if (!self->single_shot) {
+            lastrowid = sqlite3_last_insert_rowid(self->connection->db);
+            Py_SETREF(self->lastrowid, PyLong_FromLongLong(lastrowid));
+        }
+        if (PyTuple_GET_SIZE(rows) > 0) {
+            self->next_row = PyTuple_GET_ITEM(rows, 0);
+            Py_INCREF(self->next_row);
+            Py_INCREF(rows);
+            self->cached_rows = rows;
+            self->cached_index = 1;
+        }
+        Py_CLEAR(self->statement);
+        return 1;
+    }
+    if (PyErr_Occurred() || self->rows_left >= 0) {
+        /* a query cut off at max_rows is not cached */
+        Py_DECREF(key);
+        return PyErr_Occurred() ? -1 : 0;
+    }
+
+    self->captured_rows = PyList_New(0);
+    if (!self->captured_rows) {
+        Py_DECREF(key);
+        return -1;
+    }
+    self->capture_key = key;
+    self->captured_bytes = 0;
+    self->capture_epoch = cache->epoch;
+    return 0;
+}
+
+/*
+ * Runs a statement for execute() and executemany(). The statement is taken
+ * from the statement cache by its SQL, unless a prepared statement is given.
+ * timeout and max_rows are NULL to use the defaults of the connection.
+ */
 static PyObject *
-_pysqlite_query_execute(pysqlite_Cursor* self, int multiple, PyObject* args)
+_pysqlite_query_execute(pysqlite_Cursor* self, int multiple, PyObject* operation,
+                        PyObject* second_argument, pysqlite_Statement* prepared,
+                        PyObject* timeout, PyObject* max_rows)
 {
-    PyObject* operation;
     PyObject* parameters_list = NULL;
     PyObject* parameters_iter = NULL;
     PyObject* parameters = NULL;
@@ -388,8 +646,8 @@ _pysqlite_query_execute(pysqlite_Cursor* self, int multiple, PyObject* args)
     int numcols;
     PyObject* column_name;
     PyObject* column_decltype;
-    PyObject* second_argument = NULL;
     sqlite_int64 lastrowid;
+    double timeout_seconds;
 
     if (!check_cursor(self)) {
         goto error;
@@ -399,13 +657,24 @@ _pysqlite_query_execute(pysqlite_Cursor* self, int multiple, PyObject* args)
     self->reset = 0;
 
     Py_CLEAR(self->next_row);
+    _pysqlite_cursor_clear_cached(self);
+
+    timeout_seconds = self->connection->query_timeout;
+    if (timeout && !pysqlite_parse_query_timeout(timeout, &timeout_seconds)) {
+        goto error;
+    }
+    self->rows_left = self->connection->max_rows;
+    if (max_rows && !pysqlite_parse_max_rows(max_rows, &self->rows_left)) {
+        goto error;
+    }
+    self->deadline = 0.0;
+    if (timeout_seconds > 0.0) {
+        pysqlite_connection_check_deadlines(self->connection);
+        self->deadline = pysqlite_monotonic() + timeout_seconds;
+    }
 
     if (multiple) {
         /* executemany() */
-        if (!PyArg_ParseTuple(args, "UO", &operation, &second_argument)) {
-            goto error;
-        }
-
         if (PyIter_Check(second_argument)) {
             /* iterator */
             Py_INCREF(second_argument);
@@ -419,10 +688,6 @@ _pysqlite_query_execute(pysqlite_Cursor* self, int multiple, PyObject* args)
         }
     } else {
         /* execute() */
-        if (!PyArg_ParseTuple(args, "U|O", &operation, &second_argument)) {
-            goto error;
-        }
-
         parameters_list = PyList_New(0);
         if (!parameters_list) {
             goto error;
@@ -458,25 +723,30 @@ _pysqlite_query_execute(pysqlite_Cursor* self, int multiple, PyObject* args)
     Py_SETREF(self->description, Py_None);
     self->rowcount = 0L;
 
-    func_args = PyTuple_New(1);
-    if (!func_args) {
-        goto error;
-    }
-    Py_INCREF(operation);
-    if (PyTuple_SetItem(func_args, 0, operation) != 0) {
-        goto error;
-    }
-
     if (self->statement) {
         (void)pysqlite_statement_reset(self->statement);
     }
 
-    Py_XSETREF(self->statement,
-              (pysqlite_Statement *)pysqlite_cache_get(self->connection->statement_cache, func_args));
-    Py_DECREF(func_args);
+    if (prepared) {
+        Py_INCREF(prepared);
+        Py_XSETREF(self->statement, prepared);
+    } else {
+        func_args = PyTuple_New(1);
+        if (!func_args) {
+            goto error;
+        }
+        Py_INCREF(operation);
+        if (PyTuple_SetItem(func_args, 0, operation) != 0) {
+            goto error;
+        }
 
-    if (!self->statement) {
-        goto error;
+        Py_XSETREF(self->statement,
+                  (pysqlite_Statement *)pysqlite_cache_get(self->connection->statement_cache, func_args));
+        Py_DECREF(func_args);
+
+        if (!self->statement) {
+            goto error;
+        }
     }
 
     if (self->statement->in_use) {
@@ -492,6 +762,22 @@ _pysqlite_query_execute(pysqlite_Cursor* self, int multiple, PyObject* args)
         }
     }
 
+    if (self->connection->result_cache) {
+        if (!self->statement->readonly) {
+            pysqlite_result_cache_clear(self->connection->result_cache);
+        } else if (!multiple && self->statement->cacheable && self->buffer_threshold < 0) {
+            if (self->statement->cacheable < 0) {
+                self->statement->cacheable = pysqlite_result_cache_statement_ok(self->connection->db,
+                                                                                self->statement->st);
+            }
+            rc = self->statement->cacheable ? _pysqlite_cursor_use_result_cache(self, operation, second_argument) : 0;
+            if (rc < 0 || rc == 1) {
+                /* an error, or answered by the cache */
+                goto error;
+            }
+        }
+    }
+
     pysqlite_statement_reset(self->statement);
     pysqlite_statement_mark_dirty(self->statement);
 
@@ -520,7 +806,7 @@ _pysqlite_query_execute(pysqlite_Cursor* self, int multiple, PyObject* args)
             goto error;
         }
 
-        rc = pysqlite_step(self->statement->st, self->connection);
+        rc = _pysqlite_cursor_step(self);
         if (rc != SQLITE_DONE && rc != SQLITE_ROW) {
             if (PyErr_Occurred()) {
                 /* there was an error that occurred in a user-defined callback */
@@ -531,7 +817,7 @@ _pysqlite_query_execute(pysqlite_Cursor* self, int multiple, PyObject* args)
                 }
             }
             (void)pysqlite_statement_reset(self->statement);
-            _pysqlite_seterror(self->connection->db);
+            _pysqlite_cursor_seterror(self);
             goto error;
         }
 
@@ -544,7 +830,10 @@ _pysqlite_query_execute(pysqlite_Cursor* self, int multiple, PyObject* args)
         Py_BEGIN_ALLOW_THREADS
         numcols = sqlite3_column_count(self->statement->st);
         Py_END_ALLOW_THREADS
-        if (self->description == Py_None && numcols > 0) {
+        /* only row factories and the result cache can see the description of
+         * a single-shot query */
+        if (self->description == Py_None && numcols > 0 &&
+                !(self->single_shot && self->row_factory == Py_None && !self->capture_key)) {
             Py_SETREF(self->description, PyTuple_New(numcols));
             if (!self->description) {
                 goto error;
@@ -586,7 +875,7 @@ _pysqlite_query_execute(pysqlite_Cursor* self, int multiple, PyObject* args)
             self->rowcount= -1L;
         }
 
-        if (!multiple) {
+        if (!multiple && !self->single_shot) {
             Py_DECREF(self->lastrowid);
             Py_BEGIN_ALLOW_THREADS
             lastrowid = sqlite3_last_insert_rowid(self->connection->db);
@@ -603,9 +892,15 @@ _pysqlite_query_execute(pysqlite_Cursor* self, int multiple, PyObject* args)
             self->next_row = _pysqlite_fetch_one_row(self);
             if (self->next_row == NULL)
                 goto error;
+            if (!_pysqlite_cursor_capture_row(self, self->next_row)) {
+                goto error;
+            }
         } else if (rc == SQLITE_DONE && !multiple) {
             pysqlite_statement_reset(self->statement);
             Py_CLEAR(self->statement);
+            if (!_pysqlite_cursor_capture_done(self)) {
+                goto error;
+            }
         }
 
         if (multiple) {
@@ -621,6 +916,10 @@ error:
 
     self->locked = 0;
 
+    if (self->connection) {
+        pysqlite_connection_deliver_changes(self->connection);
+    }
+
     if (PyErr_Occurred()) {
         self->rowcount = -1L;
         return NULL;
@@ -630,55 +929,273 @@ error:
     }
 }
 
-PyObject* pysqlite_cursor_execute(pysqlite_Cursor* self, PyObject* args)
+PyObject* pysqlite_cursor_execute(pysqlite_Cursor* self, PyObject* args, PyObject* kwargs)
 {
-    return _pysqlite_query_execute(self, 0, args);
+    PyObject* operation;
+    PyObject* parameters = NULL;
+    PyObject* timeout = NULL;
+    PyObject* max_rows = NULL;
+
+    static char *kwlist[] = {"sql", "parameters", "timeout", "max_rows", NULL};
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "U|O$OO:execute", kwlist,
+                                     &operation, &parameters, &timeout, &max_rows)) {
+        return NULL;
+    }
+    return _pysqlite_query_execute(self, 0, operation, parameters, NULL, timeout, max_rows);
 }
 
-PyObject* pysqlite_cursor_executemany(pysqlite_Cursor* self, PyObject* args)
+PyObject* pysqlite_cursor_executemany(pysqlite_Cursor* self, PyObject* args, PyObject* kwargs)
 {
-    return _pysqlite_query_execute(self, 1, args);
+    PyObject* operation;
+    PyObject* parameters;
+    PyObject* timeout = NULL;
+
+    static char *kwlist[] = {"sql", "seq_of_parameters", "timeout", NULL};
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "UO|$O:executemany", kwlist,
+                                     &operation, &parameters, &timeout)) {
+        return NULL;
+    }
+    return _pysqlite_query_execute(self, 1, operation, parameters, NULL, timeout, NULL);
 }
 
-static PyObject *
-pysqlite_cursor_executescript(pysqlite_Cursor* self, PyObject* args)
+/*
+ * Runs a query for Connection.fetchone(), fetchall() and fetchval() and
+ * returns its result instead of the cursor. The statement is reset when
+ * the result is taken, even if rows are left.
+ */
+PyObject* pysqlite_cursor_query(pysqlite_Cursor* self, PyObject* sql, PyObject* parameters, int mode)
 {
-    PyObject* script_obj;
-    const char* script_cstr;
-    sqlite3_stmt* statement;
-    int rc;
     PyObject* result;
+    PyObject* value;
 
-    if (!PyArg_ParseTuple(args, "O", &script_obj)) {
+    self->single_shot = 1;
+    result = _pysqlite_query_execute(self, 0, sql, parameters, NULL, NULL, NULL);
+    self->single_shot = 0;
+    if (!result) {
         return NULL;
     }
+    Py_DECREF(result);
 
-    if (!check_cursor(self)) {
-        return NULL;
+    if (mode == PYSQLITE_FETCH_ALL) {
+        result = pysqlite_cursor_fetchall(self, NULL);
+    } else {
+        result = pysqlite_cursor_fetchone(self, NULL);
+        if (result && result != Py_None && mode == PYSQLITE_FETCH_VALUE) {
+            value = PySequence_GetItem(result, 0);
+            Py_SETREF(result, value);
+        }
     }
 
-    self->reset = 0;
+    if (self->statement) {
+        (void)pysqlite_statement_reset(self->statement);
+        Py_CLEAR(self->statement);
+    }
+    Py_CLEAR(self->next_row);
+    _pysqlite_cursor_clear_cached(self);
+    return result;
+}
 
-    if (PyUnicode_Check(script_obj)) {
-        script_cstr = PyUnicode_AsUTF8(script_obj);
-        if (!script_cstr) {
-            return NULL;
+/*
+ * Runs a statement prepared with Connection.prepare(). parameters may be
+ * NULL for execute(); executemany() needs an iterable of them.
+ */
+PyObject* pysqlite_cursor_execute_statement(pysqlite_Cursor* self, pysqlite_Statement* statement,
+                                            PyObject* parameters, int multiple)
+{
+    return _pysqlite_query_execute(self, multiple, statement->sql, parameters, statement, NULL, NULL);
+}
+
+/*
+ * Starts a transaction for executescript() and executebatch(), using the
+ * isolation level of the connection if there is one.
+ */
+static int _pysqlite_batch_begin(pysqlite_Cursor* self)
+{
+    PyObject* result;
+    int rc;
+
+    if (self->connection->begin_statement) {
+        result = _pysqlite_connection_begin(self->connection);
+        if (!result) {
+            return -1;
         }
-    } else {
-        PyErr_SetString(PyExc_ValueError, "script argument must be unicode.");
-        return NULL;
+        Py_DECREF(result);
+        return 0;
     }
 
-    /* commit first */
-    result = pysqlite_connection_commit(self->connection, NULL);
-    if (!result) {
-        goto error;
+    Py_BEGIN_ALLOW_THREADS
+    rc = sqlite3_exec(self->connection->db, "BEGIN", NULL, NULL, NULL);
+    Py_END_ALLOW_THREADS
+    if (rc != SQLITE_OK) {
+        _pysqlite_seterror(self->connection->db);
+        return -1;
     }
-    Py_DECREF(result);
+    return 0;
+}
 
-    while (1) {
-        Py_BEGIN_ALLOW_THREADS
-        rc = sqlite3_prepare_v2(self->connection->db,
+/*
+ * Ends the transaction started by _pysqlite_batch_begin(): commits it,
+ * or rolls it back if an exception is set, keeping the exception.
+ */
+static int _pysqlite_batch_end(pysqlite_Cursor* self)
+{
+    PyObject *result, *exc_type, *exc_value, *exc_tb;
+
+    if (!PyErr_Occurred()) {
+        result = pysqlite_connection_commit(self->connection, NULL);
+        if (!result) {
+            return -1;
+        }
+        Py_DECREF(result);
+        return 0;
+    }
+
+    PyErr_Fetch(&exc_type, &exc_value, &exc_tb);
+    result = pysqlite_connection_rollback(self->connection, NULL);
+    if (result) {
+        Py_DECREF(result);
+        PyErr_Restore(exc_type, exc_value, exc_tb);
+    } else {
+        /* the rollback error is more important than the original one */
+        Py_XDECREF(exc_type);
+        Py_XDECREF(exc_value);
+        Py_XDECREF(exc_tb);
+    }
+    return -1;
+}
+
+/*
+ * Runs one statement of executescript() or executebatch() to completion,
+ * taking the prepared statement from the statement cache. Rows returned by
+ * SELECT statements are ignored. parameters may be NULL.
+ *
+ * 0 => ok; -1 => error
+ */
+static int _pysqlite_batch_step(pysqlite_Cursor* self, PyObject* sql, PyObject* parameters)
+{
+    pysqlite_Statement* statement;
+    PyObject* func_args;
+    int rc;
+
+    func_args = PyTuple_Pack(1, sql);
+    if (!func_args) {
+        return -1;
+    }
+    statement = (pysqlite_Statement *)pysqlite_cache_get(self->connection->statement_cache, func_args);
+    Py_DECREF(func_args);
+    if (!statement) {
+        return -1;
+    }
+
+    if (statement->in_use) {
+        /* a cursor is still reading from the cached statement */
+        Py_SETREF(statement, PyObject_New(pysqlite_Statement, &pysqlite_StatementType));
+        if (!statement) {
+            return -1;
+        }
+        rc = pysqlite_statement_create(statement, self->connection, sql);
+        if (rc != SQLITE_OK) {
+            if (!PyErr_Occurred()) {
+                _pysqlite_seterror(self->connection->db);
+            }
+            Py_DECREF(statement);
+            return -1;
+        }
+    }
+
+    if (statement->st == NULL) {
+        /* nothing but comments */
+        Py_DECREF(statement);
+        return 0;
+    }
+
+    pysqlite_statement_reset(statement);
+    pysqlite_statement_mark_dirty(statement);
+
+    if (parameters) {
+        pysqlite_statement_bind_parameters(statement, parameters);
+        if (PyErr_Occurred()) {
+            goto error;
+        }
+    }
+
+    do {
+        rc = pysqlite_step(statement->st, self->connection);
+    } while (rc == SQLITE_ROW);
+
+    if (rc != SQLITE_DONE) {
+        if (PyErr_Occurred()) {
+            /* there was an error that occurred in a user-defined callback */
+            if (_pysqlite_enable_callback_tracebacks) {
+                PyErr_Print();
+            } else {
+                PyErr_Clear();
+            }
+        }
+        (void)pysqlite_statement_reset(statement);
+        _pysqlite_seterror(self->connection->db);
+        goto error;
+    }
+
+    if (statement->is_dml) {
+        self->rowcount += (long)sqlite3_changes(self->connection->db);
+    }
+    pysqlite_statement_reset(statement);
+    Py_DECREF(statement);
+    return 0;
+
+error:
+    pysqlite_statement_reset(statement);
+    Py_DECREF(statement);
+    return -1;
+}
+
+/*
+ * Runs a script one statement at a time through the statement cache.
+ * Statements end at a semicolon that sqlite3_complete() accepts, so
+ * semicolons in strings, comments and trigger bodies don't split them.
+ */
+static int _pysqlite_script_cached(pysqlite_Cursor* self, const char* script)
+{
+    const char *start = script, *end;
+    PyObject* sql;
+    int rc;
+
+    while (pysqlite_check_remaining_sql(start)) {
+        end = start;
+        while (1) {
+            end = strchr(end, ';');
+            end = end ? end + 1 : start + strlen(start);
+            sql = PyUnicode_DecodeUTF8(start, end - start, NULL);
+            if (!sql) {
+                return -1;
+            }
+            if (*end == 0 || sqlite3_complete(PyUnicode_AsUTF8(sql))) {
+                break;
+            }
+            Py_DECREF(sql);
+        }
+
+        rc = _pysqlite_batch_step(self, sql, NULL);
+        Py_DECREF(sql);
+        if (rc < 0) {
+            return -1;
+        }
+        start = end;
+    }
+    return 0;
+}
+
+static int _pysqlite_script_uncached(pysqlite_Cursor* self, const char* script_cstr)
+{
+    sqlite3_stmt* statement;
+    int rc;
+
+    while (1) {
+        Py_BEGIN_ALLOW_THREADS
+        rc = sqlite3_prepare_v2(self->connection->db,
                                 script_cstr,
                                 -1,
                                 &statement,
@@ -686,7 +1203,11 @@ pysqlite_cursor_executescript(pysqlite_Cursor* self, PyObject* args)
         Py_END_ALLOW_THREADS
         if (rc != SQLITE_OK) {
             _pysqlite_seterror(self->connection->db);
-            goto error;
+            return -1;
+        }
+        if (statement == NULL) {
+            /* nothing but whitespace and comments left */
+            return 0;
         }
 
         /* execute statement, and ignore results of SELECT statements */
@@ -694,37 +1215,275 @@ pysqlite_cursor_executescript(pysqlite_Cursor* self, PyObject* args)
             rc = pysqlite_step(statement, self->connection);
             if (PyErr_Occurred()) {
                 (void)sqlite3_finalize(statement);
-                goto error;
+                return -1;
             }
         } while (rc == SQLITE_ROW);
 
         if (rc != SQLITE_DONE) {
             (void)sqlite3_finalize(statement);
             _pysqlite_seterror(self->connection->db);
-            goto error;
+            return -1;
         }
 
         rc = sqlite3_finalize(statement);
         if (rc != SQLITE_OK) {
             _pysqlite_seterror(self->connection->db);
-            goto error;
+            return -1;
         }
 
         if (*script_cstr == (char)0) {
-            break;
+            return 0;
         }
     }
+}
 
-error:
-    if (PyErr_Occurred()) {
+static PyObject *
+pysqlite_cursor_executescript(pysqlite_Cursor* self, PyObject* args, PyObject* kwargs)
+{
+    static char *kwlist[] = {"sql_script", "commit", "transaction", "cached", NULL};
+    PyObject* script_obj;
+    const char* script_cstr;
+    int commit = 1, transaction = 0, cached = 0;
+    int own_transaction = 0;
+    int rc;
+    PyObject* result;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "O|$ppp:executescript", kwlist,
+                                     &script_obj, &commit, &transaction, &cached)) {
+        return NULL;
+    }
+
+    if (!check_cursor(self)) {
+        return NULL;
+    }
+
+    self->reset = 0;
+
+    if (PyUnicode_Check(script_obj)) {
+        script_cstr = PyUnicode_AsUTF8(script_obj);
+        if (!script_cstr) {
+            return NULL;
+        }
+    } else {
+        PyErr_SetString(PyExc_ValueError, "script argument must be unicode.");
         return NULL;
+    }
+
+    /* commit first */
+    if (commit) {
+        result = pysqlite_connection_commit(self->connection, NULL);
+        if (!result) {
+            return NULL;
+        }
+        Py_DECREF(result);
+    }
+
+    if (transaction && sqlite3_get_autocommit(self->connection->db)) {
+        if (_pysqlite_batch_begin(self) < 0) {
+            return NULL;
+        }
+        own_transaction = 1;
+    }
+
+    if (cached) {
+        rc = _pysqlite_script_cached(self, script_cstr);
     } else {
+        rc = _pysqlite_script_uncached(self, script_cstr);
+    }
+
+    if (own_transaction) {
+        rc = _pysqlite_batch_end(self);
+    }
+
+    pysqlite_connection_deliver_changes(self->connection);
+    if (rc < 0) {
+        return NULL;
+    }
+    Py_INCREF(self);
+    return (PyObject*)self;
+}
+
+static PyObject *
+pysqlite_cursor_executebatch(pysqlite_Cursor* self, PyObject* args, PyObject* kwargs)
+{
+    static char *kwlist[] = {"batch", "transaction", NULL};
+    PyObject *batch, *iter, *item;
+    PyObject *sql, *parameters, *lastrowid;
+    int transaction = 1;
+    int own_transaction = 0;
+    int rc = 0;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "O|$p:executebatch", kwlist,
+                                     &batch, &transaction)) {
+        return NULL;
+    }
+
+    if (!check_cursor(self)) {
+        return NULL;
+    }
+
+    iter = PyObject_GetIter(batch);
+    if (!iter) {
+        return NULL;
+    }
+
+    self->locked = 1;
+    self->reset = 0;
+    Py_CLEAR(self->next_row);
+    if (self->statement) {
+        (void)pysqlite_statement_reset(self->statement);
+        Py_CLEAR(self->statement);
+    }
+    Py_INCREF(Py_None);
+    Py_SETREF(self->description, Py_None);
+    self->rowcount = 0L;
+
+    if (transaction && sqlite3_get_autocommit(self->connection->db)) {
+        if (_pysqlite_batch_begin(self) < 0) {
+            rc = -1;
+            goto done;
+        }
+        own_transaction = 1;
+    }
+
+    while ((item = PyIter_Next(iter)) != NULL) {
+        if (PyUnicode_Check(item)) {
+            rc = _pysqlite_batch_step(self, item, NULL);
+        } else if (PyTuple_Check(item) && PyTuple_GET_SIZE(item) == 2 &&
+                   PyUnicode_Check(PyTuple_GET_ITEM(item, 0))) {
+            sql = PyTuple_GET_ITEM(item, 0);
+            parameters = PyTuple_GET_ITEM(item, 1);
+            rc = _pysqlite_batch_step(self, sql, parameters);
+        } else {
+            PyErr_SetString(PyExc_TypeError,
+                            "executebatch() items must be SQL strings or (sql, parameters) tuples");
+            rc = -1;
+        }
+        Py_DECREF(item);
+        if (rc < 0) {
+            break;
+        }
+    }
+    if (PyErr_Occurred()) {
+        rc = -1;
+    }
+
+    if (own_transaction) {
+        rc = _pysqlite_batch_end(self);
+    }
+
+done:
+    Py_DECREF(iter);
+    self->locked = 0;
+
+    if (rc < 0) {
+        self->rowcount = -1L;
+        pysqlite_connection_deliver_changes(self->connection);
+        return NULL;
+    }
+
+    lastrowid = PyLong_FromLongLong(sqlite3_last_insert_rowid(self->connection->db));
+    pysqlite_connection_deliver_changes(self->connection);
+    if (!lastrowid) {
+        return NULL;
+    }
+    Py_SETREF(self->lastrowid, lastrowid);
+    Py_INCREF(self);
+    return (PyObject*)self;
+}
+
+/*
+ * Takes the next row from the prefetch thread into self->next_row,
+ * which stays NULL at the end of the results. If the thread handed the
+ * statement back, it is stopped and the caller steps the statement.
+ *
+ * 0 => ok; 1 => step the statement; -1 => error
+ */
+static int _pysqlite_fetch_prefetched(pysqlite_Cursor* self)
+{
+    pysqlite_Prefetch* prefetch = self->statement->prefetch;
+    pysqlite_PrefetchRow* row;
+    int rc;
+
+    rc = pysqlite_prefetch_wait(prefetch, &row);
+    if (rc == 2) {
+        pysqlite_statement_stop_prefetch(self->statement);
+        return 1;
+    }
+    if (rc <= 0) {
+        return rc;
+    }
+    self->next_row = _pysqlite_build_prefetched_row(self, row, prefetch->ncols);
+    pysqlite_prefetch_pop(prefetch);
+    return self->next_row ? 0 : -1;
+}
+
+static PyObject *
+pysqlite_cursor_prefetch(pysqlite_Cursor* self, PyObject* args, PyObject* kwargs)
+{
+    static char *kwlist[] = {"rows", NULL};
+    int rows = 256;
+    int i, numcols;
+    unsigned char* raw;
+    pysqlite_Prefetch* prefetch;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "|i:prefetch", kwlist, &rows)) {
+        return NULL;
+    }
+
+    if (!check_cursor(self)) {
+        return NULL;
+    }
+
+    if (rows < 1) {
+        PyErr_SetString(PyExc_ValueError, "rows must be greater than zero");
+        return NULL;
+    }
+
+    /* the thread relies on the database mutex to share the connection */
+    if (!sqlite3_threadsafe() || !sqlite3_db_mutex(self->connection->db)) {
+        PyErr_SetString(pysqlite_NotSupportedError,
+                        "prefetch() needs a connection opened without SQLITE_OPEN_NOMUTEX");
+        return NULL;
+    }
+
+    /* the statement is positioned on self->next_row, the thread goes on
+     * from there; it can't run Python callbacks, so the query is stepped
+     * as usual if it may call them */
+    if (!self->statement || !self->next_row ||
+        pysqlite_connection_calls_python(self->connection)) {
         Py_INCREF(self);
         return (PyObject*)self;
     }
+    if (self->statement->prefetch) {
+        PyErr_SetString(pysqlite_ProgrammingError, "prefetch() was already called for this query");
+        return NULL;
+    }
+    /* the rows are read by the thread, without the result cache */
+    Py_CLEAR(self->capture_key);
+    Py_CLEAR(self->captured_rows);
+
+    numcols = sqlite3_column_count(self->statement->st);
+    raw = PyMem_Calloc(numcols ? numcols : 1, 1);
+    if (!raw) {
+        return PyErr_NoMemory();
+    }
+    for (i = 0; i < numcols; i++) {
+        raw[i] = _pysqlite_get_column_converter(self, i) != Py_None;
+    }
+
+    prefetch = pysqlite_prefetch_start(self->connection, self->statement->st, rows, raw,
+                                       self->deadline);
+    PyMem_Free(raw);
+    if (!prefetch) {
+        return NULL;
+    }
+    self->statement->prefetch = prefetch;
+    Py_INCREF(self);
+    return (PyObject*)self;
 }
 
-PyObject* pysqlite_cursor_iternext(pysqlite_Cursor *self)
+static PyObject* _pysqlite_cursor_iternext(pysqlite_Cursor *self)
 {
     PyObject* next_row_tuple;
     PyObject* next_row;
@@ -739,11 +1498,12 @@ PyObject* pysqlite_cursor_iternext(pysqlite_Cursor *self)
         return NULL;
     }
 
-    if (!self->next_row) {
+    if (!self->next_row || self->rows_left == 0) {
          if (self->statement) {
             (void)pysqlite_statement_reset(self->statement);
             Py_CLEAR(self->statement);
         }
+        Py_CLEAR(self->next_row);
         return NULL;
     }
 
@@ -762,8 +1522,30 @@ PyObject* pysqlite_cursor_iternext(pysqlite_Cursor *self)
         next_row = next_row_tuple;
     }
 
-    if (self->statement) {
-        rc = pysqlite_step(self->statement->st, self->connection);
+    if (self->rows_left > 0 && --self->rows_left == 0) {
+        /* max_rows reached, the rest of the query is not run */
+        if (self->statement) {
+            (void)pysqlite_statement_reset(self->statement);
+            Py_CLEAR(self->statement);
+        }
+        Py_CLEAR(self->cached_rows);
+    } else if (self->cached_rows) {
+        if (self->cached_index < PyTuple_GET_SIZE(self->cached_rows)) {
+            self->next_row = PyTuple_GET_ITEM(self->cached_rows, self->cached_index++);
+            Py_INCREF(self->next_row);
+        } else {
+            Py_CLEAR(self->cached_rows);
+        }
+    } else if (self->statement && self->statement->prefetch &&
+               (rc = _pysqlite_fetch_prefetched(self)) <= 0) {
+        /* unless the thread handed the statement back to be stepped below */
+        if (rc < 0) {
+            (void)pysqlite_statement_reset(self->statement);
+            Py_DECREF(next_row);
+            return NULL;
+        }
+    } else if (self->statement) {
+        rc = _pysqlite_cursor_step(self);
         if (PyErr_Occurred()) {
             (void)pysqlite_statement_reset(self->statement);
             Py_DECREF(next_row);
@@ -772,7 +1554,7 @@ PyObject* pysqlite_cursor_iternext(pysqlite_Cursor *self)
         if (rc != SQLITE_DONE && rc != SQLITE_ROW) {
             (void)pysqlite_statement_reset(self->statement);
             Py_DECREF(next_row);
-            _pysqlite_seterror(self->connection->db);
+            _pysqlite_cursor_seterror(self);
             return NULL;
         }
 
@@ -782,12 +1564,31 @@ PyObject* pysqlite_cursor_iternext(pysqlite_Cursor *self)
                 (void)pysqlite_statement_reset(self->statement);
                 return NULL;
             }
+            if (!_pysqlite_cursor_capture_row(self, self->next_row)) {
+                Py_DECREF(next_row);
+                return NULL;
+            }
+        } else if (!_pysqlite_cursor_capture_done(self)) {
+            Py_DECREF(next_row);
+            return NULL;
         }
     }
 
     return next_row;
 }
 
+PyObject* pysqlite_cursor_iternext(pysqlite_Cursor *self)
+{
+    PyObject* next_row;
+
+    next_row = _pysqlite_cursor_iternext(self);
+    /* a statement like INSERT ... RETURNING commits when it is done */
+    if (self->connection) {
+        pysqlite_connection_deliver_changes(self->connection);
+    }
+    return next_row;
+}
+
 PyObject* pysqlite_cursor_fetchone(pysqlite_Cursor* self, PyObject* args)
 {
     PyObject* row;
@@ -858,6 +1659,655 @@ PyObject* pysqlite_cursor_fetchall(pysqlite_Cursor* self, PyObject* args)
     }
 }
 
+/* Output formats accepted by export(). */
+enum {
+    EXPORT_CSV,
+    EXPORT_TSV,
+    EXPORT_JSONL
+};
+
+/* Output is written in blocks of at least this size. */
+#define EXPORT_BLOCK_SIZE (1 << 20)
+
+/* Returned when the output buffer cannot grow. */
+#define EXPORT_NOMEM (-1)
+
+typedef struct {
+    char* data;
+    size_t size;
+    size_t alloc;
+} ExportBuffer;
+
+typedef struct {
+    sqlite3_stmt* st;
+    PyObject* row;              /* a row of the result cache, read instead of st */
+    int format;
+    int ncols;
+    ExportBuffer out;
+    ExportBuffer keys;          /* JSON keys with their quotes and colons */
+    size_t* key_offsets;        /* ncols + 1 offsets into keys */
+    sqlite3_int64 rows;
+    Py_ssize_t rows_left;       /* rows allowed by max_rows, or -1 */
+} ExportState;
+
+static const char export_hex_digits[] = "0123456789abcdef";
+
+static int _export_reserve(ExportBuffer* buf, size_t n)
+{
+    char* data;
+    size_t alloc;
+
+    if (buf->size + n <= buf->alloc) {
+        return 0;
+    }
+    alloc = (buf->size + n) * 2;
+    if (alloc < EXPORT_BLOCK_SIZE) {
+        alloc = EXPORT_BLOCK_SIZE + 4096;
+    }
+    data = PyMem_RawRealloc(buf->data, alloc);
+    if (!data) {
+        return EXPORT_NOMEM;
+    }
+    buf->data = data;
+    buf->alloc = alloc;
+    return 0;
+}
+
+static int _export_append(ExportBuffer* buf, const char* z, size_t n)
+{
+    if (_export_reserve(buf, n)) {
+        return EXPORT_NOMEM;
+    }
+    memcpy(buf->data + buf->size, z, n);
+    buf->size += n;
+    return 0;
+}
+
+static int _export_int64(ExportBuffer* buf, sqlite3_int64 value)
+{
+    char z[24];
+    char* end = z + sizeof(z);
+    char* p = end;
+    sqlite3_uint64 u = value < 0 ? (sqlite3_uint64)0 - (sqlite3_uint64)value : (sqlite3_uint64)value;
+
+    do {
+        *--p = (char)('0' + u % 10);
+        u /= 10;
+    } while (u);
+    if (value < 0) {
+        *--p = '-';
+    }
+    return _export_append(buf, p, end - p);
+}
+
+/*
+ * Appends the shortest representation that reads back as the same double,
+ * like repr() does.
+ */
+static int _export_double(ExportBuffer* buf, double value, int json)
+{
+    static const double scale[] = {1e0, 1e1, 1e2, 1e3, 1e4, 1e5, 1e6};
+    char z[32];
+    int n, precision, digits;
+
+    if (Py_IS_NAN(value)) {
+        return _export_append(buf, json ? "NaN" : "nan", 3);
+    }
+    if (Py_IS_INFINITY(value)) {
+        if (json) {
+            return value > 0 ? _export_append(buf, "Infinity", 8) : _export_append(buf, "-Infinity", 9);
+        }
+        return value > 0 ? _export_append(buf, "inf", 3) : _export_append(buf, "-inf", 4);
+    }
+
+    /* most values have a few decimal digits and need no printf */
+    if (fabs(value) < 1e16 && (fabs(value) >= 1e-4 || value == 0.0) && !(value == 0.0 && signbit(value))) {
+        for (digits = 0; digits < (int)(sizeof(scale) / sizeof(scale[0])); digits++) {
+            double m = round(value * scale[digits]);
+            if (fabs(m) < 9007199254740992.0 && m / scale[digits] == value) {
+                sqlite3_int64 whole = (sqlite3_int64)m;
+                sqlite3_int64 unit = (sqlite3_int64)scale[digits];
+                sqlite3_int64 frac = whole % unit;
+                if (frac < 0) {
+                    frac = -frac;
+                }
+                if (whole < 0 && whole / unit == 0 && _export_append(buf, "-", 1)) {
+                    return EXPORT_NOMEM;
+                }
+                if (_export_int64(buf, whole / unit) || _export_append(buf, ".", 1)) {
+                    return EXPORT_NOMEM;
+                }
+                if (digits == 0) {
+                    return _export_append(buf, "0", 1);
+                }
+                n = PyOS_snprintf(z, sizeof(z), "%0*lld", digits, (long long)frac);
+                return _export_append(buf, z, n);
+            }
+        }
+    }
+
+    for (precision = 15; ; precision++) {
+        n = PyOS_snprintf(z, sizeof(z) - 2, "%.*g", precision, value);
+        if (precision == 17 || strtod(z, NULL) == value) {
+            break;
+        }
+    }
+    if (!strpbrk(z, ".e")) {
+        if (fabs(value) >= 1e16) {
+            /* %g prints up to 17 digits without an exponent, repr() up to 16 */
+            n = PyOS_snprintf(z, sizeof(z), "%.*e", precision - 1, value);
+        } else {
+            z[n++] = '.';
+            z[n++] = '0';
+        }
+    }
+    return _export_append(buf, z, n);
+}
+
+static int _export_hex(ExportBuffer* buf, const unsigned char* z, size_t n)
+{
+    char* out;
+    size_t i;
+
+    if (_export_reserve(buf, n * 2)) {
+        return EXPORT_NOMEM;
+    }
+    out = buf->data + buf->size;
+    for (i = 0; i < n; i++) {
+        *out++ = export_hex_digits[z[i] >> 4];
+        *out++ = export_hex_digits[z[i] & 0x0f];
+    }
+    buf->size += n * 2;
+    return 0;
+}
+
+/*
+ * Appends a CSV or TSV field, quoting it if it contains the delimiter,
+ * a quote or a line break.
+ */
+static int _export_delimited(ExportBuffer* buf, const char* z, size_t n, char delimiter)
+{
+    char* out;
+    size_t i;
+
+    for (i = 0; i < n; i++) {
+        char c = z[i];
+        if (c == delimiter || c == '"' || c == '\n' || c == '\r') {
+            break;
+        }
+    }
+    if (i == n) {
+        return _export_append(buf, z, n);
+    }
+
+    /* worst case: every character is a quote */
+    if (_export_reserve(buf, n * 2 + 2)) {
+        return EXPORT_NOMEM;
+    }
+    out = buf->data + buf->size;
+    *out++ = '"';
+    for (i = 0; i < n; i++) {
+        if (z[i] == '"') {
+            *out++ = '"';
+        }
+        *out++ = z[i];
+    }
+    *out++ = '"';
+    buf->size = out - buf->data;
+    return 0;
+}
+
+/*
+ * Appends a JSON string. Non-ASCII characters are written as is.
+ */
+static int _export_json_string(ExportBuffer* buf, const char* z, size_t n)
+{
+    char* out;
+    size_t i;
+
+    /* worst case: every character is a \u00XX escape */
+    if (_export_reserve(buf, n * 6 + 2)) {
+        return EXPORT_NOMEM;
+    }
+    out = buf->data + buf->size;
+    *out++ = '"';
+    for (i = 0; i < n; i++) {
+        unsigned char c = (unsigned char)z[i];
+        if (c >= 0x20 && c != '"' && c != '\\') {
+            *out++ = c;
+            continue;
+        }
+        *out++ = '\\';
+        switch (c) {
+            case '"': *out++ = '"'; break;
+            case '\\': *out++ = '\\'; break;
+            case '\n': *out++ = 'n'; break;
+            case '\r': *out++ = 'r'; break;
+            case '\t': *out++ = 't'; break;
+            case '\b': *out++ = 'b'; break;
+            case '\f': *out++ = 'f'; break;
+            default:
+                *out++ = 'u';
+                *out++ = '0';
+                *out++ = '0';
+                *out++ = export_hex_digits[c >> 4];
+                *out++ = export_hex_digits[c & 0x0f];
+        }
+    }
+    *out++ = '"';
+    buf->size = out - buf->data;
+    return 0;
+}
+
+static int _export_text(ExportState* state, const char* text, size_t nbytes)
+{
+    if (state->format == EXPORT_JSONL) {
+        return _export_json_string(&state->out, text, nbytes);
+    }
+    return _export_delimited(&state->out, text, nbytes, state->format == EXPORT_TSV ? '\t' : ',');
+}
+
+static int _export_blob(ExportState* state, const unsigned char* blob, size_t nbytes)
+{
+    int json = state->format == EXPORT_JSONL;
+    int rc;
+
+    if (json && _export_append(&state->out, "\"", 1)) {
+        return EXPORT_NOMEM;
+    }
+    rc = _export_hex(&state->out, blob, nbytes);
+    if (json && rc == 0) {
+        rc = _export_append(&state->out, "\"", 1);
+    }
+    return rc;
+}
+
+/*
+ * Appends a value of a row of the result cache, which holds the Python
+ * values SQLite's were converted to. Needs the GIL, and sets an exception
+ * for a value of another type.
+ */
+static int _export_object(ExportState* state, PyObject* value)
+{
+    int json = state->format == EXPORT_JSONL;
+
+    if (value == Py_None) {
+        return json ? _export_append(&state->out, "null", 4) : 0;
+    }
+    if (PyLong_Check(value)) {
+        sqlite3_int64 number = PyLong_AsLongLong(value);
+        if (number == -1 && PyErr_Occurred()) {
+            return EXPORT_NOMEM;
+        }
+        return _export_int64(&state->out, number);
+    }
+    if (PyFloat_Check(value)) {
+        return _export_double(&state->out, PyFloat_AS_DOUBLE(value), json);
+    }
+    if (PyUnicode_Check(value)) {
+        Py_ssize_t nbytes;
+        const char* text = PyUnicode_AsUTF8AndSize(value, &nbytes);
+        if (!text) {
+            return EXPORT_NOMEM;
+        }
+        return _export_text(state, text, (size_t)nbytes);
+    }
+    if (PyBytes_Check(value)) {
+        return _export_blob(state, (const unsigned char*)PyBytes_AS_STRING(value),
+                            (size_t)PyBytes_GET_SIZE(value));
+    }
+    PyErr_Format(PyExc_TypeError, "export() can't write a cached value of type %.200s",
+                 Py_TYPE(value)->tp_name);
+    return EXPORT_NOMEM;
+}
+
+/*
+ * Appends a value of the current row.
+ */
+static int _export_value(ExportState* state, int i)
+{
+    int json = state->format == EXPORT_JSONL;
+
+    if (state->row) {
+        return _export_object(state, PyTuple_GET_ITEM(state->row, i));
+    }
+    switch (sqlite3_column_type(state->st, i)) {
+        case SQLITE_INTEGER:
+            return _export_int64(&state->out, sqlite3_column_int64(state->st, i));
+        case SQLITE_FLOAT:
+            return _export_double(&state->out, sqlite3_column_double(state->st, i), json);
+        case SQLITE_TEXT: {
+            const char* text = (const char*)sqlite3_column_text(state->st, i);
+            if (!text) {
+                return EXPORT_NOMEM;
+            }
+            return _export_text(state, text, sqlite3_column_bytes(state->st, i));
+        }
+        case SQLITE_BLOB:
+            return _export_blob(state, sqlite3_column_blob(state->st, i),
+                                sqlite3_column_bytes(state->st, i));
+        default:
+            return json ? _export_append(&state->out, "null", 4) : 0;
+    }
+}
+
+/*
+ * Appends the current row.
+ */
+static int _export_row(ExportState* state)
+{
+    int i;
+
+    if (state->format == EXPORT_JSONL) {
+        for (i = 0; i < state->ncols; i++) {
+            if (_export_append(&state->out, i ? "," : "{", 1)
+                || _export_append(&state->out, state->keys.data + state->key_offsets[i],
+                                  state->key_offsets[i + 1] - state->key_offsets[i])
+                || _export_value(state, i)) {
+                return EXPORT_NOMEM;
+            }
+        }
+        return _export_append(&state->out, state->ncols ? "}\n" : "{}\n", state->ncols ? 2 : 3);
+    }
+
+    for (i = 0; i < state->ncols; i++) {
+        if ((i && _export_append(&state->out, state->format == EXPORT_TSV ? "\t" : ",", 1))
+            || _export_value(state, i)) {
+            return EXPORT_NOMEM;
+        }
+    }
+    return _export_append(&state->out, "\r\n", 2);
+}
+
+/*
+ * Formats rows into the output buffer until it holds a block or the
+ * statement is done. The statement must be positioned on a row. Stops
+ * without stepping further once max_rows rows are out.
+ * Runs without the GIL.
+ *
+ * Returns SQLITE_ROW if there are more rows, SQLITE_DONE, EXPORT_NOMEM
+ * or an SQLite error code.
+ */
+static int _export_rows(ExportState* state)
+{
+    int rc = SQLITE_ROW;
+
+    while (rc == SQLITE_ROW && state->out.size < EXPORT_BLOCK_SIZE) {
+        if (_export_row(state)) {
+            return EXPORT_NOMEM;
+        }
+        state->rows++;
+        if (state->rows_left > 0 && --state->rows_left == 0) {
+            return SQLITE_DONE;
+        }
+        rc = sqlite3_step(state->st);
+    }
+    return rc;
+}
+
+/*
+ * Writes the output buffer to the file, or calls the write() method of
+ * the file object. Returns -1 on error.
+ */
+static int _export_flush(ExportState* state, FILE* file, PyObject* fileobj)
+{
+    if (state->out.size == 0) {
+        return 0;
+    }
+    if (file) {
+        size_t written;
+        Py_BEGIN_ALLOW_THREADS
+        written = fwrite(state->out.data, 1, state->out.size, file);
+        Py_END_ALLOW_THREADS
+        if (written != state->out.size) {
+            PyErr_SetFromErrno(PyExc_OSError);
+            return -1;
+        }
+    } else {
+        PyObject* res = PyObject_CallMethod(fileobj, "write", "y#",
+                                            state->out.data, (Py_ssize_t)state->out.size);
+        if (!res) {
+            return -1;
+        }
+        Py_DECREF(res);
+    }
+    state->out.size = 0;
+    return 0;
+}
+
+/*
+ * Writes the rows of a query answered by the result cache, from the next
+ * one on. Stops once max_rows rows are out.
+ *
+ * 0 => ok; -1 => error
+ */
+static int _export_cached_rows(pysqlite_Cursor* self, ExportState* state, FILE* file, PyObject* fileobj)
+{
+    PyObject* row;
+    int rc = 0;
+
+    while (self->next_row && self->rows_left != 0) {
+        row = self->next_row;
+        self->next_row = NULL;
+        if (self->cached_rows && self->cached_index < PyTuple_GET_SIZE(self->cached_rows)) {
+            self->next_row = PyTuple_GET_ITEM(self->cached_rows, self->cached_index++);
+            Py_INCREF(self->next_row);
+        }
+
+        state->row = row;
+        rc = _export_row(state);
+        state->row = NULL;
+        Py_DECREF(row);
+        if (rc) {
+            if (!PyErr_Occurred()) {
+                PyErr_NoMemory();
+            }
+            return -1;
+        }
+        state->rows++;
+        if (self->rows_left > 0) {
+            self->rows_left--;
+        }
+        if (state->out.size >= EXPORT_BLOCK_SIZE && _export_flush(state, file, fileobj) < 0) {
+            return -1;
+        }
+    }
+    Py_CLEAR(self->next_row);
+    Py_CLEAR(self->cached_rows);
+    return 0;
+}
+
+/*
+ * Appends the header row, or builds the JSON keys, from the column names
+ * in the cursor description.
+ */
+static int _export_header(pysqlite_Cursor* self, ExportState* state, int header)
+{
+    Py_ssize_t i;
+
+    state->key_offsets = PyMem_Calloc(state->ncols + 1, sizeof(size_t));
+    if (!state->key_offsets) {
+        PyErr_NoMemory();
+        return -1;
+    }
+    for (i = 0; i < state->ncols; i++) {
+        PyObject* name = PyTuple_GET_ITEM(PyTuple_GET_ITEM(self->description, i), 0);
+        const char* z = "";
+        Py_ssize_t n = 0;
+        int rc = 0;
+
+        if (name != Py_None) {
+            z = PyUnicode_AsUTF8AndSize(name, &n);
+            if (!z) {
+                return -1;
+            }
+        }
+        if (state->format == EXPORT_JSONL) {
+            rc = _export_json_string(&state->keys, z, n) || _export_append(&state->keys, ":", 1);
+            state->key_offsets[i + 1] = state->keys.size;
+        } else if (header) {
+            if (i) {
+                rc = _export_append(&state->out, state->format == EXPORT_TSV ? "\t" : ",", 1);
+            }
+            rc = rc || _export_delimited(&state->out, z, n, state->format == EXPORT_TSV ? '\t' : ',');
+        }
+        if (rc) {
+            PyErr_NoMemory();
+            return -1;
+        }
+    }
+    if (header && state->format != EXPORT_JSONL && state->ncols > 0) {
+        if (_export_append(&state->out, "\r\n", 2)) {
+            PyErr_NoMemory();
+            return -1;
+        }
+    }
+    return 0;
+}
+
+PyObject* pysqlite_cursor_export(pysqlite_Cursor* self, PyObject* args, PyObject* kwargs)
+{
+    static char *kwlist[] = {"file", "format", "header", NULL};
+
+    PyObject* file_arg;
+    const char* format = "csv";
+    int header = 1;
+    PyObject* path = NULL;
+    FILE* file = NULL;
+    ExportState state = {0};
+    pysqlite_Connection* connection = self->connection;
+    double outer_deadline;
+    int has_row;
+    int rc = SQLITE_DONE;
+    PyObject* retval = NULL;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "O|sp:export", kwlist,
+                                     &file_arg, &format, &header)) {
+        return NULL;
+    }
+
+    if (strcmp(format, "csv") == 0) {
+        state.format = EXPORT_CSV;
+    } else if (strcmp(format, "tsv") == 0) {
+        state.format = EXPORT_TSV;
+    } else if (strcmp(format, "jsonl") == 0) {
+        state.format = EXPORT_JSONL;
+    } else {
+        PyErr_Format(PyExc_ValueError, "unknown export format: %s", format);
+        return NULL;
+    }
+
+    if (!check_cursor(self)) {
+        return NULL;
+    }
+    if (self->reset) {
+        PyErr_SetString(pysqlite_InterfaceError, errmsg_fetch_across_rollback);
+        return NULL;
+    }
+    if (self->statement && self->statement->prefetch) {
+        PyErr_SetString(pysqlite_ProgrammingError, "export() can't be used after prefetch()");
+        return NULL;
+    }
+
+    if (PyUnicode_Check(file_arg) || PyBytes_Check(file_arg) || PyObject_HasAttrString(file_arg, "__fspath__")) {
+        if (!PyUnicode_FSConverter(file_arg, &path)) {
+            return NULL;
+        }
+        Py_BEGIN_ALLOW_THREADS
+        file = fopen(PyBytes_AS_STRING(path), "wb");
+        Py_END_ALLOW_THREADS
+        if (!file) {
+            PyErr_SetFromErrnoWithFilenameObject(PyExc_OSError, file_arg);
+            Py_DECREF(path);
+            return NULL;
+        }
+    } else if (!PyObject_HasAttrString(file_arg, "write")) {
+        PyErr_SetString(PyExc_TypeError, "file must be a path or a binary file object");
+        return NULL;
+    }
+
+    self->locked = 1;
+
+    if (self->description != Py_None && self->description) {
+        state.ncols = (int)PyTuple_GET_SIZE(self->description);
+        if (_export_header(self, &state, header) < 0) {
+            goto finally;
+        }
+    }
+
+    /* rows of the result cache have no statement */
+    if (self->next_row && !self->statement && _export_cached_rows(self, &state, file, file_arg) < 0) {
+        goto finally;
+    }
+
+    /* the statement is positioned on the prefetched row, if there is one */
+    has_row = self->next_row != NULL && self->statement != NULL && self->rows_left != 0;
+    Py_CLEAR(self->next_row);
+    if (has_row) {
+        state.st = self->statement->st;
+        state.rows_left = self->rows_left;
+        rc = SQLITE_ROW;
+    }
+
+    while (rc == SQLITE_ROW) {
+        /* as in _pysqlite_cursor_step(), the progress handler checks the
+         * deadline of the query while it is stepped */
+        Py_BEGIN_ALLOW_THREADS
+        sqlite3_mutex_enter(sqlite3_db_mutex(connection->db));
+        outer_deadline = connection->deadline;
+        connection->deadline = self->deadline;
+        connection->deadline_expired = 0;
+        rc = _export_rows(&state);
+        connection->deadline = outer_deadline;
+        sqlite3_mutex_leave(sqlite3_db_mutex(connection->db));
+        Py_END_ALLOW_THREADS
+
+        if (rc == EXPORT_NOMEM) {
+            PyErr_NoMemory();
+            goto finally;
+        }
+        if (rc != SQLITE_ROW && rc != SQLITE_DONE) {
+            _pysqlite_cursor_seterror(self);
+            goto finally;
+        }
+        if (_export_flush(&state, file, file_arg) < 0) {
+            goto finally;
+        }
+    }
+    if (_export_flush(&state, file, file_arg) < 0) {
+        goto finally;
+    }
+
+    if (file) {
+        int closed;
+        Py_BEGIN_ALLOW_THREADS
+        closed = fclose(file);
+        Py_END_ALLOW_THREADS
+        file = NULL;
+        if (closed != 0) {
+            PyErr_SetFromErrnoWithFilenameObject(PyExc_OSError, file_arg);
+            goto finally;
+        }
+    }
+
+    retval = PyLong_FromLongLong(state.rows);
+
+finally:
+    if (self->statement) {
+        (void)pysqlite_statement_reset(self->statement);
+        Py_CLEAR(self->statement);
+    }
+    if (file) {
+        fclose(file);
+    }
+    self->locked = 0;
+    PyMem_RawFree(state.out.data);
+    PyMem_RawFree(state.keys.data);
+    PyMem_Free(state.key_offsets);
+    Py_XDECREF(path);
+    return retval;
+}
+
 PyObject* pysqlite_noop(pysqlite_Connection* self, PyObject* args)
 {
     /* don't care, return None */
@@ -879,6 +2329,7 @@ PyObject* pysqlite_cursor_close(pysqlite_Cursor* self, PyObject* args)
         (void)pysqlite_statement_reset(self->statement);
         Py_CLEAR(self->statement);
     }
+    _pysqlite_cursor_clear_cached(self);
 
     self->closed = 1;
 
@@ -886,18 +2337,24 @@ PyObject* pysqlite_cursor_close(pysqlite_Cursor* self, PyObject* args)
 }
 
 static PyMethodDef cursor_methods[] = {
-    {"execute", (PyCFunction)pysqlite_cursor_execute, METH_VARARGS,
+    {"execute", (PyCFunction)(void(*)(void))pysqlite_cursor_execute, METH_VARARGS|METH_KEYWORDS,
         PyDoc_STR("Executes a SQL statement.")},
-    {"executemany", (PyCFunction)pysqlite_cursor_executemany, METH_VARARGS,
+    {"executemany", (PyCFunction)(void(*)(void))pysqlite_cursor_executemany, METH_VARARGS|METH_KEYWORDS,
         PyDoc_STR("Repeatedly executes a SQL statement.")},
-    {"executescript", (PyCFunction)pysqlite_cursor_executescript, METH_VARARGS,
+    {"executescript", (PyCFunction)(void(*)(void))pysqlite_cursor_executescript, METH_VARARGS|METH_KEYWORDS,
         PyDoc_STR("Executes a multiple SQL statements at once. Non-standard.")},
+    {"executebatch", (PyCFunction)(void(*)(void))pysqlite_cursor_executebatch, METH_VARARGS|METH_KEYWORDS,
+        PyDoc_STR("Executes a sequence of SQL statements with their parameters. Non-standard.")},
     {"fetchone", (PyCFunction)pysqlite_cursor_fetchone, METH_NOARGS,
         PyDoc_STR("Fetches one row from the resultset.")},
     {"fetchmany", (PyCFunction)(void(*)(void))pysqlite_cursor_fetchmany, METH_VARARGS|METH_KEYWORDS,
         PyDoc_STR("Fetches several rows from the resultset.")},
     {"fetchall", (PyCFunction)pysqlite_cursor_fetchall, METH_NOARGS,
         PyDoc_STR("Fetches all rows from the resultset.")},
+    {"export", (PyCFunction)(void(*)(void))pysqlite_cursor_export, METH_VARARGS|METH_KEYWORDS,
+        PyDoc_STR("Writes the rest of the resultset to a file. Non-standard.")},
+    {"prefetch", (PyCFunction)(void(*)(void))pysqlite_cursor_prefetch, METH_VARARGS|METH_KEYWORDS,
+        PyDoc_STR("Reads rows ahead in a background thread. Non-standard.")},
     {"close", (PyCFunction)pysqlite_cursor_close, METH_NOARGS,
         PyDoc_STR("Closes the cursor.")},
     {"setinputsizes", (PyCFunction)pysqlite_noop, METH_VARARGS,
@@ -912,6 +2369,9 @@ static struct PyMemberDef cursor_members[] =
     {"connection", T_OBJECT, offsetof(pysqlite_Cursor, connection), READONLY},
     {"description", T_OBJECT, offsetof(pysqlite_Cursor, description), READONLY},
     {"arraysize", T_INT, offsetof(pysqlite_Cursor, arraysize), 0},
+    {"buffer_threshold", T_PYSSIZET, offsetof(pysqlite_Cursor, buffer_threshold), 0,
+        PyDoc_STR("Size from which TEXT and BLOB values are returned as read-only memoryviews "
+                  "over a pooled copy; -1 turns it off. Non-standard.")},
     {"lastrowid", T_OBJECT, offsetof(pysqlite_Cursor, lastrowid), READONLY},
     {"rowcount", T_LONG, offsetof(pysqlite_Cursor, rowcount), READONLY},
     {"row_factory", T_OBJECT, offsetof(pysqlite_Cursor, row_factory), 0},
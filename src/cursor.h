@@ -37,6 +37,7 @@ typedef struct
     PyObject* description;
     PyObject* row_cast_map;
     int arraysize;
+    Py_ssize_t buffer_threshold;
     PyObject* lastrowid;
     long rowcount;
     PyObject* row_factory;
@@ -46,25 +47,57 @@ typedef struct
     int locked;
     int initialized;
 
+    /* set while running a query for Connection.fetchone() and friends,
+     * which don't return the cursor */
+    int single_shot;
+
+    /* the deadline of the query on pysqlite_monotonic()'s clock or 0.0, and
+     * how many more rows it may return or -1 */
+    double deadline;
+    Py_ssize_t rows_left;
+
+    /* the rows of a query answered by the result cache and the index of
+     * the one after next_row */
+    PyObject* cached_rows;
+    Py_ssize_t cached_index;
+
+    /* the rows of a cacheable query read so far and their size, stored in
+     * the result cache when the query is read to the end */
+    PyObject* capture_key;
+    PyObject* captured_rows;
+    Py_ssize_t captured_bytes;
+    unsigned long capture_epoch;
+
     /* the next row to be returned, NULL if no next row available */
     PyObject* next_row;
 
+    pysqlite_Link link; /* in the cursors of the connection */
+
     PyObject* in_weakreflist; /* List of weak references */
 } pysqlite_Cursor;
 
 extern PyTypeObject pysqlite_CursorType;
 
-PyObject* pysqlite_cursor_execute(pysqlite_Cursor* self, PyObject* args);
-PyObject* pysqlite_cursor_executemany(pysqlite_Cursor* self, PyObject* args);
+PyObject* pysqlite_cursor_execute(pysqlite_Cursor* self, PyObject* args, PyObject* kwargs);
+PyObject* pysqlite_cursor_executemany(pysqlite_Cursor* self, PyObject* args, PyObject* kwargs);
+PyObject* pysqlite_cursor_query(pysqlite_Cursor* self, PyObject* sql, PyObject* parameters, int mode);
+PyObject* pysqlite_cursor_execute_statement(pysqlite_Cursor* self, pysqlite_Statement* statement,
+                                            PyObject* parameters, int multiple);
 PyObject* pysqlite_cursor_getiter(pysqlite_Cursor *self);
 PyObject* pysqlite_cursor_iternext(pysqlite_Cursor *self);
 PyObject* pysqlite_cursor_fetchone(pysqlite_Cursor* self, PyObject* args);
 PyObject* pysqlite_cursor_fetchmany(pysqlite_Cursor* self, PyObject* args, PyObject* kwargs);
 PyObject* pysqlite_cursor_fetchall(pysqlite_Cursor* self, PyObject* args);
+PyObject* pysqlite_cursor_export(pysqlite_Cursor* self, PyObject* args, PyObject* kwargs);
 PyObject* pysqlite_noop(pysqlite_Connection* self, PyObject* args);
 PyObject* pysqlite_cursor_close(pysqlite_Cursor* self, PyObject* args);
 
 int pysqlite_cursor_setup_types(void);
 
 #define UNKNOWN (-1)
+
+/* modes of pysqlite_cursor_query() */
+#define PYSQLITE_FETCH_ONE 0
+#define PYSQLITE_FETCH_ALL 1
+#define PYSQLITE_FETCH_VALUE 2
 #endif
@@ -0,0 +1,35 @@
+// Copyright (c) 2023 Anton Zhiyanov, MIT License
+// https://github.com/nalgeon/sqlean.py
+
+// Per-connection selection of the bundled Sqlean extensions.
+
+#ifndef SQLEAN_EXTENSIONS_H
+#define SQLEAN_EXTENSIONS_H
+
+// extension flags, combined into a bitmask
+#define SQLEAN_EXT_CRYPTO (1 << 0)
+#define SQLEAN_EXT_DEFINE (1 << 1)
+#define SQLEAN_EXT_FILEIO (1 << 2)
+#define SQLEAN_EXT_FUZZY (1 << 3)
+#define SQLEAN_EXT_IPADDR (1 << 4)
+#define SQLEAN_EXT_REGEXP (1 << 5)
+#define SQLEAN_EXT_STATS (1 << 6)
+#define SQLEAN_EXT_TEXT (1 << 7)
+#define SQLEAN_EXT_TIME (1 << 8)
+#define SQLEAN_EXT_UNICODE (1 << 9)
+#define SQLEAN_EXT_UUID (1 << 10)
+#define SQLEAN_EXT_VSV (1 << 11)
+#define SQLEAN_EXT_ALL ((1 << 12) - 1)
+
+// read the SQLEAN_ENABLE* environment variables instead of a bitmask
+#define SQLEAN_EXT_FROM_ENV (-1)
+
+// sqlean_select_extensions sets the extensions to initialize
+// for connections opened by the calling thread.
+void sqlean_select_extensions(int mask);
+
+// sqlean_extension_flag returns the flag for the extension name,
+// or 0 if there is no such extension.
+int sqlean_extension_flag(const char* name);
+
+#endif /* SQLEAN_EXTENSIONS_H */
@@ -29,6 +29,13 @@
 #include "microprotocols.h"
 #include "row.h"
 #include "blob.h"
+#include "serialize.h"
+#include "column_buffer.h"
+#include "backup.h"
+#include "session.h"
+#include "prepared.h"
+#include "transaction.h"
+#include "extensions.h"
 
 #if SQLITE_VERSION_NUMBER >= 3003003
 #define HAVE_SHARED_CACHE
@@ -42,6 +49,7 @@ PyObject *pysqlite_InterfaceError = NULL;
 PyObject *pysqlite_DatabaseError = NULL;
 PyObject *pysqlite_InternalError = NULL;
 PyObject *pysqlite_OperationalError = NULL;
+PyObject *pysqlite_QueryTimeout = NULL;
 PyObject *pysqlite_ProgrammingError = NULL;
 PyObject *pysqlite_IntegrityError = NULL;
 PyObject *pysqlite_DataError = NULL;
@@ -61,7 +69,7 @@ static PyObject* module_connect(PyObject* self, PyObject* args, PyObject*
     static char *kwlist[] = {
         "database", "timeout", "detect_types", "isolation_level",
         "check_same_thread", "factory", "cached_statements", "uri",
-        "flags", "vfs", NULL
+        "flags", "vfs", "extensions", "profile", "pragmas", NULL
     };
     PyObject* database;
     int detect_types = 0;
@@ -73,12 +81,15 @@ static PyObject* module_connect(PyObject* self, PyObject* args, PyObject*
     char *vfs = NULL;
     int uri = 0;
     double timeout = 5.0;
+    PyObject* extensions;
+    char* profile;
+    PyObject* pragmas;
 
-    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "O|diOiOipiz", kwlist,
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "O|diOiOipizOzO", kwlist,
                                      &database, &timeout, &detect_types,
                                      &isolation_level, &check_same_thread,
                                      &factory, &cached_statements, &uri,
-                                     &flags, &vfs))
+                                     &flags, &vfs, &extensions, &profile, &pragmas))
     {
         return NULL;
     }
@@ -92,11 +103,15 @@ static PyObject* module_connect(PyObject* self, PyObject* args, PyObject*
 
 PyDoc_STRVAR(module_connect_doc,
 "connect(database[, timeout, detect_types, isolation_level,\n\
-        check_same_thread, factory, cached_statements, uri, flags, vfs])\n\
+        check_same_thread, factory, cached_statements, uri, flags, vfs,\n\
+        extensions, profile, pragmas])\n\
 \n\
 Opens a connection to the SQLite database file *database*. You can use\n\
 \":memory:\" to open a database connection to a database that resides in\n\
-RAM instead of on disk.");
+RAM instead of on disk. *extensions* selects the Sqlean extensions to load\n\
+for this connection, either as an iterable of names or as a bitmask.\n\
+*profile* (\"read_heavy\", \"oltp\" or \"bulk_load\") and the *pragmas* dict\n\
+set pragmas when the connection is opened, see Connection.settings.");
 
 static PyObject* module_complete(PyObject* self, PyObject* args, PyObject*
         kwargs)
@@ -330,6 +345,20 @@ static const IntConstantPair _int_constants[] = {
     {"PARSE_DECLTYPES", PARSE_DECLTYPES},
     {"PARSE_COLNAMES", PARSE_COLNAMES},
 
+    {"SQLEAN_EXT_CRYPTO", SQLEAN_EXT_CRYPTO},
+    {"SQLEAN_EXT_DEFINE", SQLEAN_EXT_DEFINE},
+    {"SQLEAN_EXT_FILEIO", SQLEAN_EXT_FILEIO},
+    {"SQLEAN_EXT_FUZZY", SQLEAN_EXT_FUZZY},
+    {"SQLEAN_EXT_IPADDR", SQLEAN_EXT_IPADDR},
+    {"SQLEAN_EXT_REGEXP", SQLEAN_EXT_REGEXP},
+    {"SQLEAN_EXT_STATS", SQLEAN_EXT_STATS},
+    {"SQLEAN_EXT_TEXT", SQLEAN_EXT_TEXT},
+    {"SQLEAN_EXT_TIME", SQLEAN_EXT_TIME},
+    {"SQLEAN_EXT_UNICODE", SQLEAN_EXT_UNICODE},
+    {"SQLEAN_EXT_UUID", SQLEAN_EXT_UUID},
+    {"SQLEAN_EXT_VSV", SQLEAN_EXT_VSV},
+    {"SQLEAN_EXT_ALL", SQLEAN_EXT_ALL},
+
     {"SQLITE_OK", SQLITE_OK},
     /* enumerated return values for sqlite3_set_authorizer() callback */
     {"SQLITE_DENY", SQLITE_DENY},
@@ -392,6 +421,30 @@ static const IntConstantPair _int_constants[] = {
 #endif
 #if SQLITE_VERSION_NUMBER >= 3006011
     {"SQLITE_DONE", SQLITE_DONE},
+#endif
+    /* limit categories for Connection.setlimit() and getlimit() */
+    {"SQLITE_LIMIT_LENGTH", SQLITE_LIMIT_LENGTH},
+    {"SQLITE_LIMIT_SQL_LENGTH", SQLITE_LIMIT_SQL_LENGTH},
+    {"SQLITE_LIMIT_COLUMN", SQLITE_LIMIT_COLUMN},
+    {"SQLITE_LIMIT_EXPR_DEPTH", SQLITE_LIMIT_EXPR_DEPTH},
+    {"SQLITE_LIMIT_COMPOUND_SELECT", SQLITE_LIMIT_COMPOUND_SELECT},
+    {"SQLITE_LIMIT_VDBE_OP", SQLITE_LIMIT_VDBE_OP},
+    {"SQLITE_LIMIT_FUNCTION_ARG", SQLITE_LIMIT_FUNCTION_ARG},
+    {"SQLITE_LIMIT_ATTACHED", SQLITE_LIMIT_ATTACHED},
+    {"SQLITE_LIMIT_LIKE_PATTERN_LENGTH", SQLITE_LIMIT_LIKE_PATTERN_LENGTH},
+    {"SQLITE_LIMIT_VARIABLE_NUMBER", SQLITE_LIMIT_VARIABLE_NUMBER},
+    {"SQLITE_LIMIT_TRIGGER_DEPTH", SQLITE_LIMIT_TRIGGER_DEPTH},
+    {"SQLITE_LIMIT_WORKER_THREADS", SQLITE_LIMIT_WORKER_THREADS},
+#ifdef HAVE_SESSION
+    /* conflict types and actions for apply_changeset() */
+    {"SQLITE_CHANGESET_DATA", SQLITE_CHANGESET_DATA},
+    {"SQLITE_CHANGESET_NOTFOUND", SQLITE_CHANGESET_NOTFOUND},
+    {"SQLITE_CHANGESET_CONFLICT", SQLITE_CHANGESET_CONFLICT},
+    {"SQLITE_CHANGESET_CONSTRAINT", SQLITE_CHANGESET_CONSTRAINT},
+    {"SQLITE_CHANGESET_FOREIGN_KEY", SQLITE_CHANGESET_FOREIGN_KEY},
+    {"SQLITE_CHANGESET_OMIT", SQLITE_CHANGESET_OMIT},
+    {"SQLITE_CHANGESET_REPLACE", SQLITE_CHANGESET_REPLACE},
+    {"SQLITE_CHANGESET_ABORT", SQLITE_CHANGESET_ABORT},
 #endif
     {(char*)NULL, 0}
 };
@@ -453,7 +506,13 @@ PyMODINIT_FUNC PyInit__sqlite3(void)
         (pysqlite_cache_setup_types() < 0) ||
         (pysqlite_statement_setup_types() < 0) ||
         (pysqlite_prepare_protocol_setup_types() < 0) ||
-        (pysqlite_blob_setup_types() < 0)
+        (pysqlite_blob_setup_types() < 0) ||
+        (pysqlite_serialized_setup_types() < 0) ||
+        (pysqlite_column_buffer_setup_types() < 0) ||
+        (pysqlite_backup_setup_types() < 0) ||
+        (pysqlite_session_setup_types() < 0) ||
+        (pysqlite_prepared_setup_types() < 0) ||
+        (pysqlite_transaction_setup_types() < 0)
        ) {
         Py_XDECREF(module);
         return NULL;
@@ -512,6 +571,11 @@ PyMODINIT_FUNC PyInit__sqlite3(void)
     }
     PyDict_SetItemString(dict, "OperationalError", pysqlite_OperationalError);
 
+    if (!(pysqlite_QueryTimeout = PyErr_NewException(MODULE_NAME ".QueryTimeout", pysqlite_OperationalError, NULL))) {
+        goto error;
+    }
+    PyDict_SetItemString(dict, "QueryTimeout", pysqlite_QueryTimeout);
+
     if (!(pysqlite_ProgrammingError = PyErr_NewException(MODULE_NAME ".ProgrammingError", pysqlite_DatabaseError, NULL))) {
         goto error;
     }
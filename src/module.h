@@ -34,6 +34,7 @@ extern PyObject* pysqlite_InterfaceError;
 extern PyObject* pysqlite_DatabaseError;
 extern PyObject* pysqlite_InternalError;
 extern PyObject* pysqlite_OperationalError;
+extern PyObject* pysqlite_QueryTimeout;
 extern PyObject* pysqlite_ProgrammingError;
 extern PyObject* pysqlite_IntegrityError;
 extern PyObject* pysqlite_DataError;
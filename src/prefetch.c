@@ -0,0 +1,304 @@
+#include "prefetch.h"
+#include "util.h"
+
+#define PREFETCH_MAX_BATCH 64
+
+static void _prefetch_release(pysqlite_Prefetch* self);
+
+static int _prefetch_copy_row(pysqlite_Prefetch* self, pysqlite_PrefetchRow* row)
+{
+    Py_ssize_t size = 0;
+    int i;
+
+    /* text and blob pointers stay valid until the next step,
+       so measure first and copy after growing the buffer once */
+    for (i = 0; i < self->ncols; i++) {
+        pysqlite_PrefetchValue* value = &row->values[i];
+        int type = self->raw[i] ? SQLITE_BLOB : sqlite3_column_type(self->st, i);
+
+        value->type = type;
+        value->nbytes = 0;
+        if (type == SQLITE_INTEGER) {
+            value->ival = sqlite3_column_int64(self->st, i);
+        } else if (type == SQLITE_FLOAT) {
+            value->dval = sqlite3_column_double(self->st, i);
+        } else if (type == SQLITE_TEXT) {
+            if (!sqlite3_column_text(self->st, i)) {
+                return SQLITE_NOMEM;
+            }
+            value->nbytes = sqlite3_column_bytes(self->st, i);
+        } else if (type == SQLITE_BLOB) {
+            if (!sqlite3_column_blob(self->st, i)) {
+                /* empty blob, or NULL for a converter */
+                value->type = self->raw[i] ? SQLITE_NULL : SQLITE_BLOB;
+            }
+            value->nbytes = sqlite3_column_bytes(self->st, i);
+        }
+        value->offset = size;
+        size += value->nbytes;
+    }
+
+    if (size > row->capacity) {
+        char* data = PyMem_RawRealloc(row->data, size);
+        if (!data) {
+            return SQLITE_NOMEM;
+        }
+        row->data = data;
+        row->capacity = size;
+    }
+
+    for (i = 0; i < self->ncols; i++) {
+        pysqlite_PrefetchValue* value = &row->values[i];
+        if (value->nbytes > 0) {
+            const void* src = value->type == SQLITE_TEXT
+                ? (const void*)sqlite3_column_text(self->st, i)
+                : sqlite3_column_blob(self->st, i);
+            memcpy(row->data + value->offset, src, value->nbytes);
+        }
+    }
+    return SQLITE_ROW;
+}
+
+static void _prefetch_run(void* arg)
+{
+    pysqlite_Prefetch* self = arg;
+    pysqlite_Connection* connection = self->connection;
+    sqlite3_mutex* db_mutex = sqlite3_db_mutex(self->db);
+    pysqlite_PrefetchRow* row;
+    double outer_deadline;
+    int outer_expired;
+    int rc;
+
+    while (1) {
+        PyThread_acquire_lock(self->mutex, WAIT_LOCK);
+        while (self->count == self->capacity && !self->stop) {
+            self->producer_waiting = 1;
+            PyThread_release_lock(self->mutex);
+            PyThread_acquire_lock(self->not_full, WAIT_LOCK);
+            PyThread_acquire_lock(self->mutex, WAIT_LOCK);
+        }
+        if (self->stop) {
+            PyThread_release_lock(self->mutex);
+            break;
+        }
+        /* the consumer never touches free slots */
+        row = &self->rows[(self->head + self->count) % self->capacity];
+        PyThread_release_lock(self->mutex);
+
+        /* hold the connection so the error message and the deadline belong
+         * to this step; the deadline of a query stepped by the other thread
+         * is put back after it */
+        sqlite3_mutex_enter(db_mutex);
+        if (pysqlite_connection_calls_python(connection)) {
+            /* a callback registered since the thread started would need the
+             * GIL while this thread holds the mutex */
+            rc = PYSQLITE_PREFETCH_HANDED_BACK;
+        } else {
+            outer_deadline = connection->deadline;
+            outer_expired = connection->deadline_expired;
+            connection->deadline = self->deadline;
+            connection->deadline_expired = 0;
+            rc = sqlite3_step(self->st);
+            self->expired = connection->deadline_expired;
+            connection->deadline = outer_deadline;
+            connection->deadline_expired = outer_expired;
+            if (rc == SQLITE_ROW) {
+                rc = _prefetch_copy_row(self, row);
+            }
+            if (rc != SQLITE_ROW && rc != SQLITE_DONE) {
+                self->errcode = rc == SQLITE_NOMEM ? SQLITE_NOMEM : sqlite3_errcode(self->db);
+                self->errmsg = sqlite3_mprintf("%s", sqlite3_errmsg(self->db));
+            }
+        }
+        sqlite3_mutex_leave(db_mutex);
+
+        PyThread_acquire_lock(self->mutex, WAIT_LOCK);
+        if (rc == SQLITE_ROW) {
+            self->count++;
+        } else {
+            self->done = 1;
+            self->rc = rc;
+        }
+        if (self->consumer_waiting && (self->count >= self->batch || self->done)) {
+            self->consumer_waiting = 0;
+            PyThread_release_lock(self->not_empty);
+        }
+        PyThread_release_lock(self->mutex);
+
+        if (rc != SQLITE_ROW) {
+            break;
+        }
+    }
+
+    PyThread_release_lock(self->finished);
+}
+
+/*
+ * Starts stepping st in a new thread. raw marks the columns that are read
+ * with sqlite3_column_blob() whatever their type, as converters expect.
+ * deadline is the one of the query, or 0.0.
+ * Returns NULL with an exception set on failure.
+ */
+pysqlite_Prefetch* pysqlite_prefetch_start(pysqlite_Connection* connection, sqlite3_stmt* st,
+                                           int capacity, const unsigned char* raw, double deadline)
+{
+    pysqlite_Prefetch* self;
+    int i, ncols = sqlite3_column_count(st);
+
+    self = PyMem_Calloc(1, sizeof(pysqlite_Prefetch));
+    if (!self) {
+        PyErr_NoMemory();
+        return NULL;
+    }
+    self->connection = connection;
+    self->db = connection->db;
+    self->st = st;
+    self->deadline = deadline;
+    self->ncols = ncols;
+    self->capacity = capacity;
+    self->rc = SQLITE_DONE;
+    /* waking a thread for every row would cost more than stepping it */
+    self->batch = capacity / 2 < PREFETCH_MAX_BATCH ? capacity / 2 : PREFETCH_MAX_BATCH;
+    if (self->batch < 1) {
+        self->batch = 1;
+    }
+
+    self->raw = PyMem_Calloc(ncols ? ncols : 1, 1);
+    self->rows = PyMem_Calloc(capacity, sizeof(pysqlite_PrefetchRow));
+    if (!self->raw || !self->rows) {
+        goto nomem;
+    }
+    memcpy(self->raw, raw, ncols);
+    for (i = 0; i < capacity; i++) {
+        self->rows[i].values = PyMem_Calloc(ncols ? ncols : 1, sizeof(pysqlite_PrefetchValue));
+        if (!self->rows[i].values) {
+            goto nomem;
+        }
+    }
+
+    self->mutex = PyThread_allocate_lock();
+    self->not_empty = PyThread_allocate_lock();
+    self->not_full = PyThread_allocate_lock();
+    self->finished = PyThread_allocate_lock();
+    if (!self->mutex || !self->not_empty || !self->not_full || !self->finished) {
+        goto nomem;
+    }
+    /* the signals start taken, and are released to wake the waiting side */
+    PyThread_acquire_lock(self->not_empty, WAIT_LOCK);
+    PyThread_acquire_lock(self->not_full, WAIT_LOCK);
+    PyThread_acquire_lock(self->finished, WAIT_LOCK);
+
+    if (PyThread_start_new_thread(_prefetch_run, self) == PYTHREAD_INVALID_THREAD_ID) {
+        PyErr_SetString(PyExc_RuntimeError, "can't start prefetch thread");
+        _prefetch_release(self);
+        return NULL;
+    }
+    return self;
+
+nomem:
+    PyErr_NoMemory();
+    _prefetch_release(self);
+    return NULL;
+}
+
+/*
+ * Waits for the next row. Returns 1 and the row, 0 at the end of the
+ * results, 2 if the thread handed the statement back to be stepped by the
+ * caller, or -1 with an exception set if a step failed.
+ */
+int pysqlite_prefetch_wait(pysqlite_Prefetch* self, pysqlite_PrefetchRow** row)
+{
+    int rc;
+
+    PyThread_acquire_lock(self->mutex, WAIT_LOCK);
+    while (self->count == 0 && !self->done) {
+        self->consumer_waiting = 1;
+        PyThread_release_lock(self->mutex);
+        Py_BEGIN_ALLOW_THREADS
+        PyThread_acquire_lock(self->not_empty, WAIT_LOCK);
+        Py_END_ALLOW_THREADS
+        PyThread_acquire_lock(self->mutex, WAIT_LOCK);
+    }
+    if (self->count > 0) {
+        *row = &self->rows[self->head];
+        PyThread_release_lock(self->mutex);
+        return 1;
+    }
+    rc = self->rc;
+    PyThread_release_lock(self->mutex);
+
+    if (rc == SQLITE_DONE) {
+        return 0;
+    }
+    if (rc == PYSQLITE_PREFETCH_HANDED_BACK) {
+        return 2;
+    }
+    if (self->expired) {
+        _pysqlite_seterror_timeout();
+        return -1;
+    }
+    _pysqlite_seterror_code(self->errcode, self->errmsg ? self->errmsg : "out of memory");
+    return -1;
+}
+
+/* Releases the row returned by pysqlite_prefetch_wait(). */
+void pysqlite_prefetch_pop(pysqlite_Prefetch* self)
+{
+    PyThread_acquire_lock(self->mutex, WAIT_LOCK);
+    self->head = (self->head + 1) % self->capacity;
+    self->count--;
+    if (self->producer_waiting && self->count <= self->capacity - self->batch) {
+        self->producer_waiting = 0;
+        PyThread_release_lock(self->not_full);
+    }
+    PyThread_release_lock(self->mutex);
+}
+
+static void _prefetch_release(pysqlite_Prefetch* self)
+{
+    int i;
+
+    if (self->mutex) {
+        PyThread_free_lock(self->mutex);
+    }
+    if (self->not_empty) {
+        PyThread_free_lock(self->not_empty);
+    }
+    if (self->not_full) {
+        PyThread_free_lock(self->not_full);
+    }
+    if (self->finished) {
+        PyThread_free_lock(self->finished);
+    }
+    if (self->rows) {
+        for (i = 0; i < self->capacity; i++) {
+            PyMem_Free(self->rows[i].values);
+            PyMem_RawFree(self->rows[i].data);
+        }
+        PyMem_Free(self->rows);
+    }
+    PyMem_Free(self->raw);
+    sqlite3_free(self->errmsg);
+    PyMem_Free(self);
+}
+
+/*
+ * Stops the thread and frees the buffers. The statement is left wherever
+ * the thread stopped, so it must be reset before it is used again.
+ */
+void pysqlite_prefetch_free(pysqlite_Prefetch* self)
+{
+    PyThread_acquire_lock(self->mutex, WAIT_LOCK);
+    self->stop = 1;
+    if (self->producer_waiting) {
+        self->producer_waiting = 0;
+        PyThread_release_lock(self->not_full);
+    }
+    PyThread_release_lock(self->mutex);
+
+    Py_BEGIN_ALLOW_THREADS
+    PyThread_acquire_lock(self->finished, WAIT_LOCK);
+    Py_END_ALLOW_THREADS
+
+    _prefetch_release(self);
+}
@@ -0,0 +1,70 @@
+#ifndef PYSQLITE_PREFETCH_H
+#define PYSQLITE_PREFETCH_H
+#include "Python.h"
+#include "pythread.h"
+#include "sqlite3.h"
+#include "connection.h"
+
+/* rc of a thread that stopped so that the caller steps the statement itself */
+#define PYSQLITE_PREFETCH_HANDED_BACK (-1)
+
+/* A column value copied out of the statement by the prefetch thread */
+typedef struct
+{
+    int type;               /* SQLITE_NULL, SQLITE_INTEGER, ... */
+    sqlite3_int64 ival;
+    double dval;
+    Py_ssize_t offset;      /* text and blob values: position in the row data */
+    Py_ssize_t nbytes;
+} pysqlite_PrefetchValue;
+
+typedef struct
+{
+    pysqlite_PrefetchValue* values;
+    char* data;
+    Py_ssize_t capacity;
+} pysqlite_PrefetchRow;
+
+/*
+ * Steps a statement in a background thread and copies up to `capacity`
+ * rows ahead into a ring buffer. The thread never touches Python objects,
+ * and hands the statement back before a step could call Python.
+ */
+typedef struct
+{
+    pysqlite_Connection* connection;
+    sqlite3* db;
+    sqlite3_stmt* st;
+    double deadline;        /* of the query, see Connection.deadline */
+    int ncols;
+    unsigned char* raw;     /* per column: read as a blob for a converter */
+
+    pysqlite_PrefetchRow* rows;
+    int capacity;
+    int batch;              /* rows to wait for before waking the other side */
+    int head;
+    int count;
+
+    int done;               /* no more rows will be added */
+    int stop;               /* asked to stop */
+    int rc;                 /* SQLITE_DONE, PYSQLITE_PREFETCH_HANDED_BACK or the
+                               error code of the last step */
+    int expired;            /* the step failed because the deadline passed */
+    int errcode;
+    char* errmsg;
+
+    PyThread_type_lock mutex;
+    PyThread_type_lock not_empty;
+    PyThread_type_lock not_full;
+    PyThread_type_lock finished;
+    int consumer_waiting;
+    int producer_waiting;
+} pysqlite_Prefetch;
+
+pysqlite_Prefetch* pysqlite_prefetch_start(pysqlite_Connection* connection, sqlite3_stmt* st,
+                                           int capacity, const unsigned char* raw, double deadline);
+int pysqlite_prefetch_wait(pysqlite_Prefetch* self, pysqlite_PrefetchRow** row);
+void pysqlite_prefetch_pop(pysqlite_Prefetch* self);
+void pysqlite_prefetch_free(pysqlite_Prefetch* self);
+
+#endif
@@ -0,0 +1,265 @@
+#include "prepared.h"
+#include "cursor.h"
+#include "module.h"
+#include "util.h"
+
+/*
+ * Wraps a statement created by Connection.prepare(). The statement is run
+ * as it is on every call, without looking it up in the statement cache.
+ */
+PyObject* pysqlite_prepared_new(pysqlite_Connection* connection, pysqlite_Statement* statement)
+{
+    pysqlite_PreparedStatement* self;
+
+    self = PyObject_New(pysqlite_PreparedStatement, &pysqlite_PreparedStatementType);
+    if (!self) {
+        return NULL;
+    }
+    Py_INCREF(connection);
+    self->connection = connection;
+    Py_INCREF(statement);
+    self->statement = statement;
+    self->in_weakreflist = NULL;
+    return (PyObject*)self;
+}
+
+static void pysqlite_prepared_dealloc(pysqlite_PreparedStatement* self)
+{
+    if (self->in_weakreflist != NULL) {
+        PyObject_ClearWeakRefs((PyObject*)self);
+    }
+    Py_XDECREF(self->statement);
+    Py_XDECREF(self->connection);
+    Py_TYPE(self)->tp_free((PyObject*)self);
+}
+
+/*
+ * Checks if the statement can be used. It is finalized when the connection
+ * is closed.
+ *
+ * 0 => error; 1 => ok
+ */
+static int pysqlite_check_prepared(pysqlite_PreparedStatement* self)
+{
+    if (!pysqlite_check_thread(self->connection) || !pysqlite_check_connection(self->connection)) {
+        return 0;
+    }
+    if (!self->statement->st) {
+        PyErr_SetString(pysqlite_ProgrammingError, "Cannot operate on a finalized statement.");
+        return 0;
+    }
+    return 1;
+}
+
+/* Runs the statement on a new cursor of the connection and returns the cursor */
+static PyObject* _pysqlite_prepared_execute(pysqlite_PreparedStatement* self, PyObject* parameters,
+                                            int multiple)
+{
+    PyObject* cursor;
+    PyObject* result;
+
+    if (!pysqlite_check_prepared(self)) {
+        return NULL;
+    }
+
+    cursor = PyObject_CallMethod((PyObject*)self->connection, "cursor", NULL);
+    if (!cursor) {
+        return NULL;
+    }
+    result = pysqlite_cursor_execute_statement((pysqlite_Cursor*)cursor, self->statement,
+                                               parameters, multiple);
+    Py_DECREF(cursor);
+    return result;
+}
+
+static PyObject* pysqlite_prepared_execute(pysqlite_PreparedStatement* self, PyObject* args)
+{
+    PyObject* parameters = NULL;
+
+    if (!PyArg_ParseTuple(args, "|O:execute", &parameters)) {
+        return NULL;
+    }
+    return _pysqlite_prepared_execute(self, parameters, 0);
+}
+
+static PyObject* pysqlite_prepared_executemany(pysqlite_PreparedStatement* self, PyObject* args)
+{
+    PyObject* parameters;
+
+    if (!PyArg_ParseTuple(args, "O:executemany", &parameters)) {
+        return NULL;
+    }
+    return _pysqlite_prepared_execute(self, parameters, 1);
+}
+
+/*
+ * Returns the query plan of the statement as a list of (id, parent, detail)
+ * tuples, see EXPLAIN QUERY PLAN.
+ */
+static PyObject* pysqlite_prepared_explain(pysqlite_PreparedStatement* self, PyObject* args)
+{
+    PyObject* sql;
+    PyObject* plan = NULL;
+    PyObject* row;
+    const char* sql_cstr;
+    sqlite3_stmt* st;
+    int rc;
+
+    if (!pysqlite_check_prepared(self)) {
+        return NULL;
+    }
+
+    sql = PyUnicode_FromFormat("EXPLAIN QUERY PLAN %U", self->statement->sql);
+    if (!sql) {
+        return NULL;
+    }
+    sql_cstr = PyUnicode_AsUTF8(sql);
+    if (!sql_cstr) {
+        Py_DECREF(sql);
+        return NULL;
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+    rc = sqlite3_prepare_v2(self->connection->db, sql_cstr, -1, &st, NULL);
+    Py_END_ALLOW_THREADS
+    Py_DECREF(sql);
+    if (rc != SQLITE_OK) {
+        _pysqlite_seterror(self->connection->db);
+        return NULL;
+    }
+
+    plan = PyList_New(0);
+    if (!plan) {
+        goto error;
+    }
+    while ((rc = pysqlite_step(st, self->connection)) == SQLITE_ROW) {
+        row = Py_BuildValue("(iis)", sqlite3_column_int(st, 0), sqlite3_column_int(st, 1),
+                            (const char*)sqlite3_column_text(st, 3));
+        if (!row || PyList_Append(plan, row) != 0) {
+            Py_XDECREF(row);
+            goto error;
+        }
+        Py_DECREF(row);
+    }
+    if (rc != SQLITE_DONE) {
+        _pysqlite_seterror(self->connection->db);
+        goto error;
+    }
+    sqlite3_finalize(st);
+    return plan;
+
+error:
+    Py_XDECREF(plan);
+    sqlite3_finalize(st);
+    return NULL;
+}
+
+static PyObject* pysqlite_prepared_get_sql(pysqlite_PreparedStatement* self, void* unused)
+{
+    Py_INCREF(self->statement->sql);
+    return self->statement->sql;
+}
+
+static PyObject* pysqlite_prepared_get_readonly(pysqlite_PreparedStatement* self, void* unused)
+{
+    if (!pysqlite_check_prepared(self)) {
+        return NULL;
+    }
+    return PyBool_FromLong(sqlite3_stmt_readonly(self->statement->st));
+}
+
+static PyObject* pysqlite_prepared_get_column_names(pysqlite_PreparedStatement* self, void* unused)
+{
+    PyObject* names;
+    PyObject* name;
+    int i, count;
+
+    if (!pysqlite_check_prepared(self)) {
+        return NULL;
+    }
+
+    count = sqlite3_column_count(self->statement->st);
+    names = PyTuple_New(count);
+    if (!names) {
+        return NULL;
+    }
+    for (i = 0; i < count; i++) {
+        name = PyUnicode_FromString(sqlite3_column_name(self->statement->st, i));
+        if (!name) {
+            Py_DECREF(names);
+            return NULL;
+        }
+        PyTuple_SET_ITEM(names, i, name);
+    }
+    return names;
+}
+
+/* Names of the parameters without their prefix, or None for "?" parameters */
+static PyObject* pysqlite_prepared_get_bind_parameter_names(pysqlite_PreparedStatement* self,
+                                                            void* unused)
+{
+    PyObject* names;
+    PyObject* name;
+    const char* binding_name;
+    int i, count;
+
+    if (!pysqlite_check_prepared(self)) {
+        return NULL;
+    }
+
+    count = sqlite3_bind_parameter_count(self->statement->st);
+    names = PyTuple_New(count);
+    if (!names) {
+        return NULL;
+    }
+    for (i = 0; i < count; i++) {
+        binding_name = sqlite3_bind_parameter_name(self->statement->st, i + 1);
+        if (binding_name) {
+            name = PyUnicode_FromString(binding_name + 1);
+            if (!name) {
+                Py_DECREF(names);
+                return NULL;
+            }
+        } else {
+            Py_INCREF(Py_None);
+            name = Py_None;
+        }
+        PyTuple_SET_ITEM(names, i, name);
+    }
+    return names;
+}
+
+static PyMethodDef prepared_methods[] = {
+    {"execute", (PyCFunction)pysqlite_prepared_execute, METH_VARARGS,
+        PyDoc_STR("Runs the statement with the given parameters. Returns a new cursor.")},
+    {"executemany", (PyCFunction)pysqlite_prepared_executemany, METH_VARARGS,
+        PyDoc_STR("Runs the statement for each set of parameters. Returns a new cursor.")},
+    {"explain", (PyCFunction)pysqlite_prepared_explain, METH_NOARGS,
+        PyDoc_STR("Returns the query plan as a list of (id, parent, detail) tuples.")},
+    {NULL, NULL}
+};
+
+static PyGetSetDef prepared_getset[] = {
+    {"sql", (getter)pysqlite_prepared_get_sql, (setter)0},
+    {"readonly", (getter)pysqlite_prepared_get_readonly, (setter)0},
+    {"column_names", (getter)pysqlite_prepared_get_column_names, (setter)0},
+    {"bind_parameter_names", (getter)pysqlite_prepared_get_bind_parameter_names, (setter)0},
+    {NULL}
+};
+
+PyTypeObject pysqlite_PreparedStatementType = {
+        PyVarObject_HEAD_INIT(NULL, 0)
+        MODULE_NAME ".PreparedStatement",
+        .tp_basicsize = sizeof(pysqlite_PreparedStatement),
+        .tp_dealloc = (destructor)pysqlite_prepared_dealloc,
+        .tp_flags = Py_TPFLAGS_DEFAULT,
+        .tp_doc = PyDoc_STR("SQL statement prepared once and run many times."),
+        .tp_weaklistoffset = offsetof(pysqlite_PreparedStatement, in_weakreflist),
+        .tp_methods = prepared_methods,
+        .tp_getset = prepared_getset,
+};
+
+extern int pysqlite_prepared_setup_types(void)
+{
+    return PyType_Ready(&pysqlite_PreparedStatementType);
+}
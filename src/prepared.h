@@ -0,0 +1,24 @@
+#ifndef PYSQLITE_PREPARED_H
+#define PYSQLITE_PREPARED_H
+#include "Python.h"
+#include "sqlite3.h"
+#include "connection.h"
+#include "statement.h"
+
+/* A statement prepared once with Connection.prepare() and run many times */
+typedef struct
+{
+    PyObject_HEAD
+    pysqlite_Connection* connection;
+    pysqlite_Statement* statement;
+
+    PyObject* in_weakreflist; /* List of weak references */
+} pysqlite_PreparedStatement;
+
+extern PyTypeObject pysqlite_PreparedStatementType;
+
+PyObject* pysqlite_prepared_new(pysqlite_Connection* connection, pysqlite_Statement* statement);
+
+int pysqlite_prepared_setup_types(void);
+
+#endif
@@ -0,0 +1,575 @@
+// Copyright (c) 2023 Anton Zhiyanov, MIT License
+// https://github.com/nalgeon/sqlean.py
+
+// Connection-level cache of compiled regular expressions.
+//
+// The regexp extension keeps a compiled pattern in SQLite auxdata,
+// which only helps when the pattern is a constant within a statement.
+// Here the regexp functions look up compiled patterns in an LRU cache
+// owned by the connection instead, so patterns taken from columns or
+// parameters, and patterns reused across statements, are compiled once.
+// Each cached pattern also keeps its match data block for reuse.
+//
+// regexp_cache_stats()
+//   - returns cache statistics as a JSON object
+// regexp_cache_capacity(n)
+//   - sets the maximum number of cached patterns (0 disables the cache),
+//     up to CACHE_MAX_CAPACITY
+
+#include <stdint.h>
+#include <stdlib.h>
+#include <string.h>
+
+#include "regexp/extension.h"
+#include "regexp/pcre2/pcre2.h"
+
+#include "sqlite3ext.h"
+SQLITE_EXTENSION_INIT3
+
+#include "regexp_cache.h"
+
+#define CACHE_CLIENTDATA "sqlean_regexp_cache"
+#define CACHE_DEFAULT_CAPACITY 256
+#define CACHE_MAX_CAPACITY 1000000
+#define CACHE_MIN_BUCKETS 16
+
+// entry is a compiled pattern in the cache.
+struct entry {
+    char* pattern;
+    int pattern_len;
+    uint32_t hash;
+    pcre2_code* re;
+    pcre2_match_data* match_data;
+    // recency list, most recently used first
+    struct entry* prev;
+    struct entry* next;
+    // hash bucket chain
+    struct entry* chain;
+};
+
+// cache is an LRU cache of compiled patterns.
+struct cache {
+    long long capacity;
+    long long size;
+    long long hits;
+    long long misses;
+    struct entry** buckets;
+    size_t n_buckets;
+    struct entry* head;
+    struct entry* tail;
+};
+
+// hash_pattern returns the FNV-1a hash of the pattern.
+static uint32_t hash_pattern(const char* pattern, int len) {
+    uint32_t hash = 2166136261u;
+    for (int i = 0; i < len; i++) {
+        hash ^= (unsigned char)pattern[i];
+        hash *= 16777619u;
+    }
+    return hash;
+}
+
+// entry_free frees the cache entry.
+static void entry_free(struct entry* entry) {
+    if (entry == NULL) {
+        return;
+    }
+    pcre2_match_data_free(entry->match_data);
+    pcre2_code_free(entry->re);
+    sqlite3_free(entry->pattern);
+    sqlite3_free(entry);
+}
+
+// entry_compile compiles the pattern into a new entry.
+// On failure, returns NULL and sets the error message in errmsg
+// (the message should be freed with sqlite3_free).
+static struct entry* entry_compile(const char* pattern, int len, char** errmsg) {
+    int errcode;
+    size_t erroffset;
+    uint32_t options = PCRE2_UCP | PCRE2_UTF;
+
+    *errmsg = NULL;
+    pcre2_code* re = pcre2_compile((PCRE2_SPTR8)pattern, (PCRE2_SIZE)len, options, &errcode,
+                                   &erroffset, NULL);
+    if (re == NULL) {
+        PCRE2_UCHAR buffer[256];
+        pcre2_get_error_message(errcode, buffer, sizeof(buffer));
+        *errmsg = sqlite3_mprintf("%s (offset %d)", buffer, (int)erroffset);
+        return NULL;
+    }
+
+#ifdef SUPPORT_JIT
+    // falls back to the interpreter if JIT compilation fails
+    pcre2_jit_compile(re, PCRE2_JIT_COMPLETE);
+#endif
+
+    struct entry* entry = sqlite3_malloc(sizeof(struct entry));
+    if (entry == NULL) {
+        pcre2_code_free(re);
+        return NULL;
+    }
+    memset(entry, 0, sizeof(struct entry));
+    entry->re = re;
+
+    entry->match_data = pcre2_match_data_create_from_pattern(re, NULL);
+    entry->pattern = sqlite3_malloc(len + 1);
+    if (entry->match_data == NULL || entry->pattern == NULL) {
+        entry_free(entry);
+        return NULL;
+    }
+    memcpy(entry->pattern, pattern, len);
+    entry->pattern[len] = '\0';
+    entry->pattern_len = len;
+    entry->hash = hash_pattern(pattern, len);
+    return entry;
+}
+
+// cache_unlink removes the entry from the recency list.
+static void cache_unlink(struct cache* cache, struct entry* entry) {
+    if (entry->prev) {
+        entry->prev->next = entry->next;
+    } else {
+        cache->head = entry->next;
+    }
+    if (entry->next) {
+        entry->next->prev = entry->prev;
+    } else {
+        cache->tail = entry->prev;
+    }
+    entry->prev = NULL;
+    entry->next = NULL;
+}
+
+// cache_push_front makes the entry the most recently used one.
+static void cache_push_front(struct cache* cache, struct entry* entry) {
+    entry->prev = NULL;
+    entry->next = cache->head;
+    if (cache->head) {
+        cache->head->prev = entry;
+    } else {
+        cache->tail = entry;
+    }
+    cache->head = entry;
+}
+
+// cache_evict removes the least recently used entry from the cache.
+static void cache_evict(struct cache* cache) {
+    struct entry* entry = cache->tail;
+    if (entry == NULL) {
+        return;
+    }
+    cache_unlink(cache, entry);
+
+    struct entry** link = &cache->buckets[entry->hash & (cache->n_buckets - 1)];
+    while (*link != entry) {
+        link = &(*link)->chain;
+    }
+    *link = entry->chain;
+
+    cache->size--;
+    entry_free(entry);
+}
+
+// cache_rehash sizes the hash table for the cached entries,
+// so that it grows with the entries rather than with the capacity.
+static int cache_rehash(struct cache* cache) {
+    size_t n_buckets = CACHE_MIN_BUCKETS;
+    while ((long long)n_buckets < cache->size) {
+        n_buckets <<= 1;
+    }
+    if (n_buckets == cache->n_buckets) {
+        return SQLITE_OK;
+    }
+
+    struct entry** buckets = sqlite3_malloc64(n_buckets * sizeof(struct entry*));
+    if (buckets == NULL) {
+        return SQLITE_NOMEM;
+    }
+    memset(buckets, 0, n_buckets * sizeof(struct entry*));
+    for (struct entry* entry = cache->head; entry; entry = entry->next) {
+        size_t idx = entry->hash & (n_buckets - 1);
+        entry->chain = buckets[idx];
+        buckets[idx] = entry;
+    }
+    sqlite3_free(cache->buckets);
+    cache->buckets = buckets;
+    cache->n_buckets = n_buckets;
+    return SQLITE_OK;
+}
+
+// cache_resize sets the cache capacity, evicting entries if necessary.
+static int cache_resize(struct cache* cache, long long capacity) {
+    while (cache->size > capacity) {
+        cache_evict(cache);
+    }
+    if (cache_rehash(cache) != SQLITE_OK && cache->buckets == NULL) {
+        return SQLITE_NOMEM;
+    }
+    cache->capacity = capacity;
+    return SQLITE_OK;
+}
+
+// cache_free frees the cache and all its entries.
+static void cache_free(void* ptr) {
+    struct cache* cache = ptr;
+    struct entry* entry = cache->head;
+    while (entry) {
+        struct entry* next = entry->next;
+        entry_free(entry);
+        entry = next;
+    }
+    sqlite3_free(cache->buckets);
+    sqlite3_free(cache);
+}
+
+// cache_new creates an empty cache.
+static struct cache* cache_new(void) {
+    struct cache* cache = sqlite3_malloc(sizeof(struct cache));
+    if (cache == NULL) {
+        return NULL;
+    }
+    memset(cache, 0, sizeof(struct cache));
+    if (cache_resize(cache, CACHE_DEFAULT_CAPACITY) != SQLITE_OK) {
+        sqlite3_free(cache);
+        return NULL;
+    }
+    return cache;
+}
+
+// cache_get returns the compiled pattern, compiling it on a cache miss.
+// If the cache is disabled, sets is_owned and the caller should free the entry.
+static struct entry* cache_get(struct cache* cache,
+                               const char* pattern,
+                               int len,
+                               int* is_owned,
+                               char** errmsg) {
+    *is_owned = 0;
+    *errmsg = NULL;
+
+    uint32_t hash = hash_pattern(pattern, len);
+    struct entry* entry = cache->buckets[hash & (cache->n_buckets - 1)];
+    for (; entry; entry = entry->chain) {
+        if (entry->hash == hash && entry->pattern_len == len &&
+            memcmp(entry->pattern, pattern, len) == 0) {
+            cache->hits++;
+            if (entry != cache->head) {
+                cache_unlink(cache, entry);
+                cache_push_front(cache, entry);
+            }
+            return entry;
+        }
+    }
+
+    cache->misses++;
+    entry = entry_compile(pattern, len, errmsg);
+    if (entry == NULL) {
+        return NULL;
+    }
+
+    if (cache->capacity == 0) {
+        *is_owned = 1;
+        return entry;
+    }
+
+    if (cache->size >= cache->capacity) {
+        cache_evict(cache);
+    }
+    size_t idx = entry->hash & (cache->n_buckets - 1);
+    entry->chain = cache->buckets[idx];
+    cache->buckets[idx] = entry;
+    cache_push_front(cache, entry);
+    cache->size++;
+    if ((size_t)cache->size > cache->n_buckets) {
+        // keeps the old table if a larger one can't be allocated
+        cache_rehash(cache);
+    }
+    return entry;
+}
+
+// lookup returns the compiled pattern for the function call,
+// or sets the function result to an error and returns NULL.
+static struct entry* lookup(sqlite3_context* context, sqlite3_value* arg, int* is_owned) {
+    const char* pattern = (const char*)sqlite3_value_text(arg);
+    if (!pattern) {
+        sqlite3_result_error(context, "missing regexp pattern", -1);
+        return NULL;
+    }
+    int len = sqlite3_value_bytes(arg);
+
+    char* errmsg;
+    struct cache* cache = sqlite3_user_data(context);
+    struct entry* entry = cache_get(cache, pattern, len, is_owned, &errmsg);
+    if (entry == NULL) {
+        if (errmsg) {
+            sqlite3_result_error(context, errmsg, -1);
+            sqlite3_free(errmsg);
+        } else {
+            sqlite3_result_error_nomem(context);
+        }
+        return NULL;
+    }
+    return entry;
+}
+
+// release frees the entry if it does not belong to the cache.
+static void release(struct entry* entry, int is_owned) {
+    if (is_owned) {
+        entry_free(entry);
+    }
+}
+
+// match matches the source against the pattern.
+// Returns the number of captured groups + 1, or <= 0 if there is no match.
+static int match(struct entry* entry, const char* source, int len) {
+    return pcre2_match(entry->re, (PCRE2_SPTR8)source, (PCRE2_SIZE)len, 0, 0, entry->match_data,
+                       NULL);
+}
+
+// like_result sets the result of a match check.
+static void like_result(sqlite3_context* context, sqlite3_value* source_arg,
+                        sqlite3_value* pattern_arg) {
+    const char* source = (const char*)sqlite3_value_text(source_arg);
+    if (!source) {
+        sqlite3_result_int(context, 0);
+        return;
+    }
+    int source_len = sqlite3_value_bytes(source_arg);
+
+    int is_owned;
+    struct entry* entry = lookup(context, pattern_arg, &is_owned);
+    if (entry == NULL) {
+        return;
+    }
+
+    int rc = match(entry, source, source_len);
+    sqlite3_result_int(context, rc > 0);
+    release(entry, is_owned);
+}
+
+// extract_result sets the result to the matched group of the source.
+static void extract_result(sqlite3_context* context,
+                           sqlite3_value* source_arg,
+                           sqlite3_value* pattern_arg,
+                           size_t group_idx) {
+    const char* source = (const char*)sqlite3_value_text(source_arg);
+    if (!source) {
+        return;
+    }
+    int source_len = sqlite3_value_bytes(source_arg);
+
+    int is_owned;
+    struct entry* entry = lookup(context, pattern_arg, &is_owned);
+    if (entry == NULL) {
+        return;
+    }
+
+    int rc = match(entry, source, source_len);
+    if (rc > 0 && group_idx < (size_t)rc) {
+        PCRE2_SIZE* ovector = pcre2_get_ovector_pointer(entry->match_data);
+        PCRE2_SIZE start = ovector[2 * group_idx];
+        PCRE2_SIZE end = ovector[2 * group_idx + 1];
+        if (start != PCRE2_UNSET) {
+            sqlite3_result_text(context, source + start, (int)(end - start), SQLITE_TRANSIENT);
+        }
+    }
+    release(entry, is_owned);
+}
+
+/*
+ * Checks if the source string matches the pattern.
+ * regexp_statement(pattern, source)
+ * E.g.:
+ * select true where 'abc' regexp 'a.c';
+ */
+static void fn_statement(sqlite3_context* context, int argc, sqlite3_value** argv) {
+    like_result(context, argv[1], argv[0]);
+}
+
+/*
+ * Checks if the source string matches the pattern.
+ * regexp_like(source, pattern)
+ * E.g.:
+ * select regexp_like('abc', 'a.c');
+ */
+static void fn_like(sqlite3_context* context, int argc, sqlite3_value** argv) {
+    like_result(context, argv[0], argv[1]);
+}
+
+/*
+ * Returns a substring of the source string that matches the pattern.
+ * regexp_substr(source, pattern)
+ * E.g.: select regexp_substr('abcdef', 'b.d') = 'bcd';
+ */
+static void fn_substr(sqlite3_context* context, int argc, sqlite3_value** argv) {
+    extract_result(context, argv[0], argv[1], 0);
+}
+
+/*
+ * Finds a substring of the source string that matches the pattern
+ * and returns the nth matching group within that substring.
+ * regexp_capture(source, pattern[, n])
+ * E.g.: select regexp_capture('abcdef', 'b(.)d', 1) = 'c';
+ */
+static void fn_capture(sqlite3_context* context, int argc, sqlite3_value** argv) {
+    size_t group_idx = 0;
+    if (argc == 3) {
+        if (sqlite3_value_type(argv[2]) != SQLITE_INTEGER) {
+            sqlite3_result_error(context, "group number should be integer", -1);
+            return;
+        }
+        group_idx = sqlite3_value_int64(argv[2]);
+    }
+    extract_result(context, argv[0], argv[1], group_idx);
+}
+
+/*
+ * Replaces all matching substrings with the replacement string.
+ * regexp_replace(source, pattern, replacement)
+ * E.g.: select regexp_replace('abcdef', 'b.d', '...') = 'a...ef';
+ */
+static void fn_replace(sqlite3_context* context, int argc, sqlite3_value** argv) {
+    const char* source = (const char*)sqlite3_value_text(argv[0]);
+    if (!source) {
+        return;
+    }
+    int source_len = sqlite3_value_bytes(argv[0]);
+
+    if (!sqlite3_value_text(argv[1])) {
+        sqlite3_result_error(context, "missing regexp pattern", -1);
+        return;
+    }
+
+    const char* replacement = (const char*)sqlite3_value_text(argv[2]);
+    if (!replacement) {
+        sqlite3_result_value(context, argv[0]);
+        return;
+    }
+    int replacement_len = sqlite3_value_bytes(argv[2]);
+
+    int is_owned;
+    struct entry* entry = lookup(context, argv[1], &is_owned);
+    if (entry == NULL) {
+        return;
+    }
+
+    const uint32_t options =
+        PCRE2_SUBSTITUTE_GLOBAL | PCRE2_SUBSTITUTE_EXTENDED | PCRE2_SUBSTITUTE_OVERFLOW_LENGTH;
+    PCRE2_SIZE outlen = (PCRE2_SIZE)source_len + 1024;
+    char* output = NULL;
+    int rc;
+    for (int attempt = 0; attempt < 2; attempt++) {
+        output = sqlite3_malloc64(outlen);
+        if (output == NULL) {
+            release(entry, is_owned);
+            sqlite3_result_error_nomem(context);
+            return;
+        }
+        rc = pcre2_substitute(entry->re, (PCRE2_SPTR8)source, (PCRE2_SIZE)source_len, 0, options,
+                              entry->match_data, NULL, (PCRE2_SPTR8)replacement,
+                              (PCRE2_SIZE)replacement_len, (PCRE2_UCHAR8*)output, &outlen);
+        if (rc != PCRE2_ERROR_NOMEMORY) {
+            break;
+        }
+        // outlen now holds the required buffer size
+        sqlite3_free(output);
+        output = NULL;
+    }
+    release(entry, is_owned);
+
+    if (rc <= 0) {
+        sqlite3_free(output);
+        sqlite3_result_value(context, argv[0]);
+        return;
+    }
+
+    sqlite3_result_text64(context, output, outlen, sqlite3_free, SQLITE_UTF8);
+}
+
+/*
+ * Returns the regexp cache statistics as a JSON object.
+ * regexp_cache_stats()
+ * E.g.: select regexp_cache_stats() ->> 'hits';
+ */
+static void fn_cache_stats(sqlite3_context* context, int argc, sqlite3_value** argv) {
+    struct cache* cache = sqlite3_user_data(context);
+    char* stats = sqlite3_mprintf("{\"capacity\":%lld,\"size\":%lld,\"hits\":%lld,\"misses\":%lld}",
+                                  cache->capacity, cache->size, cache->hits, cache->misses);
+    if (stats == NULL) {
+        sqlite3_result_error_nomem(context);
+        return;
+    }
+    sqlite3_result_text(context, stats, -1, sqlite3_free);
+}
+
+/*
+ * Sets the maximum number of cached patterns and returns it.
+ * regexp_cache_capacity(n)
+ * E.g.: select regexp_cache_capacity(1000);
+ */
+static void fn_cache_capacity(sqlite3_context* context, int argc, sqlite3_value** argv) {
+    struct cache* cache = sqlite3_user_data(context);
+    if (sqlite3_value_type(argv[0]) != SQLITE_INTEGER || sqlite3_value_int64(argv[0]) < 0) {
+        sqlite3_result_error(context, "capacity should be a non-negative integer", -1);
+        return;
+    }
+    if (sqlite3_value_int64(argv[0]) > CACHE_MAX_CAPACITY) {
+        char* errmsg = sqlite3_mprintf("capacity should be at most %d", CACHE_MAX_CAPACITY);
+        if (errmsg == NULL) {
+            sqlite3_result_error_nomem(context);
+            return;
+        }
+        sqlite3_result_error(context, errmsg, -1);
+        sqlite3_free(errmsg);
+        return;
+    }
+    if (cache_resize(cache, sqlite3_value_int64(argv[0])) != SQLITE_OK) {
+        sqlite3_result_error_nomem(context);
+        return;
+    }
+    sqlite3_result_int64(context, cache->capacity);
+}
+
+int regexp_cache_init(sqlite3* db) {
+    int rc = regexp_init(db);
+    if (rc != SQLITE_OK) {
+        return rc;
+    }
+
+    struct cache* cache = sqlite3_get_clientdata(db, CACHE_CLIENTDATA);
+    if (cache == NULL) {
+        cache = cache_new();
+        if (cache == NULL) {
+            return SQLITE_NOMEM;
+        }
+        // the connection frees the cache when closed
+        rc = sqlite3_set_clientdata(db, CACHE_CLIENTDATA, cache, cache_free);
+        if (rc != SQLITE_OK) {
+            cache_free(cache);
+            return rc;
+        }
+    }
+
+    static const int flags = SQLITE_UTF8 | SQLITE_DETERMINISTIC;
+    sqlite3_create_function(db, "regexp", 2, flags, cache, fn_statement, 0, 0);
+    sqlite3_create_function(db, "regexp_like", 2, flags, cache, fn_like, 0, 0);
+    sqlite3_create_function(db, "regexp_substr", 2, flags, cache, fn_substr, 0, 0);
+    sqlite3_create_function(db, "regexp_capture", 2, flags, cache, fn_capture, 0, 0);
+    sqlite3_create_function(db, "regexp_capture", 3, flags, cache, fn_capture, 0, 0);
+    sqlite3_create_function(db, "regexp_replace", 3, flags, cache, fn_replace, 0, 0);
+    sqlite3_create_function(db, "regexp_cache_stats", 0, SQLITE_UTF8, cache, fn_cache_stats, 0, 0);
+    sqlite3_create_function(db, "regexp_cache_capacity", 1, SQLITE_UTF8, cache, fn_cache_capacity,
+                            0, 0);
+    return SQLITE_OK;
+}
+
+int regexp_cache_get_stats(sqlite3* db, struct regexp_cache_stats* stats) {
+    struct cache* cache = sqlite3_get_clientdata(db, CACHE_CLIENTDATA);
+    if (cache == NULL) {
+        return 0;
+    }
+    stats->capacity = cache->capacity;
+    stats->size = cache->size;
+    stats->hits = cache->hits;
+    stats->misses = cache->misses;
+    return 1;
+}
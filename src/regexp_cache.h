@@ -0,0 +1,27 @@
+// Copyright (c) 2023 Anton Zhiyanov, MIT License
+// https://github.com/nalgeon/sqlean.py
+
+// Connection-level cache of compiled regular expressions.
+
+#ifndef SQLEAN_REGEXP_CACHE_H
+#define SQLEAN_REGEXP_CACHE_H
+
+struct sqlite3;
+
+// regexp cache statistics
+struct regexp_cache_stats {
+    long long capacity;
+    long long size;
+    long long hits;
+    long long misses;
+};
+
+// regexp_cache_init initializes the regexp extension
+// with the cached versions of the regexp functions.
+int regexp_cache_init(struct sqlite3* db);
+
+// regexp_cache_get_stats fills the stats of the connection's regexp cache.
+// Returns 0 if the regexp extension is not enabled for the connection.
+int regexp_cache_get_stats(struct sqlite3* db, struct regexp_cache_stats* stats);
+
+#endif /* SQLEAN_REGEXP_CACHE_H */
@@ -0,0 +1,370 @@
+#include "resultcache.h"
+
+/*
+ * The entries dict keeps the order in which keys were inserted, so a hit
+ * moves its entry to the end by inserting it again, and eviction takes
+ * entries from the start.
+ *
+ * The cache is only used outside transactions. Running PRAGMA data_version
+ * on a database starts a read transaction, which makes its pager notice
+ * commits by other connections. The data version of the pager then counts
+ * those and the commits of this connection. sqlite3_total_changes64()
+ * covers temporary tables. A change in any of them clears the whole cache.
+ */
+
+/* built-in functions whose results only depend on their arguments */
+static const char* const deterministic_functions[] = {
+    "abs", "char", "coalesce", "concat", "concat_ws", "format", "glob", "hex",
+    "if", "ifnull", "iif", "instr", "length", "like", "likelihood", "likely",
+    "lower", "ltrim", "max", "min", "nullif", "octet_length", "printf",
+    "quote", "replace", "round", "rtrim", "sign", "soundex", "substr",
+    "substring", "trim", "typeof", "unhex", "unicode", "unlikely", "upper",
+    "zeroblob",
+    "acos", "acosh", "asin", "asinh", "atan", "atan2", "atanh", "ceil",
+    "ceiling", "cos", "cosh", "degrees", "exp", "floor", "ln", "log", "log10",
+    "log2", "mod", "pi", "pow", "power", "radians", "sin", "sinh", "sqrt",
+    "tan", "tanh", "trunc",
+    "avg", "count", "group_concat", "string_agg", "sum", "total",
+    "row_number", "rank", "dense_rank", "percent_rank", "cume_dist", "ntile",
+    "lag", "lead", "first_value", "last_value", "nth_value",
+    "json", "jsonb", "json_array", "jsonb_array", "json_array_length",
+    "json_error_position", "json_extract", "jsonb_extract", "json_insert",
+    "jsonb_insert", "json_object", "jsonb_object", "json_patch", "jsonb_patch",
+    "json_pretty", "json_quote", "json_remove", "jsonb_remove", "json_replace",
+    "jsonb_replace", "json_set", "jsonb_set", "json_type", "json_valid",
+    "json_group_array", "jsonb_group_array", "json_group_object",
+    "jsonb_group_object",
+    NULL
+};
+
+/* Checks the name of a function in the P4 column of EXPLAIN, like "abs(1)" */
+static int _pysqlite_deterministic_function(const char* p4)
+{
+    const char* end;
+    int i;
+
+    if (!p4 || !(end = strchr(p4, '('))) {
+        return 0;
+    }
+    for (i = 0; deterministic_functions[i]; i++) {
+        if ((size_t)(end - p4) == strlen(deterministic_functions[i]) &&
+                sqlite3_strnicmp(p4, deterministic_functions[i], (int)(end - p4)) == 0) {
+            return 1;
+        }
+    }
+    return 0;
+}
+
+int pysqlite_result_cache_statement_ok(sqlite3* db, sqlite3_stmt* statement)
+{
+    sqlite3_stmt* explain = NULL;
+    const char* opcode;
+    char* sql;
+    int ok = 1;
+    int rc;
+
+    sql = sqlite3_mprintf("EXPLAIN %s", sqlite3_sql(statement));
+    if (!sql) {
+        return 0;
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+    rc = sqlite3_prepare_v2(db, sql, -1, &explain, NULL);
+    while (rc == SQLITE_OK && ok && (rc = sqlite3_step(explain)) == SQLITE_ROW) {
+        opcode = (const char*)sqlite3_column_text(explain, 1);
+        if (!opcode) {
+            continue;
+        }
+        if (strcmp(opcode, "VOpen") == 0) {
+            ok = 0;
+        } else if (strcmp(opcode, "Function") == 0 || strcmp(opcode, "PureFunc") == 0 ||
+                   strncmp(opcode, "Agg", 3) == 0) {
+            ok = _pysqlite_deterministic_function((const char*)sqlite3_column_text(explain, 5));
+        }
+        rc = SQLITE_OK;
+    }
+    sqlite3_finalize(explain);
+    Py_END_ALLOW_THREADS
+
+    sqlite3_free(sql);
+    return ok && rc == SQLITE_DONE;
+}
+
+pysqlite_ResultCache* pysqlite_result_cache_new(Py_ssize_t max_bytes)
+{
+    pysqlite_ResultCache* cache;
+
+    cache = PyMem_Calloc(1, sizeof(pysqlite_ResultCache));
+    if (!cache) {
+        PyErr_NoMemory();
+        return NULL;
+    }
+    cache->entries = PyDict_New();
+    if (!cache->entries) {
+        PyMem_Free(cache);
+        return NULL;
+    }
+    cache->max_bytes = max_bytes;
+    cache->data_version = -1;
+    cache->total_changes = -1;
+    return cache;
+}
+
+void pysqlite_result_cache_free(pysqlite_ResultCache* cache)
+{
+    if (!cache) {
+        return;
+    }
+    sqlite3_finalize(cache->data_version_statement);
+    Py_XDECREF(cache->entries);
+    PyMem_Free(cache);
+}
+
+void pysqlite_result_cache_clear(pysqlite_ResultCache* cache)
+{
+    if (PyDict_GET_SIZE(cache->entries) > 0) {
+        cache->invalidations++;
+    }
+    PyDict_Clear(cache->entries);
+    cache->bytes = 0;
+    cache->epoch++;
+}
+
+/* Evicts the least recently used entries until size more bytes fit */
+static void _pysqlite_result_cache_evict(pysqlite_ResultCache* cache, Py_ssize_t size)
+{
+    Py_ssize_t pos;
+    PyObject* key;
+    PyObject* entry;
+
+    while (cache->bytes > 0 && cache->bytes + size > cache->max_bytes) {
+        pos = 0;
+        if (!PyDict_Next(cache->entries, &pos, &key, &entry)) {
+            cache->bytes = 0;
+            break;
+        }
+        cache->bytes -= PyLong_AsSsize_t(PyTuple_GET_ITEM(entry, 2));
+        Py_INCREF(key);
+        if (PyDict_DelItem(cache->entries, key) != 0) {
+            PyErr_Clear();
+        }
+        Py_DECREF(key);
+    }
+}
+
+void pysqlite_result_cache_resize(pysqlite_ResultCache* cache, Py_ssize_t max_bytes)
+{
+    cache->max_bytes = max_bytes;
+    _pysqlite_result_cache_evict(cache, 0);
+}
+
+/*
+ * Reads the data version of a database into *data_version after starting
+ * a read transaction on it. The statement for main is kept.
+ * 0 => error; 1 => ok
+ */
+static int _pysqlite_data_version(pysqlite_ResultCache* cache, sqlite3* db, int i, unsigned int* data_version)
+{
+    sqlite3_stmt* statement = i == 0 ? cache->data_version_statement : NULL;
+    const char* name = sqlite3_db_name(db, i);
+    char* sql;
+    int rc = SQLITE_OK;
+
+    if (!statement) {
+        sql = sqlite3_mprintf("PRAGMA \"%w\".data_version", name);
+        if (!sql) {
+            return 0;
+        }
+        rc = sqlite3_prepare_v2(db, sql, -1, &statement, NULL);
+        sqlite3_free(sql);
+        if (rc != SQLITE_OK) {
+            return 0;
+        }
+        if (i == 0) {
+            cache->data_version_statement = statement;
+        }
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+    rc = sqlite3_step(statement);
+    Py_END_ALLOW_THREADS
+    if (i == 0) {
+        sqlite3_reset(statement);
+    } else {
+        sqlite3_finalize(statement);
+    }
+    /* if the database is locked, the query runs without the cache */
+    return rc == SQLITE_ROW &&
+           sqlite3_file_control(db, name, SQLITE_FCNTL_DATA_VERSION, data_version) == SQLITE_OK;
+}
+
+int pysqlite_result_cache_check(pysqlite_ResultCache* cache, sqlite3* db)
+{
+    unsigned int version;
+    sqlite3_uint64 data_version = 0;
+    sqlite3_int64 total_changes;
+    int i;
+
+    if (!sqlite3_get_autocommit(db)) {
+        return 0;
+    }
+
+    /* temp (1) is only changed by this connection, see total_changes */
+    for (i = 0; sqlite3_db_name(db, i); i += i == 0 ? 2 : 1) {
+        if (!_pysqlite_data_version(cache, db, i, &version)) {
+            return 0;
+        }
+        data_version = data_version * 1000003 + version;
+    }
+    total_changes = sqlite3_total_changes64(db);
+
+    if ((sqlite3_int64)data_version != cache->data_version || total_changes != cache->total_changes) {
+        pysqlite_result_cache_clear(cache);
+        cache->data_version = data_version;
+        cache->total_changes = total_changes;
+    }
+    return 1;
+}
+
+/*
+ * The key holds the type of each parameter next to its value: 1 and 1.0
+ * are equal in Python but bind as different SQLite values.
+ */
+PyObject* pysqlite_result_cache_key(PyObject* sql, PyObject* parameters, PyObject* text_factory)
+{
+    PyObject* key;
+    PyObject* items = NULL;
+    PyObject* item;
+    PyObject* value;
+    Py_ssize_t i, count, width;
+
+    if (!parameters || parameters == Py_None) {
+        count = 0;
+        width = 2;
+    } else if (PyTuple_CheckExact(parameters) || PyList_CheckExact(parameters)) {
+        count = PySequence_Fast_GET_SIZE(parameters);
+        width = 2;
+    } else if (PyDict_CheckExact(parameters)) {
+        items = PyDict_Items(parameters);
+        if (!items) {
+            return NULL;
+        }
+        count = PyList_GET_SIZE(items);
+        width = 3;
+    } else {
+        return NULL;
+    }
+
+    key = PyTuple_New(2 + width * count);
+    if (!key) {
+        Py_XDECREF(items);
+        return NULL;
+    }
+    Py_INCREF(sql);
+    PyTuple_SET_ITEM(key, 0, sql);
+    Py_INCREF(text_factory);
+    PyTuple_SET_ITEM(key, 1, text_factory);
+    for (i = 0; i < count; i++) {
+        if (items) {
+            item = PyList_GET_ITEM(items, i);
+            value = PyTuple_GET_ITEM(item, 1);
+            Py_INCREF(PyTuple_GET_ITEM(item, 0));
+            PyTuple_SET_ITEM(key, 2 + 3 * i + 2, PyTuple_GET_ITEM(item, 0));
+        } else {
+            value = PySequence_Fast_GET_ITEM(parameters, i);
+        }
+        Py_INCREF(Py_TYPE(value));
+        PyTuple_SET_ITEM(key, 2 + width * i, (PyObject*)Py_TYPE(value));
+        Py_INCREF(value);
+        PyTuple_SET_ITEM(key, 2 + width * i + 1, value);
+    }
+    Py_XDECREF(items);
+
+    if (PyObject_Hash(key) == -1) {
+        /* an unhashable parameter */
+        Py_DECREF(key);
+        if (PyErr_ExceptionMatches(PyExc_TypeError)) {
+            PyErr_Clear();
+        }
+        return NULL;
+    }
+    return key;
+}
+
+PyObject* pysqlite_result_cache_get(pysqlite_ResultCache* cache, PyObject* key)
+{
+    PyObject* entry;
+
+    entry = PyDict_GetItemWithError(cache->entries, key);
+    if (!entry) {
+        if (PyErr_Occurred()) {
+            return NULL;
+        }
+        cache->misses++;
+        return NULL;
+    }
+
+    /* move the entry to the end */
+    Py_INCREF(entry);
+    if (PyDict_DelItem(cache->entries, key) != 0 || PyDict_SetItem(cache->entries, key, entry) != 0) {
+        Py_DECREF(entry);
+        return NULL;
+    }
+    Py_DECREF(entry);
+    cache->hits++;
+    return entry;
+}
+
+int pysqlite_result_cache_put(pysqlite_ResultCache* cache, PyObject* key, PyObject* rows,
+                              PyObject* description, Py_ssize_t size)
+{
+    PyObject* entry;
+    PyObject* old;
+
+    if (size > cache->max_bytes) {
+        return 1;
+    }
+
+    old = PyDict_GetItemWithError(cache->entries, key);
+    if (old) {
+        cache->bytes -= PyLong_AsSsize_t(PyTuple_GET_ITEM(old, 2));
+        if (PyDict_DelItem(cache->entries, key) != 0) {
+            return 0;
+        }
+    } else if (PyErr_Occurred()) {
+        return 0;
+    }
+    _pysqlite_result_cache_evict(cache, size);
+
+    entry = Py_BuildValue("(OOn)", rows, description, size);
+    if (!entry) {
+        return 0;
+    }
+    if (PyDict_SetItem(cache->entries, key, entry) != 0) {
+        Py_DECREF(entry);
+        return 0;
+    }
+    Py_DECREF(entry);
+    cache->bytes += size;
+    return 1;
+}
+
+Py_ssize_t pysqlite_result_cache_row_size(PyObject* row)
+{
+    Py_ssize_t size;
+    Py_ssize_t i;
+    PyObject* value;
+
+    size = sizeof(PyTupleObject) + PyTuple_GET_SIZE(row) * sizeof(PyObject*);
+    for (i = 0; i < PyTuple_GET_SIZE(row); i++) {
+        value = PyTuple_GET_ITEM(row, i);
+        if (PyUnicode_Check(value)) {
+            size += sizeof(PyASCIIObject) + PyUnicode_GET_LENGTH(value) * PyUnicode_KIND(value);
+        } else if (PyBytes_Check(value)) {
+            size += sizeof(PyBytesObject) + PyBytes_GET_SIZE(value);
+        } else if (value != Py_None) {
+            size += Py_TYPE(value)->tp_basicsize;
+        }
+    }
+    return size;
+}
@@ -0,0 +1,66 @@
+#ifndef PYSQLITE_RESULTCACHE_H
+#define PYSQLITE_RESULTCACHE_H
+#include "Python.h"
+#include "sqlite3.h"
+
+/*
+ * Results of read-only queries, keyed by their SQL and parameters, kept
+ * while the database doesn't change. See Connection.enable_result_cache().
+ */
+typedef struct
+{
+    /* key => (rows, description, size), the least recently used first */
+    PyObject* entries;
+    Py_ssize_t max_bytes;
+    Py_ssize_t bytes;
+
+    /* the data versions of the databases other than temp, combined, and
+     * sqlite3_total_changes64() when the entries were checked last; the
+     * cache is cleared when one of them changes */
+    sqlite3_stmt* data_version_statement;
+    sqlite3_int64 data_version;
+    sqlite3_int64 total_changes;
+
+    /* incremented every time the cache is cleared */
+    unsigned long epoch;
+
+    long long hits;
+    long long misses;
+    long long invalidations;
+} pysqlite_ResultCache;
+
+pysqlite_ResultCache* pysqlite_result_cache_new(Py_ssize_t max_bytes);
+void pysqlite_result_cache_free(pysqlite_ResultCache* cache);
+void pysqlite_result_cache_clear(pysqlite_ResultCache* cache);
+void pysqlite_result_cache_resize(pysqlite_ResultCache* cache, Py_ssize_t max_bytes);
+
+/*
+ * Clears the cache if the database changed since the last check. Returns 1
+ * if the cache can be used now, 0 if not (inside a transaction).
+ */
+int pysqlite_result_cache_check(pysqlite_ResultCache* cache, sqlite3* db);
+
+/*
+ * Checks that the results of a read-only query only depend on the data:
+ * it must not read virtual tables, and may only call the built-in
+ * functions that are deterministic. Returns 1 if so, 0 if not.
+ */
+int pysqlite_result_cache_statement_ok(sqlite3* db, sqlite3_stmt* statement);
+
+/*
+ * Returns a new reference to the key of a query, or NULL without an
+ * exception set if its parameters can't be part of a key.
+ */
+PyObject* pysqlite_result_cache_key(PyObject* sql, PyObject* parameters, PyObject* text_factory);
+
+/* Returns a borrowed reference to the entry of a key, or NULL */
+PyObject* pysqlite_result_cache_get(pysqlite_ResultCache* cache, PyObject* key);
+
+/* Stores the rows of a query; 0 => error; 1 => ok */
+int pysqlite_result_cache_put(pysqlite_ResultCache* cache, PyObject* key, PyObject* rows,
+                              PyObject* description, Py_ssize_t size);
+
+/* Approximate memory used by a row, for the size limit of the cache */
+Py_ssize_t pysqlite_result_cache_row_size(PyObject* row);
+
+#endif
@@ -0,0 +1,71 @@
+#include "serialize.h"
+#include "module.h"
+
+/*
+ * Wraps memory returned by sqlite3_serialize(). The object takes ownership
+ * of data and frees it with sqlite3_free().
+ */
+PyObject* pysqlite_serialized_new(unsigned char* data, Py_ssize_t size)
+{
+    pysqlite_Serialized* self;
+
+    self = PyObject_New(pysqlite_Serialized, &pysqlite_SerializedType);
+    if (!self) {
+        sqlite3_free(data);
+        return NULL;
+    }
+    self->data = data;
+    self->size = size;
+    return (PyObject*)self;
+}
+
+static void pysqlite_serialized_dealloc(pysqlite_Serialized* self)
+{
+    sqlite3_free(self->data);
+    Py_TYPE(self)->tp_free((PyObject*)self);
+}
+
+static int pysqlite_serialized_getbuffer(pysqlite_Serialized* self, Py_buffer* view, int flags)
+{
+    static char empty[1];
+
+    /* the data is never resized, so exports need no bookkeeping */
+    return PyBuffer_FillInfo(view, (PyObject*)self, self->data ? (void*)self->data : empty,
+                             self->size, 1, flags);
+}
+
+static Py_ssize_t pysqlite_serialized_length(pysqlite_Serialized* self)
+{
+    return self->size;
+}
+
+static PyObject* pysqlite_serialized_repr(pysqlite_Serialized* self)
+{
+    return PyUnicode_FromFormat("<%s object, %zd bytes>", Py_TYPE(self)->tp_name, self->size);
+}
+
+static PyBufferProcs serialized_as_buffer = {
+    (getbufferproc)pysqlite_serialized_getbuffer,
+    NULL,
+};
+
+static PySequenceMethods serialized_sequence_methods = {
+    .sq_length = (lenfunc)pysqlite_serialized_length,
+};
+
+PyTypeObject pysqlite_SerializedType = {
+        PyVarObject_HEAD_INIT(NULL, 0)
+        MODULE_NAME ".SerializedDatabase",
+        .tp_basicsize = sizeof(pysqlite_Serialized),
+        .tp_dealloc = (destructor)pysqlite_serialized_dealloc,
+        .tp_repr = (reprfunc)pysqlite_serialized_repr,
+        .tp_as_sequence = &serialized_sequence_methods,
+        .tp_as_buffer = &serialized_as_buffer,
+        .tp_flags = Py_TPFLAGS_DEFAULT,
+        .tp_doc = PyDoc_STR("Serialized SQLite database. Supports the buffer protocol."),
+};
+
+extern int pysqlite_serialized_setup_types(void)
+{
+    return PyType_Ready(&pysqlite_SerializedType);
+}
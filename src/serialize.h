@@ -0,0 +1,20 @@
+#ifndef PYSQLITE_SERIALIZE_H
+#define PYSQLITE_SERIALIZE_H
+#include "Python.h"
+#include "sqlite3.h"
+
+/* A serialized database, backed by the memory returned by sqlite3_serialize() */
+typedef struct
+{
+    PyObject_HEAD
+    unsigned char* data;
+    Py_ssize_t size;
+} pysqlite_Serialized;
+
+extern PyTypeObject pysqlite_SerializedType;
+
+PyObject* pysqlite_serialized_new(unsigned char* data, Py_ssize_t size);
+
+int pysqlite_serialized_setup_types(void);
+
+#endif
@@ -0,0 +1,283 @@
+#include "session.h"
+#include "module.h"
+#include "util.h"
+
+#ifdef HAVE_SESSION
+
+/*
+ * Wraps a session created on the connection. The object takes ownership
+ * of the session and deletes it when closed.
+ */
+PyObject* pysqlite_session_new(pysqlite_Connection* connection, sqlite3_session* session)
+{
+    pysqlite_Session* self;
+
+    self = PyObject_New(pysqlite_Session, &pysqlite_SessionType);
+    if (!self) {
+        sqlite3session_delete(session);
+        return NULL;
+    }
+    Py_INCREF(connection);
+    self->connection = connection;
+    self->session = session;
+    self->in_weakreflist = NULL;
+    return (PyObject*)self;
+}
+
+/* Drops the references to sessions that no longer exist */
+static void remove_dead_sessions_from_connection_session_list(pysqlite_Connection *connection)
+{
+    Py_ssize_t i;
+    PyObject *item, *ref;
+
+    for (i = PyList_GET_SIZE(connection->sessions) - 1; i >= 0; i--) {
+        item = PyList_GET_ITEM(connection->sessions, i);
+        if (PyWeakref_GetRef(item, &ref) == 1) {
+            Py_DECREF(ref);
+        } else {
+            PyList_SetSlice(connection->sessions, i, i+1, NULL);
+        }
+    }
+}
+
+static void _close_session_inner(pysqlite_Session* self)
+{
+    sqlite3_session* session = self->session;
+
+    self->session = NULL;
+    if (session) {
+        sqlite3session_delete(session);
+    }
+}
+
+static void pysqlite_session_dealloc(pysqlite_Session* self)
+{
+    _close_session_inner(self);
+    if (self->in_weakreflist != NULL) {
+        PyObject_ClearWeakRefs((PyObject*)self);
+    }
+    if (self->connection->sessions) {
+        remove_dead_sessions_from_connection_session_list(self->connection);
+    }
+    Py_XDECREF(self->connection);
+    Py_TYPE(self)->tp_free((PyObject*)self);
+}
+
+/*
+ * Checks if a session object is usable.
+ *
+ * 0 => error; 1 => ok
+ */
+static int pysqlite_check_session(pysqlite_Session* self)
+{
+    if (!pysqlite_check_thread(self->connection)) {
+        return 0;
+    }
+    if (!self->session) {
+        PyErr_SetString(pysqlite_ProgrammingError, "Cannot operate on a closed session.");
+        return 0;
+    }
+    return pysqlite_check_connection(self->connection);
+}
+
+PyObject* pysqlite_session_close(pysqlite_Session* self, PyObject* args)
+{
+    if (!pysqlite_check_thread(self->connection)) {
+        return NULL;
+    }
+    _close_session_inner(self);
+    Py_RETURN_NONE;
+}
+
+static PyObject* pysqlite_session_attach(pysqlite_Session* self, PyObject* args)
+{
+    const char* table = NULL;
+    int rc;
+
+    if (!PyArg_ParseTuple(args, "|z:attach", &table)) {
+        return NULL;
+    }
+    if (!pysqlite_check_session(self)) {
+        return NULL;
+    }
+
+    rc = sqlite3session_attach(self->session, table);
+    if (rc != SQLITE_OK) {
+        _pysqlite_seterror(self->connection->db);
+        if (!PyErr_Occurred()) {
+            PyErr_SetString(pysqlite_OperationalError, sqlite3_errstr(rc));
+        }
+        return NULL;
+    }
+    Py_RETURN_NONE;
+}
+
+/*
+ * Returns the changes recorded so far as a changeset or a patchset.
+ */
+static PyObject* _pysqlite_session_changes(pysqlite_Session* self, int patchset)
+{
+    void* data = NULL;
+    int size = 0;
+    int rc;
+    PyObject* result;
+
+    if (!pysqlite_check_session(self)) {
+        return NULL;
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+    if (patchset) {
+        rc = sqlite3session_patchset(self->session, &size, &data);
+    } else {
+        rc = sqlite3session_changeset(self->session, &size, &data);
+    }
+    Py_END_ALLOW_THREADS
+
+    if (rc != SQLITE_OK) {
+        sqlite3_free(data);
+        if (rc == SQLITE_NOMEM) {
+            return PyErr_NoMemory();
+        }
+        PyErr_SetString(pysqlite_OperationalError, sqlite3_errstr(rc));
+        return NULL;
+    }
+
+    result = PyBytes_FromStringAndSize(data, size);
+    sqlite3_free(data);
+    return result;
+}
+
+static PyObject* pysqlite_session_changeset(pysqlite_Session* self, PyObject* args)
+{
+    return _pysqlite_session_changes(self, 0);
+}
+
+static PyObject* pysqlite_session_patchset(pysqlite_Session* self, PyObject* args)
+{
+    return _pysqlite_session_changes(self, 1);
+}
+
+static PyObject* pysqlite_session_enter(pysqlite_Session* self, PyObject* args)
+{
+    if (!pysqlite_check_session(self)) {
+        return NULL;
+    }
+    Py_INCREF(self);
+    return (PyObject*)self;
+}
+
+static PyObject* pysqlite_session_exit(pysqlite_Session* self, PyObject* args)
+{
+    PyObject* res = pysqlite_session_close(self, NULL);
+    if (!res) {
+        return NULL;
+    }
+    Py_DECREF(res);
+    Py_RETURN_FALSE;
+}
+
+static PyObject* pysqlite_session_get_enabled(pysqlite_Session* self, void* unused)
+{
+    if (!pysqlite_check_session(self)) {
+        return NULL;
+    }
+    return PyBool_FromLong(sqlite3session_enable(self->session, -1));
+}
+
+static int pysqlite_session_set_enabled(pysqlite_Session* self, PyObject* value, void* unused)
+{
+    int enable;
+
+    if (!value) {
+        PyErr_SetString(PyExc_AttributeError, "cannot delete the enabled attribute");
+        return -1;
+    }
+    enable = PyObject_IsTrue(value);
+    if (enable < 0 || !pysqlite_check_session(self)) {
+        return -1;
+    }
+    sqlite3session_enable(self->session, enable);
+    return 0;
+}
+
+static PyObject* pysqlite_session_get_indirect(pysqlite_Session* self, void* unused)
+{
+    if (!pysqlite_check_session(self)) {
+        return NULL;
+    }
+    return PyBool_FromLong(sqlite3session_indirect(self->session, -1));
+}
+
+static int pysqlite_session_set_indirect(pysqlite_Session* self, PyObject* value, void* unused)
+{
+    int indirect;
+
+    if (!value) {
+        PyErr_SetString(PyExc_AttributeError, "cannot delete the indirect attribute");
+        return -1;
+    }
+    indirect = PyObject_IsTrue(value);
+    if (indirect < 0 || !pysqlite_check_session(self)) {
+        return -1;
+    }
+    sqlite3session_indirect(self->session, indirect);
+    return 0;
+}
+
+static PyObject* pysqlite_session_get_isempty(pysqlite_Session* self, void* unused)
+{
+    if (!pysqlite_check_session(self)) {
+        return NULL;
+    }
+    return PyBool_FromLong(sqlite3session_isempty(self->session));
+}
+
+static PyMethodDef session_methods[] = {
+    {"attach", (PyCFunction)pysqlite_session_attach, METH_VARARGS,
+        PyDoc_STR("Records changes to a table, or to all tables if none is given.")},
+    {"changeset", (PyCFunction)pysqlite_session_changeset, METH_NOARGS,
+        PyDoc_STR("Returns the recorded changes as a changeset.")},
+    {"patchset", (PyCFunction)pysqlite_session_patchset, METH_NOARGS,
+        PyDoc_STR("Returns the recorded changes as a patchset.")},
+    {"close", (PyCFunction)pysqlite_session_close, METH_NOARGS,
+        PyDoc_STR("Stops recording and releases the session.")},
+    {"__enter__", (PyCFunction)pysqlite_session_enter, METH_NOARGS,
+        PyDoc_STR("session context manager enter")},
+    {"__exit__", (PyCFunction)pysqlite_session_exit, METH_VARARGS,
+        PyDoc_STR("session context manager exit")},
+    {NULL, NULL}
+};
+
+static PyGetSetDef session_getset[] = {
+    {"enabled", (getter)pysqlite_session_get_enabled, (setter)pysqlite_session_set_enabled},
+    {"indirect", (getter)pysqlite_session_get_indirect, (setter)pysqlite_session_set_indirect},
+    {"isempty", (getter)pysqlite_session_get_isempty, (setter)0},
+    {NULL}
+};
+
+PyTypeObject pysqlite_SessionType = {
+        PyVarObject_HEAD_INIT(NULL, 0)
+        MODULE_NAME ".Session",
+        .tp_basicsize = sizeof(pysqlite_Session),
+        .tp_dealloc = (destructor)pysqlite_session_dealloc,
+        .tp_flags = Py_TPFLAGS_DEFAULT,
+        .tp_doc = PyDoc_STR("Records changes to a database as changesets."),
+        .tp_weaklistoffset = offsetof(pysqlite_Session, in_weakreflist),
+        .tp_methods = session_methods,
+        .tp_getset = session_getset,
+};
+
+extern int pysqlite_session_setup_types(void)
+{
+    return PyType_Ready(&pysqlite_SessionType);
+}
+
+#else
+
+extern int pysqlite_session_setup_types(void)
+{
+    return 0;
+}
+
+#endif
@@ -0,0 +1,32 @@
+#ifndef PYSQLITE_SESSION_H
+#define PYSQLITE_SESSION_H
+#include "Python.h"
+#include "sqlite3.h"
+#include "connection.h"
+
+#if defined(SQLITE_ENABLE_SESSION) && defined(SQLITE_ENABLE_PREUPDATE_HOOK)
+#define HAVE_SESSION
+#endif
+
+#ifdef HAVE_SESSION
+
+/* Records changes to the tables of a database, see sqlite3session_create() */
+typedef struct
+{
+    PyObject_HEAD
+    pysqlite_Connection* connection;
+    sqlite3_session* session;
+
+    PyObject* in_weakreflist; /* List of weak references */
+} pysqlite_Session;
+
+extern PyTypeObject pysqlite_SessionType;
+
+PyObject* pysqlite_session_new(pysqlite_Connection* connection, sqlite3_session* session);
+PyObject* pysqlite_session_close(pysqlite_Session* self, PyObject* args);
+
+#endif
+
+int pysqlite_session_setup_types(void);
+
+#endif
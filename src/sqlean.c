@@ -24,43 +24,97 @@ SQLITE_EXTENSION_INIT1
 #include "time/extension.h"
 #include "unicode/extension.h"
 #include "uuid/extension.h"
-#include "vsv/extension.h"
 
 // sqlean header
 #include "sqlean.h"
 
+// extension selection
+#include "extensions.h"
+
+// cached regexp functions
+#include "regexp_cache.h"
+
+// indexed vsv reader
+#include "vsv_index.h"
+
+#if defined(_MSC_VER)
+#define THREAD_LOCAL __declspec(thread)
+#else
+#define THREAD_LOCAL __thread
+#endif
+
 // sqlean_version returns the current Sqlean version.
 static void sqlean_version(sqlite3_context* context, int argc, sqlite3_value** argv) {
     sqlite3_result_text(context, SQLEAN_VERSION, -1, SQLITE_STATIC);
 }
 
-// init_all initializes all extensions.
-static int init_all(sqlite3* db) {
-    crypto_init(db);
-    define_init(db);
-    fileio_init(db);
-    fuzzy_init(db);
+// extension describes a bundled extension.
+struct extension {
+    const char* name;
+    const char* env_flag;
+    int flag;
+    int (*init_fn)(sqlite3* db);
+};
+
+static const struct extension extensions[] = {
+    {"crypto", "SQLEAN_ENABLE_CRYPTO", SQLEAN_EXT_CRYPTO, crypto_init},
+    {"define", "SQLEAN_ENABLE_DEFINE", SQLEAN_EXT_DEFINE, define_init},
+    {"fileio", "SQLEAN_ENABLE_FILEIO", SQLEAN_EXT_FILEIO, fileio_init},
+    {"fuzzy", "SQLEAN_ENABLE_FUZZY", SQLEAN_EXT_FUZZY, fuzzy_init},
 #if !defined(_WIN32)
-    ipaddr_init(db);
+    {"ipaddr", "SQLEAN_ENABLE_IPADDR", SQLEAN_EXT_IPADDR, ipaddr_init},
 #endif
-    regexp_init(db);
-    stats_init(db);
-    text_init(db);
-    time_init(db);
-    unicode_init(db);
-    uuid_init(db);
-    vsv_init(db);
-    return SQLITE_OK;
+    {"regexp", "SQLEAN_ENABLE_REGEXP", SQLEAN_EXT_REGEXP, regexp_cache_init},
+    {"stats", "SQLEAN_ENABLE_STATS", SQLEAN_EXT_STATS, stats_init},
+    {"text", "SQLEAN_ENABLE_TEXT", SQLEAN_EXT_TEXT, text_init},
+    {"time", "SQLEAN_ENABLE_TIME", SQLEAN_EXT_TIME, time_init},
+    {"unicode", "SQLEAN_ENABLE_UNICODE", SQLEAN_EXT_UNICODE, unicode_init},
+    {"uuid", "SQLEAN_ENABLE_UUID", SQLEAN_EXT_UUID, uuid_init},
+    {"vsv", "SQLEAN_ENABLE_VSV", SQLEAN_EXT_VSV, vsv_index_init},
+};
+
+#define N_EXTENSIONS (sizeof(extensions) / sizeof(extensions[0]))
+
+// Extensions selected for the connections opened by the current thread.
+// Auto-extensions run synchronously inside sqlite3_open_v2,
+// so a thread-local value is enough to pass the selection along.
+static THREAD_LOCAL int selected_extensions = SQLEAN_EXT_FROM_ENV;
+
+void sqlean_select_extensions(int mask) {
+    selected_extensions = mask;
+}
+
+int sqlean_extension_flag(const char* name) {
+    for (size_t i = 0; i < N_EXTENSIONS; i++) {
+        if (strcmp(extensions[i].name, name) == 0) {
+            return extensions[i].flag;
+        }
+    }
+    return 0;
+}
+
+// env_extensions returns the extensions enabled by the individual env variables.
+static int env_extensions(void) {
+    int mask = 0;
+    for (size_t i = 0; i < N_EXTENSIONS; i++) {
+        const char* enabled = getenv(extensions[i].env_flag);
+        if (enabled == NULL || strcmp(enabled, "0") == 0) {
+            // disable the extension unless it is explicitly enabled
+            continue;
+        }
+        mask |= extensions[i].flag;
+    }
+    return mask;
 }
 
-// init_extension initializes the extension if it's enabled according to the env variable.
-static int init_extension(const char* flag, int (*init_fn)(sqlite3* db), sqlite3* db) {
-    const char* enabled = getenv(flag);
-    if (enabled == NULL || strcmp(enabled, "0") == 0) {
-        // disable the extension unless it is explicitly enabled
-        return SQLITE_OK;
+// init_extensions initializes the extensions included in the mask.
+static int init_extensions(sqlite3* db, int mask) {
+    for (size_t i = 0; i < N_EXTENSIONS; i++) {
+        if (mask & extensions[i].flag) {
+            extensions[i].init_fn(db);
+        }
     }
-    return init_fn(db);
+    return SQLITE_OK;
 }
 
 #ifdef _WIN32
@@ -70,35 +124,24 @@ __declspec(dllexport)
     (void)errmsg_ptr;
     SQLITE_EXTENSION_INIT2(api);
 
-    const char* enable_all = getenv("SQLEAN_ENABLE");
-    if (enable_all != NULL && strcmp(enable_all, "0") == 0) {
-        // SQLEAN_ENABLE == 0, disable all extensions
-        return SQLITE_OK;
+    int mask = selected_extensions;
+    if (mask == SQLEAN_EXT_FROM_ENV) {
+        const char* enable_all = getenv("SQLEAN_ENABLE");
+        if (enable_all != NULL && strcmp(enable_all, "0") == 0) {
+            // SQLEAN_ENABLE == 0, disable all extensions
+            return SQLITE_OK;
+        }
+        if (enable_all != NULL) {
+            // SQLEAN_ENABLE != 0, enable all extensions
+            mask = SQLEAN_EXT_ALL;
+        } else {
+            // SQLEAN_ENABLE is not set, enable individual extensions
+            mask = env_extensions();
+        }
     }
 
     static const int flags = SQLITE_UTF8 | SQLITE_INNOCUOUS | SQLITE_DETERMINISTIC;
     sqlite3_create_function(db, "sqlean_version", 0, flags, 0, sqlean_version, 0, 0);
 
-    if (enable_all != NULL) {
-        // SQLEAN_ENABLE != 0, enable all extensions
-        init_all(db);
-        return SQLITE_OK;
-    }
-
-    // SQLEAN_ENABLE is not set, enable individual extensions
-    init_extension("SQLEAN_ENABLE_CRYPTO", crypto_init, db);
-    init_extension("SQLEAN_ENABLE_DEFINE", define_init, db);
-    init_extension("SQLEAN_ENABLE_FILEIO", fileio_init, db);
-    init_extension("SQLEAN_ENABLE_FUZZY", fuzzy_init, db);
-#if !defined(_WIN32)
-    init_extension("SQLEAN_ENABLE_IPADDR", ipaddr_init, db);
-#endif
-    init_extension("SQLEAN_ENABLE_REGEXP", regexp_init, db);
-    init_extension("SQLEAN_ENABLE_STATS", stats_init, db);
-    init_extension("SQLEAN_ENABLE_TEXT", text_init, db);
-    init_extension("SQLEAN_ENABLE_TIME", time_init, db);
-    init_extension("SQLEAN_ENABLE_UNICODE", unicode_init, db);
-    init_extension("SQLEAN_ENABLE_UUID", uuid_init, db);
-    init_extension("SQLEAN_ENABLE_VSV", vsv_init, db);
-    return SQLITE_OK;
+    return init_extensions(db, mask);
 }
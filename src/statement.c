@@ -28,9 +28,6 @@
 #include "prepare_protocol.h"
 #include "util.h"
 
-/* prototypes */
-static int pysqlite_check_remaining_sql(const char* tail);
-
 typedef enum {
     LINECOMMENT_1,
     IN_LINECOMMENT,
@@ -58,6 +55,9 @@ int pysqlite_statement_create(pysqlite_Statement* self, pysqlite_Connection* con
 
     self->st = NULL;
     self->in_use = 0;
+    self->prefetch = NULL;
+    self->link.prev = NULL;
+    self->link.next = NULL;
 
     assert(PyUnicode_Check(sql));
 
@@ -84,6 +84,19 @@ int pysqlite_statement_create(pysqlite_Statement* self, pysqlite_Connection* con
     self->is_dml = !sqlite3_stmt_readonly(self->st);
     Py_END_ALLOW_THREADS
 
+    /* queries only; pragmas may read settings that change without changing
+     * the data. ATTACH and DETACH are read-only for SQLite, but change the
+     * databases that queries read */
+    for (p = sql_cstr; *p == ' ' || *p == '\r' || *p == '\n' || *p == '\t'; p++) {
+    }
+    self->readonly = !self->is_dml && PyOS_strnicmp(p, "attach", 6) != 0 &&
+                     PyOS_strnicmp(p, "detach", 6) != 0;
+    self->cacheable = 0;
+    if (rc == SQLITE_OK && self->st && self->readonly && sqlite3_column_count(self->st) > 0 &&
+            PyOS_strnicmp(p, "pragma", 6) != 0) {
+        self->cacheable = -1;
+    }
+
     /* To retain backward-compatibility, we need to treat DDL and certain types
      * of transactions as being "not-dml".
      */
@@ -333,10 +346,24 @@ void pysqlite_statement_bind_parameters(pysqlite_Statement* self, PyObject* para
     }
 }
 
+/*
+ * Stops the thread stepping the statement for Cursor.prefetch(), if any.
+ * Everything else that uses the statement must call this first.
+ */
+void pysqlite_statement_stop_prefetch(pysqlite_Statement* self)
+{
+    if (self->prefetch) {
+        pysqlite_prefetch_free(self->prefetch);
+        self->prefetch = NULL;
+    }
+}
+
 int pysqlite_statement_finalize(pysqlite_Statement* self)
 {
     int rc;
 
+    pysqlite_statement_stop_prefetch(self);
+
     rc = SQLITE_OK;
     if (self->st) {
         Py_BEGIN_ALLOW_THREADS
@@ -354,6 +381,8 @@ int pysqlite_statement_reset(pysqlite_Statement* self)
 {
     int rc;
 
+    pysqlite_statement_stop_prefetch(self);
+
     rc = SQLITE_OK;
 
     if (self->in_use && self->st) {
@@ -376,6 +405,10 @@ void pysqlite_statement_mark_dirty(pysqlite_Statement* self)
 
 void pysqlite_statement_dealloc(pysqlite_Statement* self)
 {
+    /* before anything releases the GIL */
+    pysqlite_link_remove(&self->link);
+    pysqlite_statement_stop_prefetch(self);
+
     if (self->st) {
         Py_BEGIN_ALLOW_THREADS
         sqlite3_finalize(self->st);
@@ -401,7 +434,7 @@ void pysqlite_statement_dealloc(pysqlite_Statement* self)
  *
  * Returns 1 if there is more left than should be. 0 if ok.
  */
-static int pysqlite_check_remaining_sql(const char* tail)
+int pysqlite_check_remaining_sql(const char* tail)
 {
     const char* pos = tail;
 
@@ -27,6 +27,7 @@
 #include "Python.h"
 
 #include "connection.h"
+#include "prefetch.h"
 #include "sqlite3.h"
 
 #define PYSQLITE_TOO_MUCH_SQL (-100)
@@ -40,6 +41,13 @@ typedef struct
     PyObject* sql;
     int in_use;
     int is_dml;
+    int readonly;  /* doesn't change what queries return; not ATTACH or DETACH */
+    /* for the result cache: 0 if the statement is not cacheable, -1 for a
+     * read-only query that may be, until pysqlite_result_cache_statement_ok()
+     * checks it, 1 if it is */
+    int cacheable;
+    pysqlite_Prefetch* prefetch; /* see Cursor.prefetch(), NULL if not prefetching */
+    pysqlite_Link link; /* in the statements of the connection */
     PyObject* in_weakreflist; /* List of weak references */
 } pysqlite_Statement;
 
@@ -53,7 +61,9 @@ void pysqlite_statement_bind_parameters(pysqlite_Statement* self, PyObject* para
 
 int pysqlite_statement_finalize(pysqlite_Statement* self);
 int pysqlite_statement_reset(pysqlite_Statement* self);
+void pysqlite_statement_stop_prefetch(pysqlite_Statement* self);
 void pysqlite_statement_mark_dirty(pysqlite_Statement* self);
+int pysqlite_check_remaining_sql(const char* tail);
 
 int pysqlite_statement_setup_types(void);
 
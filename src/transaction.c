@@ -0,0 +1,248 @@
+#include "transaction.h"
+#include "module.h"
+#include "util.h"
+
+/*
+ * Transactions and savepoints run the statements that the connection keeps
+ * prepared. Unlike Connection.rollback(), rolling back doesn't reset the
+ * other cursors of the connection; their queries go on where SQLite allows
+ * it and fail on their next step otherwise.
+ */
+
+/* by PYSQLITE_TRANSACTION_* */
+static const char* const transaction_sql[] = {
+    "BEGIN ",
+    "BEGIN DEFERRED",
+    "BEGIN IMMEDIATE",
+    "BEGIN EXCLUSIVE",
+    "COMMIT",
+    "ROLLBACK",
+};
+
+static const char* const savepoint_formats[] = {
+    "SAVEPOINT _sqlean_%d",
+    "RELEASE _sqlean_%d",
+    "ROLLBACK TO _sqlean_%d",
+};
+
+PyObject* pysqlite_transaction_new(pysqlite_Connection* connection, int begin)
+{
+    pysqlite_Transaction* self;
+
+    self = PyObject_New(pysqlite_Transaction, &pysqlite_TransactionType);
+    if (!self) {
+        return NULL;
+    }
+    Py_INCREF(connection);
+    self->connection = connection;
+    self->begin = begin;
+    self->level = 0;
+    self->active = 0;
+    self->in_weakreflist = NULL;
+    return (PyObject*)self;
+}
+
+static void pysqlite_transaction_dealloc(pysqlite_Transaction* self)
+{
+    if (self->in_weakreflist != NULL) {
+        PyObject_ClearWeakRefs((PyObject*)self);
+    }
+    Py_XDECREF(self->connection);
+    Py_TYPE(self)->tp_free((PyObject*)self);
+}
+
+/* 0 => error; 1 => ok */
+static int _pysqlite_transaction_run(pysqlite_Transaction* self, int which)
+{
+    pysqlite_Connection* connection = self->connection;
+
+    return pysqlite_connection_run_statement(connection, &connection->transaction_statements[which],
+                                             transaction_sql[which]);
+}
+
+/*
+ * Runs SAVEPOINT, RELEASE or ROLLBACK TO for the level of the savepoint.
+ * Savepoints are named after their level, so the statements of the first
+ * levels are prepared once for the connection.
+ *
+ * 0 => error; 1 => ok
+ */
+static int _pysqlite_savepoint_run(pysqlite_Transaction* self, int action)
+{
+    pysqlite_Connection* connection = self->connection;
+    sqlite3_stmt** statement = NULL;
+    char sql[48];
+
+    PyOS_snprintf(sql, sizeof(sql), savepoint_formats[action], self->level);
+    if (self->level <= PYSQLITE_SAVEPOINT_LEVELS) {
+        statement = &connection->savepoint_statements[self->level - 1][action];
+    }
+    return pysqlite_connection_run_statement(connection, statement, sql);
+}
+
+/*
+ * Commits or rolls back the transaction. If the commit fails, the
+ * transaction is rolled back and the error of the commit is raised.
+ *
+ * 0 => error; 1 => ok
+ */
+static int _pysqlite_transaction_end(pysqlite_Transaction* self, int commit)
+{
+    PyObject *exc_type, *exc_value, *exc_tb;
+
+    if (sqlite3_get_autocommit(self->connection->db)) {
+        /* the transaction was ended inside the block */
+        return 1;
+    }
+    if (!commit) {
+        return _pysqlite_transaction_run(self, PYSQLITE_TRANSACTION_ROLLBACK);
+    }
+    if (_pysqlite_transaction_run(self, PYSQLITE_TRANSACTION_COMMIT)) {
+        return 1;
+    }
+
+    PyErr_Fetch(&exc_type, &exc_value, &exc_tb);
+    if (!sqlite3_get_autocommit(self->connection->db)) {
+        if (!_pysqlite_transaction_run(self, PYSQLITE_TRANSACTION_ROLLBACK)) {
+            PyErr_Clear();
+        }
+    }
+    PyErr_Restore(exc_type, exc_value, exc_tb);
+    return 0;
+}
+
+/*
+ * Releases the savepoint, or rolls back to it and then releases it.
+ *
+ * 0 => error; 1 => ok
+ */
+static int _pysqlite_savepoint_end(pysqlite_Transaction* self, int commit)
+{
+    PyObject *exc_type, *exc_value, *exc_tb;
+
+    self->connection->savepoint_level = self->level - 1;
+    if (sqlite3_get_autocommit(self->connection->db)) {
+        /* the transaction, and the savepoint with it, was ended inside the
+         * block */
+        return 1;
+    }
+    if (!commit) {
+        return _pysqlite_savepoint_run(self, PYSQLITE_SAVEPOINT_ROLLBACK) &&
+               _pysqlite_savepoint_run(self, PYSQLITE_SAVEPOINT_RELEASE);
+    }
+    if (_pysqlite_savepoint_run(self, PYSQLITE_SAVEPOINT_RELEASE)) {
+        return 1;
+    }
+
+    /* releasing the outermost savepoint commits, which may fail */
+    PyErr_Fetch(&exc_type, &exc_value, &exc_tb);
+    if (!sqlite3_get_autocommit(self->connection->db)) {
+        if (!_pysqlite_savepoint_run(self, PYSQLITE_SAVEPOINT_ROLLBACK) ||
+            !_pysqlite_savepoint_run(self, PYSQLITE_SAVEPOINT_RELEASE)) {
+            PyErr_Clear();
+        }
+    }
+    PyErr_Restore(exc_type, exc_value, exc_tb);
+    return 0;
+}
+
+static PyObject* pysqlite_transaction_enter(pysqlite_Transaction* self, PyObject* args)
+{
+    pysqlite_Connection* connection = self->connection;
+
+    if (!pysqlite_check_thread(connection) || !pysqlite_check_connection(connection)) {
+        return NULL;
+    }
+    if (self->active) {
+        PyErr_SetString(pysqlite_ProgrammingError, "The transaction is already active.");
+        return NULL;
+    }
+
+    if (self->begin >= 0) {
+        if (!sqlite3_get_autocommit(connection->db)) {
+            PyErr_SetString(pysqlite_ProgrammingError,
+                            "A transaction is already active, use savepoint() to nest one.");
+            return NULL;
+        }
+        if (!_pysqlite_transaction_run(self, self->begin)) {
+            return NULL;
+        }
+    } else {
+        if (sqlite3_get_autocommit(connection->db)) {
+            /* savepoints left over from an ended transaction are gone */
+            connection->savepoint_level = 0;
+        }
+        self->level = connection->savepoint_level + 1;
+        if (!_pysqlite_savepoint_run(self, PYSQLITE_SAVEPOINT_BEGIN)) {
+            return NULL;
+        }
+        connection->savepoint_level = self->level;
+    }
+
+    self->active = 1;
+    Py_INCREF(self);
+    return (PyObject*)self;
+}
+
+static PyObject* pysqlite_transaction_exit(pysqlite_Transaction* self, PyObject* args)
+{
+    PyObject *exc_type, *exc_value, *exc_tb;
+    int ok;
+
+    if (!PyArg_ParseTuple(args, "OOO", &exc_type, &exc_value, &exc_tb)) {
+        return NULL;
+    }
+    if (!pysqlite_check_thread(self->connection) || !pysqlite_check_connection(self->connection)) {
+        return NULL;
+    }
+    if (!self->active) {
+        PyErr_SetString(pysqlite_ProgrammingError, "The transaction is not active.");
+        return NULL;
+    }
+
+    self->active = 0;
+    if (self->begin >= 0) {
+        ok = _pysqlite_transaction_end(self, exc_type == Py_None);
+    } else {
+        ok = _pysqlite_savepoint_end(self, exc_type == Py_None);
+    }
+    if (!ok) {
+        return NULL;
+    }
+    Py_RETURN_FALSE;
+}
+
+static PyObject* pysqlite_transaction_get_active(pysqlite_Transaction* self, void* unused)
+{
+    return PyBool_FromLong(self->active);
+}
+
+static PyMethodDef transaction_methods[] = {
+    {"__enter__", (PyCFunction)pysqlite_transaction_enter, METH_NOARGS,
+        PyDoc_STR("Begins the transaction or savepoint.")},
+    {"__exit__", (PyCFunction)pysqlite_transaction_exit, METH_VARARGS,
+        PyDoc_STR("Commits, or rolls back if the block raised an exception.")},
+    {NULL, NULL}
+};
+
+static PyGetSetDef transaction_getset[] = {
+    {"active", (getter)pysqlite_transaction_get_active, (setter)0},
+    {NULL}
+};
+
+PyTypeObject pysqlite_TransactionType = {
+        PyVarObject_HEAD_INIT(NULL, 0)
+        MODULE_NAME ".Transaction",
+        .tp_basicsize = sizeof(pysqlite_Transaction),
+        .tp_dealloc = (destructor)pysqlite_transaction_dealloc,
+        .tp_flags = Py_TPFLAGS_DEFAULT,
+        .tp_doc = PyDoc_STR("Transaction or savepoint context manager."),
+        .tp_weaklistoffset = offsetof(pysqlite_Transaction, in_weakreflist),
+        .tp_methods = transaction_methods,
+        .tp_getset = transaction_getset,
+};
+
+extern int pysqlite_transaction_setup_types(void)
+{
+    return PyType_Ready(&pysqlite_TransactionType);
+}
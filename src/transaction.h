@@ -0,0 +1,29 @@
+#ifndef PYSQLITE_TRANSACTION_H
+#define PYSQLITE_TRANSACTION_H
+#include "Python.h"
+#include "sqlite3.h"
+#include "connection.h"
+
+/* Context manager of Connection.transaction() and Connection.savepoint() */
+typedef struct
+{
+    PyObject_HEAD
+    pysqlite_Connection* connection;
+
+    /* PYSQLITE_TRANSACTION_BEGIN_* for a transaction, -1 for a savepoint */
+    int begin;
+
+    /* the level of the savepoint while it is entered */
+    int level;
+    int active;
+
+    PyObject* in_weakreflist; /* List of weak references */
+} pysqlite_Transaction;
+
+extern PyTypeObject pysqlite_TransactionType;
+
+PyObject* pysqlite_transaction_new(pysqlite_Connection* connection, int begin);
+
+int pysqlite_transaction_setup_types(void);
+
+#endif
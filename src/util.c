@@ -24,25 +24,108 @@
 #include "module.h"
 #include "connection.h"
 
+#ifdef MS_WINDOWS
+#include <windows.h>
+#else
+#include <time.h>
+#endif
+
 int pysqlite_step(sqlite3_stmt* statement, pysqlite_Connection* connection)
 {
     int rc;
 
     Py_BEGIN_ALLOW_THREADS
     rc = sqlite3_step(statement);
+    if (rc == SQLITE_DONE) {
+        pysqlite_connection_statement_done(connection, sqlite3_sql(statement));
+    }
     Py_END_ALLOW_THREADS
 
     return rc;
 }
 
+/**
+ * Returns a monotonic time in seconds, for measuring durations.
+ */
+double pysqlite_monotonic(void)
+{
+#ifdef MS_WINDOWS
+    LARGE_INTEGER counter, frequency;
+    QueryPerformanceCounter(&counter);
+    QueryPerformanceFrequency(&frequency);
+    return (double)counter.QuadPart / (double)frequency.QuadPart;
+#else
+    struct timespec ts;
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+    return (double)ts.tv_sec + (double)ts.tv_nsec * 1e-9;
+#endif
+}
+
+/**
+ * Sleeps for a number of seconds with the best resolution available.
+ */
+void pysqlite_sleep(double seconds)
+{
+#ifdef MS_WINDOWS
+    Sleep((DWORD)(seconds * 1000.0 + 0.5));
+#else
+    struct timespec ts;
+    ts.tv_sec = (time_t)seconds;
+    ts.tv_nsec = (long)((seconds - (double)ts.tv_sec) * 1e9);
+    while (nanosleep(&ts, &ts) != 0 && errno == EINTR) {
+    }
+#endif
+}
+
+/* Creates and sets the exception with the SQLite error code and its name */
+static void _pysqlite_raise_error(PyObject* exc_class, int errorcode, const char* error_msg)
+{
+    const char *error_name;
+    PyObject *exc = NULL;
+    PyObject *args = NULL;
+    PyObject *py_code = NULL;
+    PyObject *py_name = NULL;
+
+    error_name = sqlite3ErrName(errorcode);
+
+    args = Py_BuildValue("(s)", error_msg);
+    if (!args)
+        goto error;
+
+    exc = PyObject_Call(exc_class, args, NULL);
+    if (!exc)
+        goto error;
+
+    py_code = Py_BuildValue("i", errorcode);
+    if (!py_code)
+        goto error;
+
+    if (PyObject_SetAttrString(exc, "sqlite_errorcode", py_code) < 0)
+        goto error;
+
+    py_name = Py_BuildValue("s", error_name);
+    if (!py_name)
+        goto error;
+
+    if (PyObject_SetAttrString(exc, "sqlite_errorname", py_name) < 0)
+        goto error;
+
+    PyErr_SetObject((PyObject *) Py_TYPE(exc), exc);
+
+error:
+    Py_XDECREF(py_code);
+    Py_XDECREF(py_name);
+    Py_XDECREF(args);
+    Py_XDECREF(exc);
+}
+
 /**
  * Checks the SQLite error code and sets the appropriate DB-API exception.
  * Returns the error code (0 means no error occurred).
  */
-int _pysqlite_seterror(sqlite3* db)
+int _pysqlite_seterror_code(int errorcode, const char* error_msg)
 {
     PyObject *exc_class;
-    int errorcode = sqlite3_errcode(db);
 
     switch (errorcode)
     {
@@ -89,51 +172,59 @@ int _pysqlite_seterror(sqlite3* db)
             break;
     }
 
-    /* Create and set the exception. */
-    {
-        const char *error_msg;
-        const char *error_name;
-        PyObject *exc = NULL;
-        PyObject *args = NULL;
-        PyObject *py_code = NULL;
-        PyObject *py_name = NULL;
-
-        error_name = sqlite3ErrName(errorcode);
-
-        error_msg = sqlite3_errmsg(db);
-
-        args = Py_BuildValue("(s)", error_msg);
-        if (!args)
-            goto error;
-
-        exc = PyObject_Call(exc_class, args, NULL);
-        if (!exc)
-            goto error;
+    _pysqlite_raise_error(exc_class, errorcode, error_msg);
+    return errorcode;
+}
 
-        py_code = Py_BuildValue("i", errorcode);
-        if (!py_code)
-            goto error;
+int _pysqlite_seterror(sqlite3* db)
+{
+    return _pysqlite_seterror_code(sqlite3_errcode(db), sqlite3_errmsg(db));
+}
 
-        if (PyObject_SetAttrString(exc, "sqlite_errorcode", py_code) < 0)
-            goto error;
+int _pysqlite_seterror_timeout(void)
+{
+    _pysqlite_raise_error(pysqlite_QueryTimeout, SQLITE_INTERRUPT, "query timed out");
+    return SQLITE_INTERRUPT;
+}
 
-        py_name = Py_BuildValue("s", error_name);
-        if (!py_name)
-            goto error;
+int pysqlite_parse_query_timeout(PyObject* value, double* timeout)
+{
+    double seconds;
 
-        if (PyObject_SetAttrString(exc, "sqlite_errorname", py_name) < 0)
-            goto error;
+    if (value == Py_None) {
+        *timeout = 0.0;
+        return 1;
+    }
+    seconds = PyFloat_AsDouble(value);
+    if (seconds == -1.0 && PyErr_Occurred()) {
+        return 0;
+    }
+    if (!(seconds > 0.0)) {
+        PyErr_SetString(PyExc_ValueError, "timeout must be greater than zero");
+        return 0;
+    }
+    *timeout = seconds;
+    return 1;
+}
 
-        PyErr_SetObject((PyObject *) Py_TYPE(exc), exc);
+int pysqlite_parse_max_rows(PyObject* value, Py_ssize_t* max_rows)
+{
+    Py_ssize_t rows;
 
-    error:
-        Py_XDECREF(py_code);
-        Py_XDECREF(py_name);
-        Py_XDECREF(args);
-        Py_XDECREF(exc);
+    if (value == Py_None) {
+        *max_rows = -1;
+        return 1;
     }
-
-    return errorcode;
+    rows = PyNumber_AsSsize_t(value, PyExc_OverflowError);
+    if (rows == -1 && PyErr_Occurred()) {
+        return 0;
+    }
+    if (rows < 0) {
+        PyErr_SetString(PyExc_ValueError, "max_rows must not be negative");
+        return 0;
+    }
+    *max_rows = rows;
+    return 1;
 }
 
 #ifdef WORDS_BIGENDIAN
@@ -31,12 +31,41 @@
 
 int pysqlite_step(sqlite3_stmt* statement, pysqlite_Connection* connection);
 
+/**
+ * Returns a monotonic time in seconds, for measuring durations.
+ */
+double pysqlite_monotonic(void);
+
+/**
+ * Sleeps for a number of seconds with the best resolution available.
+ */
+void pysqlite_sleep(double seconds);
+
 /**
  * Checks the SQLite error code and sets the appropriate DB-API exception.
  * Returns the error code (0 means no error occurred).
  */
 int _pysqlite_seterror(sqlite3* db);
 
+/**
+ * Same as _pysqlite_seterror(), for an error code and message saved earlier.
+ */
+int _pysqlite_seterror_code(int errorcode, const char* error_msg);
+
+/**
+ * Sets QueryTimeout for a query that the progress handler interrupted at
+ * its deadline. Returns SQLITE_INTERRUPT.
+ */
+int _pysqlite_seterror_timeout(void);
+
+/**
+ * Converts the timeout and max_rows arguments of execute(), where None means
+ * no limit, to 0.0 and -1.
+ * 0 => error; 1 => ok
+ */
+int pysqlite_parse_query_timeout(PyObject* value, double* timeout);
+int pysqlite_parse_max_rows(PyObject* value, Py_ssize_t* max_rows);
+
 sqlite_int64 _pysqlite_long_as_int64(PyObject * value);
 
 #ifndef _Py_CAST
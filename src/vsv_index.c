@@ -0,0 +1,1400 @@
+// Copyright (c) 2023 Anton Zhiyanov, MIT License
+// https://github.com/nalgeon/sqlean.py
+
+// Indexed reader for the vsv virtual table.
+//
+// Based on the vsv extension by Keith Medcalf (Public Domain),
+// as modified by Anton Zhiyanov for sqlean. Accepts the same
+// parameters as the original module, but:
+//
+//   - reads the input in blocks (see vsv_reader.c);
+//   - remembers the byte offset of every VSV_STRIDE-th row, so that
+//     rowid constraints (rowid = N, rowid BETWEEN A AND B)
+//     seek close to the first matching row instead of rescanning;
+//   - index=BOOL keeps the offsets in a sidecar file next to the
+//     input (FILENAME.vsvidx), so that they survive the connection;
+//   - the offsets are dropped when the size or the modification time
+//     of the file changes, and found again by the next scans;
+//   - affinity=auto infers the type of each column from the first
+//     VSV_SAMPLE_ROWS rows and declares it in the generated schema.
+//
+// Each cursor has its own reader, and the offsets are shared through
+// the table, which SQLite only calls into from one thread at a time.
+
+#include <assert.h>
+#include <ctype.h>
+#include <limits.h>
+#include <math.h>
+#include <stdarg.h>
+#include <stdint.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <sys/stat.h>
+
+#include "sqlite3ext.h"
+SQLITE_EXTENSION_INIT3
+
+#include "vsv_index.h"
+#include "vsv_reader.h"
+
+// every VSV_STRIDE-th row offset is kept in the index
+#define VSV_STRIDE 64
+// number of rows used to infer column types with affinity=auto
+#define VSV_SAMPLE_ROWS 1000
+// sidecar index file
+#define VSV_INDEX_SUFFIX ".vsvidx"
+#define VSV_INDEX_MAGIC "VSVIDX02"
+#define VSV_INDEX_NHDR 8
+
+// value affinities
+enum {
+    VSV_AFF_NONE = 0,
+    VSV_AFF_BLOB,
+    VSV_AFF_TEXT,
+    VSV_AFF_INTEGER,
+    VSV_AFF_REAL,
+    VSV_AFF_NUMERIC,
+    VSV_AFF_AUTO,
+};
+
+// rowid constraints in idxNum
+#define VSV_IDX_EQ 0x01
+#define VSV_IDX_GE 0x02
+#define VSV_IDX_GT 0x04
+#define VSV_IDX_LE 0x08
+#define VSV_IDX_LT 0x10
+
+// VsvTable is an instance of the VSV virtual table.
+typedef struct VsvTable {
+    sqlite3_vtab base;         // base class, must be first
+    char* zFilename;           // name of the VSV file
+    char* zData;               // raw VSV data in lieu of zFilename
+    sqlite3_int64 iStart;      // offset to start of data
+    int nStartRecords;         // header and skipped records before iStart
+    int nCol;                  // number of columns
+    int fsep;                  // field separator
+    int rsep;                  // record separator
+    int dsep;                  // decimal separator
+    int affinity;              // affinity conversions
+    int* aAffinity;            // per-column affinity for affinity=auto
+    int nulls;                 // empty fields are NULL
+    int validateUTF8;          // validate UTF-8
+    sqlite3_int64* aOffset;    // aOffset[k] is the offset of row k*VSV_STRIDE+1
+    sqlite3_int64 nOffset;     // number of entries in aOffset
+    sqlite3_int64 nOffsetAlloc;  // space allocated for aOffset
+    sqlite3_int64 nRow;        // number of rows, if bComplete
+    int bComplete;             // true if the whole input has been indexed
+    char* zIndex;              // sidecar index file, if index=yes
+    int bIndexSaved;           // true if the sidecar index is up to date
+    sqlite3_int64 iFileSize;   // size of the file the offsets belong to
+    sqlite3_int64 iFileMtime;  // modification time of the file, in nanoseconds
+    int iGeneration;           // incremented whenever the file changes
+} VsvTable;
+
+// VsvCursor is a cursor for the VSV virtual table.
+typedef struct VsvCursor {
+    sqlite3_vtab_cursor base;  // base class, must be first
+    VsvReader rdr;             // reader
+    char** azVal;              // value of the current row
+    int* aLen;                 // allocation length of each entry
+    int* dLen;                 // data length of each entry
+    sqlite3_int64 iRowid;      // current rowid, negative for EOF
+    sqlite3_int64 iMax;        // last rowid to return
+    sqlite3_int64 iFileSize;   // size of the file the reader opened
+    sqlite3_int64 iFileMtime;  // modification time of that file
+    int iGeneration;           // generation of the table the reader matches
+} VsvCursor;
+
+// file_stat returns the size and the modification time of the file,
+// in nanoseconds where the platform records them.
+// Returns the number of errors.
+static int file_stat(const char* zFilename, sqlite3_int64* pSize, sqlite3_int64* pMtime) {
+#if defined(_WIN32)
+    struct _stat64 st;
+    if (_stat64(zFilename, &st) != 0) {
+        return 1;
+    }
+#else
+    struct stat st;
+    if (stat(zFilename, &st) != 0) {
+        return 1;
+    }
+#endif
+    *pSize = (sqlite3_int64)st.st_size;
+    *pMtime = (sqlite3_int64)st.st_mtime * 1000000000;
+#if defined(__APPLE__)
+    *pMtime += st.st_mtimespec.tv_nsec;
+#elif !defined(_WIN32)
+    *pMtime += st.st_mtim.tv_nsec;
+#endif
+    return 0;
+}
+
+// index_header fills the sidecar index header for the table.
+static void index_header(VsvTable* pTab, sqlite3_int64* aHdr) {
+    aHdr[0] = pTab->iFileSize;
+    aHdr[1] = pTab->iFileMtime;
+    aHdr[2] = pTab->iStart;
+    aHdr[3] = pTab->fsep;
+    aHdr[4] = pTab->rsep;
+    aHdr[5] = VSV_STRIDE;
+    aHdr[6] = pTab->nRow;
+    aHdr[7] = pTab->nOffset;
+}
+
+// index_load loads the row offsets from the sidecar index,
+// if it matches the file.
+static void index_load(VsvTable* pTab) {
+    char zMagic[sizeof(VSV_INDEX_MAGIC) - 1];
+    sqlite3_int64 aHdr[VSV_INDEX_NHDR];
+    sqlite3_int64 aWant[VSV_INDEX_NHDR];
+    sqlite3_int64* aOffset = 0;
+
+    FILE* in = fopen(pTab->zIndex, "rb");
+    if (in == 0) {
+        return;
+    }
+    if (fread(zMagic, 1, sizeof(zMagic), in) != sizeof(zMagic) ||
+        memcmp(zMagic, VSV_INDEX_MAGIC, sizeof(zMagic)) != 0 ||
+        fread(aHdr, sizeof(aHdr[0]), VSV_INDEX_NHDR, in) != VSV_INDEX_NHDR) {
+        goto done;
+    }
+    // everything but the row count must match the table
+    index_header(pTab, aWant);
+    if (memcmp(aHdr, aWant, 6 * sizeof(aHdr[0])) != 0 || aHdr[6] < 0 ||
+        aHdr[7] != (aHdr[6] + VSV_STRIDE - 1) / VSV_STRIDE) {
+        goto done;
+    }
+    if (aHdr[7] > 0) {
+        aOffset = sqlite3_malloc64(aHdr[7] * sizeof(sqlite3_int64));
+        if (aOffset == 0 || fread(aOffset, sizeof(aOffset[0]), (size_t)aHdr[7], in) != (size_t)aHdr[7]) {
+            sqlite3_free(aOffset);
+            goto done;
+        }
+    }
+    sqlite3_free(pTab->aOffset);
+    pTab->aOffset = aOffset;
+    pTab->nOffset = aHdr[7];
+    pTab->nOffsetAlloc = aHdr[7];
+    pTab->nRow = aHdr[6];
+    pTab->bComplete = 1;
+    pTab->bIndexSaved = 1;
+
+done:
+    fclose(in);
+}
+
+// index_save writes the row offsets to the sidecar index.
+// The index is written to a temporary file first, so that readers
+// of the same file never see a partially written index.
+static void index_save(VsvTable* pTab) {
+    sqlite3_int64 aHdr[VSV_INDEX_NHDR];
+    sqlite3_int64 iSize, iMtime;
+    unsigned int iRandom;
+
+    pTab->bIndexSaved = 1;
+    if (file_stat(pTab->zFilename, &iSize, &iMtime) || iSize != pTab->iFileSize ||
+        iMtime != pTab->iFileMtime) {
+        // the file has changed since the table was connected
+        return;
+    }
+    sqlite3_randomness(sizeof(iRandom), &iRandom);
+    char* zTemp = sqlite3_mprintf("%s-%08x", pTab->zIndex, iRandom);
+    if (zTemp == 0) {
+        return;
+    }
+    FILE* out = fopen(zTemp, "wb");
+    if (out == 0) {
+        sqlite3_free(zTemp);
+        return;
+    }
+    index_header(pTab, aHdr);
+    int ok = fwrite(VSV_INDEX_MAGIC, 1, sizeof(VSV_INDEX_MAGIC) - 1, out) ==
+                 sizeof(VSV_INDEX_MAGIC) - 1 &&
+             fwrite(aHdr, sizeof(aHdr[0]), VSV_INDEX_NHDR, out) == VSV_INDEX_NHDR &&
+             fwrite(pTab->aOffset, sizeof(pTab->aOffset[0]), (size_t)pTab->nOffset, out) ==
+                 (size_t)pTab->nOffset;
+    ok = fclose(out) == 0 && ok;
+    if (ok) {
+#if defined(_WIN32)
+        remove(pTab->zIndex);
+#endif
+        ok = rename(zTemp, pTab->zIndex) == 0;
+    }
+    if (!ok) {
+        remove(zTemp);
+    }
+    sqlite3_free(zTemp);
+}
+
+// index_add_row records the offset of the row, if it is due.
+// Rows are seen in order from an indexed row, so the offsets
+// are appended without gaps.
+static void index_add_row(VsvTable* pTab, sqlite3_int64 iRowid, sqlite3_int64 iOffset) {
+    if (pTab->bComplete || (iRowid - 1) % VSV_STRIDE != 0 ||
+        (iRowid - 1) / VSV_STRIDE != pTab->nOffset) {
+        return;
+    }
+    if (pTab->nOffset >= pTab->nOffsetAlloc) {
+        sqlite3_int64 nNew = pTab->nOffsetAlloc * 2 + 64;
+        sqlite3_int64* aNew = sqlite3_realloc64(pTab->aOffset, nNew * sizeof(sqlite3_int64));
+        if (aNew == 0) {
+            // the index is only an optimization
+            return;
+        }
+        pTab->aOffset = aNew;
+        pTab->nOffsetAlloc = nNew;
+    }
+    pTab->aOffset[pTab->nOffset++] = iOffset;
+}
+
+// index_end marks the end of input after nRow rows.
+static void index_end(VsvTable* pTab, sqlite3_int64 nRow) {
+    if (pTab->bComplete || pTab->nOffset < (nRow + VSV_STRIDE - 1) / VSV_STRIDE) {
+        return;
+    }
+    pTab->nRow = nRow;
+    pTab->bComplete = 1;
+    if (pTab->zIndex && !pTab->bIndexSaved) {
+        index_save(pTab);
+    }
+}
+
+// xfer_error transfers the error message from a reader into the table.
+static void xfer_error(VsvTable* pTab, VsvReader* pRdr) {
+    sqlite3_free(pTab->base.zErrMsg);
+    pTab->base.zErrMsg = sqlite3_mprintf("%s", pRdr->zErr);
+}
+
+// vsv_disconnect is the destructor for a VsvTable.
+static int vsv_disconnect(sqlite3_vtab* pVtab) {
+    VsvTable* p = (VsvTable*)pVtab;
+    sqlite3_free(p->zFilename);
+    sqlite3_free(p->zData);
+    sqlite3_free(p->aAffinity);
+    sqlite3_free(p->aOffset);
+    sqlite3_free(p->zIndex);
+    sqlite3_free(p);
+    return SQLITE_OK;
+}
+
+// skip_whitespace skips leading whitespace.
+static const char* skip_whitespace(const char* z) {
+    while (isspace((unsigned char)z[0])) {
+        z++;
+    }
+    return z;
+}
+
+// trim_whitespace removes trailing whitespace.
+static void trim_whitespace(char* z) {
+    size_t n = strlen(z);
+    while (n > 0 && isspace((unsigned char)z[n])) {
+        n--;
+    }
+    z[n] = 0;
+}
+
+// dequote removes the quotes around the string.
+static void dequote(char* z) {
+    int j;
+    char cQuote = z[0];
+    size_t i, n;
+
+    if (cQuote != '\'' && cQuote != '"') {
+        return;
+    }
+    n = strlen(z);
+    if (n < 2 || z[n - 1] != z[0]) {
+        return;
+    }
+    for (i = 1, j = 0; i < n - 1; i++) {
+        if (z[i] == cQuote && z[i + 1] == cQuote) {
+            i++;
+        }
+        z[j++] = z[i];
+    }
+    z[j] = 0;
+}
+
+// parameter checks if the string is of the form "TAG = VALUE".
+// If it is, returns a pointer to the first character of VALUE,
+// otherwise returns NULL.
+static const char* parameter(const char* zTag, int nTag, const char* z) {
+    z = skip_whitespace(z);
+    if (strncmp(zTag, z, nTag) != 0) {
+        return 0;
+    }
+    z = skip_whitespace(z + nTag);
+    if (z[0] != '=') {
+        return 0;
+    }
+    return skip_whitespace(z + 1);
+}
+
+// string_parameter decodes a parameter that requires a dequoted string.
+// Returns 1 if the parameter is seen, or 0 if not (1 is returned even
+// if there is an error, leaving the message in p->zErr).
+static int string_parameter(VsvReader* p, const char* zParam, const char* zArg, char** pzVal) {
+    const char* zValue;
+    zValue = parameter(zParam, (int)strlen(zParam), zArg);
+    if (zValue == 0) {
+        return 0;
+    }
+    p->zErr[0] = 0;
+    if (*pzVal) {
+        vsv_reader_errmsg(p, "more than one '%s' parameter", zParam);
+        return 1;
+    }
+    *pzVal = sqlite3_mprintf("%s", zValue);
+    if (*pzVal == 0) {
+        vsv_reader_errmsg(p, "out of memory");
+        return 1;
+    }
+    trim_whitespace(*pzVal);
+    dequote(*pzVal);
+    return 1;
+}
+
+// boolean returns 0 if the argument is false and 1 if it is true,
+// or -1 if it cannot tell.
+static int boolean(const char* z) {
+    if (sqlite3_stricmp("yes", z) == 0 || sqlite3_stricmp("on", z) == 0 ||
+        sqlite3_stricmp("true", z) == 0 || (z[0] == '1' && z[1] == 0)) {
+        return 1;
+    }
+    if (sqlite3_stricmp("no", z) == 0 || sqlite3_stricmp("off", z) == 0 ||
+        sqlite3_stricmp("false", z) == 0 || (z[0] == '0' && z[1] == 0)) {
+        return 0;
+    }
+    return -1;
+}
+
+// boolean_parameter checks if the string is of the form "TAG = BOOLEAN"
+// or just "TAG". If it is, sets *pValue and returns non-zero.
+static int boolean_parameter(const char* zTag, int nTag, const char* z, int* pValue) {
+    int b;
+    z = skip_whitespace(z);
+    if (strncmp(zTag, z, nTag) != 0) {
+        return 0;
+    }
+    z = skip_whitespace(z + nTag);
+    if (z[0] == 0) {
+        *pValue = 1;
+        return 1;
+    }
+    if (z[0] != '=') {
+        return 0;
+    }
+    z = skip_whitespace(z + 1);
+    b = boolean(z);
+    if (b >= 0) {
+        *pValue = b;
+        return 1;
+    }
+    return 0;
+}
+
+// parse_sep_char converts the separator specification into
+// the character code: any single character, an escaped character
+// (\f \n \t \v) or an escaped hex byte (\x1e).
+// Returns 1 on error, 0 otherwise.
+static int parse_sep_char(char* in, int dflt, int* out) {
+    if (!in) {
+        *out = dflt;
+        return 0;
+    }
+    switch (strlen(in)) {
+        case 0: {
+            *out = dflt;
+            return 0;
+        }
+        case 1: {
+            *out = (unsigned char)in[0];
+            return 0;
+        }
+        case 2: {
+            if (in[0] != '\\') {
+                return 1;
+            }
+            switch (in[1]) {
+                case 'f': {
+                    *out = 12;
+                    return 0;
+                }
+                case 'n': {
+                    *out = 10;
+                    return 0;
+                }
+                case 't': {
+                    *out = 9;
+                    return 0;
+                }
+                case 'v': {
+                    *out = 11;
+                    return 0;
+                }
+            }
+            return 1;
+        }
+        case 4: {
+            if (sqlite3_strnicmp(in, "\\x", 2) != 0) {
+                return 1;
+            }
+            if (!isxdigit((unsigned char)in[2]) || !isxdigit((unsigned char)in[3])) {
+                return 1;
+            }
+            *out = ((in[2] > '9' ? (in[2] & 0x0f) + 9 : in[2] & 0x0f) << 4) +
+                   (in[3] > '9' ? (in[3] & 0x0f) + 9 : in[3] & 0x0f);
+            return 0;
+        }
+    }
+    return 0;
+}
+
+
+// utf8_valid returns the length of the string,
+// or -1 if it is not valid UTF-8.
+static long long utf8_valid(char* string) {
+    long long length = 0;
+    unsigned char* start;
+    int trailing = 0;
+    unsigned char c;
+
+    start = (unsigned char*)string;
+    while ((c = *start)) {
+        if (trailing) {
+            if ((c & 0xC0) == 0x80) {
+                trailing--;
+                start++;
+                length++;
+                continue;
+            } else {
+                length = -1;
+                break;
+            }
+        }
+        if ((c & 0x80) == 0) {
+            start++;
+            length++;
+            continue;
+        }
+        if ((c & 0xE0) == 0xC0) {
+            trailing = 1;
+            start++;
+            length++;
+            continue;
+        }
+        if ((c & 0xF0) == 0xE0) {
+            trailing = 2;
+            start++;
+            length++;
+            continue;
+        }
+        if ((c & 0xF8) == 0xF0) {
+            trailing = 3;
+            start++;
+            length++;
+            continue;
+        }
+        length = -1;
+        break;
+    }
+    return length;
+}
+
+// affinity_name returns the declared type for the affinity.
+static const char* affinity_name(int affinity) {
+    switch (affinity) {
+        case VSV_AFF_INTEGER:
+            return "INTEGER";
+        case VSV_AFF_REAL:
+            return "REAL";
+        default:
+            return "TEXT";
+    }
+}
+
+// infer_affinity determines the affinity of each column from the first
+// VSV_SAMPLE_ROWS rows: INTEGER if every value is an integer, REAL if
+// every value is a number, and TEXT otherwise. Empty values are ignored.
+// The offsets of the sampled rows go to the index along the way.
+// Returns the number of errors.
+static int infer_affinity(VsvTable* pTab, VsvReader* p) {
+    enum { SEEN_INTEGER = 1, SEEN_REAL = 2, SEEN_TEXT = 4 };
+    sqlite3_int64 iRowid = 0;
+    int i;
+
+    int* aSeen = sqlite3_malloc64(pTab->nCol * sizeof(int));
+    if (aSeen == 0) {
+        vsv_reader_errmsg(p, "out of memory");
+        return 1;
+    }
+    memset(aSeen, 0, pTab->nCol * sizeof(int));
+    if (vsv_reader_seek(p, pTab->iStart)) {
+        sqlite3_free(aSeen);
+        vsv_reader_errmsg(p, "cannot seek in the input");
+        return 1;
+    }
+
+    while (iRowid < VSV_SAMPLE_ROWS) {
+        sqlite3_int64 iOffset = vsv_reader_tell(p);
+        char* z;
+        i = 0;
+        do {
+            z = vsv_reader_read_field(p);
+            if (z == 0) {
+                break;
+            }
+            if (i < pTab->nCol && p->notNull && p->n > 0) {
+                switch (vsv_number_type(p->dsep, z)) {
+                    case 1:
+                        aSeen[i] |= SEEN_INTEGER;
+                        break;
+                    case 2:
+                        aSeen[i] |= SEEN_REAL;
+                        break;
+                    default:
+                        aSeen[i] |= SEEN_TEXT;
+                }
+            }
+            i++;
+        } while (p->cTerm == p->fsep);
+        if (p->rc) {
+            sqlite3_free(aSeen);
+            return 1;
+        }
+        if (z == 0 && i == 0) {
+            index_end(pTab, iRowid);
+            break;
+        }
+        iRowid++;
+        index_add_row(pTab, iRowid, iOffset);
+    }
+
+    for (i = 0; i < pTab->nCol; i++) {
+        if (aSeen[i] == 0 || (aSeen[i] & SEEN_TEXT)) {
+            pTab->aAffinity[i] = VSV_AFF_TEXT;
+        } else if (aSeen[i] & SEEN_REAL) {
+            pTab->aAffinity[i] = VSV_AFF_REAL;
+        } else {
+            pTab->aAffinity[i] = VSV_AFF_INTEGER;
+        }
+    }
+    sqlite3_free(aSeen);
+    return 0;
+}
+
+// Parameters:
+//    filename=FILENAME     name of file containing VSV content
+//    data=TEXT             direct VSV content
+//    schema=SCHEMA         alternative VSV schema
+//    header=YES|NO         first row of VSV defines the names of columns
+//    columns=N             assume the VSV file contains N columns
+//    fsep=FSEP             field separator
+//    rsep=RSEP             record separator
+//    dsep=DSEP             decimal separator
+//    skip=N                skip N records of file (default 0)
+//    validatetext=YES|NO   validate UTF-8 encoding of text fields
+//    affinity=AFF          none, blob, text, integer, real, numeric or auto
+//    nulls=YES|NO          empty fields are returned as NULL
+//    index=YES|NO          keep the row offsets in FILENAME.vsvidx
+static int vsv_connect(sqlite3* db,
+                       void* pAux,
+                       int argc,
+                       const char* const* argv,
+                       sqlite3_vtab** ppVtab,
+                       char** pzErr) {
+    VsvTable* pNew = 0;     // the VsvTable object to construct
+    int affinity = -1;      // affinity coercion
+    int bHeader = -1;       // header= flag, -1 means not seen yet
+    int validateUTF8 = -1;  // validatetext= flag
+    int bNulls = -1;        // nulls= flag
+    int bIndex = -1;        // index= flag
+    int rc = SQLITE_OK;     // result code from this routine
+    size_t i, j;            // loop counters
+    int b;                  // value of a boolean parameter
+    int nCol = -99;         // value of the columns= parameter
+    int nSkip = -1;         // value of the skip= parameter
+    char** azName = 0;      // column names from the header
+    int nName = 0;          // number of names in azName
+    VsvReader sRdr;         // reader to count the columns and to store errors
+    static const char* azParam[] = {"filename", "data", "schema", "fsep", "rsep", "dsep"};
+    char* azPValue[6];  // parameter values
+#define VSV_FILENAME (azPValue[0])
+#define VSV_DATA (azPValue[1])
+#define VSV_SCHEMA (azPValue[2])
+#define VSV_FSEP (azPValue[3])
+#define VSV_RSEP (azPValue[4])
+#define VSV_DSEP (azPValue[5])
+
+    assert(sizeof(azPValue) == sizeof(azParam));
+    vsv_reader_init(&sRdr, 0, 0, 0);
+    memset(azPValue, 0, sizeof(azPValue));
+    for (i = 3; i < (size_t)argc; i++) {
+        const char* z = argv[i];
+        const char* zValue;
+        for (j = 0; j < sizeof(azParam) / sizeof(azParam[0]); j++) {
+            if (string_parameter(&sRdr, azParam[j], z, &azPValue[j])) {
+                break;
+            }
+        }
+        if (j < sizeof(azParam) / sizeof(azParam[0])) {
+            if (sRdr.zErr[0]) {
+                goto connect_error;
+            }
+        } else if (boolean_parameter("header", 6, z, &b)) {
+            if (bHeader >= 0) {
+                vsv_reader_errmsg(&sRdr, "more than one 'header' parameter");
+                goto connect_error;
+            }
+            bHeader = b;
+        } else if (boolean_parameter("validatetext", 12, z, &b)) {
+            if (validateUTF8 >= 0) {
+                vsv_reader_errmsg(&sRdr, "more than one 'validatetext' parameter");
+                goto connect_error;
+            }
+            validateUTF8 = b;
+        } else if (boolean_parameter("nulls", 5, z, &b)) {
+            if (bNulls >= 0) {
+                vsv_reader_errmsg(&sRdr, "more than one 'nulls' parameter");
+                goto connect_error;
+            }
+            bNulls = b;
+        } else if (boolean_parameter("index", 5, z, &b)) {
+            if (bIndex >= 0) {
+                vsv_reader_errmsg(&sRdr, "more than one 'index' parameter");
+                goto connect_error;
+            }
+            bIndex = b;
+        } else if ((zValue = parameter("columns", 7, z)) != 0) {
+            if (nCol > 0) {
+                vsv_reader_errmsg(&sRdr, "more than one 'columns' parameter");
+                goto connect_error;
+            }
+            nCol = atoi(zValue);
+            if (nCol <= 0) {
+                vsv_reader_errmsg(&sRdr, "column= value must be positive");
+                goto connect_error;
+            }
+        } else if ((zValue = parameter("skip", 4, z)) != 0) {
+            if (nSkip > 0) {
+                vsv_reader_errmsg(&sRdr, "more than one 'skip' parameter");
+                goto connect_error;
+            }
+            nSkip = atoi(zValue);
+            if (nSkip <= 0) {
+                vsv_reader_errmsg(&sRdr, "skip= value must be positive");
+                goto connect_error;
+            }
+        } else if ((zValue = parameter("affinity", 8, z)) != 0) {
+            if (affinity > -1) {
+                vsv_reader_errmsg(&sRdr, "more than one 'affinity' parameter");
+                goto connect_error;
+            }
+            if (sqlite3_strnicmp(zValue, "none", 4) == 0)
+                affinity = VSV_AFF_NONE;
+            else if (sqlite3_strnicmp(zValue, "blob", 4) == 0)
+                affinity = VSV_AFF_BLOB;
+            else if (sqlite3_strnicmp(zValue, "text", 4) == 0)
+                affinity = VSV_AFF_TEXT;
+            else if (sqlite3_strnicmp(zValue, "integer", 7) == 0)
+                affinity = VSV_AFF_INTEGER;
+            else if (sqlite3_strnicmp(zValue, "real", 4) == 0)
+                affinity = VSV_AFF_REAL;
+            else if (sqlite3_strnicmp(zValue, "numeric", 7) == 0)
+                affinity = VSV_AFF_NUMERIC;
+            else if (sqlite3_strnicmp(zValue, "auto", 4) == 0)
+                affinity = VSV_AFF_AUTO;
+            else {
+                vsv_reader_errmsg(&sRdr, "unknown affinity: '%s'", zValue);
+                goto connect_error;
+            }
+        } else {
+            vsv_reader_errmsg(&sRdr, "bad parameter: '%s'", z);
+            goto connect_error;
+        }
+    }
+    if (affinity == -1) {
+        affinity = VSV_AFF_NONE;
+    }
+    if (bNulls == -1) {
+        bNulls = 0;
+    }
+    if (validateUTF8 == -1) {
+        validateUTF8 = 0;
+    }
+    if ((VSV_FILENAME == 0) == (VSV_DATA == 0)) {
+        vsv_reader_errmsg(&sRdr, "must specify either filename= or data= but not both");
+        goto connect_error;
+    }
+    if (bIndex == 1 && VSV_FILENAME == 0) {
+        vsv_reader_errmsg(&sRdr, "index= requires filename=");
+        goto connect_error;
+    }
+    if (parse_sep_char(VSV_FSEP, ',', &(sRdr.fsep))) {
+        vsv_reader_errmsg(&sRdr, "cannot parse fsep: '%s'", VSV_FSEP);
+        goto connect_error;
+    }
+    if (parse_sep_char(VSV_RSEP, '\n', &(sRdr.rsep))) {
+        vsv_reader_errmsg(&sRdr, "cannot parse rsep: '%s'", VSV_RSEP);
+        goto connect_error;
+    }
+    if (parse_sep_char(VSV_DSEP, '.', &(sRdr.dsep))) {
+        vsv_reader_errmsg(&sRdr, "cannot parse dsep: '%s'", VSV_DSEP);
+        goto connect_error;
+    }
+    if ((nCol <= 0 || bHeader == 1 || nSkip > 0 || affinity == VSV_AFF_AUTO) &&
+        vsv_reader_open(&sRdr, VSV_FILENAME, VSV_DATA)) {
+        goto connect_error;
+    }
+    pNew = sqlite3_malloc(sizeof(*pNew));
+    *ppVtab = (sqlite3_vtab*)pNew;
+    if (pNew == 0) {
+        goto connect_oom;
+    }
+    memset(pNew, 0, sizeof(*pNew));
+    pNew->fsep = sRdr.fsep;
+    pNew->rsep = sRdr.rsep;
+    pNew->dsep = sRdr.dsep;
+    pNew->affinity = affinity;
+    pNew->validateUTF8 = validateUTF8;
+    pNew->nulls = bNulls;
+
+    // the first record gives the number of columns and/or their names
+    if (VSV_SCHEMA == 0 && bHeader == 1) {
+        do {
+            char* z = vsv_reader_read_field(&sRdr);
+            if (sRdr.rc) {
+                goto connect_oom;
+            }
+            if (nCol < 0 || nName < nCol) {
+                char** azNew = sqlite3_realloc64(azName, (nName + 1) * sizeof(char*));
+                if (azNew == 0) {
+                    goto connect_oom;
+                }
+                azName = azNew;
+                azName[nName] = sqlite3_mprintf("%s", z ? z : "");
+                if (azName[nName++] == 0) {
+                    goto connect_oom;
+                }
+            }
+        } while (sRdr.cTerm == sRdr.fsep);
+        if (nCol < 0) {
+            nCol = nName;
+        }
+    } else if (nCol < 0) {
+        nCol = 0;
+        do {
+            vsv_reader_read_field(&sRdr);
+            nCol++;
+        } while (sRdr.cTerm == sRdr.fsep);
+    } else if (nSkip < 1 && bHeader == 1) {
+        vsv_reader_skip_record(&sRdr);
+    }
+    pNew->nCol = nCol;
+
+    if (nSkip > 0) {
+        int tskip = nSkip + (bHeader == 1);
+        vsv_reader_seek(&sRdr, 0);
+        do {
+            do {
+                if (!vsv_reader_read_field(&sRdr)) {
+                    goto connect_error;
+                }
+            } while (sRdr.cTerm == sRdr.fsep);
+            tskip--;
+        } while (tskip > 0 && sRdr.cTerm == sRdr.rsep);
+        if (tskip > 0) {
+            vsv_reader_errmsg(&sRdr, "premature end of file during skip");
+            goto connect_error;
+        }
+    }
+    pNew->zFilename = VSV_FILENAME;
+    VSV_FILENAME = 0;
+    pNew->zData = VSV_DATA;
+    VSV_DATA = 0;
+    if (bHeader != 1 && nSkip < 1) {
+        pNew->iStart = 0;
+    } else {
+        pNew->iStart = vsv_reader_tell(&sRdr);
+    }
+    pNew->nStartRecords = (bHeader == 1) + (nSkip > 0 ? nSkip : 0);
+
+    if (bIndex == 1) {
+        pNew->zIndex = sqlite3_mprintf("%s" VSV_INDEX_SUFFIX, pNew->zFilename);
+        if (pNew->zIndex == 0) {
+            goto connect_oom;
+        }
+        if (file_stat(pNew->zFilename, &pNew->iFileSize, &pNew->iFileMtime)) {
+            vsv_reader_errmsg(&sRdr, "cannot open '%s' for reading", pNew->zFilename);
+            goto connect_error;
+        }
+        index_load(pNew);
+    } else if (pNew->zFilename) {
+        // a missing file is reported when it is read
+        file_stat(pNew->zFilename, &pNew->iFileSize, &pNew->iFileMtime);
+    }
+
+    if (affinity == VSV_AFF_AUTO) {
+        pNew->aAffinity = sqlite3_malloc64(nCol * sizeof(int));
+        if (pNew->aAffinity == 0) {
+            goto connect_oom;
+        }
+        if (infer_affinity(pNew, &sRdr)) {
+            goto connect_error;
+        }
+    }
+
+    if (VSV_SCHEMA == 0) {
+        sqlite3_str* pStr = sqlite3_str_new(0);
+        int iCol;
+        sqlite3_str_appendf(pStr, "CREATE TABLE x(");
+        for (iCol = 0; iCol < nCol; iCol++) {
+            if (iCol > 0) {
+                sqlite3_str_appendchar(pStr, 1, ',');
+            }
+            if (iCol < nName) {
+                sqlite3_str_appendf(pStr, "\"%w\"", azName[iCol]);
+            } else {
+                // columns missing from the header are numbered from 1
+                sqlite3_str_appendf(pStr, "c%d", bHeader == 1 ? iCol + 1 : iCol);
+            }
+            if (pNew->aAffinity) {
+                sqlite3_str_appendf(pStr, " %s", affinity_name(pNew->aAffinity[iCol]));
+            }
+        }
+        sqlite3_str_appendf(pStr, ")");
+        VSV_SCHEMA = sqlite3_str_finish(pStr);
+        if (VSV_SCHEMA == 0) {
+            goto connect_oom;
+        }
+    }
+
+    vsv_reader_reset(&sRdr);
+    rc = sqlite3_declare_vtab(db, VSV_SCHEMA);
+    if (rc) {
+        vsv_reader_errmsg(&sRdr, "bad schema: '%s' - %s", VSV_SCHEMA, sqlite3_errmsg(db));
+        goto connect_error;
+    }
+    for (i = 0; i < sizeof(azPValue) / sizeof(azPValue[0]); i++) {
+        sqlite3_free(azPValue[i]);
+    }
+    for (b = 0; b < nName; b++) {
+        sqlite3_free(azName[b]);
+    }
+    sqlite3_free(azName);
+    // An attacker who controls a database schema could use this vtab
+    // to exfiltrate sensitive data from other files in the filesystem.
+    sqlite3_vtab_config(db, SQLITE_VTAB_DIRECTONLY);
+    return SQLITE_OK;
+
+connect_oom:
+    rc = SQLITE_NOMEM;
+    vsv_reader_errmsg(&sRdr, "out of memory");
+
+connect_error:
+    if (pNew) {
+        vsv_disconnect(&pNew->base);
+        *ppVtab = 0;
+    }
+    for (i = 0; i < sizeof(azPValue) / sizeof(azPValue[0]); i++) {
+        sqlite3_free(azPValue[i]);
+    }
+    for (b = 0; b < nName; b++) {
+        sqlite3_free(azName[b]);
+    }
+    sqlite3_free(azName);
+    if (sRdr.zErr[0]) {
+        sqlite3_free(*pzErr);
+        *pzErr = sqlite3_mprintf("%s", sRdr.zErr);
+    }
+    vsv_reader_reset(&sRdr);
+    if (rc == SQLITE_OK) {
+        rc = SQLITE_ERROR;
+    }
+    return rc;
+#undef VSV_FILENAME
+#undef VSV_DATA
+#undef VSV_SCHEMA
+#undef VSV_FSEP
+#undef VSV_RSEP
+#undef VSV_DSEP
+}
+
+// vsv_create is the same as vsv_connect, but the module must have both
+// so that the virtual table is not an eponymous virtual table.
+static int vsv_create(sqlite3* db,
+                      void* pAux,
+                      int argc,
+                      const char* const* argv,
+                      sqlite3_vtab** ppVtab,
+                      char** pzErr) {
+    return vsv_connect(db, pAux, argc, argv, ppVtab, pzErr);
+}
+
+// cursor_row_reset resets the current row content held by the cursor.
+static void cursor_row_reset(VsvCursor* pCur) {
+    VsvTable* pTab = (VsvTable*)pCur->base.pVtab;
+    int i;
+    for (i = 0; i < pTab->nCol; i++) {
+        sqlite3_free(pCur->azVal[i]);
+        pCur->azVal[i] = 0;
+        pCur->aLen[i] = 0;
+        pCur->dLen[i] = -1;
+    }
+}
+
+// vsv_close is the destructor for a VsvCursor.
+static int vsv_close(sqlite3_vtab_cursor* cur) {
+    VsvCursor* pCur = (VsvCursor*)cur;
+    cursor_row_reset(pCur);
+    vsv_reader_reset(&pCur->rdr);
+    sqlite3_free(cur);
+    return SQLITE_OK;
+}
+
+// vsv_open is the constructor for a VsvCursor.
+static int vsv_open(sqlite3_vtab* p, sqlite3_vtab_cursor** ppCursor) {
+    VsvTable* pTab = (VsvTable*)p;
+    VsvCursor* pCur;
+    size_t nByte;
+    nByte = sizeof(*pCur) + (sizeof(char*) + (2 * sizeof(int))) * pTab->nCol;
+    pCur = sqlite3_malloc64(nByte);
+    if (pCur == 0) {
+        return SQLITE_NOMEM;
+    }
+    memset(pCur, 0, nByte);
+    pCur->azVal = (char**)&pCur[1];
+    pCur->aLen = (int*)&pCur->azVal[pTab->nCol];
+    pCur->dLen = (int*)&pCur->aLen[pTab->nCol];
+    vsv_reader_init(&pCur->rdr, pTab->fsep, pTab->rsep, pTab->dsep);
+    *ppCursor = &pCur->base;
+    if (pTab->zFilename) {
+        // checked against the file in vsv_filter
+        file_stat(pTab->zFilename, &pCur->iFileSize, &pCur->iFileMtime);
+        pCur->iGeneration = pTab->iGeneration;
+    }
+    if (vsv_reader_open(&pCur->rdr, pTab->zFilename, pTab->zData)) {
+        xfer_error(pTab, &pCur->rdr);
+        return SQLITE_ERROR;
+    }
+    return SQLITE_OK;
+}
+
+// cursor_check_file makes sure that the table offsets and the reader
+// of the cursor belong to the file as it is now. When the size or the
+// modification time of the file has changed, the offsets are dropped,
+// the start of the data is found again and the reader is reopened.
+static int cursor_check_file(VsvCursor* pCur) {
+    VsvTable* pTab = (VsvTable*)pCur->base.pVtab;
+    sqlite3_int64 iSize, iMtime;
+    int i;
+
+    if (file_stat(pTab->zFilename, &iSize, &iMtime)) {
+        vsv_reader_errmsg(&pCur->rdr, "cannot open '%s' for reading", pTab->zFilename);
+        xfer_error(pTab, &pCur->rdr);
+        return SQLITE_ERROR;
+    }
+    if (iSize != pTab->iFileSize || iMtime != pTab->iFileMtime) {
+        pTab->iFileSize = iSize;
+        pTab->iFileMtime = iMtime;
+        pTab->iGeneration++;
+        pTab->nOffset = 0;
+        pTab->nRow = 0;
+        pTab->bComplete = 0;
+        pTab->bIndexSaved = 0;
+    }
+    if (pCur->iGeneration == pTab->iGeneration && iSize == pCur->iFileSize &&
+        iMtime == pCur->iFileMtime) {
+        return SQLITE_OK;
+    }
+
+    vsv_reader_reset(&pCur->rdr);
+    if (vsv_reader_open(&pCur->rdr, pTab->zFilename, 0)) {
+        xfer_error(pTab, &pCur->rdr);
+        return SQLITE_ERROR;
+    }
+    pCur->iFileSize = iSize;
+    pCur->iFileMtime = iMtime;
+    if (pCur->iGeneration != pTab->iGeneration) {
+        pCur->iGeneration = pTab->iGeneration;
+        // the header may have a different length, or the skipped
+        // records may be missing from the new file
+        for (i = 0; i < pTab->nStartRecords && pCur->rdr.cTerm != EOF; i++) {
+            vsv_reader_skip_record(&pCur->rdr);
+        }
+        if (pCur->rdr.rc) {
+            return pCur->rdr.rc;
+        }
+        pTab->iStart = vsv_reader_tell(&pCur->rdr);
+    }
+    return SQLITE_OK;
+}
+
+// cursor_read_row reads the next record. Skipped records (bStore == 0)
+// are parsed but not copied into the row. Sets iRowid to -1 at EOF.
+static int cursor_read_row(VsvCursor* pCur, int bStore) {
+    VsvTable* pTab = (VsvTable*)pCur->base.pVtab;
+    VsvReader* p = &pCur->rdr;
+    sqlite3_int64 iOffset = vsv_reader_tell(p);
+    int i = 0;
+    char* z;
+    do {
+        z = vsv_reader_read_field(p);
+        if (z == 0) {
+            if (p->rc) {
+                xfer_error(pTab, p);
+                return p->rc;
+            }
+            if (bStore && i < pTab->nCol) {
+                pCur->dLen[i] = -1;
+            }
+        } else if (i < pTab->nCol) {
+            if (bStore) {
+                if (pCur->aLen[i] < p->n + 1) {
+                    char* zNew = sqlite3_realloc64(pCur->azVal[i], p->n + 1);
+                    if (zNew == 0) {
+                        vsv_reader_errmsg(p, "out of memory");
+                        xfer_error(pTab, p);
+                        return SQLITE_NOMEM;
+                    }
+                    pCur->azVal[i] = zNew;
+                    pCur->aLen[i] = p->n + 1;
+                }
+                if (!p->notNull && pTab->nulls) {
+                    pCur->dLen[i] = -1;
+                } else {
+                    pCur->dLen[i] = p->n;
+                    memcpy(pCur->azVal[i], z, p->n + 1);
+                }
+            }
+            i++;
+        }
+    } while (p->cTerm == p->fsep);
+    if (p->cTerm == EOF && i == 0) {
+        if (pCur->iGeneration == pTab->iGeneration) {
+            index_end(pTab, pCur->iRowid);
+        }
+        pCur->iRowid = -1;
+    } else {
+        pCur->iRowid++;
+        if (pCur->iGeneration == pTab->iGeneration) {
+            index_add_row(pTab, pCur->iRowid, iOffset);
+        }
+        if (bStore) {
+            while (i < pTab->nCol) {
+                pCur->dLen[i] = -1;
+                i++;
+            }
+        }
+    }
+    return SQLITE_OK;
+}
+
+// vsv_next advances the cursor to the next row.
+static int vsv_next(sqlite3_vtab_cursor* cur) {
+    VsvCursor* pCur = (VsvCursor*)cur;
+    if (pCur->iRowid >= pCur->iMax) {
+        pCur->iRowid = -1;
+        return SQLITE_OK;
+    }
+    return cursor_read_row(pCur, 1);
+}
+
+// result_text returns the field as text. With validatetext, returns
+// an invalid field as a blob (or as an error for affinity=none).
+static void result_text(sqlite3_context* ctx, VsvTable* pTab, int affinity, char* z, long long dLen) {
+    long long length;
+    if (!pTab->validateUTF8) {
+        sqlite3_result_text(ctx, z, -1, SQLITE_TRANSIENT);
+        return;
+    }
+    length = utf8_valid(z);
+    if (affinity == VSV_AFF_NONE) {
+        if (length == dLen) {
+            sqlite3_result_text(ctx, z, dLen, SQLITE_TRANSIENT);
+        } else {
+            sqlite3_result_error(ctx, "Invalid UTF8 Data", -1);
+        }
+    } else if (length < dLen) {
+        sqlite3_result_blob(ctx, z, dLen, SQLITE_TRANSIENT);
+    } else {
+        sqlite3_result_text(ctx, z, length, SQLITE_TRANSIENT);
+    }
+}
+
+// vsv_column returns the value of the column for the current row.
+static int vsv_column(sqlite3_vtab_cursor* cur, sqlite3_context* ctx, int i) {
+    VsvCursor* pCur = (VsvCursor*)cur;
+    VsvTable* pTab = (VsvTable*)cur->pVtab;
+    if (i < 0 || i >= pTab->nCol || pCur->azVal[i] == 0 || pCur->dLen[i] < 0) {
+        return SQLITE_OK;
+    }
+
+    char* z = pCur->azVal[i];
+    long long dLen = pCur->dLen[i];
+    int affinity = pTab->aAffinity ? pTab->aAffinity[i] : pTab->affinity;
+    switch (affinity) {
+        case VSV_AFF_BLOB: {
+            sqlite3_result_blob(ctx, z, dLen, SQLITE_TRANSIENT);
+            break;
+        }
+        case VSV_AFF_INTEGER: {
+            if (vsv_number_type(pTab->dsep, z) == 1) {
+                sqlite3_result_int64(ctx, strtoll(z, 0, 10));
+            } else {
+                result_text(ctx, pTab, affinity, z, dLen);
+            }
+            break;
+        }
+        case VSV_AFF_REAL: {
+            if (vsv_number_type(pTab->dsep, z) != 0) {
+                sqlite3_result_double(ctx, strtod(z, 0));
+            } else {
+                result_text(ctx, pTab, affinity, z, dLen);
+            }
+            break;
+        }
+        case VSV_AFF_NUMERIC: {
+            switch (vsv_number_type(pTab->dsep, z)) {
+                case 1: {
+                    sqlite3_result_int64(ctx, strtoll(z, 0, 10));
+                    break;
+                }
+                case 2: {
+                    long double dv, fp, ip;
+                    dv = strtold(z, 0);
+                    fp = modfl(dv, &ip);
+                    if (sizeof(long double) > sizeof(double)) {
+                        if (fp == 0.0L && dv >= -9223372036854775808.0L &&
+                            dv <= 9223372036854775807.0L) {
+                            sqlite3_result_int64(ctx, (long long)dv);
+                        } else {
+                            sqlite3_result_double(ctx, (double)dv);
+                        }
+                    } else {
+                        // only convert if it will fit in a 6-byte varint
+                        if (fp == 0.0L && dv >= -140737488355328.0L &&
+                            dv <= 140737488355328.0L) {
+                            sqlite3_result_int64(ctx, (long long)dv);
+                        } else {
+                            sqlite3_result_double(ctx, (double)dv);
+                        }
+                    }
+                    break;
+                }
+                default: {
+                    result_text(ctx, pTab, affinity, z, dLen);
+                    break;
+                }
+            }
+            break;
+        }
+        default: {
+            result_text(ctx, pTab, affinity, z, dLen);
+            break;
+        }
+    }
+    return SQLITE_OK;
+}
+
+// vsv_rowid returns the rowid for the current row.
+static int vsv_rowid(sqlite3_vtab_cursor* cur, sqlite_int64* pRowid) {
+    VsvCursor* pCur = (VsvCursor*)cur;
+    *pRowid = pCur->iRowid;
+    return SQLITE_OK;
+}
+
+// vsv_eof returns true if the cursor has been moved off of the last row.
+static int vsv_eof(sqlite3_vtab_cursor* cur) {
+    VsvCursor* pCur = (VsvCursor*)cur;
+    return pCur->iRowid < 0;
+}
+
+// rowid_bound narrows [*piMin, *piMax] by the rowid constraint.
+// The bounds may be wider than the constraint (SQLite checks it
+// again), but never narrower.
+static void rowid_bound(sqlite3_value* pVal, int op, sqlite3_int64* piMin, sqlite3_int64* piMax) {
+    sqlite3_int64 iLo, iHi;
+    switch (sqlite3_value_numeric_type(pVal)) {
+        case SQLITE_INTEGER: {
+            iLo = iHi = sqlite3_value_int64(pVal);
+            break;
+        }
+        case SQLITE_FLOAT: {
+            double r = sqlite3_value_double(pVal);
+            if (r >= 9223372036854775807.0) {
+                iLo = iHi = LLONG_MAX;
+            } else if (r <= -9223372036854775808.0) {
+                iLo = iHi = LLONG_MIN;
+            } else {
+                iLo = (sqlite3_int64)floor(r);
+                iHi = (sqlite3_int64)ceil(r);
+            }
+            break;
+        }
+        default:
+            return;
+    }
+    if ((op & (VSV_IDX_EQ | VSV_IDX_GE | VSV_IDX_GT)) && iLo > *piMin) {
+        *piMin = (op & VSV_IDX_GT) && iLo < LLONG_MAX ? iLo + 1 : iLo;
+    }
+    if ((op & (VSV_IDX_EQ | VSV_IDX_LE | VSV_IDX_LT)) && iHi < *piMax) {
+        *piMax = (op & VSV_IDX_LT) && iHi > LLONG_MIN ? iHi - 1 : iHi;
+    }
+}
+
+// vsv_filter starts a scan from the first row that can satisfy
+// the rowid constraints, seeking to the nearest indexed row.
+static int vsv_filter(sqlite3_vtab_cursor* pVtabCursor,
+                      int idxNum,
+                      const char* idxStr,
+                      int argc,
+                      sqlite3_value** argv) {
+    VsvCursor* pCur = (VsvCursor*)pVtabCursor;
+    VsvTable* pTab = (VsvTable*)pVtabCursor->pVtab;
+    sqlite3_int64 iMin = 1;
+    sqlite3_int64 iMax = LLONG_MAX;
+    sqlite3_int64 iOffset, k;
+    int iArg = 0;
+    int rc;
+
+    if (pTab->zFilename) {
+        rc = cursor_check_file(pCur);
+        if (rc != SQLITE_OK) {
+            return rc;
+        }
+    }
+    if (idxNum & VSV_IDX_EQ) {
+        rowid_bound(argv[iArg++], VSV_IDX_EQ, &iMin, &iMax);
+    }
+    if (idxNum & (VSV_IDX_GE | VSV_IDX_GT)) {
+        rowid_bound(argv[iArg++], idxNum & (VSV_IDX_GE | VSV_IDX_GT), &iMin, &iMax);
+    }
+    if (idxNum & (VSV_IDX_LE | VSV_IDX_LT)) {
+        rowid_bound(argv[iArg++], idxNum & (VSV_IDX_LE | VSV_IDX_LT), &iMin, &iMax);
+    }
+    if (iMin < 1) {
+        iMin = 1;
+    }
+    pCur->iMax = iMax;
+    if (iMin > iMax || (pTab->bComplete && iMin > pTab->nRow)) {
+        pCur->iRowid = -1;
+        return SQLITE_OK;
+    }
+
+    k = (iMin - 1) / VSV_STRIDE;
+    if (k >= pTab->nOffset) {
+        k = pTab->nOffset - 1;
+    }
+    if (k < 0) {
+        iOffset = pTab->iStart;
+        pCur->iRowid = 0;
+    } else {
+        iOffset = pTab->aOffset[k];
+        pCur->iRowid = k * VSV_STRIDE;
+    }
+    if (vsv_reader_seek(&pCur->rdr, iOffset)) {
+        vsv_reader_errmsg(&pCur->rdr, "cannot seek in the input");
+        xfer_error(pTab, &pCur->rdr);
+        return SQLITE_ERROR;
+    }
+    while (pCur->iRowid + 1 < iMin) {
+        rc = cursor_read_row(pCur, 0);
+        if (rc != SQLITE_OK || pCur->iRowid < 0) {
+            return rc;
+        }
+    }
+    return vsv_next(pVtabCursor);
+}
+
+// vsv_best_index uses the rowid constraints to seek in the input.
+// The rows come in the rowid order, so ORDER BY rowid is free.
+static int vsv_best_index(sqlite3_vtab* tab, sqlite3_index_info* pIdxInfo) {
+    VsvTable* pTab = (VsvTable*)tab;
+    int iEq = -1, iLo = -1, iHi = -1;
+    int idxNum = 0;
+    int nArg = 0;
+    int i;
+
+    for (i = 0; i < pIdxInfo->nConstraint; i++) {
+        const struct sqlite3_index_constraint* pCons = &pIdxInfo->aConstraint[i];
+        if (!pCons->usable || pCons->iColumn >= 0) {
+            continue;
+        }
+        switch (pCons->op) {
+            case SQLITE_INDEX_CONSTRAINT_EQ:
+                if (iEq < 0) {
+                    iEq = i;
+                }
+                break;
+            case SQLITE_INDEX_CONSTRAINT_GE:
+            case SQLITE_INDEX_CONSTRAINT_GT:
+                if (iLo < 0) {
+                    iLo = i;
+                }
+                break;
+            case SQLITE_INDEX_CONSTRAINT_LE:
+            case SQLITE_INDEX_CONSTRAINT_LT:
+                if (iHi < 0) {
+                    iHi = i;
+                }
+                break;
+        }
+    }
+
+    if (iEq >= 0) {
+        idxNum = VSV_IDX_EQ;
+        pIdxInfo->aConstraintUsage[iEq].argvIndex = ++nArg;
+        pIdxInfo->estimatedCost = 10;
+        pIdxInfo->estimatedRows = 1;
+        pIdxInfo->idxFlags |= SQLITE_INDEX_SCAN_UNIQUE;
+    } else {
+        double cost = 1000000;
+        if (iLo >= 0) {
+            int op = pIdxInfo->aConstraint[iLo].op;
+            idxNum |= op == SQLITE_INDEX_CONSTRAINT_GT ? VSV_IDX_GT : VSV_IDX_GE;
+            pIdxInfo->aConstraintUsage[iLo].argvIndex = ++nArg;
+            cost /= 2;
+        }
+        if (iHi >= 0) {
+            int op = pIdxInfo->aConstraint[iHi].op;
+            idxNum |= op == SQLITE_INDEX_CONSTRAINT_LT ? VSV_IDX_LT : VSV_IDX_LE;
+            pIdxInfo->aConstraintUsage[iHi].argvIndex = ++nArg;
+            cost /= 2;
+        }
+        pIdxInfo->estimatedCost = cost;
+        if (pTab->bComplete && idxNum == 0) {
+            pIdxInfo->estimatedRows = pTab->nRow;
+        }
+    }
+    pIdxInfo->idxNum = idxNum;
+
+    if (pIdxInfo->nOrderBy == 1 && pIdxInfo->aOrderBy[0].iColumn < 0 &&
+        !pIdxInfo->aOrderBy[0].desc) {
+        pIdxInfo->orderByConsumed = 1;
+    }
+    return SQLITE_OK;
+}
+
+static sqlite3_module vsv_module = {
+    .xCreate = vsv_create,
+    .xConnect = vsv_connect,
+    .xBestIndex = vsv_best_index,
+    .xDisconnect = vsv_disconnect,
+    .xDestroy = vsv_disconnect,
+    .xOpen = vsv_open,
+    .xClose = vsv_close,
+    .xFilter = vsv_filter,
+    .xNext = vsv_next,
+    .xEof = vsv_eof,
+    .xColumn = vsv_column,
+    .xRowid = vsv_rowid,
+};
+
+int vsv_index_init(sqlite3* db) {
+    sqlite3_create_module(db, "vsv", &vsv_module, 0);
+    return SQLITE_OK;
+}
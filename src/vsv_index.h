@@ -0,0 +1,15 @@
+// Copyright (c) 2023 Anton Zhiyanov, MIT License
+// https://github.com/nalgeon/sqlean.py
+
+// Indexed reader for the vsv virtual table.
+
+#ifndef SQLEAN_VSV_INDEX_H
+#define SQLEAN_VSV_INDEX_H
+
+struct sqlite3;
+
+// vsv_index_init registers the vsv virtual table module
+// backed by the block reader and the row offset index.
+int vsv_index_init(struct sqlite3* db);
+
+#endif /* SQLEAN_VSV_INDEX_H */
@@ -0,0 +1,414 @@
+// Copyright (c) 2023 Anton Zhiyanov, MIT License
+// https://github.com/nalgeon/sqlean.py
+
+// VSV field reader, based on the vsv extension by Keith Medcalf
+// (Public Domain), as modified by Anton Zhiyanov for sqlean.
+// Reads the input in blocks (memory-mapped where available)
+// and copies unquoted field text a run at a time.
+
+#include <assert.h>
+#include <ctype.h>
+#include <limits.h>
+#include <stdarg.h>
+#include <stdint.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <sys/stat.h>
+#include <time.h>
+
+#if !defined(_WIN32)
+#include <sys/mman.h>
+#endif
+
+#include "sqlite3.h"
+
+#include "vsv_reader.h"
+
+#if defined(__GNUC__)
+#define VSV_NOINLINE __attribute__((noinline))
+#elif defined(_MSC_VER) && _MSC_VER >= 1310
+#define VSV_NOINLINE __declspec(noinline)
+#else
+#define VSV_NOINLINE
+#endif
+
+#if defined(_WIN32)
+#define vsv_fseek _fseeki64
+#else
+#define vsv_fseek fseeko
+#endif
+
+// size of the input block for files that are not memory-mapped
+#define VSV_BLOCKSZ 65536
+
+// files modified less than this many seconds ago are read in blocks:
+// one that is still being written may shrink while it is mapped, and
+// reading a mapped page past the end of the file kills the process
+#define VSV_MAP_MIN_AGE 2
+
+// vsv_reader_init initializes the reader.
+void vsv_reader_init(VsvReader* p, int fsep, int rsep, int dsep) {
+    memset(p, 0, sizeof(*p));
+    p->fsep = fsep;
+    p->rsep = rsep;
+    p->dsep = dsep;
+}
+
+// vsv_reader_reset closes the input and frees the reader's memory.
+void vsv_reader_reset(VsvReader* p) {
+#if !defined(_WIN32)
+    if (p->zMap) {
+        munmap(p->zMap, p->nMap);
+    }
+#endif
+    if (p->in) {
+        fclose(p->in);
+    }
+    sqlite3_free(p->zBuf);
+    sqlite3_free(p->z);
+    vsv_reader_init(p, p->fsep, p->rsep, p->dsep);
+}
+
+// vsv_reader_errmsg sets the reader's error message.
+void vsv_reader_errmsg(VsvReader* p, const char* zFormat, ...) {
+    va_list ap;
+    va_start(ap, zFormat);
+    sqlite3_vsnprintf(VSV_MXERR, p->zErr, zFormat, ap);
+    va_end(ap);
+}
+
+// vsv_reader_open opens the file, or uses the data if there is no file.
+// Returns the number of errors.
+int vsv_reader_open(VsvReader* p, const char* zFilename, const char* zData) {
+    if (zFilename == 0) {
+        p->zIn = (const unsigned char*)zData;
+        p->nIn = strlen(zData);
+        return 0;
+    }
+
+    FILE* in = fopen(zFilename, "rb");
+    if (in == 0) {
+        vsv_reader_errmsg(p, "cannot open '%s' for reading", zFilename);
+        return 1;
+    }
+
+#if !defined(_WIN32)
+    struct stat st;
+    if (fstat(fileno(in), &st) == 0 && S_ISREG(st.st_mode) && st.st_size > 0 &&
+        (sqlite3_uint64)st.st_size <= (sqlite3_uint64)SIZE_MAX &&
+        time(0) - st.st_mtime >= VSV_MAP_MIN_AGE) {
+        void* zMap = mmap(0, (size_t)st.st_size, PROT_READ, MAP_PRIVATE, fileno(in), 0);
+        if (zMap != MAP_FAILED) {
+#ifdef MADV_SEQUENTIAL
+            madvise(zMap, (size_t)st.st_size, MADV_SEQUENTIAL);
+#endif
+            fclose(in);
+            p->zMap = zMap;
+            p->nMap = (size_t)st.st_size;
+            p->zIn = p->zMap;
+            p->nIn = p->nMap;
+            return 0;
+        }
+    }
+#endif
+
+    // mapping is not available, read the file in blocks
+    p->zBuf = sqlite3_malloc(VSV_BLOCKSZ);
+    if (p->zBuf == 0) {
+        fclose(in);
+        vsv_reader_errmsg(p, "out of memory");
+        return 1;
+    }
+    p->in = in;
+    p->zIn = (const unsigned char*)p->zBuf;
+    return 0;
+}
+
+// vsv_reader_tell returns the offset of the next unread byte.
+sqlite3_int64 vsv_reader_tell(VsvReader* p) {
+    return p->iBase + (sqlite3_int64)p->iIn;
+}
+
+// vsv_reader_seek moves the reader to the offset.
+// Returns the number of errors.
+int vsv_reader_seek(VsvReader* p, sqlite3_int64 iOffset) {
+    if (p->in) {
+        if (vsv_fseek(p->in, iOffset, SEEK_SET) != 0) {
+            return 1;
+        }
+        p->iBase = iOffset;
+        p->iIn = 0;
+        p->nIn = 0;
+    } else {
+        if (iOffset < 0 || (sqlite3_uint64)iOffset > (sqlite3_uint64)p->nIn) {
+            return 1;
+        }
+        p->iIn = (size_t)iOffset;
+    }
+    // the byte order mark is only expected at the start of the input
+    p->bNotFirst = iOffset > 0;
+    return 0;
+}
+
+// reader_refill reads the next block of the file
+// and returns its first character, or EOF.
+static VSV_NOINLINE int reader_refill(VsvReader* p) {
+    assert(p->iIn >= p->nIn);
+    if (p->in == 0) {
+        return EOF;
+    }
+    p->iBase += (sqlite3_int64)p->nIn;
+    p->iIn = 0;
+    p->nIn = fread(p->zBuf, 1, VSV_BLOCKSZ, p->in);
+    if (p->nIn == 0) {
+        return EOF;
+    }
+    p->iIn = 1;
+    return p->zIn[0];
+}
+
+// reader_getc returns the next character of input, or EOF.
+static int reader_getc(VsvReader* p) {
+    if (p->iIn < p->nIn) {
+        return p->zIn[p->iIn++];
+    }
+    return reader_refill(p);
+}
+
+// reader_grow makes room for at least nNeed bytes in p->z.
+// Returns 0 on success and non-zero on OOM.
+static VSV_NOINLINE int reader_grow(VsvReader* p, sqlite3_int64 nNeed) {
+    sqlite3_int64 nNew = (sqlite3_int64)p->nAlloc * 2 + 100;
+    while (nNew < nNeed) {
+        nNew *= 2;
+    }
+    if (nNew > INT_MAX) {
+        nNew = INT_MAX;
+    }
+    char* zNew = nNeed <= nNew ? sqlite3_realloc64(p->z, nNew) : 0;
+    if (zNew == 0) {
+        vsv_reader_errmsg(p, "out of memory");
+        p->rc = SQLITE_NOMEM;
+        return 1;
+    }
+    p->z = zNew;
+    p->nAlloc = (int)nNew;
+    return 0;
+}
+
+// reader_append appends a character to p->z.
+// Returns 0 on success and non-zero on OOM.
+static int reader_append(VsvReader* p, char c) {
+    if (p->n >= p->nAlloc - 1 && reader_grow(p, (sqlite3_int64)p->n + 2)) {
+        return 1;
+    }
+    p->z[p->n++] = c;
+    return 0;
+}
+
+// reader_append_n appends n bytes to p->z.
+// Returns 0 on success and non-zero on OOM.
+static int reader_append_n(VsvReader* p, const unsigned char* z, size_t n) {
+    if ((sqlite3_int64)p->n + (sqlite3_int64)n >= p->nAlloc &&
+        reader_grow(p, (sqlite3_int64)p->n + (sqlite3_int64)n + 1)) {
+        return 1;
+    }
+    memcpy(p->z + p->n, z, n);
+    p->n += (int)n;
+    return 0;
+}
+
+// vsv_reader_read_field reads a single field of VSV text, compatible with
+// RFC 4180 and extended with custom separators. Stores the field in p->z
+// of length p->n and the character that terminated it in p->cTerm.
+//
+// Returns 0 at EOF (p->cTerm is EOF) or on OOM (p->rc is SQLITE_NOMEM).
+char* vsv_reader_read_field(VsvReader* p) {
+    int c;
+    p->notNull = 0;
+    p->n = 0;
+    c = reader_getc(p);
+    if (c == EOF) {
+        p->cTerm = EOF;
+        return 0;
+    }
+    if (c == '"') {
+        int pc, ppc;
+        int startLine = p->nLine;
+        p->notNull = 1;
+        pc = ppc = 0;
+        while (1) {
+            c = reader_getc(p);
+            if (c == '\n') {
+                p->nLine++;
+            }
+            if (c == '"' && pc == '"') {
+                pc = ppc;
+                ppc = 0;
+                continue;
+            }
+            if ((c == p->fsep && pc == '"') || (c == p->rsep && pc == '"') ||
+                (p->rsep == '\n' && c == '\n' && pc == '\r' && ppc == '"') ||
+                (c == EOF && pc == '"')) {
+                do {
+                    p->n--;
+                } while (p->z[p->n] != '"');
+                p->cTerm = c;
+                break;
+            }
+            if (pc == '"' && p->rsep == '\n' && c != '\r') {
+                vsv_reader_errmsg(p, "line %d: unescaped %c character", p->nLine, '"');
+                break;
+            }
+            if (c == EOF) {
+                vsv_reader_errmsg(p, "line %d: unterminated %c-quoted field\n", startLine, '"');
+                p->cTerm = c;
+                break;
+            }
+            if (reader_append(p, (char)c)) {
+                p->cTerm = EOF;
+                return 0;
+            }
+            ppc = pc;
+            pc = c;
+        }
+    } else {
+        // if this is the first field being parsed and it begins with
+        // the UTF-8 BOM (0xEF BB BF) then skip the BOM
+        if ((c & 0xff) == 0xef && p->bNotFirst == 0) {
+            reader_append(p, (char)c);
+            c = reader_getc(p);
+            if ((c & 0xff) == 0xbb) {
+                reader_append(p, (char)c);
+                c = reader_getc(p);
+                if ((c & 0xff) == 0xbf) {
+                    p->bNotFirst = 1;
+                    p->n = 0;
+                    return vsv_reader_read_field(p);
+                }
+            }
+        }
+        while (c != EOF && c != p->rsep && c != p->fsep) {
+            if (c == '\n') {
+                p->nLine++;
+            }
+            p->notNull = 1;
+            if (reader_append(p, (char)c)) {
+                p->cTerm = EOF;
+                return 0;
+            }
+            // copy the rest of the run straight from the input block
+            const unsigned char* zStart = p->zIn + p->iIn;
+            const unsigned char* zEnd = p->zIn + p->nIn;
+            const unsigned char* z = zStart;
+            while (z < zEnd && *z != p->fsep && *z != p->rsep && *z != '\n') {
+                z++;
+            }
+            if (z > zStart) {
+                if (reader_append_n(p, zStart, (size_t)(z - zStart))) {
+                    p->cTerm = EOF;
+                    return 0;
+                }
+                p->iIn += (size_t)(z - zStart);
+            }
+            c = reader_getc(p);
+        }
+        if (c == '\n') {
+            p->nLine++;
+        }
+        if (p->n > 0 && (p->rsep == '\n' || p->fsep == '\n') && p->z[p->n - 1] == '\r') {
+            p->n--;
+            if (p->n == 0) {
+                p->notNull = 0;
+            }
+        }
+        p->cTerm = c;
+    }
+    if (p->nAlloc == 0 && reader_grow(p, 1)) {
+        p->cTerm = EOF;
+        return 0;
+    }
+    p->z[p->n] = 0;
+    p->bNotFirst = 1;
+    return p->z;
+}
+
+// vsv_reader_skip_record reads the rest of the current record.
+void vsv_reader_skip_record(VsvReader* p) {
+    do {
+        if (vsv_reader_read_field(p) == 0) {
+            break;
+        }
+    } while (p->cTerm == p->fsep);
+}
+
+// vsv_number_type determines the type of the field:
+// 1 for an integer, 2 for a real, 0 for anything else.
+// Replaces the decimal separator with a point.
+int vsv_number_type(int dsep, char* arg) {
+    char* start;
+    char* stop;
+    int isValid = 0;
+    int hasDigit = 0;
+
+    start = arg;
+    stop = arg + strlen(arg) - 1;
+    while (start <= stop && *start == ' ') {
+        start++;
+    }
+    while (start <= stop && *stop == ' ') {
+        stop--;
+    }
+    if (start > stop) {
+        goto end;
+    }
+    if (start <= stop && (*start == '+' || *start == '-')) {
+        start++;
+    }
+    if (start <= stop && isdigit((unsigned char)*start)) {
+        hasDigit = 1;
+        isValid = 1;
+    }
+    while (start <= stop && isdigit((unsigned char)*start)) {
+        start++;
+    }
+    if (start <= stop && (unsigned char)*start == dsep) {
+        isValid = 2;
+        if (*start != '.') {
+            *start = '.';
+        }
+        start++;
+    }
+    if (start <= stop && isdigit((unsigned char)*start)) {
+        hasDigit = 1;
+    }
+    while (start <= stop && isdigit((unsigned char)*start)) {
+        start++;
+    }
+    if (!hasDigit) {
+        isValid = 0;
+        goto end;
+    }
+    if (start <= stop && (*start == 'e' || *start == 'E')) {
+        isValid = 3;
+        start++;
+    }
+    if (start <= stop && isValid == 3 && (*start == '+' || *start == '-')) {
+        start++;
+    }
+    if (start <= stop && isValid == 3 && isdigit((unsigned char)*start)) {
+        isValid = 2;
+    }
+    while (start <= stop && isdigit((unsigned char)*start)) {
+        start++;
+    }
+    if (isValid == 3) {
+        isValid = 0;
+    }
+end:
+    if (start <= stop) {
+        isValid = 0;
+    }
+    return isValid;
+}
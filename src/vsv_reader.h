@@ -0,0 +1,77 @@
+// Copyright (c) 2023 Anton Zhiyanov, MIT License
+// https://github.com/nalgeon/sqlean.py
+
+// VSV (CSV-like) field reader shared by the vsv virtual table
+// and Connection.import_csv().
+
+#ifndef SQLEAN_VSV_READER_H
+#define SQLEAN_VSV_READER_H
+
+#include <stddef.h>
+#include <stdio.h>
+
+#include "sqlite3.h"
+
+// max size of the error message in a reader
+#define VSV_MXERR 200
+
+// VsvReader reads fields from a file or from a string.
+typedef struct VsvReader {
+    FILE* in;                  // file, if it is read in blocks
+    char* zBuf;                // input block for the file
+    unsigned char* zMap;       // memory-mapped file
+    size_t nMap;               // size of the memory-mapped file
+    const unsigned char* zIn;  // input: block, mapped file or data
+    size_t nIn;                // number of bytes in zIn
+    size_t iIn;                // next unread byte in zIn
+    sqlite3_int64 iBase;       // offset of zIn[0] in the input
+    char* z;                   // accumulated text for a field
+    int n;                     // number of bytes in z
+    int nAlloc;                // space allocated for z
+    int nLine;                 // current line number
+    int bNotFirst;             // true if prior text has been seen
+    int cTerm;                 // character that terminated the most recent field
+    int fsep;                  // field separator
+    int rsep;                  // record separator
+    int dsep;                  // decimal separator
+    int notNull;               // true if the field has data
+    int rc;                    // SQLITE_NOMEM after an allocation failure
+    char zErr[VSV_MXERR];      // error message
+} VsvReader;
+
+// vsv_reader_init initializes the reader.
+void vsv_reader_init(VsvReader* p, int fsep, int rsep, int dsep);
+
+// vsv_reader_reset closes the input and frees the reader's memory.
+void vsv_reader_reset(VsvReader* p);
+
+// vsv_reader_errmsg sets the reader's error message.
+void vsv_reader_errmsg(VsvReader* p, const char* zFormat, ...);
+
+// vsv_reader_open opens the file, or uses the data if there is no file.
+// Returns the number of errors.
+int vsv_reader_open(VsvReader* p, const char* zFilename, const char* zData);
+
+// vsv_reader_tell returns the offset of the next unread byte.
+sqlite3_int64 vsv_reader_tell(VsvReader* p);
+
+// vsv_reader_seek moves the reader to the offset.
+// Returns the number of errors.
+int vsv_reader_seek(VsvReader* p, sqlite3_int64 iOffset);
+
+// vsv_reader_read_field reads a single field of VSV text, compatible with
+// RFC 4180 and extended with custom separators. Stores the field in p->z
+// of length p->n and the character that terminated it in p->cTerm.
+//
+// Returns 0 at EOF (p->cTerm is EOF) or on OOM (p->rc is SQLITE_NOMEM).
+char* vsv_reader_read_field(VsvReader* p);
+
+// vsv_reader_skip_record reads the rest of the current record.
+void vsv_reader_skip_record(VsvReader* p);
+
+// vsv_number_type determines the type of the field:
+// 1 for an integer, 2 for a real, 0 for anything else.
+// Replaces the decimal separator with a point.
+int vsv_number_type(int dsep, char* arg);
+
+#endif /* SQLEAN_VSV_READER_H */
@@ -8,6 +8,7 @@ from tests.extensions import suite as extensions_suite
 from tests.factory import suite as factory_suite
 from tests.hooks import suite as hooks_suite
 from tests.regression import suite as regression_suite
+from tests.session import suite as session_suite
 from tests.transactions import suite as transactions_suite
 from tests.ttypes import suite as types_suite
 from tests.userfunctions import suite as userfunctions_suite
@@ -22,6 +23,7 @@ def test(verbosity=1, failfast=False):
         factory_suite(),
         hooks_suite(),
         regression_suite(),
+        session_suite(),
         transactions_suite(),
         types_suite(),
         userfunctions_suite()))
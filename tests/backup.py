@@ -1,6 +1,9 @@
 from sqlean import dbapi2 as sqlite
+import os
 import unittest
 
+TESTFN = '/tmp/pysqlite3_backup_test'
+
 
 @unittest.skipIf(sqlite.sqlite_version_info < (3, 6, 11), "Backup API not supported")
 class BackupTests(unittest.TestCase):
@@ -168,11 +171,136 @@ class BackupTests(unittest.TestCase):
             self.cx.backup(bck, name='attached_db')
             self.verify_backup(bck)
 
+    def test_step_time(self):
+        self.cx.execute("CREATE TABLE big (data BLOB)")
+        self.cx.executemany("INSERT INTO big VALUES (zeroblob(4000))", [()] * 500)
+        self.cx.commit()
+        steps = []
+        with sqlite.connect(':memory:') as bck:
+            self.cx.backup(bck, step_time=0.001, progress=lambda *args: steps.append(args))
+            self.verify_backup(bck)
+            self.assertEqual(bck.execute("SELECT count(*) FROM big").fetchone(), (500,))
+        self.assertGreater(len(steps), 1)
+        self.assertEqual(steps[-1][1], 0)
+
+    def test_bad_step_time(self):
+        with sqlite.connect(':memory:') as bck:
+            with self.assertRaises(ValueError):
+                self.cx.backup(bck, step_time=-1)
+
+
+@unittest.skipIf(sqlite.sqlite_version_info < (3, 6, 11), "Backup API not supported")
+class AsyncBackupTests(unittest.TestCase):
+    def setUp(self):
+        self.cx = sqlite.connect(":memory:")
+        self.cx.execute("CREATE TABLE foo (data BLOB)")
+        self.cx.executemany("INSERT INTO foo VALUES (zeroblob(4000))", [()] * 500)
+        self.cx.commit()
+        self.bck = sqlite.connect(":memory:")
+
+    def tearDown(self):
+        self.bck.close()
+        self.cx.close()
+
+    def verify_backup(self):
+        result = self.bck.execute("SELECT count(*) FROM foo").fetchone()
+        self.assertEqual(result, (500,))
+
+    def test_steps(self):
+        backup = self.cx.backup_async(self.bck, pages=100)
+        self.assertEqual((backup.remaining, backup.pagecount), (-1, -1))
+        self.assertFalse(backup.step())
+        self.assertEqual(backup.pagecount - backup.remaining, 100)
+        while not backup.step():
+            pass
+        self.assertTrue(backup.done)
+        self.assertEqual(backup.remaining, 0)
+        self.verify_backup()
+
+    def test_step_pages(self):
+        backup = self.cx.backup_async(self.bck, pages=10)
+        backup.step(pages=50)
+        self.assertEqual(backup.pagecount - backup.remaining, 50)
+        self.assertTrue(backup.step(pages=-1))
+        self.verify_backup()
+
+    def test_adaptive(self):
+        backup = self.cx.backup_async(self.bck, step_time=10)
+        self.assertEqual(backup.pages, 64)
+        backup.step()
+        self.assertEqual(backup.pages, 128)
+        while not backup.step():
+            pass
+        self.verify_backup()
+
+    def test_restart(self):
+        path = TESTFN
+        src = sqlite.connect(path)
+        src.execute("CREATE TABLE foo (data BLOB)")
+        src.executemany("INSERT INTO foo VALUES (zeroblob(4000))", [()] * 500)
+        src.commit()
+        writer = sqlite.connect(path)
+        backup = src.backup_async(self.bck, pages=10)
+        backup.step()
+        writer.execute("INSERT INTO foo VALUES (zeroblob(4000))")
+        writer.commit()
+        while not backup.step():
+            pass
+        self.assertGreaterEqual(backup.restarts, 1)
+        self.assertEqual(self.bck.execute("SELECT count(*) FROM foo").fetchone(), (501,))
+        backup.finish()
+        writer.close()
+        src.close()
+        os.unlink(path)
+
+    def test_restart_wal(self):
+        path = TESTFN
+        self.addCleanup(lambda: [os.unlink(p) for p in (path, path + "-wal", path + "-shm")
+                                 if os.path.exists(p)])
+        src = sqlite.connect(path, isolation_level=None)
+        self.addCleanup(src.close)
+        src.execute("PRAGMA journal_mode = wal")
+        src.execute("CREATE TABLE foo (data BLOB)")
+        src.executemany("INSERT INTO foo VALUES (zeroblob(4000))", [()] * 5000)
+        writer = sqlite.connect(path, isolation_level=None)
+        self.addCleanup(writer.close)
+        backup = src.backup_async(self.bck, step_time=0.0001)
+        self.addCleanup(backup.finish)
+        self.assertEqual(backup.step_time, 0.0001)
+        for _ in range(10):
+            backup.step()
+            writer.execute("INSERT INTO foo VALUES (zeroblob(4000))")
+        self.assertGreaterEqual(backup.restarts, 5)
+        self.assertAlmostEqual(backup.step_time, 0.0016)
+
+    def test_finish(self):
+        with self.cx.backup_async(self.bck, pages=10) as backup:
+            backup.step()
+        with self.assertRaises(sqlite.ProgrammingError):
+            backup.step()
+        backup.finish()
+
+    def test_closed_source(self):
+        cx = sqlite.connect(":memory:")
+        backup = cx.backup_async(self.bck)
+        cx.close()
+        with self.assertRaises(sqlite.ProgrammingError):
+            backup.step()
+
+    def test_bad_arguments(self):
+        with self.assertRaises(TypeError):
+            self.cx.backup_async(None)
+        with self.assertRaises(ValueError):
+            self.cx.backup_async(self.cx)
+        with self.assertRaises(ValueError):
+            self.cx.backup_async(self.bck, step_time=-1)
+
 
 def suite():
     loader = unittest.TestLoader()
     tests = [loader.loadTestsFromTestCase(t) for t in (
-        BackupTests,)]
+        BackupTests,
+        AsyncBackupTests)]
     return unittest.TestSuite(tests)
 
 def test():
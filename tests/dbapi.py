@@ -21,9 +21,15 @@
 #    misrepresented as being the original software.
 # 3. This notice may not be removed or altered from any source distribution.
 
+import csv
+import ctypes
+import io
+import json
+import tempfile
 import threading
 import unittest
 from sqlean import dbapi2 as sqlite
+from sqlean.chunked import ChunkedBlob
 
 #from test.support import TESTFN, unlink
 TESTFN = '/tmp/pysqlite3_test'
@@ -439,6 +445,42 @@ class CursorTests(unittest.TestCase):
 
         self.assertEqual(len(res), 2)
 
+    def test_BufferThreshold(self):
+        self.assertEqual(self.cu.buffer_threshold, -1)
+        self.cu.execute("delete from test")
+        self.cu.execute("insert into test(name, income) values (?, ?)", ("\u0436" * 100, b"x" * 200))
+        self.cu.execute("insert into test(name, income) values (?, ?)", ("short", b"y"))
+        self.cu.buffer_threshold = 100
+        rows = self.cu.execute("select name, income, id from test order by id").fetchall()
+        name, income, _ = rows[0]
+        self.assertIsInstance(name, memoryview)
+        self.assertTrue(name.readonly)
+        self.assertEqual(bytes(name).decode(), "\u0436" * 100)
+        self.assertIsInstance(income, memoryview)
+        self.assertEqual(income, b"x" * 200)
+        self.assertEqual(rows[1], ("short", b"y", 2))
+
+    def test_BufferThresholdTextFactory(self):
+        self.cu.execute("delete from test")
+        self.cu.execute("insert into test(name, income) values (?, ?)", ("x" * 200, b"y" * 200))
+        self.cu.buffer_threshold = 100
+        try:
+            for factory, expected in ((bytes, b"x" * 200), (lambda b: b.decode().upper(), "X" * 200)):
+                self.cx.text_factory = factory
+                name, income = self.cu.execute("select name, income from test").fetchone()
+                self.assertEqual(name, expected)
+                self.assertIsInstance(income, memoryview)
+        finally:
+            self.cx.text_factory = str
+
+    def test_BufferThresholdReuse(self):
+        self.cu.execute("delete from test")
+        self.cu.executemany("insert into test(name) values (?)",
+                            [(str(i) * 100000,) for i in range(10)])
+        self.cu.buffer_threshold = 0
+        values = [bytes(value) for (value,) in self.cu.execute("select name from test order by id")]
+        self.assertEqual(values, [(str(i) * 100000).encode() for i in range(10)])
+
     def test_Fetchmany(self):
         self.cu.execute("select name from test")
         res = self.cu.fetchmany(100)
@@ -690,6 +732,107 @@ class BlobTests(unittest.TestCase):
         with self.assertRaises(SystemError):
             b"aaaaa" in self.blob
 
+    def test_BlobGetItemIgnoresOffset(self):
+        self.blob.write(b"bcdef")
+        self.blob.seek(1)
+        self.assertEqual(self.blob[3], b"e")
+        self.assertEqual(self.blob.tell(), 1)
+
+    def test_BlobReadInto(self):
+        buf = bytearray(10)
+        self.blob.seek(95)
+        self.assertEqual(self.blob.readinto(buf), 5)
+        self.assertEqual(buf, b"a" * 5 + b"\0" * 5)
+        self.assertEqual(self.blob.tell(), 100)
+        self.assertEqual(self.blob.readinto(buf), 0)
+
+    def test_BlobReadIntoMemoryview(self):
+        self.blob.write(b"bcdef")
+        self.blob.seek(0)
+        buf = bytearray(b"x" * 10)
+        self.assertEqual(self.blob.readinto(memoryview(buf)[2:5]), 3)
+        self.assertEqual(buf, b"xxbcdxxxxx")
+
+    def test_BlobReadIntoReadOnlyBuffer(self):
+        with self.assertRaises(TypeError):
+            self.blob.readinto(b"0123456789")
+
+    def test_BlobIterChunks(self):
+        self.blob.write(bytes(range(100)))
+        self.blob.seek(10)
+        chunks = [bytes(chunk) for chunk in self.blob.iter_chunks(40)]
+        self.assertEqual([len(chunk) for chunk in chunks], [40, 40, 10])
+        self.assertEqual(b"".join(chunks), bytes(range(10, 100)))
+        self.assertEqual(self.blob.tell(), 100)
+
+    def test_BlobIterChunksReleased(self):
+        self.blob.write(bytes(range(100)))
+        self.blob.seek(0)
+        chunks = self.blob.iter_chunks(50)
+        first = next(chunks)
+        self.assertEqual(first[0], 0)
+        second = next(chunks)
+        self.assertEqual(second[0], 50)
+        with self.assertRaises(ValueError):
+            first[0]
+        with self.assertRaises(StopIteration):
+            next(chunks)
+        with self.assertRaises(ValueError):
+            second[0]
+
+    def test_BlobIterChunksExported(self):
+        self.blob.write(bytes(range(100)))
+        self.blob.seek(0)
+        chunks = self.blob.iter_chunks(40)
+        kept = (ctypes.c_char * 40).from_buffer(next(chunks))
+        cast = next(chunks).cast("B")
+        third = next(chunks)
+        self.assertEqual(kept.raw[:3], bytes([0, 1, 2]))
+        self.assertEqual(cast[:3].tolist(), [40, 41, 42])
+        self.assertEqual(third.tobytes(), bytes(range(80, 100)))
+
+    def test_BlobIterChunksBadSize(self):
+        with self.assertRaises(ValueError):
+            self.blob.iter_chunks(0)
+
+    def test_BlobSendfile(self):
+        self.blob.write(bytes(range(100)))
+        self.blob.seek(20)
+        with tempfile.TemporaryFile() as f:
+            self.assertEqual(self.blob.sendfile(f, count=30), 30)
+            self.assertEqual(self.blob.tell(), 50)
+            self.assertEqual(self.blob.sendfile(f.fileno()), 50)
+            self.assertEqual(self.blob.sendfile(f), 0)
+            f.seek(0)
+            self.assertEqual(f.read(), bytes(range(20, 100)))
+
+    def test_BlobSendfileBadFile(self):
+        with self.assertRaises(TypeError):
+            self.blob.sendfile("file.txt")
+
+    def test_BlobReopen(self):
+        self.cx.execute("insert into test(blob_col) values (?)", (b"xyz", ))
+        self.blob.seek(50)
+        self.blob.reopen(2)
+        self.assertEqual(len(self.blob), 3)
+        self.assertEqual(self.blob.tell(), 0)
+        self.assertEqual(self.blob.read(), b"xyz")
+        self.blob.reopen(1)
+        self.assertEqual(self.blob.read(), self.blob_data)
+
+    def test_BlobReopenBadRow(self):
+        with self.assertRaises(sqlite.OperationalError):
+            self.blob.reopen(100)
+        with self.assertRaises(sqlite.OperationalError):
+            self.blob.read()
+
+    def test_BlobSeekLargeOffset(self):
+        with self.assertRaises(ValueError):
+            self.blob.seek(2**40)
+        with self.assertRaises(ValueError):
+            self.blob.seek(2**62, 1)
+        self.assertEqual(self.blob.read(2**40), self.blob_data)
+
 @unittest.skipUnless(threading, 'This test requires threading.')
 class ThreadTests(unittest.TestCase):
     def setUp(self):
@@ -922,6 +1065,95 @@ class ExtensionTests(unittest.TestCase):
         result = con.execute("select foo from test").fetchone()[0]
         self.assertEqual(result, 5, "Basic test of Connection.executescript")
 
+    def test_ScriptNoCommit(self):
+        con = sqlite.connect(":memory:")
+        con.execute("create table test(foo)")
+        con.execute("insert into test(foo) values (1)")
+        con.executescript("insert into test(foo) values (2);", commit=False)
+        self.assertTrue(con.in_transaction)
+        con.rollback()
+        self.assertEqual(con.execute("select count(*) from test").fetchone()[0], 0)
+
+    def test_ScriptTransaction(self):
+        con = sqlite.connect(":memory:", isolation_level=None)
+        con.execute("create table test(foo)")
+        with self.assertRaises(sqlite.OperationalError):
+            con.executescript("insert into test values (1); insert into nope values (2);",
+                              transaction=True)
+        self.assertFalse(con.in_transaction)
+        self.assertEqual(con.execute("select count(*) from test").fetchone()[0], 0)
+        con.executescript("insert into test values (1); insert into test values (2);",
+                          transaction=True)
+        self.assertFalse(con.in_transaction)
+        self.assertEqual(con.execute("select count(*) from test").fetchone()[0], 2)
+
+    def test_ScriptCached(self):
+        con = sqlite.connect(":memory:")
+        script = """
+            -- a comment; with a semicolon
+            create table if not exists test(foo, bar);
+            create table if not exists log(foo);
+            create trigger if not exists test_log after insert on test begin
+                insert into log values (new.foo);
+            end;
+            insert into test values (1, 'a;b'); /* c; d */
+            select * from test
+            """
+        con.executescript(script, cached=True)
+        con.executescript(script, cached=True)
+        self.assertEqual(con.execute("select * from test").fetchall(),
+                         [(1, "a;b"), (1, "a;b")])
+        self.assertEqual(con.execute("select * from log").fetchall(), [(1,), (1,)])
+
+    def test_ScriptCachedSyntaxError(self):
+        con = sqlite.connect(":memory:")
+        with self.assertRaises(sqlite.OperationalError):
+            con.executescript("create table test(x); asdf; create table test2(x)", cached=True)
+
+    def test_ExecuteBatch(self):
+        con = sqlite.connect(":memory:")
+        con.execute("create table test(foo, bar)")
+        cur = con.executebatch([
+            ("insert into test values (?, ?)", (1, "a")),
+            ("insert into test values (:foo, :bar)", {"foo": 2, "bar": "b"}),
+            "insert into test values (3, 'c')",
+            ("update test set bar = ? where foo > ?", ["x", 1]),
+            ("select * from test", ()),
+        ])
+        self.assertEqual(cur.rowcount, 5)
+        self.assertEqual(cur.lastrowid, 3)
+        self.assertFalse(con.in_transaction)
+        self.assertEqual(con.execute("select * from test").fetchall(),
+                         [(1, "a"), (2, "x"), (3, "x")])
+
+    def test_ExecuteBatchRollback(self):
+        con = sqlite.connect(":memory:")
+        con.execute("create table test(foo)")
+        with self.assertRaises(sqlite.IntegrityError):
+            con.executebatch([
+                ("insert into test values (?)", (1,)),
+                ("insert into test values (?)", (None,)),
+                "create table other(foo not null)",
+                ("insert into other values (?)", (None,)),
+            ])
+        self.assertFalse(con.in_transaction)
+        self.assertEqual(con.execute("select count(*) from test").fetchone()[0], 0)
+
+    def test_ExecuteBatchWithoutTransaction(self):
+        con = sqlite.connect(":memory:", isolation_level=None)
+        con.execute("create table test(foo unique)")
+        with self.assertRaises(sqlite.IntegrityError):
+            con.executebatch([("insert into test values (?)", (i % 2,)) for i in range(3)],
+                             transaction=False)
+        self.assertEqual(con.execute("select count(*) from test").fetchone()[0], 2)
+
+    def test_ExecuteBatchBadItem(self):
+        con = sqlite.connect(":memory:")
+        with self.assertRaises(TypeError):
+            con.executebatch([("select ?",)])
+        with self.assertRaises(sqlite.ProgrammingError):
+            con.executebatch([("select ?", ())])
+
 class ClosedConTests(unittest.TestCase):
     def test_ClosedConCursor(self):
         con = sqlite.connect(":memory:")
@@ -1198,6 +1430,1004 @@ class BlobContextManagerTests(unittest.TestCase):
             blob.close()
 
 
+class ChunkedBlobTests(unittest.TestCase):
+    def setUp(self):
+        self.cx = sqlite.connect(":memory:")
+        self.data = bytes(range(256)) * 40
+
+    def tearDown(self):
+        self.cx.close()
+
+    def write(self, data, mode="w", chunk_size=1000):
+        with ChunkedBlob(self.cx, "objects", "key", mode=mode, chunk_size=chunk_size) as f:
+            f.write(data)
+
+    def test_write_read(self):
+        self.write(self.data)
+        rows = self.cx.execute("select seq, length(data) from objects order by seq").fetchall()
+        self.assertEqual(rows, [(i, 1000) for i in range(10)] + [(10, 240)])
+        with ChunkedBlob(self.cx, "objects", "key") as f:
+            self.assertEqual(len(f), len(self.data))
+            self.assertEqual(f.read(), self.data)
+
+    def test_stream_append(self):
+        with ChunkedBlob(self.cx, "objects", "key", mode="w", chunk_size=1000) as f:
+            for i in range(0, len(self.data), 300):
+                f.write(self.data[i:i + 300])
+        self.write(b"tail", mode="a", chunk_size=10)
+        with ChunkedBlob(self.cx, "objects", "key") as f:
+            self.assertEqual(f.chunk_size, 1000)
+            self.assertEqual(f.read(), self.data + b"tail")
+
+    def test_append_single_row(self):
+        self.write(b"01234567", chunk_size=10)
+        with ChunkedBlob(self.cx, "objects", "key", mode="a", chunk_size=4) as f:
+            self.assertEqual(len(f), 8)
+            f.write(b"89abcde")
+            self.assertEqual(len(f), 15)
+        rows = self.cx.execute("select length(data) from objects order by seq").fetchall()
+        self.assertEqual(rows, [(4,), (4,), (4,), (3,)])
+        with ChunkedBlob(self.cx, "objects", "key") as f:
+            self.assertEqual(len(f), 15)
+            self.assertEqual(f.read(), b"0123456789abcde")
+
+    def test_read_single_row(self):
+        self.write(b"01234567", chunk_size=10)
+        with ChunkedBlob(self.cx, "objects", "key", chunk_size=3) as f:
+            f.seek(5)
+            self.assertEqual(f.read(), b"567")
+
+    def test_replace(self):
+        self.write(self.data)
+        self.write(b"short")
+        with ChunkedBlob(self.cx, "objects", "key") as f:
+            self.assertEqual(f.read(), b"short")
+
+    def test_random_access(self):
+        self.write(self.data)
+        with ChunkedBlob(self.cx, "objects", "key") as f:
+            self.assertEqual(f.seek(995), 995)
+            self.assertEqual(f.read(10), self.data[995:1005])
+            f.seek(-20, io.SEEK_END)
+            self.assertEqual(f.read(), self.data[-20:])
+            f.seek(3500)
+            buf = bytearray(2000)
+            self.assertEqual(f.readinto(buf), 2000)
+            self.assertEqual(buf, self.data[3500:5500])
+            f.seek(2**40)
+            self.assertEqual(f.read(10), b"")
+
+    def test_buffered_reader(self):
+        self.write(self.data)
+        with io.BufferedReader(ChunkedBlob(self.cx, "objects", "key")) as f:
+            self.assertEqual(b"".join(iter(lambda: f.read(333), b"")), self.data)
+
+    def test_missing_key(self):
+        with ChunkedBlob(self.cx, "objects", "key", mode="w") as f:
+            pass
+        with ChunkedBlob(self.cx, "objects", "other") as f:
+            self.assertEqual(f.read(), b"")
+
+    def test_modes(self):
+        self.write(self.data)
+        with ChunkedBlob(self.cx, "objects", "key") as f:
+            with self.assertRaises(io.UnsupportedOperation):
+                f.write(b"data")
+        with ChunkedBlob(self.cx, "objects", "key", mode="a") as f:
+            with self.assertRaises(io.UnsupportedOperation):
+                f.read()
+            with self.assertRaises(io.UnsupportedOperation):
+                f.seek(0)
+        with self.assertRaises(ValueError):
+            ChunkedBlob(self.cx, "objects", "key", mode="x")
+
+
+class ImportCsvTests(unittest.TestCase):
+    def setUp(self):
+        self.cx = sqlite.connect(":memory:")
+        self.path = TESTFN + ".csv"
+        self.write("id,name,score\n" + "".join(
+            '%d,"name %d",%s\n' % (i, i, i / 4) for i in range(1, 1001)))
+
+    def tearDown(self):
+        self.cx.close()
+        unlink(self.path)
+
+    def write(self, text):
+        with open(self.path, "w", newline="") as f:
+            f.write(text)
+
+    def test_import_creates_table(self):
+        n = self.cx.import_csv(self.path, "t")
+        self.assertEqual(n, 1000)
+        names = [row[1] for row in self.cx.execute("pragma table_info(t)")]
+        self.assertEqual(names, ["id", "name", "score"])
+        row = self.cx.execute("select * from t where rowid = 3").fetchone()
+        self.assertEqual(row, ("3", "name 3", "0.75"))
+        self.assertFalse(self.cx.in_transaction)
+
+    def test_import_types(self):
+        self.cx.import_csv(self.path, "t", types=("integer", "text", "real"))
+        row = self.cx.execute("select id, name, score from t where id = 2").fetchone()
+        self.assertEqual(row, (2, "name 2", 0.5))
+        self.assertEqual(self.cx.execute("select sum(id) from t").fetchone(), (500500,))
+
+    def test_import_existing_table(self):
+        self.cx.execute("create table t(id integer primary key, name, score real)")
+        self.cx.import_csv(self.path, "t")
+        row = self.cx.execute("select id, score from t where id = 1000").fetchone()
+        self.assertEqual(row, (1000, 250.0))
+
+    def test_import_columns(self):
+        self.write("1;a\n2;b\n\n3\n")
+        self.cx.import_csv(self.path, "t", header=False, columns=["x", "y"],
+                           types=["integer", "text"], delimiter=";")
+        rows = self.cx.execute("select x, y from t").fetchall()
+        self.assertEqual(rows, [(1, "a"), (2, "b"), (3, None)])
+
+    def test_import_no_header(self):
+        self.write("1,2\n3,4\n")
+        self.cx.import_csv(self.path, "t", header=False, types=["integer", "integer"])
+        self.assertEqual(self.cx.execute("select c1, c2 from t").fetchall(), [(1, 2), (3, 4)])
+
+    def test_import_schema(self):
+        self.cx.execute("attach ':memory:' as aux")
+        self.cx.import_csv(self.path, "aux.t")
+        self.assertEqual(self.cx.execute("select count(*) from aux.t").fetchone(), (1000,))
+        self.cx.execute("create table aux.u(id integer, name, score)")
+        self.cx.import_csv(self.path, "aux.u")
+        self.assertEqual(self.cx.execute("select sum(id) from aux.u").fetchone(), (500500,))
+        self.assertIsNone(self.cx.execute("select name from main.sqlite_master").fetchone())
+
+    def test_import_one_column_blank_lines(self):
+        self.write("x\na\n\nb\n\n")
+        self.cx.import_csv(self.path, "t")
+        self.assertEqual(self.cx.execute("select x from t").fetchall(), [("a",), ("",), ("b",), ("",)])
+
+    def test_import_progress(self):
+        progress = []
+        n = self.cx.import_csv(self.path, "t", batch_rows=300, progress=progress.append)
+        self.assertEqual(n, 1000)
+        self.assertEqual(progress, [300, 600, 900, 1000])
+
+    def test_import_in_transaction(self):
+        self.cx.execute("create table t(id, name, score)")
+        self.cx.execute("insert into t values (0, '', 0)")
+        self.cx.import_csv(self.path, "t", batch_rows=100)
+        self.assertTrue(self.cx.in_transaction)
+        self.cx.rollback()
+        self.assertEqual(self.cx.execute("select count(*) from t").fetchone(), (0,))
+
+    def test_import_parse_error_late(self):
+        self.write("a,b\n" + "".join("%d,%d\n" % (i, i) for i in range(1000)) + "3,\"4\n")
+        progress = []
+        with self.assertRaises(sqlite.DataError):
+            self.cx.import_csv(self.path, "t", batch_rows=100, progress=progress.append)
+        self.assertEqual(progress[-1], 1000)
+        self.assertFalse(self.cx.in_transaction)
+        self.assertIsNone(self.cx.execute("select name from sqlite_master where name = 't'").fetchone())
+
+    def test_import_parse_error_in_transaction(self):
+        self.write("a,b\n" + "".join("%d,%d\n" % (i, i) for i in range(1000)) + "3,\"4\n")
+        self.cx.execute("create table t(a, b)")
+        self.cx.execute("insert into t values (0, 0)")
+        with self.assertRaises(sqlite.DataError):
+            self.cx.import_csv(self.path, "t", batch_rows=100)
+        self.assertTrue(self.cx.in_transaction)
+        self.assertEqual(self.cx.execute("select count(*) from t").fetchone(), (1,))
+
+    def test_import_parse_error(self):
+        self.write("a,b\n1,2\n3,\"4\n")
+        self.cx.execute("create table t(a, b)")
+        with self.assertRaises(sqlite.DataError):
+            self.cx.import_csv(self.path, "t")
+        self.assertFalse(self.cx.in_transaction)
+        self.assertEqual(self.cx.execute("select count(*) from t").fetchone(), (0,))
+
+    def test_import_bad_types(self):
+        with self.assertRaises(ValueError):
+            self.cx.import_csv(self.path, "t", types=["integer"])
+        with self.assertRaises(ValueError):
+            self.cx.import_csv(self.path, "t", types=["integer", "text", "date"])
+
+    def test_import_missing_file(self):
+        with self.assertRaises(sqlite.OperationalError):
+            self.cx.import_csv(TESTFN + ".missing", "t")
+
+
+class PreparedStatementTests(unittest.TestCase):
+    def setUp(self):
+        self.cx = sqlite.connect(":memory:")
+        self.cx.execute("create table test(id integer primary key, name)")
+
+    def tearDown(self):
+        self.cx.close()
+
+    def test_execute(self):
+        insert = self.cx.prepare("insert into test(name) values (?)")
+        cur = insert.execute(("foo",))
+        self.assertEqual(cur.rowcount, 1)
+        self.assertEqual(cur.lastrowid, 1)
+        self.assertTrue(self.cx.in_transaction)
+        select = self.cx.prepare("select name from test where id = :id")
+        self.assertEqual(select.execute({"id": 1}).fetchall(), [("foo",)])
+        self.assertEqual(select.execute({"id": 2}).fetchall(), [])
+
+    def test_executemany(self):
+        insert = self.cx.prepare("insert into test(name) values (?)")
+        cur = insert.executemany([("a",), ("b",), ("c",)])
+        self.assertEqual(cur.rowcount, 3)
+        count = self.cx.prepare("select count(*) from test")
+        self.assertEqual(count.execute().fetchone(), (3,))
+
+    def test_overlapping_cursors(self):
+        self.cx.executemany("insert into test(name) values (?)", [("a",), ("b",), ("c",)])
+        select = self.cx.prepare("select name from test where id >= ? order by id")
+        cur1 = select.execute((1,))
+        self.assertEqual(cur1.fetchone(), ("a",))
+        cur2 = select.execute((3,))
+        self.assertEqual(cur2.fetchall(), [("c",)])
+        self.assertEqual(cur1.fetchall(), [("b",), ("c",)])
+
+    def test_attributes(self):
+        sql = "select id, name as n from test where id = :id and name = ?2"
+        select = self.cx.prepare(sql)
+        self.assertEqual(select.sql, sql)
+        self.assertTrue(select.readonly)
+        self.assertEqual(select.column_names, ("id", "n"))
+        self.assertEqual(select.bind_parameter_names, ("id", "2"))
+        insert = self.cx.prepare("insert into test(name) values (?)")
+        self.assertFalse(insert.readonly)
+        self.assertEqual(insert.column_names, ())
+        self.assertEqual(insert.bind_parameter_names, (None,))
+
+    def test_explain(self):
+        plan = self.cx.prepare("select * from test where id = ?").explain()
+        self.assertEqual(len(plan), 1)
+        self.assertIn("USING INTEGER PRIMARY KEY", plan[0][2])
+
+    def test_invalid(self):
+        with self.assertRaises(sqlite.OperationalError):
+            self.cx.prepare("select * from nowhere")
+        with self.assertRaises(sqlite.ProgrammingError):
+            self.cx.prepare("  -- nothing")
+        with self.assertRaises(sqlite.Warning):
+            self.cx.prepare("select 1; select 2")
+
+    def test_closed_connection(self):
+        select = self.cx.prepare("select 1")
+        self.cx.close()
+        with self.assertRaises(sqlite.ProgrammingError):
+            select.execute()
+        with self.assertRaises(sqlite.ProgrammingError):
+            select.column_names
+        self.assertEqual(select.sql, "select 1")
+
+
+class ConnectionFetchTests(unittest.TestCase):
+    def setUp(self):
+        self.cx = sqlite.connect(":memory:")
+        self.cx.execute("create table test(id integer primary key, name)")
+        self.cx.executemany("insert into test(name) values (?)", [("a",), ("b",), ("c",)])
+        self.cx.commit()
+
+    def tearDown(self):
+        self.cx.close()
+
+    def test_fetchone(self):
+        self.assertEqual(self.cx.fetchone("select id, name from test where id = ?", (2,)), (2, "b"))
+        self.assertEqual(self.cx.fetchone("select name from test order by id"), ("a",))
+        self.assertIsNone(self.cx.fetchone("select name from test where id = 4"))
+
+    def test_fetchall(self):
+        self.assertEqual(self.cx.fetchall("select name from test where id > :id", {"id": 1}),
+                         [("b",), ("c",)])
+        self.assertEqual(self.cx.fetchall("select name from test where id = 4"), [])
+
+    def test_fetchval(self):
+        self.assertEqual(self.cx.fetchval("select count(*) from test"), 3)
+        self.assertEqual(self.cx.fetchval("select name, id from test where id = ?", (3,)), "c")
+        self.assertIsNone(self.cx.fetchval("select name from test where id = 4"))
+        self.assertIsNone(self.cx.fetchval("select null"))
+
+    def test_row_factory(self):
+        self.cx.row_factory = sqlite.Row
+        row = self.cx.fetchone("select id, name from test where id = 1")
+        self.assertEqual(row["name"], "a")
+        self.assertEqual(self.cx.fetchall("select name from test")[2].keys(), ["name"])
+        self.assertEqual(self.cx.fetchval("select name from test where id = 2"), "b")
+        self.cx.row_factory = None
+        self.assertEqual(self.cx.fetchone("select id from test where id = 1"), (1,))
+
+    def test_row_factory_keeps_cursor(self):
+        cursors = []
+
+        def factory(cursor, row):
+            cursors.append(cursor)
+            return row
+
+        cx = sqlite.connect(":memory:")
+        cx.row_factory = factory
+        cx.fetchone("select 1")
+        cx.fetchall("select 2")
+        self.assertIsNot(cursors[0], cursors[1])
+        del cx
+        cursor = cursors[0]
+        self.assertEqual(cursor.execute("select 3").fetchone(), (3,))
+        cursor.connection.close()
+        with self.assertRaises(sqlite.ProgrammingError):
+            cursor.execute("select 4")
+
+    def test_converters(self):
+        cx = sqlite.connect(":memory:", detect_types=sqlite.PARSE_COLNAMES)
+        cx.create_function("upper", 1, str.upper)
+        sqlite.converters["UPPER"] = lambda b: b.decode().upper()
+        try:
+            self.assertEqual(cx.fetchval('select \'abc\' as "x [upper]"'), "ABC")
+        finally:
+            del sqlite.converters["UPPER"]
+            cx.close()
+
+    def test_dml(self):
+        self.assertEqual(self.cx.fetchone("insert into test(name) values ('d') returning id"), (4,))
+        self.assertTrue(self.cx.in_transaction)
+        self.cx.rollback()
+        self.assertEqual(self.cx.fetchval("select count(*) from test"), 3)
+
+    def test_recursive(self):
+        # a query run from a user function while the shared cursor is busy
+        self.cx.create_function("name_of", 1,
+                                lambda i: self.cx.fetchval("select name from test where id = ?", (i,)))
+        self.assertEqual(self.cx.fetchall("select name_of(id) from test"), [("a",), ("b",), ("c",)])
+        self.assertEqual(self.cx.fetchval("select name_of(2)"), "b")
+
+    def test_cursors_unaffected(self):
+        cur = self.cx.execute("select name from test order by id")
+        self.assertEqual(cur.fetchone(), ("a",))
+        self.assertEqual(self.cx.fetchval("select name from test where id = 3"), "c")
+        self.assertEqual(cur.fetchall(), [("b",), ("c",)])
+
+    def test_errors(self):
+        with self.assertRaises(sqlite.OperationalError):
+            self.cx.fetchone("select * from nowhere")
+        with self.assertRaises(sqlite.ProgrammingError):
+            self.cx.fetchone("select ?", (1, 2))
+        with self.assertRaises(TypeError):
+            self.cx.fetchall(42)
+        self.assertEqual(self.cx.fetchval("select 1"), 1)
+
+    def test_closed_connection(self):
+        self.cx.close()
+        with self.assertRaises(sqlite.ProgrammingError):
+            self.cx.fetchone("select 1")
+
+    @unittest.skipUnless(threading, 'This test requires threading.')
+    def test_other_thread(self):
+        errors = []
+        def run():
+            try:
+                self.cx.fetchval("select 1")
+            except sqlite.ProgrammingError:
+                errors.append(None)
+        t = threading.Thread(target=run)
+        t.start()
+        t.join()
+        self.assertEqual(errors, [None])
+
+
+class PrefetchTests(unittest.TestCase):
+    def setUp(self):
+        self.cx = sqlite.connect(":memory:")
+        self.cx.execute("create table test(i, t, f, b)")
+        self.rows = [(i, "text %d" % i, i / 2, b"\x00" * (i % 5)) for i in range(1000)]
+        self.cx.executemany("insert into test values (?, ?, ?, ?)", self.rows)
+        self.cx.execute("insert into test values (null, '', null, null)")
+        self.rows.append((None, "", None, None))
+        self.cx.commit()
+
+    def tearDown(self):
+        self.cx.close()
+
+    def test_prefetch(self):
+        for size in (1, 2, 7, 256, 5000):
+            cur = self.cx.execute("select * from test order by rowid")
+            self.assertIs(cur.prefetch(size), cur)
+            self.assertEqual(cur.fetchall(), self.rows)
+
+    def test_fetch_methods(self):
+        cur = self.cx.execute("select i from test order by rowid").prefetch(8)
+        self.assertEqual(cur.fetchone(), (0,))
+        self.assertEqual(cur.fetchmany(3), [(1,), (2,), (3,)])
+        self.assertEqual(len(list(cur)), 997)
+        self.assertIsNone(cur.fetchone())
+
+    def test_execute_again(self):
+        cur = self.cx.execute("select i from test").prefetch(4)
+        cur.fetchone()
+        cur.execute("select count(*) from test")
+        self.assertEqual(cur.fetchone(), (1001,))
+
+    def test_close(self):
+        cur = self.cx.execute("select i from test").prefetch(4)
+        cur.close()
+        cur = self.cx.execute("select i from test").prefetch(4)
+        self.cx.close()
+
+    def test_row_factory_keeps_cursor(self):
+        cursors = []
+
+        def factory(cursor, row):
+            cursors.append(cursor)
+            return row
+
+        cx = sqlite.connect(":memory:")
+        cx.row_factory = factory
+        cx.fetchone("select 1")
+        cx.fetchall("select 2")
+        self.assertIsNot(cursors[0], cursors[1])
+        del cx
+        cursor = cursors[0]
+        self.assertEqual(cursor.execute("select 3").fetchone(), (3,))
+        cursor.connection.close()
+        with self.assertRaises(sqlite.ProgrammingError):
+            cursor.execute("select 4")
+
+    def test_converters(self):
+        cx = sqlite.connect(":memory:", detect_types=sqlite.PARSE_COLNAMES)
+        self.addCleanup(cx.close)
+        cx.text_factory = bytes
+        cx.execute("create table test(x)")
+        cx.executemany("insert into test values (?)", [(1,), (None,), ("a",)])
+        query = 'select x as "x [bracket]", x from test order by rowid'
+        sqlite.register_converter("bracket", lambda b: b"[" + b + b"]")
+        self.addCleanup(sqlite.converters.pop, "BRACKET")
+        expected = cx.execute(query).fetchall()
+        self.assertEqual(expected, [(b"[1]", 1), (None, None), (b"[a]", b"a")])
+        self.assertEqual(cx.execute(query).prefetch(2).fetchall(), expected)
+
+    def test_error(self):
+        def check(x):
+            if x == 500:
+                raise ValueError
+            return x
+        self.cx.create_function("check_value", 1, check)
+        cur = self.cx.execute("select check_value(i) from test order by rowid").prefetch(16)
+        rows = []
+        with self.assertRaises(sqlite.OperationalError):
+            for row in cur:
+                rows.append(row)
+        self.assertEqual(len(rows), 499)
+
+    def test_python_function(self):
+        # the thread would need the GIL inside the step, while this thread
+        # waits for the database mutex with the GIL held
+        self.cx.create_function("slow", 1, lambda x: x)
+        cur = self.cx.execute("select slow(i) from test order by rowid").prefetch(4)
+        rows = []
+        for row in cur:
+            rows.append(row)
+            self.cx.execute("select count(*) from test where i < 3").fetchall()
+        self.assertEqual(rows, [row[:1] for row in self.rows])
+
+    def test_callback_set_while_prefetching(self):
+        statements = []
+        cur = self.cx.execute("select i from test order by rowid").prefetch(4)
+        rows = [cur.fetchone()]
+        self.cx.set_trace_callback(statements.append)
+        for row in cur:
+            rows.append(row)
+            self.cx.execute("select 1").fetchall()
+        self.assertEqual(rows, [row[:1] for row in self.rows])
+        self.assertIn("select 1", statements)
+
+    def test_timeout(self):
+        endless = "with recursive r(i) as (select 1 union all select i + 1 from r) select i from r"
+        cur = self.cx.execute(endless + " where i % 100000 = 0", timeout=0.05).prefetch(4)
+        with self.assertRaises(sqlite.QueryTimeout):
+            cur.fetchall()
+        self.assertEqual(self.cx.execute("select 1").fetchall(), [(1,)])
+
+    def test_twice(self):
+        cur = self.cx.execute("select i from test").prefetch()
+        with self.assertRaises(sqlite.ProgrammingError):
+            cur.prefetch()
+
+    def test_no_rows(self):
+        cur = self.cx.execute("select i from test where 0").prefetch()
+        self.assertEqual(cur.fetchall(), [])
+        cur = self.cx.cursor()
+        self.assertIs(cur.prefetch(), cur)
+        self.assertEqual(cur.fetchall(), [])
+
+    def test_bad_size(self):
+        cur = self.cx.execute("select i from test")
+        with self.assertRaises(ValueError):
+            cur.prefetch(0)
+
+    def test_no_mutex(self):
+        flags = sqlite.SQLITE_OPEN_READWRITE | sqlite.SQLITE_OPEN_CREATE | sqlite.SQLITE_OPEN_NOMUTEX
+        cx = sqlite.connect(":memory:", flags=flags)
+        self.addCleanup(cx.close)
+        cur = cx.execute("select 1")
+        with self.assertRaises(sqlite.NotSupportedError):
+            cur.prefetch()
+        self.assertEqual(cur.fetchall(), [(1,)])
+
+    def test_export(self):
+        cur = self.cx.execute("select i from test").prefetch()
+        with self.assertRaises(sqlite.ProgrammingError):
+            cur.export(io.BytesIO())
+
+
+class ExportTests(unittest.TestCase):
+    def setUp(self):
+        self.cx = sqlite.connect(":memory:")
+        self.cx.execute("create table t(id integer, name text, score real, data blob, note)")
+        self.cx.execute("""insert into t values
+            (1, 'a,"b"', 0.1, x'00ff', null),
+            (2, 'two
+lines', 1e300, null, 3),
+            (3, 'tab	bed', 2.0, null, '')""")
+        self.path = TESTFN + ".out"
+
+    def tearDown(self):
+        self.cx.close()
+        try:
+            unlink(self.path)
+        except OSError:
+            pass
+
+    def export(self, sql, **kwargs):
+        buf = io.BytesIO()
+        count = self.cx.execute(sql).export(buf, **kwargs)
+        return count, buf.getvalue().decode()
+
+    def test_export_csv(self):
+        count, text = self.export("select * from t")
+        self.assertEqual(count, 3)
+        rows = list(csv.reader(io.StringIO(text, newline="")))
+        self.assertEqual(rows, [
+            ["id", "name", "score", "data", "note"],
+            ["1", 'a,"b"', "0.1", "00ff", ""],
+            ["2", "two\nlines", "1e+300", "", "3"],
+            ["3", "tab\tbed", "2.0", "", ""],
+        ])
+
+    def test_export_tsv(self):
+        count, text = self.export("select id, name from t", format="tsv", header=False)
+        rows = list(csv.reader(io.StringIO(text, newline=""), dialect="excel-tab"))
+        self.assertEqual(rows, [["1", 'a,"b"'], ["2", "two\nlines"], ["3", "tab\tbed"]])
+
+    def test_export_jsonl(self):
+        count, text = self.export("select * from t", format="jsonl")
+        rows = [json.loads(line) for line in text.splitlines()]
+        self.assertEqual(rows[0], {"id": 1, "name": 'a,"b"', "score": 0.1, "data": "00ff", "note": None})
+        self.assertEqual(rows[1]["score"], 1e300)
+        self.assertEqual(rows[2]["name"], "tab\tbed")
+
+    def test_export_floats(self):
+        values = [0.5, -1.25, 1e16, 123456.789, 1 / 3, 2.5e-7, -7e22]
+        sql = "select column1 from (values %s)" % ",".join(["(?)"] * len(values))
+        buf = io.BytesIO()
+        self.cx.execute(sql, values).export(buf, header=False)
+        self.assertEqual(buf.getvalue().decode().split(), [repr(v) for v in values])
+
+    def test_export_path(self):
+        count = self.cx.execute("select id from t").export(self.path)
+        self.assertEqual(count, 3)
+        with open(self.path, "rb") as f:
+            self.assertEqual(f.read(), b"id\r\n1\r\n2\r\n3\r\n")
+
+    def test_export_rest(self):
+        cur = self.cx.execute("select id from t")
+        cur.fetchone()
+        buf = io.BytesIO()
+        self.assertEqual(cur.export(buf, header=False), 2)
+        self.assertEqual(buf.getvalue(), b"2\r\n3\r\n")
+        self.assertIsNone(cur.fetchone())
+
+    def test_export_no_rows(self):
+        count, text = self.export("select id, name from t where 0")
+        self.assertEqual((count, text), (0, "id,name\r\n"))
+
+    def test_export_large(self):
+        self.cx.execute("create table big(x)")
+        self.cx.execute("""with recursive c(i) as (select 1 union all select i + 1 from c where i < 100000)
+            insert into big select 'row ' || i from c""")
+        count, text = self.export("select x from big", header=False)
+        self.assertEqual(count, 100000)
+        self.assertEqual(text.split("\r\n")[-2], "row 100000")
+
+    def test_export_max_rows(self):
+        buf = io.BytesIO()
+        cur = self.cx.execute("select id from t", max_rows=2)
+        self.assertEqual(cur.export(buf, header=False), 2)
+        self.assertEqual(buf.getvalue(), b"1\r\n2\r\n")
+        cur = self.cx.execute("select id from t", max_rows=2)
+        cur.fetchone()
+        buf = io.BytesIO()
+        self.assertEqual(cur.export(buf, header=False), 1)
+        self.assertEqual(buf.getvalue(), b"2\r\n")
+        cur = self.cx.execute("select id from t", max_rows=1)
+        cur.fetchone()
+        self.assertEqual(cur.export(io.BytesIO()), 0)
+
+    def test_export_timeout(self):
+        endless = "with recursive r(i) as (select 1 union all select i + 1 from r) select i from r"
+        cur = self.cx.execute(endless + " where i % 1000 = 0", timeout=0.05)
+        with self.assertRaises(sqlite.QueryTimeout):
+            cur.export(io.BytesIO())
+        self.assertEqual(self.cx.execute("select 1").fetchall(), [(1,)])
+
+    def test_export_bad_format(self):
+        with self.assertRaises(ValueError):
+            self.cx.execute("select 1").export(io.BytesIO(), format="xml")
+
+    def test_export_text_file(self):
+        with self.assertRaises(TypeError):
+            self.cx.execute("select 1").export(io.StringIO())
+
+    def test_export_result_cache(self):
+        self.cx.isolation_level = None
+        expected = [self.export("select * from t", format=f) for f in ("csv", "jsonl")]
+        self.cx.enable_result_cache(1 << 20)
+        self.cx.execute("select * from t").fetchall()
+        hits = self.cx.result_cache_stats()["hits"]
+        self.assertEqual([self.export("select * from t", format=f) for f in ("csv", "jsonl")], expected)
+        self.assertEqual(self.cx.result_cache_stats()["hits"], hits + 2)
+
+        cur = self.cx.execute("select id from t")
+        cur.fetchone()
+        buf = io.BytesIO()
+        self.assertEqual(cur.export(buf, header=False), 2)
+        self.assertEqual(buf.getvalue(), b"2\r\n3\r\n")
+        self.assertIsNone(cur.fetchone())
+
+        buf = io.BytesIO()
+        self.assertEqual(self.cx.execute("select id from t", max_rows=2).export(buf, header=False), 2)
+        self.assertEqual(buf.getvalue(), b"1\r\n2\r\n")
+
+    def test_export_result_cache_converted(self):
+        self.cx.isolation_level = None
+        self.cx.enable_result_cache(1 << 20)
+        self.cx.text_factory = lambda b: b.decode().upper()
+        self.cx.execute("select name from t where id = 3").fetchall()
+        buf = io.BytesIO()
+        self.cx.execute("select name from t where id = 3").export(buf, header=False)
+        self.assertEqual(buf.getvalue(), b"TAB\tBED\r\n")
+        self.cx.text_factory = lambda b: [b]
+        self.cx.execute("select name from t where id = 3").fetchall()
+        with self.assertRaises(TypeError):
+            self.cx.execute("select name from t where id = 3").export(io.BytesIO())
+
+
+class ResultCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mktemp(suffix=".db")
+        self.cx = sqlite.connect(self.path, isolation_level=None)
+        self.cx.execute("create table test(id integer primary key, name)")
+        self.cx.executemany("insert into test(name) values (?)", [("a",), ("b",), ("c",)])
+        self.cx.enable_result_cache(1 << 20)
+
+    def tearDown(self):
+        self.cx.close()
+        unlink(self.path)
+
+    def stats(self):
+        stats = self.cx.result_cache_stats()
+        return stats["hits"], stats["misses"]
+
+    def test_hit(self):
+        sql = "select name from test where id > ?"
+        self.assertEqual(self.cx.execute(sql, (1,)).fetchall(), [("b",), ("c",)])
+        cur = self.cx.execute(sql, (1,))
+        self.assertEqual(cur.description[0][0], "name")
+        self.assertEqual(cur.fetchall(), [("b",), ("c",)])
+        self.assertEqual(self.cx.fetchval("select count(*) from test"), 3)
+        self.assertEqual(self.cx.fetchval("select count(*) from test"), 3)
+        self.assertEqual(self.stats(), (2, 2))
+        self.assertEqual(self.cx.result_cache_stats()["entries"], 2)
+
+    def test_empty_result(self):
+        self.assertEqual(self.cx.fetchall("select name from test where id = 4"), [])
+        self.assertEqual(self.cx.fetchall("select name from test where id = 4"), [])
+        self.assertEqual(self.stats(), (1, 1))
+
+    def test_partial_read_not_cached(self):
+        self.cx.execute("select name from test").fetchone()
+        self.assertEqual(self.cx.fetchall("select name from test"), [("a",), ("b",), ("c",)])
+        self.assertEqual(self.stats(), (0, 2))
+
+    def test_invalidated_by_write(self):
+        self.cx.fetchall("select name from test")
+        self.cx.execute("insert into test(name) values ('d')")
+        self.assertEqual(len(self.cx.fetchall("select name from test")), 4)
+        self.assertEqual(self.cx.result_cache_stats()["invalidations"], 1)
+
+    def test_invalidated_by_other_connection(self):
+        self.cx.fetchall("select name from test")
+        other = sqlite.connect(self.path, isolation_level=None)
+        other.execute("delete from test where id = 1")
+        other.close()
+        self.assertEqual(self.cx.fetchall("select name from test"), [("b",), ("c",)])
+
+    def test_invalidated_by_temp_ddl(self):
+        sql = "select name from sqlite_temp_master"
+        self.assertEqual(self.cx.fetchall(sql), [])
+        self.cx.execute("create temp table scratch(x)")
+        self.assertEqual(self.cx.fetchall(sql), [("scratch",)])
+
+    def test_parameter_types(self):
+        self.cx.execute("insert into test(id, name) values (10, 'ten')")
+        sql = "select name, typeof(?) from test where id = ?"
+        self.assertEqual(self.cx.fetchall(sql, (1, 10)), [("ten", "integer")])
+        self.assertEqual(self.cx.fetchall(sql, (1.0, 10)), [("ten", "real")])
+        self.assertEqual(self.cx.fetchall(sql, (True, 10)), [("ten", "integer")])
+        self.assertEqual(self.stats(), (0, 3))
+
+    def test_named_parameters(self):
+        sql = "select name from test where id = :id"
+        self.assertEqual(self.cx.fetchall(sql, {"id": 2}), [("b",)])
+        self.assertEqual(self.cx.fetchall(sql, {"id": 2}), [("b",)])
+        self.assertEqual(self.cx.fetchall(sql, {"id": 3}), [("c",)])
+        self.assertEqual(self.stats(), (1, 2))
+
+    def test_unhashable_parameters(self):
+        sql = "select count(*) from test where name = ?"
+        self.assertEqual(self.cx.fetchval(sql, (bytearray(b"a"),)), 0)
+        self.assertEqual(self.cx.fetchval(sql, (bytearray(b"a"),)), 0)
+        self.assertEqual(self.stats(), (0, 0))
+
+    def test_not_in_transaction(self):
+        self.cx.execute("begin")
+        self.cx.fetchall("select name from test")
+        self.cx.execute("insert into test(name) values ('d')")
+        self.assertEqual(len(self.cx.fetchall("select name from test")), 4)
+        self.cx.execute("rollback")
+        self.assertEqual(self.stats(), (0, 0))
+        self.assertEqual(len(self.cx.fetchall("select name from test")), 3)
+
+    def test_not_for_pragmas(self):
+        self.cx.fetchall("pragma table_info(test)")
+        self.cx.fetchall("pragma table_info(test)")
+        self.assertEqual(self.stats(), (0, 0))
+
+    def test_eviction(self):
+        self.cx.enable_result_cache(1000)
+        big = "x" * 600
+        self.cx.fetchall("select ?", (big,))
+        self.cx.fetchall("select ?", (big + "y",))
+        self.cx.fetchall("select ?", (big + "z",))
+        stats = self.cx.result_cache_stats()
+        self.assertEqual(stats["entries"], 1)
+        self.assertLessEqual(stats["size"], 1000)
+        self.cx.fetchall("select ?", (big + "z",))
+        self.assertEqual(self.stats(), (1, 3))
+
+    def test_too_large(self):
+        self.cx.enable_result_cache(100)
+        self.cx.fetchall("select ?", ("x" * 200,))
+        self.assertEqual(self.cx.result_cache_stats()["entries"], 0)
+
+    def test_max_rows(self):
+        sql = "select name from test order by id"
+        self.assertEqual(self.cx.execute(sql, max_rows=2).fetchall(), [("a",), ("b",)])
+        self.assertEqual(self.cx.fetchall(sql), [("a",), ("b",), ("c",)])
+        self.assertEqual(self.cx.execute(sql, max_rows=1).fetchall(), [("a",)])
+        self.assertEqual(self.stats(), (1, 2))
+
+    def test_row_factory(self):
+        sql = "select id, name from test where id = 1"
+        self.cx.fetchall(sql)
+        self.cx.row_factory = sqlite.Row
+        row = self.cx.fetchone(sql)
+        self.assertEqual(row["name"], "a")
+        self.assertEqual(self.stats(), (1, 1))
+
+    def test_not_for_nondeterministic_functions(self):
+        self.cx.create_function("plus_one", 1, lambda x: x + 1)
+        for sql in ("select random()", "select strftime('%f', 'now')", "select current_timestamp",
+                    "select plus_one(id) from test"):
+            self.cx.fetchall(sql)
+            self.cx.fetchall(sql)
+        self.assertEqual(self.stats(), (0, 0))
+        values = {self.cx.fetchval("select random()") for _ in range(5)}
+        self.assertGreater(len(values), 1)
+
+    def test_deterministic_functions(self):
+        sql = "select upper(name), count(*), json_array(1) from test group by name"
+        self.cx.fetchall(sql)
+        self.cx.fetchall(sql)
+        self.assertEqual(self.stats(), (1, 1))
+
+    def test_not_for_virtual_tables(self):
+        sql = "select name from pragma_table_info('test')"
+        self.cx.fetchall(sql)
+        self.cx.fetchall(sql)
+        self.assertEqual(self.stats(), (0, 0))
+
+    def test_invalidated_by_other_connection_attached(self):
+        other_path = self.path + ".aux"
+        self.addCleanup(unlink, other_path)
+        other = sqlite.connect(other_path, isolation_level=None)
+        self.addCleanup(other.close)
+        other.execute("create table data(x)")
+        other.execute("insert into data values (1)")
+        self.cx.execute("attach ? as aux", (other_path,))
+        sql = "select x from aux.data"
+        self.assertEqual(self.cx.fetchall(sql), [(1,)])
+        other.execute("insert into data values (2)")
+        self.assertEqual(self.cx.fetchall(sql), [(1,), (2,)])
+
+    def test_invalidated_by_attach(self):
+        paths = [self.path + ".a", self.path + ".b"]
+        for i, path in enumerate(paths):
+            self.addCleanup(unlink, path)
+            other = sqlite.connect(path)
+            other.execute("create table data(x)")
+            other.execute("insert into data values (?)", (i,))
+            other.commit()
+            other.close()
+        sql = "select x from aux.data"
+        self.cx.execute("attach ? as aux", (paths[0],))
+        self.assertEqual(self.cx.fetchall(sql), [(0,)])
+        self.cx.execute("detach aux")
+        self.cx.execute("attach ? as aux", (paths[1],))
+        self.assertEqual(self.cx.fetchall(sql), [(1,)])
+
+    def test_disable(self):
+        self.cx.enable_result_cache(0)
+        with self.assertRaises(sqlite.OperationalError):
+            self.cx.result_cache_stats()
+        with self.assertRaises(ValueError):
+            self.cx.enable_result_cache(-1)
+
+
+class ConnectSettingsTests(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = self.dir.name + "/test.db"
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def connect(self, *args, **kwargs):
+        cx = sqlite.connect(*args, **kwargs)
+        self.addCleanup(cx.close)
+        return cx
+
+    def test_no_settings(self):
+        self.assertEqual(dict(self.connect(":memory:").settings), {})
+
+    def test_profiles(self):
+        for profile in ("read_heavy", "oltp", "bulk_load"):
+            cx = self.connect(self.path, profile=profile)
+            self.assertEqual(cx.settings["journal_mode"], "wal")
+            self.assertEqual(cx.settings["temp_store"], 2)
+            self.assertEqual(cx.execute("pragma cache_size").fetchone()[0], cx.settings["cache_size"])
+        self.assertEqual(self.connect(self.path, profile="bulk_load").settings["synchronous"], 0)
+        self.assertEqual(self.connect(self.path, profile="read_heavy").settings["mmap_size"], 2**40)
+
+    def test_pragmas_override_profile(self):
+        cx = self.connect(self.path, profile="oltp", pragmas={"Cache_Size": -1000, "foreign_keys": True})
+        self.assertEqual(cx.settings["cache_size"], -1000)
+        self.assertEqual(cx.settings["foreign_keys"], 1)
+        self.assertEqual(list(cx.settings)[:2], ["journal_mode", "synchronous"])
+        self.assertEqual(cx.execute("pragma foreign_keys").fetchone(), (1,))
+
+    def test_values_read_back(self):
+        cx = self.connect(":memory:", profile="oltp")
+        self.assertEqual(cx.settings["journal_mode"], "memory")
+        self.assertIsNone(cx.settings["mmap_size"])
+
+    def test_values_checked(self):
+        with self.assertRaisesRegex(sqlite.OperationalError, "journal_mode is 'delete'"):
+            sqlite.connect(self.path, pragmas={"journal_mode": "wall"})
+        with self.assertRaises(sqlite.OperationalError):
+            sqlite.connect(":memory:", pragmas={"synchronous": 7})
+        with self.assertRaises(sqlite.OperationalError):
+            sqlite.connect(":memory:", pragmas={"temp_store": "disk"})
+        self.assertEqual(self.connect(":memory:", pragmas={"synchronous": "yes"}).settings["synchronous"], 1)
+        cx = self.connect(self.path, pragmas={"journal_mode": "WAL", "synchronous": "Full",
+                                              "temp_store": 1, "foreign_keys": True})
+        self.assertEqual(dict(cx.settings), {"journal_mode": "wal", "synchronous": 2,
+                                             "temp_store": 1, "foreign_keys": 1})
+
+    def test_busy_timeout(self):
+        cx = self.connect(":memory:", timeout=1.0, pragmas={"busy_timeout": 250})
+        self.assertEqual(cx.execute("pragma busy_timeout").fetchone(), (250,))
+
+    def test_schema_qualified(self):
+        cx = self.connect(self.path, pragmas={"main.synchronous": "full"})
+        self.assertEqual(cx.settings["main.synchronous"], 2)
+
+    def test_settings_read_only(self):
+        cx = self.connect(":memory:", pragmas={"cache_size": -100})
+        with self.assertRaises(TypeError):
+            cx.settings["cache_size"] = 0
+        with self.assertRaises(AttributeError):
+            cx.settings = {}
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            sqlite.connect(":memory:", profile="fast")
+        with self.assertRaises(sqlite.OperationalError):
+            sqlite.connect(":memory:", pragmas={"no_such_pragma": 1})
+        with self.assertRaises(ValueError):
+            sqlite.connect(":memory:", pragmas={"cache_size = 1; pragma x": 1})
+        with self.assertRaises(TypeError):
+            sqlite.connect(":memory:", pragmas={"cache_size": b"1"})
+        with self.assertRaises(TypeError):
+            sqlite.connect(":memory:", pragmas={1: 1})
+
+
+class SerializeTests(unittest.TestCase):
+    def setUp(self):
+        self.cx = sqlite.connect(":memory:")
+        self.cx.execute("create table t(x)")
+        self.cx.executemany("insert into t values (?)", [(i,) for i in range(100)])
+        self.cx.commit()
+
+    def tearDown(self):
+        self.cx.close()
+
+    def test_serialize(self):
+        data = self.cx.serialize()
+        view = memoryview(data)
+        self.assertTrue(view.readonly)
+        self.assertEqual(len(data), view.nbytes)
+        self.assertEqual(bytes(view[:16]), b"SQLite format 3\x00")
+
+    def test_serialize_unknown_name(self):
+        with self.assertRaises(sqlite.OperationalError):
+            self.cx.serialize(name="nope")
+
+    def test_deserialize(self):
+        cx = sqlite.connect(":memory:")
+        cx.deserialize(bytes(self.cx.serialize()))
+        cx.execute("insert into t values (100)")
+        self.assertEqual(cx.execute("select count(*) from t").fetchone(), (101,))
+        cx.close()
+
+    def test_deserialize_readonly(self):
+        cx = sqlite.connect(":memory:")
+        data = self.cx.serialize()
+        cx.deserialize(data, readonly=True)
+        del data
+        self.assertEqual(cx.execute("select sum(x) from t").fetchone(), (4950,))
+        with self.assertRaises(sqlite.OperationalError):
+            cx.execute("insert into t values (100)")
+        cx.close()
+
+    def test_deserialize_readonly_keeps_buffer(self):
+        data = bytearray(self.cx.serialize())
+        cx = sqlite.connect(":memory:")
+        cx.deserialize(data, readonly=True)
+        with self.assertRaises(BufferError):
+            data.clear()
+        cx.close()
+        data.clear()
+
+    def test_deserialize_attached(self):
+        cx = sqlite.connect(":memory:")
+        cx.execute("attach ':memory:' as ref")
+        cx.deserialize(self.cx.serialize(), name="ref", readonly=True)
+        self.assertEqual(cx.execute("select count(*) from ref.t").fetchone(), (100,))
+        cx.close()
+
+    def test_deserialize_temp(self):
+        with self.assertRaises(sqlite.OperationalError):
+            self.cx.deserialize(self.cx.serialize(), name="temp")
+
+    def test_closed(self):
+        cx = sqlite.connect(":memory:")
+        cx.close()
+        with self.assertRaises(sqlite.ProgrammingError):
+            cx.serialize()
+        with self.assertRaises(sqlite.ProgrammingError):
+            cx.deserialize(b"")
+
+
 def suite():
     loader = unittest.TestLoader()
     tests = [loader.loadTestsFromTestCase(t) for t in (
@@ -1213,7 +2443,16 @@ def suite():
         SqliteOnConflictTests,
         BlobTests,
         ClosedBlobTests,
-        BlobContextManagerTests)]
+        BlobContextManagerTests,
+        ChunkedBlobTests,
+        ImportCsvTests,
+        ExportTests,
+        PrefetchTests,
+        PreparedStatementTests,
+        ConnectionFetchTests,
+        ResultCacheTests,
+        ConnectSettingsTests,
+        SerializeTests)]
     return unittest.TestSuite(tests)
 
 def test():
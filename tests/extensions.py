@@ -1,3 +1,7 @@
+import json
+import os
+import tempfile
+import time
 import unittest
 import sqlean
 from sqlean import dbapi2 as sqlite
@@ -97,6 +101,266 @@ class EnableTest(unittest.TestCase):
         self.conn.close()
 
 
+class ConnectExtensionsTest(unittest.TestCase):
+    def setUp(self):
+        sqlean.extensions.disable_all()
+
+    def test_names(self):
+        conn = sqlite.connect(":memory:", extensions=("stats", "text"))
+        self.assertEqual(self._eval(conn, "text_substring('hello world', 7)"), "world")
+        with self.assertRaises(sqlite.OperationalError):
+            self._eval(conn, "dlevenshtein('abc', 'abcd')")
+        conn.close()
+
+    def test_bitmask(self):
+        conn = sqlite.connect(":memory:", extensions=sqlite.SQLEAN_EXT_FUZZY)
+        self.assertEqual(self._eval(conn, "dlevenshtein('abc', 'abcd')"), 1)
+        with self.assertRaises(sqlite.OperationalError):
+            self._eval(conn, "text_substring('hello world', 7)")
+        conn.close()
+
+    def test_all(self):
+        conn = sqlite.connect(":memory:", extensions=sqlite.SQLEAN_EXT_ALL)
+        self.assertEqual(self._eval(conn, "sqlean_version()"), SQLEAN_VERSION)
+        self.assertEqual(self._eval(conn, "length(uuid4())"), 36)
+        conn.close()
+
+    def test_none(self):
+        conn = sqlite.connect(":memory:", extensions=())
+        self.assertEqual(self._eval(conn, "sqlean_version()"), SQLEAN_VERSION)
+        with self.assertRaises(sqlite.OperationalError):
+            self._eval(conn, "length(uuid4())")
+        conn.close()
+
+    def test_independent(self):
+        conn1 = sqlite.connect(":memory:", extensions=("fileio",))
+        conn2 = sqlite.connect(":memory:", extensions=("uuid",))
+        self.assertEqual(self._eval(conn2, "length(uuid4())"), 36)
+        with self.assertRaises(sqlite.OperationalError):
+            self._eval(conn1, "length(uuid4())")
+        conn1.close()
+        conn2.close()
+
+    def test_env_default(self):
+        conn = sqlite.connect(":memory:")
+        with self.assertRaises(sqlite.OperationalError):
+            self._eval(conn, "sqlean_version()")
+        conn.close()
+
+    def test_unknown_name(self):
+        with self.assertRaises(ValueError):
+            sqlite.connect(":memory:", extensions=("stats", "nope"))
+
+    def test_invalid_bitmask(self):
+        with self.assertRaises(ValueError):
+            sqlite.connect(":memory:", extensions=-5)
+
+    def test_invalid_type(self):
+        with self.assertRaises(TypeError):
+            sqlite.connect(":memory:", extensions="stats")
+        with self.assertRaises(TypeError):
+            sqlite.connect(":memory:", extensions=[1, 2])
+
+    def _eval(self, conn, expr):
+        return conn.execute(f"select {expr}").fetchone()[0]
+
+
+class RegexpCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.conn = sqlite.connect(":memory:", extensions=("regexp",))
+        self.conn.execute("create table t(s text, p text)")
+        self.conn.executemany(
+            "insert into t values (?, ?)",
+            [("abc", "b"), ("abd", "b"), ("xyz", "y"), ("x1z", "\\d")],
+        )
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_hits(self):
+        rows = self.conn.execute("select regexp_like(s, p) from t").fetchall()
+        self.assertEqual(rows, [(1,), (1,), (1,), (1,)])
+        stats = self.conn.regexp_cache_stats()
+        self.assertEqual(stats["size"], 3)
+        self.assertEqual(stats["misses"], 3)
+        self.assertEqual(stats["hits"], 1)
+
+    def test_functions(self):
+        row = self.conn.execute(
+            "select regexp_substr(s, p), regexp_capture(s, '(.)' || p, 1), "
+            "regexp_replace(s, p, '_') from t where s = 'x1z'"
+        ).fetchone()
+        self.assertEqual(row, ("1", "x", "x_z"))
+        row = self.conn.execute("select 'abc' regexp 'a.c', regexp_capture('ab', 'a(x)?b', 1)").fetchone()
+        self.assertEqual(row, (1, None))
+
+    def test_invalid_pattern(self):
+        with self.assertRaises(sqlite.OperationalError):
+            self.conn.execute("select regexp_like('abc', '(')").fetchone()
+
+    def test_sql_stats(self):
+        self.conn.execute("select regexp_like(s, p) from t").fetchall()
+        stats = json.loads(self.conn.execute("select regexp_cache_stats()").fetchone()[0])
+        self.assertEqual(stats, self.conn.regexp_cache_stats())
+
+    def test_capacity(self):
+        self.conn.execute("select regexp_cache_capacity(2)")
+        self.conn.execute("select regexp_like(s, p) from t").fetchall()
+        stats = self.conn.regexp_cache_stats()
+        self.assertEqual(stats["capacity"], 2)
+        self.assertEqual(stats["size"], 2)
+
+    def test_disabled(self):
+        self.conn.execute("select regexp_cache_capacity(0)")
+        rows = self.conn.execute("select regexp_like(s, p) from t").fetchall()
+        self.assertEqual(rows, [(1,), (1,), (1,), (1,)])
+        stats = self.conn.regexp_cache_stats()
+        self.assertEqual((stats["size"], stats["hits"]), (0, 0))
+
+    def test_invalid_capacity(self):
+        with self.assertRaises(sqlite.OperationalError):
+            self.conn.execute("select regexp_cache_capacity(-1)")
+
+    def test_max_capacity(self):
+        for capacity in (1000001, 9223372036854775807):
+            with self.assertRaises(sqlite.OperationalError):
+                self.conn.execute("select regexp_cache_capacity(?)", (capacity,))
+        self.assertEqual(self.conn.regexp_cache_stats()["capacity"], 256)
+        self.conn.execute("select regexp_cache_capacity(1000000)")
+        self.assertEqual(self.conn.regexp_cache_stats()["capacity"], 1000000)
+
+    def test_many_patterns(self):
+        self.conn.execute("select regexp_cache_capacity(1000000)")
+        sql = """with recursive c(i) as (select 1 union all select i + 1 from c where i < 5000)
+            select sum(regexp_like('x' || i, 'x' || i || '$')) from c"""
+        self.assertEqual(self.conn.execute(sql).fetchone(), (5000,))
+        self.assertEqual(self.conn.execute(sql).fetchone(), (5000,))
+        stats = self.conn.regexp_cache_stats()
+        self.assertEqual((stats["size"], stats["hits"]), (5000, 5000))
+        self.conn.execute("select regexp_cache_capacity(10)")
+        self.assertEqual(self.conn.regexp_cache_stats()["size"], 10)
+        self.assertEqual(self.conn.execute("select regexp_like('x1', 'x1$')").fetchone(), (1,))
+
+    def test_not_enabled(self):
+        conn = sqlite.connect(":memory:", extensions=("text",))
+        with self.assertRaises(sqlite.OperationalError):
+            conn.regexp_cache_stats()
+        conn.close()
+
+
+class VsvTest(unittest.TestCase):
+    def setUp(self):
+        self.conn = sqlite.connect(":memory:", extensions=("vsv",))
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "data.csv")
+        with open(self.path, "w", newline="") as f:
+            f.write("id,name,score\n")
+            for i in range(1, 1001):
+                f.write(f'{i},"name {i}",{i / 4}\n')
+
+    def tearDown(self):
+        self.conn.close()
+        self.dir.cleanup()
+
+    def test_scan(self):
+        self._create("header")
+        self.assertEqual(self._fetch("select count(*), max(name) from t"), [(1000, "name 999")])
+        self.assertEqual(self._fetch("select * from t where rowid = 3"), [("3", "name 3", "0.75")])
+
+    def test_data(self):
+        self.conn.execute("create virtual table temp.t using vsv(data='a;b\n1;\n', fsep=';', header, nulls)")
+        self.assertEqual(self._fetch("select a, b from t"), [("1", None)])
+
+    def test_skip(self):
+        self._create("header, skip=2")
+        self.assertEqual(self._fetch("select rowid, id from t limit 1"), [(1, "3")])
+
+    def test_skip_without_header(self):
+        # as in upstream, skip counts records, including the first one
+        self._create("skip=1")
+        self.assertEqual(self._fetch("select rowid, c0 from t limit 1"), [(1, "1")])
+
+    def test_skip_data(self):
+        # upstream skipped N + 1 rows with data=
+        self.conn.execute("create virtual table temp.t using vsv(data='a,b\n1,2\n3,4\n', header, skip=1)")
+        self.assertEqual(self._fetch("select a, b from t"), [("3", "4")])
+
+    def test_validatetext(self):
+        with open(self.path, "wb") as f:
+            f.write(b"a,b\n,x\n\xff\xfe,y\n")
+        self._create("header, validatetext")
+        # upstream raised "Invalid UTF8 Data" for the empty field
+        self.assertEqual(self._fetch("select a, b from t where rowid = 1"), [("", "x")])
+        with self.assertRaises(sqlite.OperationalError):
+            self._fetch("select a from t")
+        self.conn.execute("drop table temp.t")
+        self._create("header, validatetext, affinity=integer")
+        self.assertEqual(self._fetch("select a, b from t"), [("", "x"), (b"\xff\xfe", "y")])
+
+    def test_rowid_range(self):
+        self._create("header")
+        rows = self._fetch("select rowid, id from t where rowid between 130 and 132")
+        self.assertEqual(rows, [(130, "130"), (131, "131"), (132, "132")])
+        rows = self._fetch("select rowid from t where rowid > 998.5 order by rowid")
+        self.assertEqual(rows, [(999,), (1000,)])
+        self.assertEqual(self._fetch("select id from t where rowid = 1001"), [])
+        self.assertEqual(self._fetch("select id from t where rowid = 700"), [("700",)])
+
+    def test_affinity_auto(self):
+        self._create("header, affinity=auto")
+        types = [(row[1], row[2]) for row in self.conn.execute("pragma table_info(t)")]
+        self.assertEqual(types, [("id", "INTEGER"), ("name", "TEXT"), ("score", "REAL")])
+        row = self._fetch("select id, name, score from t where rowid = 2")
+        self.assertEqual(row, [(2, "name 2", 0.5)])
+
+    def test_index(self):
+        self._create("header, index")
+        self.assertFalse(os.path.exists(self.path + ".vsvidx"))
+        self._fetch("select count(*) from t")
+        self.assertTrue(os.path.exists(self.path + ".vsvidx"))
+        conn = sqlite.connect(":memory:", extensions=("vsv",))
+        conn.execute(f"create virtual table temp.t using vsv(filename='{self.path}', header, index)")
+        self.assertEqual(conn.execute("select id from t where rowid = 999").fetchall(), [("999",)])
+        self.assertEqual(conn.execute("select count(*) from t").fetchall(), [(1000,)])
+        conn.close()
+
+    def test_file_rewritten(self):
+        self._create("header")
+        self.assertEqual(self._fetch("select id from t where rowid = 150"), [("150",)])
+        with open(self.path, "w", newline="") as f:
+            f.write("identifier,name,score\n")
+            for i in range(1, 1501):
+                f.write(f"{i * 1000},n,0\n")
+        self.assertEqual(self._fetch("select id from t where rowid = 150"), [("150000",)])
+        self.assertEqual(self._fetch("select count(*) from t"), [(1500,)])
+
+    def test_index_file_rewritten(self):
+        # same size and second as the indexed file, only the nanoseconds differ
+        mtime = int(time.time()) * 10**9
+        os.utime(self.path, ns=(mtime, mtime + 100))
+        self._create("header, index")
+        self._fetch("select count(*) from t")
+        with open(self.path, "w", newline="") as f:
+            f.write("id,name,score\n")
+            for i in range(1000, 0, -1):
+                f.write(f'{i},"name {i}",{i / 4}\n')
+        os.utime(self.path, ns=(mtime, mtime + 200))
+        conn = sqlite.connect(":memory:", extensions=("vsv",))
+        conn.execute(f"create virtual table temp.t using vsv(filename='{self.path}', header, index)")
+        self.assertEqual(conn.execute("select id from t where rowid = 999").fetchall(), [("2",)])
+        conn.close()
+
+    def test_index_requires_file(self):
+        with self.assertRaises(sqlite.OperationalError):
+            self.conn.execute("create virtual table temp.t using vsv(data='a', index)")
+
+    def _create(self, options):
+        self.conn.execute(f"create virtual table temp.t using vsv(filename='{self.path}', {options})")
+
+    def _fetch(self, sql):
+        return self.conn.execute(sql).fetchall()
+
+
 class PragmaTest(unittest.TestCase):
     def setUp(self):
         self.conn = sqlite.connect(":memory:")
@@ -117,7 +381,7 @@ class PragmaTest(unittest.TestCase):
 
 def suite():
     loader = unittest.TestLoader()
-    cases = (FuncTest, EnableTest, PragmaTest)
+    cases = (FuncTest, EnableTest, ConnectExtensionsTest, RegexpCacheTest, VsvTest, PragmaTest)
     tests = [loader.loadTestsFromTestCase(c) for c in cases]
     return unittest.TestSuite(tests)
 
@@ -22,8 +22,12 @@
 # 3. This notice may not be removed or altered from any source distribution.
 
 import os
+import tempfile
+import threading
+import time
 import unittest
 from sqlean import dbapi2 as sqlite
+from sqlean.checkpoint import Checkpointer
 
 
 class CollationTests(unittest.TestCase):
@@ -200,6 +204,114 @@ class ProgressTests(unittest.TestCase):
         con.execute("select 1 union select 2 union select 3").fetchall()
         self.assertEqual(action, 0, "progress handler was not cleared")
 
+class QueryLimitTests(unittest.TestCase):
+    endless = "with recursive r(i) as (select 1 union all select i + 1 from r) select i from r"
+
+    def setUp(self):
+        self.con = sqlite.connect(":memory:")
+
+    def tearDown(self):
+        self.con.close()
+
+    def test_Timeout(self):
+        start = time.monotonic()
+        with self.assertRaises(sqlite.QueryTimeout) as cm:
+            self.con.execute("select count(*) from (%s)" % self.endless, timeout=0.05)
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertIsInstance(cm.exception, sqlite.OperationalError)
+        self.assertEqual(cm.exception.sqlite_errorname, "SQLITE_INTERRUPT")
+        self.assertEqual(self.con.execute("select 1", timeout=0.05).fetchall(), [(1,)])
+
+    def test_TimeoutWhileFetching(self):
+        cur = self.con.execute(self.endless + " where i % 100 = 0", timeout=0.05)
+        self.assertEqual(cur.fetchone(), (100,))
+        with self.assertRaises(sqlite.QueryTimeout):
+            cur.fetchall()
+
+    def test_DefaultTimeout(self):
+        self.assertIsNone(self.con.query_timeout)
+        self.con.query_timeout = 0.05
+        self.assertEqual(self.con.query_timeout, 0.05)
+        with self.assertRaises(sqlite.QueryTimeout):
+            self.con.execute("select count(*) from (%s)" % self.endless)
+        with self.assertRaises(sqlite.QueryTimeout):
+            self.con.fetchval("select count(*) from (%s)" % self.endless)
+        # an explicit None turns the default off
+        cur = self.con.execute(self.endless, timeout=None)
+        self.assertEqual(cur.fetchone(), (1,))
+        self.con.query_timeout = None
+        self.assertIsNone(self.con.query_timeout)
+
+    def test_TimeoutWithProgressHandler(self):
+        calls = []
+        def progress():
+            calls.append(None)
+            return 0
+        self.con.set_progress_handler(progress, 100)
+        self.con.execute("select count(*) from (%s limit 1000)" % self.endless).fetchall()
+        without_timeout = len(calls)
+        del calls[:]
+        self.con.execute("select count(*) from (%s limit 1000)" % self.endless, timeout=10).fetchall()
+        self.assertEqual(len(calls), without_timeout)
+        with self.assertRaises(sqlite.QueryTimeout):
+            self.con.execute("select count(*) from (%s)" % self.endless, timeout=0.05)
+
+        self.con.set_progress_handler(lambda: 1, 100)
+        with self.assertRaises(sqlite.OperationalError) as cm:
+            self.con.execute("select count(*) from (%s)" % self.endless, timeout=10)
+        self.assertNotIsInstance(cm.exception, sqlite.QueryTimeout)
+
+    def test_MaxRows(self):
+        cur = self.con.execute(self.endless, max_rows=3)
+        self.assertEqual(cur.fetchall(), [(1,), (2,), (3,)])
+        self.assertIsNone(cur.fetchone())
+        cur = self.con.execute(self.endless, max_rows=5)
+        self.assertEqual(cur.fetchmany(2), [(1,), (2,)])
+        self.assertEqual(list(cur), [(3,), (4,), (5,)])
+        self.assertEqual(self.con.execute("select 1", max_rows=0).fetchall(), [])
+        self.assertEqual(self.con.execute("select 1", max_rows=2).fetchall(), [(1,)])
+
+    def test_DefaultMaxRows(self):
+        self.assertIsNone(self.con.max_rows)
+        self.con.max_rows = 2
+        self.assertEqual(self.con.max_rows, 2)
+        self.assertEqual(self.con.execute(self.endless).fetchall(), [(1,), (2,)])
+        self.assertEqual(self.con.fetchall(self.endless), [(1,), (2,)])
+        self.assertEqual(len(self.con.execute(self.endless, max_rows=4).fetchall()), 4)
+        self.assertEqual(self.con.execute(self.endless, max_rows=None).fetchmany(3), [(1,), (2,), (3,)])
+
+    def test_InvalidArguments(self):
+        with self.assertRaises(ValueError):
+            self.con.execute("select 1", timeout=0)
+        with self.assertRaises(ValueError):
+            self.con.execute("select 1", max_rows=-1)
+        with self.assertRaises(TypeError):
+            self.con.execute("select 1", timeout="1")
+        with self.assertRaises(TypeError):
+            self.con.execute("select 1", (), 1)
+        with self.assertRaises(ValueError):
+            self.con.query_timeout = -1
+        with self.assertRaises(AttributeError):
+            del self.con.max_rows
+
+    def test_ExecutemanyTimeout(self):
+        self.con.execute("create table t(x)")
+        with self.assertRaises(sqlite.QueryTimeout):
+            self.con.executemany("insert into t select count(*) from (%s)" % self.endless,
+                                 [()], timeout=0.05)
+
+    def test_Limits(self):
+        length = self.con.getlimit(sqlite.SQLITE_LIMIT_LENGTH)
+        self.assertEqual(self.con.setlimit(sqlite.SQLITE_LIMIT_LENGTH, 100), length)
+        self.assertEqual(self.con.getlimit(sqlite.SQLITE_LIMIT_LENGTH), 100)
+        with self.assertRaises(sqlite.DataError):
+            self.con.execute("select randomblob(1000)")
+        self.assertEqual(self.con.setlimit(sqlite.SQLITE_LIMIT_LENGTH, -1), 100)
+        with self.assertRaises(sqlite.ProgrammingError):
+            self.con.getlimit(1000)
+        with self.assertRaises(sqlite.ProgrammingError):
+            self.con.setlimit(-1000, 1)
+
 class TraceCallbackTests(unittest.TestCase):
     def test_TraceCallbackUsed(self):
         """
@@ -311,14 +423,401 @@ class TestBusyHandlerTimeout(unittest.TestCase):
             conn2.execute('create table test(id)')
         self.assertEqual(accum, [])
 
+    def test_busy_backoff(self):
+        self.addCleanup(os.unlink, 'busy.db')
+        conn1 = sqlite.connect('busy.db', isolation_level=None, check_same_thread=False)
+        conn2 = sqlite.connect('busy.db')
+        self.addCleanup(conn1.close)
+        self.addCleanup(conn2.close)
+        conn2.set_busy_backoff(0.05, initial_delay=0.001, max_delay=0.01)
+
+        conn1.execute('begin exclusive')
+        start = time.monotonic()
+        with self.assertRaises(sqlite.OperationalError):
+            conn2.execute('create table test(id)')
+        self.assertGreaterEqual(time.monotonic() - start, 0.05)
+        stats = conn2.busy_stats()
+        self.assertEqual(stats["events"], 1)
+        self.assertEqual(stats["timeouts"], 1)
+        self.assertGreaterEqual(stats["retries"], 5)
+        self.assertGreaterEqual(stats["wait_time"], 0.045)
+        self.assertGreaterEqual(stats["max_wait"], 0.05)
+
+        # the lock is released while the handler waits
+        conn2.set_busy_backoff(10)
+        timer = threading.Timer(0.05, conn1.execute, ("commit",))
+        timer.start()
+        self.addCleanup(timer.join)
+        conn2.execute('create table test(id)')
+        stats = conn2.busy_stats(reset=True)
+        self.assertEqual(stats["events"], 2)
+        self.assertEqual(stats["timeouts"], 1)
+        self.assertLess(stats["max_wait"], 10)
+        self.assertEqual(conn2.busy_stats(), {"events": 0, "retries": 0, "timeouts": 0,
+                                              "wait_time": 0.0, "max_wait": 0.0})
+
+    def test_busy_backoff_replaced(self):
+        self.addCleanup(os.unlink, 'busy.db')
+        conn1 = sqlite.connect('busy.db')
+        conn2 = sqlite.connect('busy.db')
+        self.addCleanup(conn1.close)
+        self.addCleanup(conn2.close)
+        accum = []
+        conn2.set_busy_handler(lambda n: accum.append(n))
+        conn2.set_busy_backoff(0.01, jitter=0)
+        conn1.execute('begin exclusive')
+        with self.assertRaises(sqlite.OperationalError):
+            conn2.execute('create table test(id)')
+        self.assertEqual(accum, [])
+        self.assertEqual(conn2.busy_stats()["events"], 1)
+
+        conn2.set_busy_timeout(0.01)
+        with self.assertRaises(sqlite.OperationalError):
+            conn2.execute('create table test(id)')
+        self.assertEqual(conn2.busy_stats()["events"], 1)
+
+    def test_busy_backoff_arguments(self):
+        conn = sqlite.connect(':memory:')
+        for kwargs in ({"timeout": -1}, {"timeout": 1, "initial_delay": 0},
+                       {"timeout": 1, "initial_delay": 0.5, "max_delay": 0.1},
+                       {"timeout": 1, "jitter": 1.5}):
+            with self.assertRaises(ValueError):
+                conn.set_busy_backoff(**kwargs)
+        conn.close()
+        with self.assertRaises(sqlite.ProgrammingError):
+            conn.set_busy_backoff(1)
+        with self.assertRaises(sqlite.ProgrammingError):
+            conn.busy_stats()
+
+
+class WalTests(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "wal.db")
+        self.con = sqlite.connect(self.path, isolation_level=None)
+        self.con.execute("pragma journal_mode = wal")
+        self.con.execute("create table test(x)")
+
+    def tearDown(self):
+        self.con.close()
+        self.dir.cleanup()
+
+    def test_wal_hook(self):
+        calls = []
+        self.con.set_wal_hook(lambda name, frames: calls.append((name, frames)))
+        self.con.execute("insert into test values (1)")
+        self.con.execute("insert into test values (2)")
+        self.assertEqual([name for name, _ in calls], ["main", "main"])
+        self.assertLess(calls[0][1], calls[1][1])
+        self.con.set_wal_hook(None)
+        self.con.execute("insert into test values (3)")
+        self.assertEqual(len(calls), 2)
+
+    def test_wal_hook_error(self):
+        self.con.set_wal_hook(lambda name, frames: 1 / 0)
+        self.con.execute("insert into test values (1)")
+        self.assertEqual(self.con.execute("select count(*) from test").fetchone(), (1,))
+
+    def test_wal_hook_disables_autocheckpoint(self):
+        self.con.execute("pragma wal_autocheckpoint = 1")
+        self.con.set_wal_hook(lambda name, frames: None)
+        self.con.execute("insert into test values (1)")
+        log, checkpointed = self.con.wal_checkpoint()
+        self.assertGreater(log, 0)
+        self.assertEqual(log, checkpointed)
+
+    def test_wal_checkpoint(self):
+        self.con.execute("pragma wal_autocheckpoint = 0")
+        self.con.executemany("insert into test values (?)", [(i,) for i in range(100)])
+        log, checkpointed = self.con.wal_checkpoint("passive")
+        self.assertGreater(log, 0)
+        self.assertEqual(log, checkpointed)
+        self.assertEqual(self.con.wal_checkpoint("truncate"), (0, 0))
+        self.assertEqual(os.path.getsize(self.path + "-wal"), 0)
+
+    def test_wal_checkpoint_busy(self):
+        self.con.execute("pragma wal_autocheckpoint = 0")
+        reader = sqlite.connect(self.path, isolation_level=None)
+        self.addCleanup(reader.close)
+        self.con.execute("insert into test values (1)")
+        reader.execute("begin")
+        reader.execute("select * from test").fetchall()
+        self.con.execute("insert into test values (2)")
+        self.con.set_busy_timeout(0)
+        log, checkpointed = self.con.wal_checkpoint("full")
+        self.assertLess(checkpointed, log)
+
+    def test_wal_checkpoint_bad_mode(self):
+        with self.assertRaises(ValueError):
+            self.con.wal_checkpoint("sometimes")
+
+    def test_checkpointer(self):
+        checkpointer = Checkpointer(self.con, frames=5)
+        with checkpointer:
+            for i in range(100):
+                self.con.execute("insert into test values (?)", (i,))
+        self.assertIsNone(checkpointer.error)
+        self.assertGreater(checkpointer.checkpoints, 0)
+        self.assertEqual(self.con.execute("pragma wal_autocheckpoint").fetchone(), (1000,))
+        log, checkpointed = self.con.wal_checkpoint()
+        self.assertEqual(log, checkpointed)
+
+    def test_checkpointer_interval(self):
+        checkpointer = Checkpointer(self.con, frames=100000, interval=0.01)
+        with checkpointer:
+            self.con.execute("insert into test values (1)")
+            for _ in range(500):
+                if checkpointer.checkpoints:
+                    break
+                time.sleep(0.01)
+        self.assertGreater(checkpointer.checkpoints, 0)
+
+    def test_checkpointer_error(self):
+        self.con.execute("pragma wal_autocheckpoint = 5")
+        checkpointer = Checkpointer(self.con, frames=1)
+        checkpointer.path = os.path.join(self.dir.name, "missing", "wal.db")
+        checkpointer.start()
+        checkpointer._thread.join(5)
+        self.assertIsInstance(checkpointer.error, sqlite.OperationalError)
+        for i in range(50):
+            self.con.execute("insert into test values (?)", (i,))
+        log, checkpointed = self.con.wal_checkpoint()
+        self.assertLess(log, 10)
+        with self.assertRaises(sqlite.OperationalError):
+            checkpointer.stop()
+        self.assertEqual(self.con.execute("pragma wal_autocheckpoint").fetchone(), (5,))
+
+    def test_checkpointer_error_in_block(self):
+        checkpointer = Checkpointer(self.con)
+        checkpointer.path = os.path.join(self.dir.name, "missing", "wal.db")
+        with self.assertRaises(KeyError):
+            with checkpointer:
+                checkpointer._thread.join(5)
+                raise KeyError
+        self.assertIsInstance(checkpointer.error, sqlite.OperationalError)
+
+    def test_checkpointer_requires_wal(self):
+        con = sqlite.connect(":memory:")
+        self.addCleanup(con.close)
+        with self.assertRaises(ValueError):
+            Checkpointer(con)
+
+
+class ChangeHookTests(unittest.TestCase):
+    def setUp(self):
+        self.con = sqlite.connect(":memory:", isolation_level=None)
+        self.con.execute("create table test(x)")
+
+    def tearDown(self):
+        self.con.close()
+
+    def test_update_hook(self):
+        calls = []
+        self.con.set_update_hook(lambda *args: calls.append(args))
+        self.con.execute("insert into test values (1)")
+        self.con.execute("update test set x = 2")
+        self.con.execute("delete from test where x = 2")
+        self.assertEqual(calls, [(sqlite.SQLITE_INSERT, "main", "test", 1),
+                                 (sqlite.SQLITE_UPDATE, "main", "test", 1),
+                                 (sqlite.SQLITE_DELETE, "main", "test", 1)])
+        self.con.set_update_hook(None)
+        self.con.execute("insert into test values (1)")
+        self.assertEqual(len(calls), 3)
+
+    def test_update_hook_error(self):
+        self.con.set_update_hook(lambda *args: 1 / 0)
+        self.con.execute("insert into test values (1)")
+        self.assertEqual(self.con.fetchval("select count(*) from test"), 1)
+
+    def test_commit_hook(self):
+        calls = []
+        self.con.set_commit_hook(lambda: calls.append(1))
+        self.con.execute("insert into test values (1)")
+        with self.con.transaction():
+            self.con.execute("insert into test values (2)")
+            self.con.execute("insert into test values (3)")
+        self.assertEqual(len(calls), 2)
+
+    def test_commit_hook_veto(self):
+        self.con.set_commit_hook(lambda: True)
+        with self.assertRaises(sqlite.IntegrityError):
+            self.con.execute("insert into test values (1)")
+        self.con.set_commit_hook(lambda: 1 / 0)
+        with self.assertRaises(sqlite.IntegrityError):
+            self.con.execute("insert into test values (1)")
+        self.con.set_commit_hook(None)
+        self.assertEqual(self.con.fetchval("select count(*) from test"), 0)
+
+    def test_rollback_hook(self):
+        calls = []
+        self.con.set_rollback_hook(lambda: calls.append(1))
+        self.con.execute("begin")
+        self.con.execute("insert into test values (1)")
+        self.con.execute("rollback")
+        self.con.execute("insert into test values (1)")
+        self.assertEqual(calls, [1])
+
+    def test_changes(self):
+        batches = []
+        self.con.changes(batches.append)
+        self.con.execute("insert into test values (1)")
+        with self.con.transaction():
+            self.con.executemany("insert into test values (?)", [(2,), (3,)])
+            self.con.execute("delete from test where x = 1")
+            self.assertEqual(len(batches), 1)
+        self.assertEqual(batches, [
+            [(sqlite.SQLITE_INSERT, "test", 1)],
+            [(sqlite.SQLITE_INSERT, "test", 2), (sqlite.SQLITE_INSERT, "test", 3),
+             (sqlite.SQLITE_DELETE, "test", 1)]])
+
+    def test_changes_rollback(self):
+        batches = []
+        self.con.changes(batches.append)
+        self.con.execute("begin")
+        self.con.execute("insert into test values (1)")
+        self.con.execute("rollback")
+        self.con.execute("select * from test").fetchall()
+        self.assertEqual(batches, [])
+
+    def test_changes_rollback_to_savepoint(self):
+        batches = []
+        self.con.changes(batches.append)
+        self.con.execute("begin")
+        self.con.execute("insert into test values (1)")
+        self.con.execute("savepoint a")
+        self.con.execute("insert into test values (2)")
+        self.con.execute("savepoint b")
+        self.con.execute("insert into test values (3)")
+        self.con.execute("release b")
+        self.con.execute("rollback to a")
+        self.con.execute("insert into test values (4)")
+        self.con.execute("savepoint \"c d\"")
+        self.con.execute("insert into test values (5)")
+        self.con.execute("/* undo */ ROLLBACK TRANSACTION TO SAVEPOINT [C D]")
+        self.con.execute("commit")
+        self.assertEqual(batches, [[(sqlite.SQLITE_INSERT, "test", 1), (sqlite.SQLITE_INSERT, "test", 2)]])
+        self.assertEqual(self.con.fetchall("select rowid, x from test"), [(1, 1), (2, 4)])
+
+    def test_changes_rollback_to_outer_savepoint(self):
+        batches = []
+        self.con.changes(batches.append)
+        self.con.execute("savepoint a")
+        self.con.execute("insert into test values (1)")
+        self.con.execute("rollback to a")
+        self.con.execute("insert into test values (2)")
+        self.con.execute("release a")
+        self.assertEqual(batches, [[(sqlite.SQLITE_INSERT, "test", 1)]])
+        self.con.executescript("savepoint s; insert into test values (3); rollback to s; release s;")
+        self.con.execute("insert into test values (4)")
+        self.assertEqual(batches[1:], [[(sqlite.SQLITE_INSERT, "test", 2)]])
+
+    def test_changes_truncate(self):
+        batches = []
+        self.con.executemany("insert into test values (?)", [(i,) for i in range(3)])
+        self.con.changes(batches.append)
+        self.con.execute("delete from test")
+        self.assertEqual(batches, [[(sqlite.SQLITE_DELETE, "test", i) for i in (1, 2, 3)]])
+        authorized = []
+        self.con.set_authorizer(lambda *args: authorized.append(args[0]) or sqlite.SQLITE_OK)
+        self.con.executemany("insert into test values (?)", [(i,) for i in range(3)])
+        self.con.execute("delete from test")
+        self.assertEqual(batches[-1], [(sqlite.SQLITE_DELETE, "test", i) for i in (1, 2, 3)])
+        self.assertIn(sqlite.SQLITE_DELETE, authorized)
+
+    def test_changes_attached(self):
+        batches = []
+        self.con.execute("attach ':memory:' as aux")
+        self.con.execute("create table aux.other(y)")
+        self.con.changes(batches.append)
+        self.con.execute("insert into aux.other values (1)")
+        self.assertEqual(batches, [[(sqlite.SQLITE_INSERT, "aux.other", 1)]])
+
+    def test_changes_max_events(self):
+        batches = []
+        self.con.executemany("insert into test values (?)", [(i,) for i in range(10)])
+        self.con.changes(batches.append, max_events=3)
+        self.con.execute("update test set x = 0")
+        self.assertEqual(batches[0][:3], [(sqlite.SQLITE_UPDATE, "test", i) for i in (1, 2, 3)])
+        self.assertEqual(batches[0][3:], [(None, "test", None)])
+        with self.assertRaises(ValueError):
+            self.con.changes(batches.append, max_events=-1)
+
+    def test_changes_with_update_hook(self):
+        batches = []
+        calls = []
+        self.con.changes(batches.append)
+        self.con.set_update_hook(lambda *args: calls.append(args))
+        self.con.execute("insert into test values (1)")
+        self.con.changes(None)
+        self.con.execute("insert into test values (2)")
+        self.assertEqual(len(batches), 1)
+        self.assertEqual(len(calls), 2)
+
+    def test_changes_commit_hook_veto(self):
+        batches = []
+        self.con.changes(batches.append)
+        self.con.set_commit_hook(lambda: True)
+        with self.assertRaises(sqlite.IntegrityError):
+            self.con.execute("insert into test values (1)")
+        self.con.set_commit_hook(None)
+        self.con.execute("insert into test values (2)")
+        self.assertEqual(batches, [[(sqlite.SQLITE_INSERT, "test", 1)]])
+
+    def test_changes_cursor_state(self):
+        self.con.execute("create table log(y)")
+        self.con.executemany("insert into log values (?)", [(i,) for i in range(5)])
+
+        def log(changes):
+            self.con.execute("insert into log values (?)", (len(changes),))
+            self.con.execute("update log set y = y + 1")
+        self.con.changes(log)
+        cur = self.con.execute("insert into test values (1)")
+        self.assertEqual(cur.lastrowid, 1)
+        self.assertEqual(cur.rowcount, 1)
+        self.assertEqual(self.con.fetchval("select count(*) from log"), 6)
+
+    def test_changes_reentrant(self):
+        self.con.execute("create table log(y)")
+        batches = []
+        depth = []
+
+        def log(changes):
+            depth.append(len(depth))
+            batches.append(changes)
+            if changes[0][1] == "test":
+                self.con.execute("insert into log values (1)")
+            depth.pop()
+        self.con.changes(log)
+        self.con.execute("insert into test values (1)")
+        self.assertEqual(batches, [[(sqlite.SQLITE_INSERT, "test", 1)]])
+        self.con.execute("select 1")
+        self.assertEqual(batches[1:], [[(sqlite.SQLITE_INSERT, "log", 1)]])
+        self.assertEqual(depth, [])
+
+    def test_changes_error(self):
+        self.con.changes(lambda changes: 1 / 0)
+        self.con.execute("insert into test values (1)")
+        self.assertEqual(self.con.fetchval("select count(*) from test"), 1)
+
+    def test_closed(self):
+        con = sqlite.connect(":memory:")
+        con.close()
+        with self.assertRaises(sqlite.ProgrammingError):
+            con.set_update_hook(None)
+        with self.assertRaises(sqlite.ProgrammingError):
+            con.changes(None)
+
 
 def suite():
     loader = unittest.TestLoader()
     tests = [loader.loadTestsFromTestCase(t) for t in (
         CollationTests,
         ProgressTests,
+        QueryLimitTests,
         TraceCallbackTests,
-        TestBusyHandlerTimeout)]
+        TestBusyHandlerTimeout,
+        WalTests,
+        ChangeHookTests)]
     return unittest.TestSuite(tests)
 
 def test():
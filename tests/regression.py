@@ -237,6 +237,39 @@ class RegressionTests(unittest.TestCase):
         with self.assertRaises(sqlite.InterfaceError):
             cur.fetchall()
 
+    def test_CursorReinitRegistration(self):
+        """
+        A cursor initialized again with another connection is only reset by
+        the rollbacks of that connection.
+        """
+        con1 = sqlite.connect(":memory:")
+        con2 = sqlite.connect(":memory:")
+        con2.execute("create table foo(x)")
+        con2.executemany("insert into foo(x) values (?)", [(3,), (4,), (5,)])
+        con2.commit()
+        cur = con1.cursor()
+        cur.__init__(con2)
+        cur.execute("select x from foo")
+        con1.execute("create table bar(y)")
+        con1.rollback()
+        self.assertEqual(cur.fetchall(), [(3,), (4,), (5,)])
+        cur.execute("select x from foo")
+        con2.execute("insert into foo(x) values (6)")
+        con2.rollback()
+        with self.assertRaises(sqlite.InterfaceError):
+            cur.fetchall()
+        con1.close()
+        con2.close()
+
+    def test_StatementOutlivesConnection(self):
+        con = sqlite.connect(":memory:")
+        statement = con("select 1")
+        cur = con.execute("select 2")
+        del con
+        self.assertEqual(cur.fetchall(), [(2,)])
+        del cur
+        del statement
+
     def test_AutoCommit(self):
         """
         Verifies that creating a connection in autocommit mode works.
@@ -0,0 +1,138 @@
+from sqlean import dbapi2 as sqlite
+import unittest
+
+
+@unittest.skipUnless(hasattr(sqlite.Connection, "session"), "Session extension not enabled")
+class SessionTests(unittest.TestCase):
+    def setUp(self):
+        self.src = sqlite.connect(":memory:", isolation_level=None)
+        self.dst = sqlite.connect(":memory:", isolation_level=None)
+        for cx in (self.src, self.dst):
+            cx.execute("CREATE TABLE foo (id INTEGER PRIMARY KEY, val)")
+            cx.execute("CREATE TABLE bar (id INTEGER PRIMARY KEY, val)")
+
+    def tearDown(self):
+        self.src.close()
+        self.dst.close()
+
+    def fetch(self, cx, table="foo"):
+        return cx.execute("SELECT id, val FROM %s ORDER BY id" % table).fetchall()
+
+    def test_changeset(self):
+        session = self.src.session()
+        self.assertTrue(session.isempty)
+        self.src.execute("INSERT INTO foo VALUES (1, 'a'), (2, 'b')")
+        self.src.execute("UPDATE foo SET val = 'c' WHERE id = 2")
+        self.src.execute("INSERT INTO bar VALUES (1, 'x')")
+        self.assertFalse(session.isempty)
+        changeset = session.changeset()
+        self.assertIsInstance(changeset, bytes)
+        self.dst.apply_changeset(changeset)
+        self.assertEqual(self.fetch(self.dst), [(1, "a"), (2, "c")])
+        self.assertEqual(self.fetch(self.dst, "bar"), [(1, "x")])
+
+    def test_patchset(self):
+        self.src.execute("INSERT INTO foo VALUES (1, 'a')")
+        self.dst.execute("INSERT INTO foo VALUES (1, 'a')")
+        session = self.src.session(["foo"])
+        self.src.execute("UPDATE foo SET val = 'b'")
+        self.dst.apply_changeset(session.patchset())
+        self.assertEqual(self.fetch(self.dst), [(1, "b")])
+
+    def test_tables(self):
+        session = self.src.session(["bar"])
+        self.src.execute("INSERT INTO foo VALUES (1, 'a')")
+        self.assertTrue(session.isempty)
+        session.attach("foo")
+        self.src.execute("INSERT INTO foo VALUES (2, 'b')")
+        self.dst.apply_changeset(session.changeset())
+        self.assertEqual(self.fetch(self.dst), [(2, "b")])
+
+    def test_enabled(self):
+        session = self.src.session()
+        session.enabled = False
+        self.src.execute("INSERT INTO foo VALUES (1, 'a')")
+        self.assertTrue(session.isempty)
+        session.enabled = True
+        self.assertTrue(session.enabled)
+
+    def test_conflict_abort(self):
+        session = self.src.session()
+        self.src.execute("INSERT INTO foo VALUES (1, 'a'), (2, 'b')")
+        self.dst.execute("INSERT INTO foo VALUES (2, 'dst')")
+        with self.assertRaises(sqlite.IntegrityError):
+            self.dst.apply_changeset(session.changeset())
+        self.assertEqual(self.fetch(self.dst), [(2, "dst")])
+
+    def test_conflict_omit(self):
+        session = self.src.session()
+        self.src.execute("INSERT INTO foo VALUES (1, 'a'), (2, 'b')")
+        self.dst.execute("INSERT INTO foo VALUES (2, 'dst')")
+        self.dst.apply_changeset(session.changeset(), conflict="omit")
+        self.assertEqual(self.fetch(self.dst), [(1, "a"), (2, "dst")])
+
+    def test_conflict_replace(self):
+        session = self.src.session()
+        self.src.execute("INSERT INTO foo VALUES (1, 'a'), (2, 'b')")
+        self.dst.execute("INSERT INTO foo VALUES (2, 'dst')")
+        self.dst.apply_changeset(session.changeset(), conflict="replace")
+        self.assertEqual(self.fetch(self.dst), [(1, "a"), (2, "b")])
+
+    def test_conflict_callback(self):
+        session = self.src.session()
+        self.src.execute("INSERT INTO foo VALUES (1, 'a'), (2, 'b')")
+        self.dst.execute("INSERT INTO foo VALUES (2, 'dst')")
+        conflicts = []
+
+        def conflict(kind, table):
+            conflicts.append((kind, table))
+            return sqlite.SQLITE_CHANGESET_REPLACE
+
+        self.dst.apply_changeset(session.changeset(), conflict=conflict)
+        self.assertEqual(conflicts, [(sqlite.SQLITE_CHANGESET_CONFLICT, "foo")])
+        self.assertEqual(self.fetch(self.dst), [(1, "a"), (2, "b")])
+
+    def test_conflict_callback_error(self):
+        session = self.src.session()
+        self.src.execute("INSERT INTO foo VALUES (1, 'a'), (2, 'b')")
+        self.dst.execute("INSERT INTO foo VALUES (2, 'dst')")
+        with self.assertRaises(ZeroDivisionError):
+            self.dst.apply_changeset(session.changeset(), conflict=lambda kind, table: 1 / 0)
+        with self.assertRaises(ValueError):
+            self.dst.apply_changeset(session.changeset(), conflict=lambda kind, table: 42)
+        self.assertEqual(self.fetch(self.dst), [(2, "dst")])
+
+    def test_bad_conflict(self):
+        with self.assertRaises(ValueError):
+            self.dst.apply_changeset(b"", conflict="ignore")
+
+    def test_corrupt(self):
+        with self.assertRaises(sqlite.DatabaseError):
+            self.dst.apply_changeset(b"garbage")
+
+    def test_close(self):
+        with self.src.session() as session:
+            pass
+        with self.assertRaises(sqlite.ProgrammingError):
+            session.changeset()
+
+    def test_close_connection(self):
+        cx = sqlite.connect(":memory:")
+        session = cx.session()
+        cx.close()
+        with self.assertRaises(sqlite.ProgrammingError):
+            session.changeset()
+
+
+def suite():
+    loader = unittest.TestLoader()
+    tests = [loader.loadTestsFromTestCase(t) for t in (
+        SessionTests,)]
+    return unittest.TestSuite(tests)
+
+def test():
+    runner = unittest.TextTestRunner()
+    runner.run(suite())
+
+if __name__ == "__main__":
+    test()
@@ -21,8 +21,10 @@
 #    misrepresented as being the original software.
 # 3. This notice may not be removed or altered from any source distribution.
 
-import glob, os, unittest
+import glob, os, tempfile, threading, unittest
+from concurrent.futures import CancelledError
 from sqlean import dbapi2 as sqlite
+from sqlean.writer import WriteQueue, WriteResult
 
 def get_db_path():
     return "sqlite_testdb"
@@ -133,6 +135,23 @@ class TransactionTests(unittest.TestCase):
         # NO self.con2.rollback() HERE!!!
         self.con1.commit()
 
+    def test_IsolationLevelChange(self):
+        self.cur1.execute("create table test(i)")
+        self.con1.commit()
+        for level, blocks_readers in (("EXCLUSIVE", True), ("DEFERRED", False),
+                                      ("EXCLUSIVE", True), ("IMMEDIATE", False)):
+            self.con1.isolation_level = level
+            self.cur1.execute("insert into test(i) values (5)")
+            if blocks_readers:
+                with self.assertRaises(sqlite.OperationalError):
+                    self.cur2.execute("select i from test")
+            else:
+                self.cur2.execute("select i from test")
+                self.cur2.fetchall()
+            self.con1.rollback()
+        self.cur2.execute("select i from test")
+        self.assertEqual(self.cur2.fetchall(), [])
+
     def test_RollbackCursorConsistency(self):
         """
         Checks if cursors on the connection are set into a "reset" state
@@ -284,13 +303,233 @@ class DMLStatementDetectionTestCase(unittest.TestCase):
         self.assertFalse(conn.in_transaction)
 
 
+class TransactionContextTests(unittest.TestCase):
+    def setUp(self):
+        self.con = sqlite.connect(":memory:")
+        self.con.execute("create table test(x)")
+
+    def tearDown(self):
+        self.con.close()
+
+    def values(self):
+        return [x for (x,) in self.con.execute("select x from test order by rowid")]
+
+    def test_transaction(self):
+        with self.con.transaction() as transaction:
+            self.assertTrue(transaction.active)
+            self.assertTrue(self.con.in_transaction)
+            self.con.execute("insert into test values (1)")
+        self.assertFalse(transaction.active)
+        self.assertFalse(self.con.in_transaction)
+        self.assertEqual(self.values(), [1])
+
+    def test_transaction_rollback(self):
+        with self.assertRaises(KeyError):
+            with self.con.transaction("deferred"):
+                self.con.execute("insert into test values (1)")
+                raise KeyError
+        self.assertFalse(self.con.in_transaction)
+        self.assertEqual(self.values(), [])
+
+    def test_transaction_modes(self):
+        for mode in ("deferred", "IMMEDIATE", "Exclusive"):
+            with self.con.transaction(mode):
+                self.con.execute("insert into test values (?)", (mode,))
+        self.assertEqual(self.values(), ["deferred", "IMMEDIATE", "Exclusive"])
+        with self.assertRaises(ValueError):
+            self.con.transaction("eventually")
+
+    def test_transaction_nested(self):
+        self.con.execute("insert into test values (1)")
+        with self.assertRaises(sqlite.ProgrammingError):
+            with self.con.transaction():
+                pass
+        self.con.commit()
+        transaction = self.con.transaction()
+        with transaction:
+            with self.assertRaises(sqlite.ProgrammingError):
+                with transaction:
+                    pass
+
+    def test_transaction_ended_inside(self):
+        with self.con.transaction():
+            self.con.execute("insert into test values (1)")
+            self.con.commit()
+        self.assertEqual(self.values(), [1])
+
+    def test_savepoint(self):
+        with self.con.transaction():
+            self.con.execute("insert into test values (1)")
+            with self.con.savepoint():
+                self.con.execute("insert into test values (2)")
+            with self.assertRaises(KeyError):
+                with self.con.savepoint():
+                    self.con.execute("insert into test values (3)")
+                    raise KeyError
+            self.assertTrue(self.con.in_transaction)
+        self.assertEqual(self.values(), [1, 2])
+
+    def test_savepoint_outside_transaction(self):
+        with self.con.savepoint():
+            self.con.execute("insert into test values (1)")
+            self.assertTrue(self.con.in_transaction)
+        self.assertFalse(self.con.in_transaction)
+        self.assertEqual(self.values(), [1])
+
+    def test_savepoint_ended_inside(self):
+        with self.con.savepoint():
+            self.con.execute("insert into test values (1)")
+            self.con.commit()
+        with self.assertRaises(KeyError):
+            with self.con.transaction():
+                with self.con.savepoint():
+                    self.con.execute("insert into test values (2)")
+                    self.con.rollback()
+                    raise KeyError
+        self.assertFalse(self.con.in_transaction)
+        self.assertEqual(self.values(), [1])
+
+    def test_savepoint_deep(self):
+        def nest(depth):
+            if depth == 0:
+                self.con.execute("insert into test values (?)", (len(self.values()),))
+                raise KeyError
+            with self.con.savepoint():
+                self.con.execute("insert into test values (?)", (depth,))
+                if depth == 5:
+                    with self.assertRaises(KeyError):
+                        nest(depth - 1)
+                else:
+                    nest(depth - 1)
+
+        for _ in range(2):
+            nest(12)
+        self.assertEqual(self.values(), list(range(12, 4, -1)) * 2)
+
+    def test_rollback_keeps_cursors(self):
+        self.con.executemany("insert into test values (?)", [(1,), (2,), (3,)])
+        self.con.commit()
+        cur = self.con.execute("select x from test order by rowid")
+        self.assertEqual(cur.fetchone(), (1,))
+        with self.con.transaction():
+            with self.assertRaises(KeyError):
+                with self.con.savepoint():
+                    self.con.execute("insert into test values (4)")
+                    raise KeyError
+        self.assertEqual(cur.fetchall(), [(2,), (3,)])
+
+    def test_closed(self):
+        transaction = self.con.transaction()
+        self.con.close()
+        with self.assertRaises(sqlite.ProgrammingError):
+            with transaction:
+                pass
+        with self.assertRaises(sqlite.ProgrammingError):
+            self.con.savepoint()
+
+
+class WriteQueueTests(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "queue.db")
+        con = sqlite.connect(self.path)
+        con.execute("create table test(x unique)")
+        con.close()
+        self.queue = WriteQueue(self.path, timeout=5)
+
+    def tearDown(self):
+        self.queue.close()
+        self.dir.cleanup()
+
+    def count(self):
+        con = sqlite.connect(self.path)
+        try:
+            return con.execute("select count(*) from test").fetchone()[0]
+        finally:
+            con.close()
+
+    def test_submit(self):
+        result = self.queue.submit("insert into test values (?)", (1,)).result()
+        self.assertEqual(result, WriteResult(rowcount=1, lastrowid=1))
+        result = self.queue.execute("update test set x = x + 1")
+        self.assertEqual(result.rowcount, 1)
+        self.assertEqual(self.count(), 1)
+
+    def test_threads(self):
+        def write(base):
+            futures = [self.queue.submit("insert into test values (?)", (base + i,))
+                       for i in range(100)]
+            for future in futures:
+                future.result()
+
+        threads = [threading.Thread(target=write, args=(n * 1000,)) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.count(), 400)
+        self.assertEqual(self.queue.writes, 400)
+        self.assertLessEqual(self.queue.batches, 400)
+
+    def test_batching(self):
+        queue = WriteQueue(self.path, max_batch=10, max_delay=0.5)
+        try:
+            futures = [queue.submit("insert into test values (?)", (i,)) for i in range(25)]
+            for future in futures:
+                future.result()
+            self.assertEqual(queue.batches, 3)
+        finally:
+            queue.close()
+
+    def test_error(self):
+        ok = self.queue.submit("insert into test values (1)")
+        duplicate = self.queue.submit("insert into test values (1)")
+        bad = self.queue.submit("insert into nowhere values (1)")
+        ok2 = self.queue.submit("insert into test values (2)")
+        self.assertEqual(ok.result().rowcount, 1)
+        self.assertIsInstance(duplicate.exception(), sqlite.IntegrityError)
+        self.assertIsInstance(bad.exception(), sqlite.OperationalError)
+        self.assertEqual(ok2.result().rowcount, 1)
+        self.assertEqual(self.count(), 2)
+
+    def test_cancel(self):
+        queue = WriteQueue(self.path, max_delay=0.5)
+        try:
+            first = queue.submit("insert into test values (1)")
+            second = queue.submit("insert into test values (2)")
+            self.assertTrue(second.cancel())
+            first.result()
+            with self.assertRaises(CancelledError):
+                second.result()
+        finally:
+            queue.close()
+        self.assertEqual(self.count(), 1)
+
+    def test_close(self):
+        futures = [self.queue.submit("insert into test values (?)", (i,)) for i in range(50)]
+        self.queue.close()
+        self.assertTrue(all(future.done() for future in futures))
+        self.assertEqual(self.count(), 50)
+        with self.assertRaises(RuntimeError):
+            self.queue.submit("insert into test values (100)")
+        self.queue.close()
+
+    def test_bad_arguments(self):
+        with self.assertRaises(ValueError):
+            WriteQueue(self.path, max_batch=0)
+        with self.assertRaises(ValueError):
+            WriteQueue(self.path, max_delay=-1)
+
+
 def suite():
     loader = unittest.TestLoader()
     tests = [loader.loadTestsFromTestCase(t) for t in (
         TransactionTests,
         SpecialCommandTests,
         TransactionalDDL,
-        DMLStatementDetectionTestCase)]
+        DMLStatementDetectionTestCase,
+        TransactionContextTests,
+        WriteQueueTests)]
     return unittest.TestSuite(tests)
 
 def test():